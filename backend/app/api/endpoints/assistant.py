@@ -14,7 +14,7 @@ from app.models.assistant import (
 from app.services.assistant import (
     create_conversation, get_conversation, get_user_conversations,
     update_conversation, delete_conversation, create_message,
-    get_conversation_messages, generate_assistant_response
+    get_conversation_messages, generate_assistant_response, conversation_history
 )
 
 router = APIRouter()
@@ -164,6 +164,8 @@ def create_new_message(
     # 创建消息并获取助手回复
     message = create_message(db=db, message_in=message_in)
     db.commit()
+    # 近期消息超出token预算时在后台并入对话摘要
+    conversation_history.schedule_fold(conversation.id)
     return message
 
 
@@ -249,6 +251,8 @@ def chat_with_assistant(
     # 保存用户消息并获取助手回复
     assistant_message = create_message(db=db, message_in=message_in)
     db.commit()
+    # 近期消息超出token预算时在后台并入对话摘要
+    conversation_history.schedule_fold(conversation_id)
     
     # 返回响应
     sources = None
@@ -1,15 +1,22 @@
 from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from pydantic import BaseModel, Field
 import uuid
+import json
+import asyncio
 import numpy as np
 
 from app.api.deps import get_current_user, get_db
 from app.db.models import User, GlucoseRecord
 from app.services.glucose import get_user_glucose_records
-from app.ml.ollama_service import ollama_service
+from app.services.user_context import user_context_store
+from app.ml.llm_router import llm_router, LLMUnavailableError
+from app.core.config import settings
+from app.core.jobs import job_queue, JobQueueFullError, FINISHED
 from app.models.glucose import MeasurementTimeEnum, MeasurementMethodEnum
 from app.models.diet import MealTypeEnum
 import logging
@@ -74,6 +81,28 @@ class GlucoseTrendAnalysisRequest(BaseModel):
 class QuickDietSuggestionResponse(BaseModel):
     suggestion: str
 
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: str
+    finished_at: Optional[str] = None
+
+class JobAcceptedResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    deduplicated: bool
+    status_url: str
+    events_url: str
+
+# 提交为后台任务时的202响应
+JOB_ACCEPTED_RESPONSES: Dict[Any, Any] = {
+    status.HTTP_202_ACCEPTED: {"model": JobAcceptedResponse, "description": "已提交后台任务，结果通过status_url或events_url获取"}
+}
+
 # CRUD operations for Glucose Records
 @router.post("", response_model=GlucoseResponse)
 def create_glucose_record(
@@ -89,6 +118,8 @@ def create_glucose_record(
     db.add(db_record)
     db.commit()
     db.refresh(db_record)
+    # 与 app.services.glucose 的写入路径一致，立即重建用户上下文快照
+    user_context_store.refresh_health(db, current_user.id)
     return db_record
 
 @router.get("", response_model=List[GlucoseResponse])
@@ -136,14 +167,14 @@ async def get_quick_diet_suggestion(
     """
     
     try:
-        response = await ollama_service.generate(
-            prompt=prompt,
-            model="deepseek-r1:1.5b",
-            temperature=0.7,
-            max_tokens=250
+        result = await llm_router.complete("quick_suggestion", prompt, temperature=0.7, max_tokens=250)
+        return QuickDietSuggestionResponse(suggestion=result["text"])
+    except LLMUnavailableError as e:
+        logger.warning(f"为用户 {current_user.id} 生成快速饮食建议时模型繁忙: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="智能建议服务繁忙，请稍后重试。"
         )
-        suggestion = response.get("response", "抱歉，暂时无法生成建议，请稍后再试。")
-        return QuickDietSuggestionResponse(suggestion=suggestion)
     except Exception as e:
         logger.error(f"为用户 {current_user.id} 生成快速饮食建议失败: {e}")
         raise HTTPException(
@@ -179,6 +210,7 @@ def update_glucose_record(
         
     db.commit()
     db.refresh(db_record)
+    user_context_store.refresh_health(db, current_user.id)
     return db_record
 
 @router.delete("/{record_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -193,16 +225,20 @@ def delete_glucose_record(
     
     db.delete(db_record)
     db.commit()
+    user_context_store.refresh_health(db, current_user.id)
 
 # Analysis Endpoints
-@router.post("/analyze", response_model=AnalysisResponse)
-async def analyze_glucose(
+@router.post("/analyze", response_model=AnalysisResponse, responses=JOB_ACCEPTED_RESPONSES)
+def analyze_glucose(
     request: GlucoseAnalysisRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ) -> Any:
     """
     分析最近一段时间的血糖数据并检查异常
+
+    没有异常时直接返回分析结果；有异常时预警消息由后台任务生成，返回202和任务信息，
+    结果通过 GET /jobs/{job_id} 轮询或 GET /jobs/{job_id}/events 订阅获取
     """
     try:
         end_date = datetime.now()
@@ -244,32 +280,41 @@ async def analyze_glucose(
                 "severity": "high" if max_value > 12.0 else "medium"
             })
         
-        alert_message = None
-        if alerts:
-            alert_message = await generate_alert_message(current_user, alerts, records)
-
-        return {
+        result = {
             "status": "ok",
             "statistics": {
                 "average": avg_value, "max": max_value, "min": min_value,
                 "count": len(records), "period_hours": request.hours
             },
             "alerts": alerts, "has_alerts": len(alerts) > 0,
-            "alert_message": alert_message
+            "alert_message": None
         }
+        if not alerts:
+            return result
+
+        # 预警消息需要调用大模型，提交为后台任务
+        user_name = current_user.name
+        return submit_analysis_job(
+            "alert", current_user.id, result,
+            lambda: dict(result, alert_message=generate_alert_message(user_name, alerts))
+        )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"分析血糖数据失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"分析血糖数据失败: {str(e)}")
 
-@router.post("/analyze-trend")
-async def analyze_glucose_trend(
+@router.post("/analyze-trend", responses=JOB_ACCEPTED_RESPONSES)
+def analyze_glucose_trend(
     request: GlucoseTrendAnalysisRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     分析用户近三天的血糖趋势并提供智能建议
+
+    统计数据在请求中计算，建议由后台任务生成：返回202和任务信息，结果获取方式同 /analyze
     """
     try:
         days = request.days if request.days else 3
@@ -303,16 +348,85 @@ async def analyze_glucose_trend(
             "in_range_percentage": in_range_percentage, "high_percentage": high_percentage, "low_percentage": low_percentage
         }
         
-        advice = await generate_glucose_advice(current_user, records, statistics, patterns)
-        
-        return {
+        result = jsonable_encoder({
             "status": "success", "has_data": True, "days": days, "record_count": len(records),
-            "statistics": statistics, "patterns": patterns, "advice": advice
-        }
+            "statistics": {k: float(v) for k, v in statistics.items()},
+            "patterns": {k: float(v) for k, v in patterns.items()},
+            "advice": None
+        })
+        user_name = current_user.name
+        diabetes_type = getattr(current_user, "diabetes_type", None) or "未知"
+        return submit_analysis_job(
+            "advice", current_user.id, result,
+            lambda: dict(result, advice=generate_glucose_advice(user_name, diabetes_type, statistics, patterns))
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"分析血糖趋势失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"分析血糖趋势失败: {str(e)}")
 
+# Analysis jobs
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def read_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    查询分析任务的状态和结果，status为queued、running、succeeded或failed
+    """
+    job = job_queue.get(job_id, user_id=current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="分析任务不存在或已过期")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    以SSE推送分析任务的状态变化，任务结束时推送包含结果的最终事件后关闭连接
+    """
+    user_id = current_user.id
+    job = job_queue.get(job_id, user_id=user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="分析任务不存在或已过期")
+
+    async def event_generator():
+        current, last_status = job, None
+        while current is not None:
+            if current.status != last_status:
+                last_status = current.status
+                yield f"event: status\ndata: {json.dumps(current.to_dict(), ensure_ascii=False)}\n\n"
+            if current.status in FINISHED:
+                break
+            await asyncio.sleep(0.5)
+            # 任务可能在其他工作进程中执行，每次重新读取状态
+            current = await asyncio.to_thread(job_queue.get, job_id, user_id)
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+def submit_analysis_job(kind: str, user_id: str, params: Dict[str, Any], fn) -> JSONResponse:
+    """
+    提交分析任务并返回202和任务信息
+
+    同一用户的相同分析（统计结果相同）正在进行时直接返回已有任务；排队已满时返回503
+    """
+    try:
+        job, created = job_queue.submit(kind, user_id, params, fn)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    base_url = f"{settings.API_V1_STR}/glucose-monitor/jobs/{job.id}"
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "deduplicated": not created,
+        "status_url": base_url,
+        "events_url": f"{base_url}/events",
+    })
+
 # Helper functions for analysis
 def analyze_glucose_patterns(records):
     from collections import defaultdict
@@ -331,28 +445,28 @@ def analyze_glucose_patterns(records):
         "postprandial_avg": np.mean(postprandial_values) if postprandial_values else 0,
     }
 
-async def generate_alert_message(user, alerts, records):
-    """使用Ollama生成警报消息"""
+def generate_alert_message(user_name, alerts):
+    """生成警报消息（短文本，路由到小模型）；在后台任务中执行"""
     try:
         latest_alert = sorted(alerts, key=lambda a: a.get("timestamp", ""), reverse=True)[0]
-        prompt = f"为糖尿病患者{user.name}生成一条血糖预警消息。警报类型: {latest_alert['type']}, 严重程度: {latest_alert['severity']}. 请提供简短描述、风险和建议措施。"
-        response = await ollama_service.generate(prompt=prompt, model="deepseek-r1:1.5b", temperature=0.7, max_tokens=200)
-        return response.get("response", "无法生成警报消息")
+        prompt = f"为糖尿病患者{user_name}生成一条血糖预警消息。警报类型: {latest_alert['type']}, 严重程度: {latest_alert['severity']}. 请提供简短描述、风险和建议措施。"
+        result = llm_router.complete_sync("alert", prompt, temperature=0.7, max_tokens=200)
+        return result["text"]
     except Exception as e:
         logger.error(f"生成警报消息失败: {str(e)}")
         return "检测到血糖异常，请及时核对并采取措施。"
 
-async def generate_glucose_advice(user, records, statistics, patterns):
-    """使用Ollama生成个性化血糖管理建议"""
+def generate_glucose_advice(user_name, diabetes_type, statistics, patterns):
+    """生成个性化血糖管理建议（长文本，路由到大模型）；在后台任务中执行"""
     try:
         prompt = f"""
-        为糖尿病患者 {user.name} (糖尿病类型: {getattr(user, 'diabetes_type', '未知')}) 生成一份详细的血糖分析报告和管理建议。
+        为糖尿病患者 {user_name} (糖尿病类型: {diabetes_type}) 生成一份详细的血糖分析报告和管理建议。
         数据概览: 平均血糖 {statistics['average']:.1f}, 范围 {statistics['min']:.1f}-{statistics['max']:.1f}, 达标率 {statistics['in_range_percentage']:.1f}%.
         模式: 空腹平均 {patterns.get('fasting_avg', 0):.1f}, 餐后平均 {patterns.get('postprandial_avg', 0):.1f}.
         请提供: 1. 总体评估 2. 具体问题分析 3. 改善建议(饮食、运动) 4. 监测重点.
         """
-        response = await ollama_service.generate(prompt=prompt, model="deepseek-r1:1.5b", temperature=0.7, max_tokens=800)
-        return response.get("response", "无法生成血糖管理建议")
+        result = llm_router.complete_sync("advice", prompt, temperature=0.7, max_tokens=800)
+        return result["text"]
     except Exception as e:
         logger.error(f"生成血糖管理建议失败: {str(e)}")
         return "生成建议时发生错误，请稍后再试" 
\ No newline at end of file
@@ -3,12 +3,12 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_current_user, get_db, get_current_active_superuser
-from app.db.models import User, KnowledgeBase
+from app.db.models import User
 from app.models.assistant import KnowledgeBaseCreate, KnowledgeBaseUpdate
 from app.services.assistant import (
     create_knowledge_base_entry, get_knowledge_base_entry, 
     get_knowledge_base_entries, update_knowledge_base_entry,
-    delete_knowledge_base_entry
+    delete_knowledge_base_entry, search_knowledge_base_entries
 )
 
 router = APIRouter()
@@ -122,26 +122,23 @@ def delete_entry(
 def search_knowledge(
     query: str,
     limit: int = Query(3, ge=1, le=10),
+    tag: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ) -> Any:
     """
     搜索知识库
+
+    关键词查询（药名、食物名等）直接由BM25倒排索引返回，其他查询与向量检索结果按RRF融合
     """
-    # 直接从数据库搜索而不是使用向量数据库
-    # 简单的基于关键字的模糊搜索
-    entries = db.query(KnowledgeBase).filter(
-        KnowledgeBase.content.ilike(f"%{query}%") | 
-        KnowledgeBase.title.ilike(f"%{query}%")
-    ).limit(limit).all()
-    
-    results = []
-    for entry in entries:
-        results.append({
-            "id": entry.id,
-            "title": entry.title,
-            "content": entry.content,
-            "score": 1.0  # 默认评分
-        })
+    results = search_knowledge_base_entries(query=query, limit=limit, tag=tag)
     
-    return results 
\ No newline at end of file
+    return [
+        {
+            "id": result["id"],
+            "title": result["title"],
+            "content": result["content"],
+            "score": result["score"]
+        }
+        for result in results
+    ]
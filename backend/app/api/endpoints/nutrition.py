@@ -1,5 +1,5 @@
 from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Path, Request, Response
 from sqlalchemy.orm import Session
 import logging
 
@@ -8,20 +8,35 @@ from app.db.models import User, FoodNutrition
 from app.models.nutrition import (
     FoodNutritionCreate, FoodNutritionUpdate, FoodNutrition as FoodNutritionModel,
     FoodNutritionPage, FoodNutritionImport, FoodNutritionImportResponse,
-    FoodNutritionCategories, ImageUploadResponse
+    FoodNutritionCategories, ImageUploadResponse, FoodSuggestion
 )
 from app.services.nutrition import (
     create_food_nutrition, get_food_nutrition, get_food_nutrition_list,
     update_food_nutrition, delete_food_nutrition, import_food_nutrition_data,
     get_food_by_category, get_all_categories, get_diabetes_friendly_foods,
-    get_low_gi_foods, get_foods_by_gi_range, search_foods,
+    get_low_gi_foods, get_foods_by_gi_range, search_foods, suggest_foods,
     upload_food_image, delete_food_image
 )
+from app.services.food_catalog import food_catalog
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def _check_catalog_etag(request: Request, response: Response, db: Session) -> Optional[Response]:
+    """
+    以目录快照版本作为ETag；客户端缓存的版本（If-None-Match）仍是最新时返回304，不重新生成列表
+    """
+    version = food_catalog.get(db).version
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Catalog-Version": version}
+    cached = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in cached or "*" in cached:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
 @router.post("", response_model=FoodNutritionModel)
 def create_food(
     food_in: FoodNutritionCreate,
@@ -43,6 +58,8 @@ def create_food(
 
 @router.get("", response_model=FoodNutritionPage)
 def read_foods(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     size: int = Query(20, ge=1, le=100),
     category: Optional[str] = None,
@@ -55,6 +72,11 @@ def read_foods(
     """
     获取食物营养记录列表
     """
+    # 搜索结果的顺序还取决于热度，不使用目录版本作为ETag
+    if not search:
+        not_modified = _check_catalog_etag(request, response, db)
+        if not_modified:
+            return not_modified
     try:
         return get_food_nutrition_list(
             db=db,
@@ -188,6 +210,8 @@ def import_foods(
 
 @router.get("/categories/{category}", response_model=FoodNutritionPage)
 def read_foods_by_category(
+    request: Request,
+    response: Response,
     category: str = Path(...),
     page: int = Query(1, ge=1),
     size: int = Query(20, ge=1, le=100),
@@ -196,6 +220,9 @@ def read_foods_by_category(
     """
     按分类获取食物列表
     """
+    not_modified = _check_catalog_etag(request, response, db)
+    if not_modified:
+        return not_modified
     return get_food_by_category(
         db=db, category=category, page=page, size=size
     )
@@ -203,17 +230,24 @@ def read_foods_by_category(
 
 @router.get("/categories", response_model=FoodNutritionCategories)
 def read_all_categories(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ) -> Any:
     """
     获取所有食物分类
     """
+    not_modified = _check_catalog_etag(request, response, db)
+    if not_modified:
+        return not_modified
     categories = get_all_categories(db=db)
     return FoodNutritionCategories(categories=categories)
 
 
 @router.get("/diabetes-friendly", response_model=FoodNutritionPage)
 def read_diabetes_friendly_foods(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     size: int = Query(20, ge=1, le=100),
     category: Optional[str] = None,
@@ -222,6 +256,9 @@ def read_diabetes_friendly_foods(
     """
     获取适合糖尿病患者的食物
     """
+    not_modified = _check_catalog_etag(request, response, db)
+    if not_modified:
+        return not_modified
     return get_diabetes_friendly_foods(
         db=db, page=page, size=size, category=category
     )
@@ -229,6 +266,8 @@ def read_diabetes_friendly_foods(
 
 @router.get("/low-gi", response_model=FoodNutritionPage)
 def read_low_gi_foods(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     size: int = Query(20, ge=1, le=100),
     threshold: int = Query(55, ge=0, le=100),
@@ -237,6 +276,9 @@ def read_low_gi_foods(
     """
     获取低GI食物
     """
+    not_modified = _check_catalog_etag(request, response, db)
+    if not_modified:
+        return not_modified
     return get_low_gi_foods(
         db=db, page=page, size=size, threshold=threshold
     )
@@ -244,6 +286,8 @@ def read_low_gi_foods(
 
 @router.get("/gi-range", response_model=FoodNutritionPage)
 def read_foods_by_gi_range(
+    request: Request,
+    response: Response,
     min: int = Query(0, ge=0),
     max: int = Query(100, le=100),
     page: int = Query(1, ge=1),
@@ -253,6 +297,9 @@ def read_foods_by_gi_range(
     """
     根据血糖指数范围查询食物
     """
+    not_modified = _check_catalog_etag(request, response, db)
+    if not_modified:
+        return not_modified
     return get_foods_by_gi_range(
         db=db, min_gi=min, max_gi=max, page=page, size=size
     )
@@ -273,6 +320,17 @@ def search_food(
     )
 
 
+@router.get("/suggest", response_model=List[FoodSuggestion])
+def suggest_food(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50)
+) -> Any:
+    """
+    食物名称输入联想（支持拼音、首字母、同义词和错字）
+    """
+    return suggest_foods(query=q, limit=limit)
+
+
 @router.post("/{food_id:int}/image", response_model=ImageUploadResponse)
 async def upload_image(
     food_id: int = Path(..., ge=1),
@@ -43,16 +43,78 @@ class Settings(BaseSettings):
     # 如果MySQL连接失败，使用SQLite作为备用
     SQLALCHEMY_DATABASE_URI_FALLBACK: str = "sqlite:///diabetes_assistant.db"
     
+    # 静态文件设置
+    STATIC_DIR: str = os.getenv("STATIC_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "static"))  # 静态文件目录（上传的食物图片、食物图标）
+    
     # 向量数据库设置
     VECTOR_STORE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "vector_db")
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-zh-v1.5")  # 本地CPU嵌入模型（名称或路径）
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"  # 持久化嵌入缓存
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))  # 缓存向量数上限
+    KNOWLEDGE_CHUNK_SIZE: int = int(os.getenv("KNOWLEDGE_CHUNK_SIZE", "256"))  # 知识库文本块最大字符数
+    KNOWLEDGE_CHUNK_OVERLAP: int = int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP", "64"))  # 相邻文本块重叠字符数
+    KNOWLEDGE_INDEX_BACKEND: str = os.getenv("KNOWLEDGE_INDEX_BACKEND", "ivf")  # 向量检索后端：flat、ivf、flat_sq8、ivf_sq8
+    KNOWLEDGE_INDEX_IVF_MIN_SIZE: int = int(os.getenv("KNOWLEDGE_INDEX_IVF_MIN_SIZE", "20000"))  # 块数达到该值后启用倒排列表
+    KNOWLEDGE_INDEX_NPROBE: int = int(os.getenv("KNOWLEDGE_INDEX_NPROBE", "16"))  # 每次检索扫描的倒排列表数，越大召回率越高
+    KNOWLEDGE_INDEX_MMAP: bool = os.getenv("KNOWLEDGE_INDEX_MMAP", "False").lower() == "true"  # 以内存映射方式加载向量文件
+    KNOWLEDGE_KEYWORD_REBUILD_SECONDS: int = int(os.getenv("KNOWLEDGE_KEYWORD_REBUILD_SECONDS", "300"))  # 知识库关键词和标签索引从数据库重建的间隔（同步其他进程的修改）
+    KNOWLEDGE_INDEX_RETRY_SECONDS: float = float(os.getenv("KNOWLEDGE_INDEX_RETRY_SECONDS", "60"))  # 索引初始化失败后首次重试的等待时间，之后逐次加倍（最长1小时）
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"  # 助手回复语义缓存
+    RESPONSE_CACHE_THRESHOLD: float = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))  # 问题余弦相似度不低于该值视为相同问题
+    RESPONSE_CACHE_MIN_TERM_OVERLAP: float = float(os.getenv("RESPONSE_CACHE_MIN_TERM_OVERLAP", "0.6"))  # 语义命中还要求问题词项的Jaccard重合度不低于该值且关键词项相同
+    RESPONSE_CACHE_TTL_SECONDS: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))  # 缓存回答的有效期
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))  # 缓存的回答总数上限
     
     # 大模型配置
     MODEL_PATH: str = os.getenv("MODEL_PATH", "./models/deepseek-lite")
     MODEL_DEVICE: str = os.getenv("MODEL_DEVICE", "cpu")
     MODEL_QUANTIZATION: str = os.getenv("MODEL_QUANTIZATION", "int4")
     MODEL_PRELOAD: bool = False  # 默认不预加载模型
-    MODEL_PROVIDER: str = os.getenv("MODEL_PROVIDER", "local")  # 模型提供者：local, ollama, openai等
+    MODEL_PROVIDER: str = os.getenv("MODEL_PROVIDER", "local")  # 本地推理后端：local（transformers）, gguf（llama.cpp，MODEL_PATH为.gguf文件）
     MODEL_NAME: str = os.getenv("MODEL_NAME", "deepseek-lite")  # 模型名称
+    MODEL_THREADS: int = int(os.getenv("MODEL_THREADS", "0"))  # CPU推理线程数，0为由后端决定（通常为物理核数）
+    MODEL_CONTEXT_LENGTH: int = int(os.getenv("MODEL_CONTEXT_LENGTH", "4096"))  # gguf后端的上下文长度（token）
+    # 本地模型服务（python model_server.py）地址，如"127.0.0.1:8765"；为空时在API进程内加载模型
+    MODEL_SERVER_ADDRESS: str = os.getenv("MODEL_SERVER_ADDRESS", "")
+    MODEL_SERVER_AUTHKEY: str = os.getenv("MODEL_SERVER_AUTHKEY", "")  # 连接认证密钥，必须在部署时随机生成，未设置时模型服务拒绝启动
+    MODEL_SERVER_TIMEOUT: float = float(os.getenv("MODEL_SERVER_TIMEOUT", "300"))  # 等待一次生成的最长秒数（含排队）
+    # 动态批处理：并发的生成请求合并为一批送入模型，为1时逐条生成
+    MODEL_BATCH_MAX_SIZE: int = int(os.getenv("MODEL_BATCH_MAX_SIZE", "8"))  # 每批最多请求数
+    MODEL_BATCH_MAX_WAIT_MS: float = float(os.getenv("MODEL_BATCH_MAX_WAIT_MS", "20"))  # 凑批时最多等待的毫秒数
+    MODEL_PREFIX_CACHE_MB: int = int(os.getenv("MODEL_PREFIX_CACHE_MB", "512"))  # 系统提示词和对话历史的前缀KV缓存上限（MB），0为不缓存
+    
+    OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")  # Ollama服务地址
+    
+    # 大模型路由配置：按任务选择模型，逗号分隔的备选列表，依次回退；"ollama:<模型名>"或"local"（LLMService的本地模型）
+    LLM_ROUTE_ALERT: str = os.getenv("LLM_ROUTE_ALERT", "ollama:deepseek-r1:1.5b,local")  # 血糖预警消息（短文本，小模型）
+    LLM_ROUTE_QUICK_SUGGESTION: str = os.getenv("LLM_ROUTE_QUICK_SUGGESTION", "ollama:deepseek-r1:1.5b,local")  # 即时饮食建议（短文本，小模型）
+    LLM_ROUTE_ADVICE: str = os.getenv("LLM_ROUTE_ADVICE", "ollama:deepseek-r1:7b,ollama:deepseek-r1:1.5b")  # 血糖管理建议（长文本，大模型）
+    LLM_MODEL_CONCURRENCY: int = int(os.getenv("LLM_MODEL_CONCURRENCY", "2"))  # 每个模型同时处理的请求数
+    LLM_MODEL_MAX_QUEUE: int = int(os.getenv("LLM_MODEL_MAX_QUEUE", "8"))  # 每个模型最多排队的请求数，超出视为饱和并回退
+    LLM_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))  # 排队等待并发名额的截止时间
+    
+    # 后台任务配置（大模型分析接口）
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))  # 同时执行的后台任务数
+    JOB_MAX_PENDING: int = int(os.getenv("JOB_MAX_PENDING", "100"))  # 最多排队的任务数
+    JOB_RESULT_TTL_SECONDS: int = int(os.getenv("JOB_RESULT_TTL_SECONDS", "600"))  # 完成的任务结果保留时间
+    
+    # 对话上下文配置
+    ASSISTANT_HISTORY_TOKEN_BUDGET: int = int(os.getenv("ASSISTANT_HISTORY_TOKEN_BUDGET", "1536"))  # 带入提示词的近期消息token上限，超出部分并入摘要
+    ASSISTANT_HISTORY_MAX_MESSAGES: int = int(os.getenv("ASSISTANT_HISTORY_MAX_MESSAGES", "40"))  # 每次最多读取的近期消息条数
+    ASSISTANT_SUMMARY_MAX_TOKENS: int = int(os.getenv("ASSISTANT_SUMMARY_MAX_TOKENS", "256"))  # 生成对话摘要的最大token数
+    
+    # 用户上下文快照配置（助手提示词中的资料、近期血糖、饮食和用药）
+    USER_CONTEXT_CACHE_TTL_SECONDS: int = int(os.getenv("USER_CONTEXT_CACHE_TTL_SECONDS", "300"))  # 进程内缓存有效期，多进程部署时其他进程的写入在此时间内生效
+    USER_CONTEXT_MAX_AGE_SECONDS: int = int(os.getenv("USER_CONTEXT_MAX_AGE_SECONDS", "3600"))  # 快照超过此时间后重新构建（近7天统计随时间变化）
+    USER_CONTEXT_CACHE_MAX_ENTRIES: int = int(os.getenv("USER_CONTEXT_CACHE_MAX_ENTRIES", "10000"))  # 进程内最多缓存的用户数
+    ASSISTANT_HEALTH_CONTEXT: bool = os.getenv("ASSISTANT_HEALTH_CONTEXT", "False").lower() == "true"  # 提示词中带入近期血糖、饮食和用药；开启后有健康记录的用户不使用回答缓存
+    FOOD_SEARCH_REBUILD_SECONDS: int = int(os.getenv("FOOD_SEARCH_REBUILD_SECONDS", "1800"))  # 食物搜索索引从数据库重建的间隔（同步其他进程的修改和热度）
+    FOOD_SEARCH_POPULARITY_DAYS: int = int(os.getenv("FOOD_SEARCH_POPULARITY_DAYS", "90"))  # 按最近多少天的饮食记录计算食物热度
+    FOOD_CATALOG_RELOAD_SECONDS: int = int(os.getenv("FOOD_CATALOG_RELOAD_SECONDS", "300"))  # 食物目录快照从数据库重新加载的间隔（同步其他进程的修改）
+    
+    # 性能监控配置
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"  # 是否启用/metrics指标
     
     class Config:
         case_sensitive = True
@@ -0,0 +1,323 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+import json
+import time
+import uuid
+import queue
+import hashlib
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.models import BackgroundJob
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+jobs_total = registry.counter(
+    "background_jobs_total", "后台任务数，result为succeeded、failed或deduplicated（合并到进行中的相同任务）", ("kind", "result")
+)
+job_queue_depth = registry.gauge(
+    "background_job_queue_depth", "排队等待执行的后台任务数"
+)
+job_duration_seconds = registry.histogram(
+    "background_job_duration_seconds", "后台任务的执行时间（秒）", ("kind",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+job_wait_seconds = registry.histogram(
+    "background_job_wait_seconds", "后台任务从提交到开始执行的排队时间（秒）", ("kind",),
+    buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+FINISHED = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+# 清理过期任务（内存和数据库）的间隔（秒）
+PURGE_INTERVAL_SECONDS = 60
+
+
+class JobQueueFullError(RuntimeError):
+    """排队的任务数已达上限"""
+
+
+class Job:
+    """一个后台任务及其状态和结果"""
+
+    def __init__(self, kind: str, user_id: str, key: str, fn: Optional[Callable[[], Any]]):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.user_id = user_id
+        self.key = key
+        self.fn = fn
+        self.status = STATUS_QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+
+    @classmethod
+    def from_row(cls, row) -> "Job":
+        """由数据库中的记录构造任务（其他进程提交的任务，只用于查询）"""
+        job = cls(row.kind, row.user_id, row.params_key, None)
+        job.id = row.id
+        job.status = row.status
+        job.result = row.result
+        job.error = row.error
+        job.created_at = row.created_at
+        job.finished_at = row.finished_at
+        if job.status in FINISHED:
+            job.done.set()
+        return job
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class JobQueue:
+    """
+    后台任务队列
+
+    耗时的大模型分析在接口中提交为任务并立即返回任务ID，由固定数量的工作线程执行（并发上限workers），
+    客户端轮询任务状态或订阅SSE获取结果。同一用户提交的相同任务（kind和参数相同）在排队或执行中时直接返回已有任务，不重复调用模型。
+    任务在提交它的进程中执行，状态和结果同时写入数据库（background_jobs），多个API工作进程时查询请求到达任一进程都能取到；
+    其他进程中进行中的相同任务也会被复用。完成的任务保留result_ttl秒供查询；排队或执行超过result_ttl秒仍未完成的任务
+    （如所在进程已退出）视为失败。
+    锁只保护内存中的状态，数据库读写都在锁外进行；过期任务每purge_interval秒清理一次，查询时按result_ttl判断是否过期。
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        max_pending: int = None,
+        result_ttl: float = None,
+        session_factory: Optional[Callable] = None,
+        purge_interval: float = None
+    ):
+        self.workers = workers or settings.JOB_WORKERS
+        self.max_pending = max_pending or settings.JOB_MAX_PENDING
+        self.result_ttl = result_ttl if result_ttl is not None else settings.JOB_RESULT_TTL_SECONDS
+        self.purge_interval = PURGE_INTERVAL_SECONDS if purge_interval is None else purge_interval
+        self._next_purge = 0.0
+        self._session_factory = session_factory
+        self._queue: "queue.Queue[Job]" = queue.Queue()
+        self._jobs: Dict[str, Job] = {}
+        # (用户, 类型, 参数摘要) -> 排队或执行中的任务
+        self._inflight: Dict[Tuple[str, str, str], Job] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    @staticmethod
+    def params_key(params: Dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _session(self):
+        if self._session_factory is None:
+            from app.db.session import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def submit(self, kind: str, user_id: str, params: Dict[str, Any], fn: Callable[[], Any]) -> Tuple[Job, bool]:
+        """
+        提交任务
+
+        Returns:
+            (任务, 是否新建)；相同任务进行中时返回已有任务和False
+
+        Raises:
+            JobQueueFullError: 排队的任务数已达max_pending
+        """
+        key = self.params_key(params)
+        with self._lock:
+            existing = self._inflight.get((user_id, kind, key))
+            purge = time.monotonic() >= self._next_purge
+            if purge:
+                self._next_purge = time.monotonic() + self.purge_interval
+        if purge:
+            self._purge()
+        # 查询其他进程中的相同任务不持有锁；查询期间本进程提交的相同任务在下面加锁后再次检查
+        if existing is None:
+            existing = self._find_inflight(user_id, kind, key)
+        if existing is None:
+            with self._lock:
+                existing = self._inflight.get((user_id, kind, key))
+                if existing is None:
+                    queued = sum(1 for job in self._inflight.values() if job.status == STATUS_QUEUED)
+                    if queued >= self.max_pending:
+                        raise JobQueueFullError("后台任务过多，请稍后再试")
+                    job = Job(kind, user_id, key, fn)
+                    self._jobs[job.id] = job
+                    self._inflight[(user_id, kind, key)] = job
+                    if not self._threads:
+                        self._start_workers()
+        if existing is not None:
+            jobs_total.inc(kind=kind, result="deduplicated")
+            return existing, False
+
+        # 先写入数据库再入队，工作线程更新状态时记录已存在
+        self._insert(job)
+        self._queue.put(job)
+        job_queue_depth.set(self._queue.qsize())
+        return job, True
+
+    def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[Job]:
+        """按ID取任务，本进程中没有时从数据库读取；指定user_id时只返回该用户的任务，完成超过result_ttl的任务视为不存在"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and self._expired(job):
+                job = None
+        if job is None:
+            job = self._load(job_id)
+        if job is None or (user_id is not None and job.user_id != user_id):
+            return None
+        return job
+
+    def _expired(self, job: Job) -> bool:
+        """已完成超过result_ttl；本进程中执行的任务需在锁内调用，避免看到已完成但没有完成时间的任务"""
+        return job.status in FINISHED and (datetime.now() - job.finished_at).total_seconds() > self.result_ttl
+
+    def _start_workers(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"background-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job_queue_depth.set(self._queue.qsize())
+            job_wait_seconds.observe(time.perf_counter() - job.enqueued_at, kind=job.kind)
+            job.status = STATUS_RUNNING
+            self._save(job)
+            start = time.perf_counter()
+            result, error = None, None
+            try:
+                result = job.fn()
+            except Exception as e:
+                logger.error(f"后台任务 {job.kind} 执行失败: {str(e)}")
+                error = str(e)
+            job_duration_seconds.observe(time.perf_counter() - start, kind=job.kind)
+            # 完成时间和最终状态一起在锁内更新，_expired不会看到已完成但没有完成时间的任务
+            with self._lock:
+                job.result, job.error = result, error
+                job.finished_at = datetime.now()
+                job.status = STATUS_FAILED if error is not None else STATUS_SUCCEEDED
+                job.fn = None
+                self._inflight.pop((job.user_id, job.kind, job.key), None)
+            jobs_total.inc(kind=job.kind, result=job.status)
+            self._save(job)
+            job.done.set()
+
+    def _purge(self):
+        """删除超过result_ttl的已完成任务；数据库中的删除不持有锁"""
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if self._expired(job)]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+        cutoff = datetime.now() - timedelta(seconds=self.result_ttl)
+        db = self._session()
+        try:
+            db.query(BackgroundJob).filter(
+                (BackgroundJob.finished_at < cutoff)
+                | (BackgroundJob.created_at < cutoff - timedelta(seconds=self.result_ttl))
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"清理过期后台任务失败: {str(e)}")
+        finally:
+            db.close()
+
+    # ---------- 数据库中的任务状态 ----------
+
+    def _stale_before(self) -> datetime:
+        """在此之前创建且仍未完成的任务视为已失败（执行任务的进程已退出）"""
+        return datetime.now() - timedelta(seconds=self.result_ttl)
+
+    def _find_inflight(self, user_id: str, kind: str, key: str) -> Optional[Job]:
+        """其他进程中排队或执行中的相同任务"""
+        db = self._session()
+        try:
+            row = db.query(BackgroundJob).filter(
+                BackgroundJob.user_id == user_id,
+                BackgroundJob.kind == kind,
+                BackgroundJob.params_key == key,
+                BackgroundJob.status.in_((STATUS_QUEUED, STATUS_RUNNING)),
+                BackgroundJob.created_at >= self._stale_before()
+            ).order_by(BackgroundJob.created_at.desc()).first()
+            return Job.from_row(row) if row is not None else None
+        except Exception as e:
+            logger.warning(f"查询进行中的后台任务失败: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        db = self._session()
+        try:
+            row = db.get(BackgroundJob, job_id)
+            if row is None:
+                return None
+            job = Job.from_row(row)
+        except Exception as e:
+            logger.warning(f"读取后台任务失败: {str(e)}")
+            return None
+        finally:
+            db.close()
+        if self._expired(job):
+            return None
+        if job.status not in FINISHED and job.created_at < self._stale_before():
+            job.status = STATUS_FAILED
+            job.error = "任务超时未完成，请重新提交"
+            job.done.set()
+        return job
+
+    def _insert(self, job: Job):
+        db = self._session()
+        try:
+            db.add(BackgroundJob(
+                id=job.id, user_id=job.user_id, kind=job.kind, params_key=job.key,
+                status=job.status, created_at=job.created_at
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            # 写入失败时任务仍在本进程执行，只是其他进程查询不到
+            logger.warning(f"保存后台任务失败: {str(e)}")
+        finally:
+            db.close()
+
+    def _save(self, job: Job):
+        db = self._session()
+        try:
+            db.query(BackgroundJob).filter(BackgroundJob.id == job.id).update({
+                "status": job.status,
+                "result": json.loads(json.dumps(job.result, default=str)),
+                "error": job.error,
+                "finished_at": job.finished_at,
+            }, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"更新后台任务状态失败: {str(e)}")
+        finally:
+            db.close()
+
+
+# 全局任务队列
+job_queue = JobQueue()
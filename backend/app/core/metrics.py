@@ -0,0 +1,350 @@
+import time
+import threading
+import logging
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple, Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认的延迟直方图分桶，单位秒
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 大模型调用耗时普遍较长，使用更宽的分桶
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: Optional[Dict[str, str]] = None) -> str:
+    """把标签格式化为Prometheus文本格式"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Metric:
+    """指标基类，按标签值分组保存样本"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def collect(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签对应 [各分桶计数..., +Inf计数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            for i, bound in enumerate(self.buckets):
+                labels = _format_labels(self.labelnames, key, {"le": repr(float(bound))})
+                lines.append(f"{self.name}_bucket{labels} {state[i]}")
+            labels = _format_labels(self.labelnames, key, {"le": "+Inf"})
+            lines.append(f"{self.name}_bucket{labels} {state[-2]}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{plain} {state[-2]}")
+            lines.append(f"{self.name}_sum{plain} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表，输出Prometheus文本格式"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """渲染所有指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表
+registry = MetricsRegistry()
+
+# HTTP请求指标
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP请求总数", ("method", "route", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时（秒）", ("method", "route")
+)
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "正在处理的HTTP请求数", ("method",)
+)
+
+# 数据库指标（按请求路由聚合）
+db_queries_per_request = registry.histogram(
+    "http_request_db_queries", "单个请求执行的SQL语句数", ("method", "route"),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+db_query_duration_seconds = registry.histogram(
+    "http_request_db_duration_seconds", "单个请求内SQL执行总耗时（秒）", ("method", "route")
+)
+db_queries_total = registry.counter(
+    "db_queries_total", "SQL语句执行总数", ("source",)
+)
+
+# 大模型调用指标
+llm_request_duration_seconds = registry.histogram(
+    "llm_request_duration_seconds", "大模型调用耗时（秒）", ("backend", "model", "operation"),
+    buckets=LLM_LATENCY_BUCKETS
+)
+llm_requests_total = registry.counter(
+    "llm_requests_total", "大模型调用总数", ("backend", "model", "operation", "outcome")
+)
+llm_tokens_total = registry.counter(
+    "llm_tokens_total", "大模型处理的token总数", ("backend", "model", "kind")
+)
+
+
+class RequestStats:
+    """单个请求内累积的数据库统计"""
+
+    __slots__ = ("db_queries", "db_time")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+
+
+# 当前请求的统计对象；线程池中执行的同步路由会继承同一个对象
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """获取当前请求的统计对象，不在请求上下文中时返回None"""
+    return _current_request.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    stats = _current_request.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_time += elapsed
+        db_queries_total.inc(source="request")
+    else:
+        db_queries_total.inc(source="background")
+
+
+def instrument_engine(engine: Engine) -> None:
+    """为数据库引擎注册SQL执行事件，统计每个请求的查询次数与耗时"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    logger.info("已为数据库引擎注册性能统计钩子")
+
+
+def observe_llm_call(
+    backend: str,
+    model: str,
+    operation: str,
+    duration: float,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    success: bool = True
+) -> None:
+    """
+    记录一次大模型调用
+
+    Args:
+        backend: 推理后端（ollama、local等）
+        model: 模型名称
+        operation: 调用类型（generate、chat等）
+        duration: 调用耗时，单位秒
+        prompt_tokens: 输入token数
+        completion_tokens: 生成token数
+        success: 是否调用成功
+    """
+    model = model or "unknown"
+    llm_request_duration_seconds.observe(duration, backend=backend, model=model, operation=operation)
+    llm_requests_total.inc(
+        backend=backend, model=model, operation=operation, outcome="success" if success else "error"
+    )
+    if prompt_tokens:
+        llm_tokens_total.inc(prompt_tokens, backend=backend, model=model, kind="prompt")
+    if completion_tokens:
+        llm_tokens_total.inc(completion_tokens, backend=backend, model=model, kind="completion")
+
+
+class PerformanceMiddleware:
+    """
+    请求级性能统计中间件
+
+    记录每个路由模板的请求耗时直方图、并发请求数，以及请求内的SQL执行次数和耗时。
+    路由使用模板路径（如 /api/v1/health/{record_id}），避免路径参数导致标签爆炸。
+    """
+
+    def __init__(self, app, exclude_paths: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "GET")
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status_code = 500
+        # 路由在进入应用后才能匹配，并发数只按方法统计
+        http_requests_in_flight.inc(method=method)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+
+            http_requests_in_flight.dec(method=method)
+            http_requests_total.inc(method=method, route=route_path, status=str(status_code))
+            http_request_duration_seconds.observe(duration, method=method, route=route_path)
+            db_queries_per_request.observe(stats.db_queries, method=method, route=route_path)
+            db_query_duration_seconds.observe(stats.db_time, method=method, route=route_path)
+            _current_request.reset(token)
+
+
+def render_metrics() -> str:
+    """以Prometheus文本格式导出所有指标"""
+    return registry.render()
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Text, JSON, Enum
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Date, Text, JSON, Enum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -47,6 +47,10 @@ class User(Base):
 
 class GlucoseRecord(Base):
     __tablename__ = "glucose_records"
+    __table_args__ = (
+        # 按用户查询时间范围内的血糖并按测量时间排序
+        Index("ix_glucose_records_user_measured", "user_id", "measured_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), ForeignKey("users.id"))
@@ -64,6 +68,10 @@ class GlucoseRecord(Base):
 
 class DietRecord(Base):
     __tablename__ = "diet_records"
+    __table_args__ = (
+        # 按用户查询时间范围内的饮食记录并按用餐时间排序
+        Index("ix_diet_records_user_meal_time", "user_id", "meal_time"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), ForeignKey("users.id"))
@@ -83,10 +91,17 @@ class DietRecord(Base):
 
 class HealthRecord(Base):
     __tablename__ = "health_records"
+    __table_args__ = (
+        # 每个用户每天只有一条快速记录使用的当日健康记录；普通健康记录的daily_date为空，不受约束
+        UniqueConstraint("user_id", "daily_date", name="uq_health_records_user_daily"),
+        # 按用户查询时间范围内的健康记录并按记录日期排序
+        Index("ix_health_records_user_record_date", "user_id", "record_date"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), ForeignKey("users.id"))
     record_date = Column(DateTime, default=func.now())
+    daily_date = Column(Date, nullable=True)  # 当日健康记录对应的日期
     notes = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -101,6 +116,11 @@ class HealthRecord(Base):
 
 class WeightRecord(Base):
     __tablename__ = "weight_records"
+    __table_args__ = (
+        # 按健康记录加载子记录；按用户查询体重时间序列
+        Index("ix_weight_records_health_record", "health_record_id"),
+        Index("ix_weight_records_user_measured", "user_id", "measured_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     health_record_id = Column(String(36), ForeignKey("health_records.id"))
@@ -119,6 +139,11 @@ class WeightRecord(Base):
 
 class BloodPressureRecord(Base):
     __tablename__ = "blood_pressure_records"
+    __table_args__ = (
+        # 按健康记录加载子记录；按用户查询血压时间序列
+        Index("ix_blood_pressure_records_health_record", "health_record_id"),
+        Index("ix_blood_pressure_records_user_measured", "user_id", "measured_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     health_record_id = Column(String(36), ForeignKey("health_records.id"))
@@ -137,6 +162,11 @@ class BloodPressureRecord(Base):
 
 class ExerciseRecord(Base):
     __tablename__ = "exercise_records"
+    __table_args__ = (
+        # 按健康记录加载子记录；按用户查询运动时间序列
+        Index("ix_exercise_records_health_record", "health_record_id"),
+        Index("ix_exercise_records_user_start_time", "user_id", "start_time"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     health_record_id = Column(String(36), ForeignKey("health_records.id"))
@@ -157,6 +187,11 @@ class ExerciseRecord(Base):
 
 class MedicationRecord(Base):
     __tablename__ = "medication_records"
+    __table_args__ = (
+        # 按健康记录加载子记录；按用户查询用药时间序列
+        Index("ix_medication_records_health_record", "health_record_id"),
+        Index("ix_medication_records_user_taken_at", "user_id", "taken_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     health_record_id = Column(String(36), ForeignKey("health_records.id"))
@@ -176,11 +211,18 @@ class MedicationRecord(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # 按用户列出对话并按更新时间排序
+        Index("ix_conversations_user_updated", "user_id", "updated_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), ForeignKey("users.id"))
     title = Column(String(100), nullable=False)
     is_active = Column(Boolean, default=True)
+    # 较早消息的滚动摘要，及已并入摘要的消息数（各消息是否已合并见Message.summarized）
+    summary = Column(Text, nullable=True)
+    summarized_count = Column(Integer, default=0, nullable=False)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -189,8 +231,40 @@ class Conversation(Base):
     messages = relationship("Message", back_populates="conversation")
 
 
+class UserContextSnapshot(Base):
+    """用户上下文快照：资料、近7天血糖统计、近期饮食和用药，写入相关记录时重建，助手生成回复时直接读取"""
+    __tablename__ = "user_context_snapshots"
+
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    data = Column(JSON, nullable=False)
+    built_at = Column(DateTime, nullable=False)
+
+
+class BackgroundJob(Base):
+    """后台任务的状态和结果，由执行任务的工作进程写入，任一API工作进程都能查询"""
+    __tablename__ = "background_jobs"
+    __table_args__ = (
+        # 提交时查找同一用户进行中的相同任务
+        Index("ix_background_jobs_user_kind_key", "user_id", "kind", "params_key"),
+    )
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(20), nullable=False)
+    params_key = Column(String(40), nullable=False)
+    status = Column(String(20), nullable=False)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # 按对话读取消息并按时间排序
+        Index("ix_messages_conversation_timestamp", "conversation_id", "timestamp"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     conversation_id = Column(String(36), ForeignKey("conversations.id"))
@@ -198,6 +272,8 @@ class Message(Base):
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=func.now())
     message_metadata = Column(JSON, nullable=True)
+    # 是否已并入对话摘要；按消息标记，同一秒内的消息顺序不影响哪些消息已合并
+    summarized = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -207,6 +283,10 @@ class Message(Base):
 
 class KnowledgeBase(Base):
     __tablename__ = "knowledge_base"
+    __table_args__ = (
+        # 知识库列表按更新时间排序
+        Index("ix_knowledge_base_updated_at", "updated_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     title = Column(String(100), nullable=False)
@@ -0,0 +1,153 @@
+from typing import List, Dict, Any, Callable, Optional
+import time
+import threading
+import logging
+from collections import deque
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+llm_batch_size = registry.histogram(
+    "llm_batch_size", "每次送入模型的请求数（动态批处理）",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+llm_batch_queue_seconds = registry.histogram(
+    "llm_batch_queue_seconds", "生成请求在批处理队列中等待的时间（秒）",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0, 30.0, 120.0)
+)
+
+Messages = List[Dict[str, str]]
+BatchFunction = Callable[..., List[Dict[str, Any]]]
+
+
+class _Request:
+    def __init__(self, messages: Messages, options: Dict[str, Any]):
+        self.messages = messages
+        self.options = options
+        self.key = tuple(sorted(options.items()))
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+
+
+class BatchScheduler:
+    """
+    生成请求的动态批处理
+
+    并发的生成请求先进入队列，调度线程取出队首请求后最多再等待max_wait_ms，
+    把生成参数相同的请求（最多max_batch_size个）合并为一个左填充的批次一次送入模型。
+    一个批次生成期间到达的请求会在下一轮直接组成批次，不再额外等待。
+    CPU上单条生成受内存带宽限制，批量生成时每读一次权重可服务多条请求，总吞吐（token/秒）随并发上升。
+    max_batch_size为1时退化为按顺序逐条生成。
+    """
+
+    def __init__(self, generate_batch: BatchFunction, max_batch_size: int = 8, max_wait_ms: float = 20):
+        self._generate_batch = generate_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "deque[_Request]" = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def pending(self) -> int:
+        """排队中的请求数"""
+        with self._cond:
+            return len(self._queue)
+
+    def submit(self, messages: Messages, **options: Any) -> Dict[str, Any]:
+        """
+        提交一次生成并等待结果
+
+        Returns:
+            生成结果，另附batch_size（所在批次的请求数）和queue_seconds（排队时间）
+
+        Raises:
+            生成该批次时的异常
+        """
+        request = _Request(messages, options)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("批处理调度器已停止")
+            self._queue.append(request)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="llm-batch-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _next_batch(self) -> Optional[List[_Request]]:
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                # 停止时仍在排队的请求直接报错返回，不让调用方一直等待
+                for request in self._queue:
+                    request.error = RuntimeError("批处理调度器已停止")
+                    request.done.set()
+                self._queue.clear()
+                return None
+            first = self._queue[0]
+            deadline = first.enqueued_at + self.max_wait
+            while True:
+                compatible = sum(1 for request in self._queue if request.key == first.key)
+                remaining = deadline - time.perf_counter()
+                if compatible >= self.max_batch_size or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, rest = [], deque()
+            for request in self._queue:
+                if request.key == first.key and len(batch) < self.max_batch_size:
+                    batch.append(request)
+                else:
+                    rest.append(request)
+            self._queue = rest
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            llm_batch_size.observe(len(batch))
+            for request in batch:
+                llm_batch_queue_seconds.observe(started - request.enqueued_at)
+            try:
+                results = self._generate_batch([request.messages for request in batch], **batch[0].options)
+                for request, result in zip(batch, results):
+                    request.result = dict(result, batch_size=len(batch), queue_seconds=started - request.enqueued_at)
+            except Exception as e:
+                logger.error(f"批量生成失败（{len(batch)} 条）: {str(e)}")
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                request.done.set()
+
+
+def create_batch_scheduler(runner) -> BatchScheduler:
+    """
+    为推理器创建批处理调度器
+
+    批次大小取MODEL_BATCH_MAX_SIZE与推理器max_batch_size中的较小值；不能真正批量生成的推理器
+    （如逐条生成的GGUFModelRunner）为1，每个请求生成完即返回，不必等待同批的其他请求。
+    """
+    max_batch_size = min(settings.MODEL_BATCH_MAX_SIZE, getattr(runner, "max_batch_size", settings.MODEL_BATCH_MAX_SIZE))
+    return BatchScheduler(
+        runner.generate_batch,
+        max_batch_size=max_batch_size,
+        max_wait_ms=settings.MODEL_BATCH_MAX_WAIT_MS
+    )
@@ -0,0 +1,94 @@
+from typing import List, Tuple
+import re
+
+# 句末标点：中文句号、问号、叹号、分号、省略号及对应的英文标点；其后可跟闭合引号/括号
+_SENTENCE_END = re.compile(r"(……|[。！？；!?;]|\.(?=\s|$))[”’」』）)\]]*")
+
+
+def _sentences_with_separators(text: str) -> List[Tuple[str, str]]:
+    """切分句子，返回 [(与上一句之间的原分隔符, 句子)]；段落之间的分隔符为换行"""
+    sentences = []
+    for paragraph in re.split(r"\n+", text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        separator = "\n" if sentences else ""
+        start = 0
+        for match in _SENTENCE_END.finditer(paragraph):
+            segment = paragraph[start:match.end()]
+            sentence = segment.strip()
+            if sentence:
+                # 英文等以空格分隔的句子保留原空格，中文句子之间为空串
+                sentences.append((separator + segment[:len(segment) - len(segment.lstrip())], sentence))
+                separator = ""
+            start = match.end()
+        segment = paragraph[start:]
+        tail = segment.strip()
+        if tail:
+            sentences.append((separator + segment[:len(segment) - len(segment.lstrip())], tail))
+    return sentences
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    按中文句末标点和换行切分句子，句末标点保留在句子中
+
+    英文句点只在其后为空白或文本结尾时才视为句末，避免切开"2.5mmol/L"这类数字。
+    """
+    return [sentence for _, sentence in _sentences_with_separators(text)]
+
+
+def chunk_text(text: str, chunk_size: int = 256, overlap: int = 64) -> List[str]:
+    """
+    把文本切分为相互重叠的块
+
+    以句子为单位拼接，句子之间保留原文的分隔符（英文句子间的空格、段落间的换行），
+    每块不超过chunk_size个字符；下一块以上一块末尾不超过overlap个字符的整句开头，
+    使跨块的上下文不丢失。单个句子超过chunk_size时按字符硬切分，同样保留overlap重叠。
+
+    Args:
+        text: 原文
+        chunk_size: 每块的最大字符数
+        overlap: 相邻块之间的最大重叠字符数
+
+    Returns:
+        文本块列表，空文本返回空列表
+    """
+    overlap = max(0, min(overlap, chunk_size // 2))
+    # (与上一片之间的分隔符, 片段)；分隔符只在片段不是块的开头时计入
+    pieces: List[Tuple[str, str]] = []
+    for separator, sentence in _sentences_with_separators(text):
+        if len(sentence) <= chunk_size:
+            pieces.append((separator, sentence))
+            continue
+        step = chunk_size - overlap
+        for offset in range(0, len(sentence) - overlap, step):
+            pieces.append((separator if offset == 0 else "", sentence[offset:offset + chunk_size]))
+
+    def join(parts: List[Tuple[str, str]]) -> str:
+        return parts[0][1] + "".join(separator + piece for separator, piece in parts[1:])
+
+    chunks = []
+    current: List[Tuple[str, str]] = []
+    length = 0
+    for separator, piece in pieces:
+        if current and length + len(separator) + len(piece) > chunk_size:
+            chunks.append(join(current))
+            # 从末尾回取整句作为下一块的开头
+            carried: List[Tuple[str, str]] = []
+            carried_length = 0
+            for previous_separator, previous in reversed(current):
+                added = len(previous) + (len(carried[0][0]) if carried else 0)
+                if (carried_length + added > overlap
+                        or carried_length + added + len(separator) + len(piece) > chunk_size):
+                    break
+                carried.insert(0, (previous_separator, previous))
+                carried_length += added
+            current, length = carried, carried_length
+        if current:
+            length += len(separator)
+        current.append((separator, piece))
+        length += len(piece)
+    if current:
+        chunks.append(join(current))
+    return chunks
@@ -0,0 +1,294 @@
+from typing import List, Dict, Any, Optional, Sequence
+import os
+import re
+import json
+import time
+import atexit
+import hashlib
+import threading
+import unicodedata
+import weakref
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.metrics import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+embedding_cache_requests_total = registry.counter(
+    "embedding_cache_requests_total", "嵌入缓存查询次数，result为hit或miss", ("model", "result")
+)
+embedding_cache_entries = registry.gauge(
+    "embedding_cache_entries", "嵌入缓存中的向量数", ("model",)
+)
+embedding_cache_evictions_total = registry.counter(
+    "embedding_cache_evictions_total", "嵌入缓存淘汰的向量数", ("model",)
+)
+
+VECTORS_FILE = "vectors.f16"
+INDEX_FILE = "index.json"
+# 持有该文件排他锁的进程才能读写磁盘上的缓存
+LOCK_FILE = "writer.lock"
+INITIAL_CAPACITY = 1024
+# 缓存满时一次淘汰的比例，避免每次写入都触发淘汰
+EVICT_FRACTION = 0.05
+# 新增条目累计到该数量或距上次落盘超过该秒数时写入偏移索引
+FLUSH_EVERY_ENTRIES = 64
+FLUSH_EVERY_SECONDS = 30
+
+# 进程退出时落盘所有仍在使用的缓存
+_open_caches: "weakref.WeakSet[EmbeddingCache]" = weakref.WeakSet()
+
+
+def _flush_all():
+    for cache in list(_open_caches):
+        cache.flush()
+
+
+atexit.register(_flush_all)
+
+
+def _try_lock(path: str):
+    """以非阻塞方式获取文件排他锁，成功时返回需保持打开的文件对象，被其他进程持有时返回None"""
+    f = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return f
+    except OSError:
+        f.close()
+        return None
+
+
+def normalize_text(text: str) -> str:
+    """缓存键使用的文本规范化：NFKC（全角转半角等）、去首尾空白、合并连续空白"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    持久化的嵌入向量缓存
+
+    键为 (模型名, 规范化文本的SHA-256)，每个模型一个目录：
+    - vectors.f16：float16向量矩阵，通过np.memmap映射，只有访问到的页会读入内存
+    - index.json：键 -> 行号的偏移索引，按最近使用顺序保存
+
+    缓存达到max_entries后按最近最少使用淘汰，被淘汰的行号留给新向量复用，文件不会无限增长。
+
+    行号分配和偏移索引只保存在进程内，多个进程同时写同一目录会互相覆盖行号，
+    因此只有取得目录中writer.lock排他锁的进程使用磁盘缓存（多工作进程部署时为最先启动的进程），
+    其他进程使用同样淘汰策略的进程内缓存，不读写磁盘文件。
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dir = os.path.join(cache_dir, re.sub(r"[^\w.-]+", "_", model_name))
+        self._lock = threading.Lock()
+
+        # 键 -> 行号，从最久未使用到最近使用排列
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+        self._lock_file = None
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            self._lock_file = _try_lock(os.path.join(self.dir, LOCK_FILE))
+        except OSError as e:
+            logger.warning(f"无法创建嵌入缓存目录，使用进程内缓存: {str(e)}")
+        self.persistent = self._lock_file is not None
+        if self.persistent:
+            self._load()
+        else:
+            logger.info(f"嵌入缓存目录已由其他进程使用，本进程使用进程内缓存: {self.dir}")
+        _open_caches.add(self)
+
+    # ---------- 持久化 ----------
+
+    def _load(self):
+        index_path = os.path.join(self.dir, INDEX_FILE)
+        vectors_path = os.path.join(self.dir, VECTORS_FILE)
+        if not (os.path.exists(index_path) and os.path.exists(vectors_path)):
+            return
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("model") != self.model_name:
+                logger.warning(f"嵌入缓存模型不匹配（{index.get('model')}），忽略已有缓存")
+                return
+            dim, capacity = index["dim"], index["capacity"]
+            if os.path.getsize(vectors_path) < dim * capacity * 2:
+                logger.warning("嵌入缓存向量文件不完整，忽略已有缓存")
+                return
+            self._vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+", shape=(capacity, dim))
+            self._dim, self._capacity = dim, capacity
+            self._slots = OrderedDict((key, slot) for key, slot in index["entries"])
+            used = set(self._slots.values())
+            self._free = [slot for slot in range(capacity - 1, -1, -1) if slot not in used]
+            embedding_cache_entries.set(len(self._slots), model=self.model_name)
+            logger.info(f"已加载嵌入缓存: {len(self._slots)} 条，模型 {self.model_name}")
+        except Exception as e:
+            logger.warning(f"加载嵌入缓存失败，将重新建立: {str(e)}")
+            self._slots, self._free, self._vectors = OrderedDict(), [], None
+            self._dim, self._capacity = None, 0
+
+    def flush(self):
+        """把向量和偏移索引写入磁盘"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """落盘并释放目录锁，之后其他缓存实例（包括其他进程）可以使用磁盘缓存"""
+        with self._lock:
+            self._flush_locked()
+            if self._lock_file is not None:
+                self._vectors = None
+                self._slots, self._free, self._dim, self._capacity = OrderedDict(), [], None, 0
+                self._lock_file.close()
+                self._lock_file = None
+                self.persistent = False
+
+    def _flush_locked(self):
+        if not self.persistent or self._vectors is None or not self._unflushed or not os.path.isdir(self.dir):
+            return
+        try:
+            # 先落盘向量再写索引，索引中的行号总是指向已写入的数据
+            self._vectors.flush()
+            index_path = os.path.join(self.dir, INDEX_FILE)
+            with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({
+                    "model": self.model_name,
+                    "dim": self._dim,
+                    "capacity": self._capacity,
+                    "entries": list(self._slots.items()),
+                }, f)
+            os.replace(index_path + ".tmp", index_path)
+            self._unflushed = 0
+            self._last_flush = time.monotonic()
+        except Exception as e:
+            logger.error(f"保存嵌入缓存失败: {str(e)}")
+
+    def _grow(self, dim: int):
+        """按倍数扩大向量文件（进程内缓存时为数组），上限为max_entries"""
+        capacity = min(self.max_entries, max(INITIAL_CAPACITY, self._capacity * 2))
+        if not self.persistent:
+            vectors = np.zeros((capacity, dim), dtype=np.float16)
+            if self._vectors is not None:
+                vectors[:self._capacity] = self._vectors
+            self._vectors = vectors
+            self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+            self._dim, self._capacity = dim, capacity
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        vectors_path = os.path.join(self.dir, VECTORS_FILE)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(vectors_path, "ab") as f:
+            f.truncate(capacity * dim * 2)
+        self._vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+", shape=(capacity, dim))
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._dim, self._capacity = dim, capacity
+
+    def _evict(self):
+        count = min(max(1, int(self.max_entries * EVICT_FRACTION)), len(self._slots))
+        for _ in range(count):
+            _, slot = self._slots.popitem(last=False)
+            self._free.append(slot)
+        self.evictions += count
+        embedding_cache_evictions_total.inc(count, model=self.model_name)
+
+    # ---------- 读写 ----------
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """查询一批文本的缓存向量，未命中的位置为None"""
+        keys = [text_key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is None:
+                    results.append(None)
+                    continue
+                self._slots.move_to_end(key)
+                results.append(np.asarray(self._vectors[slot], dtype=np.float32))
+            hits = sum(1 for vector in results if vector is not None)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        if hits:
+            embedding_cache_requests_total.inc(hits, model=self.model_name, result="hit")
+        if len(keys) - hits:
+            embedding_cache_requests_total.inc(len(keys) - hits, model=self.model_name, result="miss")
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray):
+        """写入一批文本的向量"""
+        if not len(texts):
+            return
+        vectors = np.asarray(vectors)
+        with self._lock:
+            if self._dim is not None and vectors.shape[1] != self._dim:
+                logger.warning(f"嵌入向量维度变化（{self._dim} -> {vectors.shape[1]}），不写入缓存")
+                return
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                slot = self._slots.get(key)
+                if slot is None:
+                    if not self._free:
+                        if self._capacity < self.max_entries:
+                            self._grow(vectors.shape[1])
+                        else:
+                            self._evict()
+                    slot = self._free.pop()
+                    self._slots[key] = slot
+                    self._unflushed += 1
+                else:
+                    self._slots.move_to_end(key)
+                self._vectors[slot] = vector
+            embedding_cache_entries.set(len(self._slots), model=self.model_name)
+            if self._unflushed >= FLUSH_EVERY_ENTRIES or time.monotonic() - self._last_flush >= FLUSH_EVERY_SECONDS:
+                self._flush_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "persistent": self.persistent,
+                "entries": len(self._slots),
+                "capacity": self._capacity,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._capacity * (self._dim or 0) * 2,
+            }
+
+    def __len__(self) -> int:
+        return len(self._slots)
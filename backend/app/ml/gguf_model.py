@@ -0,0 +1,120 @@
+from typing import List, Dict, Any
+import os
+import time
+import threading
+import logging
+
+from app.core.config import settings
+from app.ml.local_model import GENERATION_DEFAULTS, WARMUP_TOKENS
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class GGUFModelRunner:
+    """
+    llama.cpp（GGUF量化模型）的CPU推理
+
+    MODEL_PROVIDER=gguf 时替代 LocalModelRunner，MODEL_PATH 指向 .gguf 文件（如Q4_K_M量化）。
+    llama.cpp的int4/int8矩阵运算针对CPU的SIMD指令优化，速度远高于transformers在CPU上的浮点推理。
+    解码线程数取 MODEL_THREADS（0为物理核数，按逻辑核数的一半估计），提示词编码使用全部逻辑核。
+    llama-cpp-python在首次加载模型时才导入；前缀KV缓存使用llama.cpp自带的LlamaRAMCache，上限为 MODEL_PREFIX_CACHE_MB。
+    """
+
+    # 逐条生成，调度器不合并批次，每个请求生成完即返回
+    max_batch_size = 1
+
+    def __init__(
+        self,
+        model_path: str = None,
+        threads: int = None,
+        context_length: int = None,
+        prefix_cache_mb: int = None
+    ):
+        self.model_path = model_path or settings.MODEL_PATH
+        self.threads = threads if threads is not None else settings.MODEL_THREADS
+        self.context_length = context_length or settings.MODEL_CONTEXT_LENGTH
+        self.prefix_cache_mb = prefix_cache_mb if prefix_cache_mb is not None else settings.MODEL_PREFIX_CACHE_MB
+        # 与LocalModelRunner接口一致；前缀缓存由llama.cpp管理
+        self.prefix_cache = None
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._generate_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self):
+        """加载GGUF模型；已加载时直接返回"""
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            try:
+                from llama_cpp import Llama, LlamaRAMCache
+
+                cpu_count = os.cpu_count() or 1
+                threads = self.threads or max(1, cpu_count // 2)
+                logger.info(f"正在加载GGUF模型: {self.model_path}（{threads} 线程）")
+                start = time.perf_counter()
+                model = Llama(
+                    model_path=self.model_path,
+                    n_ctx=self.context_length,
+                    n_threads=threads,
+                    n_threads_batch=cpu_count,
+                    verbose=False
+                )
+                if self.prefix_cache_mb > 0:
+                    model.set_cache(LlamaRAMCache(capacity_bytes=self.prefix_cache_mb * 2 ** 20))
+                self.model = model
+                logger.info(f"GGUF模型加载完成，耗时 {time.perf_counter() - start:.1f}s")
+            except Exception as e:
+                logger.error(f"加载GGUF模型失败: {str(e)}")
+                raise RuntimeError(f"加载GGUF模型失败: {str(e)}")
+
+    def warm_up(self):
+        """加载模型并生成几个token，使首个真实请求不再承担初始化开销"""
+        self.load()
+        start = time.perf_counter()
+        self.generate([{"role": "user", "content": "你好"}], max_new_tokens=WARMUP_TOKENS, do_sample=False)
+        logger.info(f"GGUF模型预热完成，耗时 {time.perf_counter() - start:.2f}s")
+
+    def generate(self, messages: List[Dict[str, str]], **options: Any) -> Dict[str, Any]:
+        """
+        按对话消息生成回复，参数与LocalModelRunner.generate相同
+
+        Returns:
+            {"text", "prompt_tokens", "completion_tokens", "seconds"}
+        """
+        self.load()
+        params = dict(GENERATION_DEFAULTS, **options)
+        with self._generate_lock:
+            start = time.perf_counter()
+            completion = self.model.create_chat_completion(
+                messages=messages,
+                max_tokens=params["max_new_tokens"],
+                # 贪心解码对应温度0
+                temperature=params["temperature"] if params.get("do_sample") else 0.0,
+                top_p=params["top_p"],
+                repeat_penalty=params["repetition_penalty"],
+            )
+            seconds = time.perf_counter() - start
+
+        usage = completion.get("usage") or {}
+        return {
+            "text": (completion["choices"][0]["message"]["content"] or "").strip(),
+            "prompt_tokens": int(usage.get("prompt_tokens", 0)),
+            "completion_tokens": int(usage.get("completion_tokens", 0)),
+            "seconds": seconds,
+        }
+
+    def generate_batch(self, conversations: List[List[Dict[str, str]]], **options: Any) -> List[Dict[str, Any]]:
+        """
+        依次生成多段对话的回复
+
+        llama-cpp-python的高层接口一次只处理一个序列，批次内逐条生成；
+        连续的请求共享系统提示词前缀，由llama.cpp的前缀缓存复用。
+        """
+        return [self.generate(messages, **options) for messages in conversations]
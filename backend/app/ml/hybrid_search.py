@@ -0,0 +1,89 @@
+from typing import List, Dict, Any, Optional, Sequence
+import re
+import time
+import logging
+
+from app.core.metrics import registry
+from app.ml.knowledge_index import KnowledgeIndex, knowledge_search_duration_seconds, CANDIDATE_FACTOR
+from app.ml.keyword_index import KeywordIndex, normalize
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+knowledge_search_requests_total = registry.counter(
+    "knowledge_search_requests_total", "知识库检索次数，path为keyword（关键词直接命中）或hybrid", ("path",)
+)
+
+# RRF融合常数，取常用值60：排名靠前的结果得分差距不会过大
+RRF_K = 60
+# 不超过该长度且不含空白和标点的查询视为关键词查询（药名、食物名等）
+KEYWORD_QUERY_MAX_CHARS = 12
+_KEYWORD_QUERY = re.compile(r"^[\w\-.]+$")
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    按倒数排名融合（RRF）合并多路检索结果
+
+    每路结果按排名计分 1 / (k + 排名)，同一条目在多路中的得分相加。
+    融合后的结果保留该条目在最先出现的那一路中的字段（title、content等），score替换为融合得分。
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            item = fused.get(hit["id"])
+            if item is None:
+                item = fused[hit["id"]] = dict(hit, score=0.0)
+            item["score"] += 1.0 / (k + rank)
+    results = sorted(fused.values(), key=lambda item: item["score"], reverse=True)
+    for item in results:
+        item["score"] = round(item["score"], 6)
+    return results
+
+
+def is_keyword_query(query: str) -> bool:
+    normalized = normalize(query).strip()
+    return 0 < len(normalized) <= KEYWORD_QUERY_MAX_CHARS and bool(_KEYWORD_QUERY.match(normalized))
+
+
+class HybridKnowledgeSearch:
+    """
+    知识库混合检索：BM25关键词检索 + 向量检索，按RRF融合
+
+    - 关键词查询（如"二甲双胍"）且排名第一的条目原样包含该词时，直接返回关键词检索结果，不做向量化
+    - 其他查询两路各取若干候选后融合；向量索引尚未就绪时只用关键词检索结果
+    - 按标签过滤使用关键词索引维护的 标签 -> 条目 映射
+    """
+
+    def __init__(self, vector_index: KnowledgeIndex, keyword_index: KeywordIndex):
+        self.vector_index = vector_index
+        self.keyword_index = keyword_index
+
+    def search(self, query: str, limit: int = 3, tag: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        检索与查询最相关的知识库条目
+
+        Returns:
+            [{"id", "title", "content", "score"}]，向量检索命中的条目content为最相关的块，
+            只被关键词命中的条目content为包含查询词的片段
+        """
+        if limit <= 0 or not query.strip():
+            return []
+        candidates = limit * CANDIDATE_FACTOR
+
+        start = time.perf_counter()
+        keyword_hits = self.keyword_index.search(query, candidates, tag=tag)
+        knowledge_search_duration_seconds.observe(time.perf_counter() - start, stage="keyword")
+
+        if keyword_hits and is_keyword_query(query) and self.keyword_index.contains_phrase(keyword_hits[0]["id"], query):
+            knowledge_search_requests_total.inc(path="keyword")
+            return keyword_hits[:limit]
+
+        knowledge_search_requests_total.inc(path="hybrid")
+        vector_hits = self.vector_index.search(query, candidates)
+        if tag:
+            vector_hits = [hit for hit in vector_hits if self.keyword_index.has_tag(hit["id"], tag)]
+        if not vector_hits:
+            return keyword_hits[:limit]
+        # 向量检索的块通常比关键词片段更贴近问题，放在前面以便融合结果优先保留其content
+        return reciprocal_rank_fusion([vector_hits, keyword_hits])[:limit]
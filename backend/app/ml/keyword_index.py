@@ -0,0 +1,313 @@
+from typing import List, Dict, Any, Optional, Callable, Set, Iterable, Tuple
+import re
+import math
+import time
+import heapq
+import threading
+import unicodedata
+import logging
+from collections import Counter
+
+from app.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 字段权重：标题和标签中的词按出现次数乘以该权重计入词频（简化的BM25F）
+TITLE_WEIGHT = 3
+TAG_WEIGHT = 3
+# 返回给调用方的内容片段长度
+SNIPPET_LENGTH = 256
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[㐀-䶿一-鿿]+")
+
+
+def normalize(text: str) -> str:
+    """NFKC规范化（全角转半角）并转小写"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文按字切分为单字和相邻二字组合（字符n-gram），英文和数字按连续字母数字切分
+
+    不依赖分词词典，药名、食物名等专有名词也能按二字组合精确匹配。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(normalize(text)):
+        run = match.group()
+        if run[0] < "㐀":
+            tokens.append(run)
+            continue
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def query_terms(text: str) -> List[str]:
+    """
+    查询使用的词项：有二字组合时只用二字组合和英文词，避免"糖"这类高频单字遍历几乎全部文档；
+    单字查询才使用单字。
+    """
+    tokens = set(tokenize(text))
+    selective = [token for token in tokens if len(token) > 1 or token[0] < "㐀"]
+    return selective or list(tokens)
+
+
+class KeywordIndex:
+    """
+    知识库关键词倒排索引（BM25）
+
+    覆盖知识库条目的标题、内容和标签，常驻内存。药名、食物名等关键词查询只需查几个倒排表，
+    不需要向量化，耗时在亚毫秒级。同时维护 标签 -> 条目 的索引，供按标签过滤使用。
+    首次使用时从数据库同步构建，之后随知识库条目的增删改增量更新；
+    超过max_age秒后由一个请求线程从数据库重建（同步其他工作进程的修改），重建期间其他线程继续使用旧索引，
+    重建期间的增删改在新索引替换旧索引时重放。
+    """
+
+    def __init__(self, session_factory: Optional[Callable] = None, max_age: float = None):
+        self._session_factory = session_factory
+        self.max_age = max_age if max_age is not None else settings.KNOWLEDGE_KEYWORD_REBUILD_SECONDS
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self._built_at: Optional[float] = None
+        # 重建期间的增删改，重建完成后在新索引上重放
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+
+        # 词项 -> {条目ID: 加权词频}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # 条目ID -> 该条目的词频，删除和更新时用来撤销倒排表中的记录
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        # 条目ID -> BM25长度归一化项，依赖平均长度，条目变化后在下次检索时重新计算
+        self._norms: Optional[Dict[str, float]] = None
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._tags: Dict[str, Set[str]] = {}
+
+    # ---------- 构建 ----------
+
+    def ensure_built(self):
+        """首次使用时从数据库构建索引，超过max_age后重建"""
+        built_at = self._built_at
+        if built_at is not None and time.monotonic() - built_at <= self.max_age:
+            return
+        # 首次构建时等待；索引过期时只由一个线程重建，其他线程继续使用旧索引
+        if not self._rebuild_lock.acquire(blocking=built_at is None):
+            return
+        try:
+            if self._built_at is built_at:
+                self.rebuild()
+        finally:
+            self._rebuild_lock.release()
+
+    def _get_session(self):
+        if self._session_factory is None:
+            from app.db.session import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def rebuild(self) -> int:
+        """从数据库重建索引，返回条目数"""
+        from app.db.models import KnowledgeBase
+
+        with self._lock:
+            self._pending = []
+        db = self._get_session()
+        try:
+            entries = db.query(
+                KnowledgeBase.id, KnowledgeBase.title, KnowledgeBase.content, KnowledgeBase.tags
+            ).all()
+            # 在锁外构建新索引，期间查询继续使用旧索引
+            fresh = KeywordIndex(max_age=self.max_age)
+            for entry in entries:
+                fresh._add(entry.id, entry.title, entry.content, entry.tags or [])
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            for action, args in self._pending:
+                fresh._remove(args[0])
+                if action == "upsert":
+                    fresh._add(*args)
+            self._postings, self._doc_terms, self._doc_lengths = fresh._postings, fresh._doc_terms, fresh._doc_lengths
+            self._docs, self._tags, self._total_length = fresh._docs, fresh._tags, fresh._total_length
+            self._norms = None
+            self._pending = None
+            self._built_at = time.monotonic()
+        logger.info(f"已构建知识库关键词索引: {len(entries)} 条，{len(self._postings)} 个词项")
+        return len(entries)
+
+    def _add(self, doc_id: str, title: str, content: str, tags: Iterable[str]):
+        tags = [tag for tag in tags if tag]
+        terms = Counter(tokenize(content))
+        for token in tokenize(title):
+            terms[token] += TITLE_WEIGHT
+        for tag in tags:
+            for token in tokenize(tag):
+                terms[token] += TAG_WEIGHT
+            self._tags.setdefault(normalize(tag), set()).add(doc_id)
+
+        for token, frequency in terms.items():
+            self._postings.setdefault(token, {})[doc_id] = frequency
+        length = sum(terms.values())
+        self._doc_terms[doc_id] = terms
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+        self._norms = None
+        self._docs[doc_id] = {
+            "title": title,
+            "content": content,
+            "tags": tags,
+            "normalized": normalize(f"{title}\n{' '.join(tags)}\n{content}"),
+        }
+
+    def _remove(self, doc_id: str) -> bool:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        for token in terms:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+        for tag in self._docs[doc_id]["tags"]:
+            tagged = self._tags.get(normalize(tag))
+            if tagged is not None:
+                tagged.discard(doc_id)
+                if not tagged:
+                    del self._tags[normalize(tag)]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        self._norms = None
+        del self._docs[doc_id]
+        return True
+
+    # ---------- 增删改 ----------
+
+    def upsert(self, doc_id: str, title: str, content: str, tags: Optional[Iterable[str]] = None):
+        """添加或更新一条知识库条目"""
+        self.ensure_built()
+        with self._lock:
+            self._remove(doc_id)
+            self._add(doc_id, title, content, tags or [])
+            if self._pending is not None:
+                self._pending.append(("upsert", (doc_id, title, content, list(tags or []))))
+
+    def delete(self, doc_id: str) -> bool:
+        """删除一条知识库条目"""
+        self.ensure_built()
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("delete", (doc_id,)))
+            return self._remove(doc_id)
+
+    # ---------- 查询 ----------
+
+    def ids_with_tag(self, tag: str) -> Set[str]:
+        """带有指定标签的条目ID（标签比较忽略大小写和全半角）"""
+        self.ensure_built()
+        with self._lock:
+            return set(self._tags.get(normalize(tag), ()))
+
+    def key_terms(self, text: str, limit: int = 3) -> Set[str]:
+        """
+        文本中最有区分度的词项：在知识库中出现过的查询词项按IDF取前limit个
+
+        用于判断两个问题是否问的是同一对象（如不同的食物、药物），知识库中没有出现过的词项不计入。
+        """
+        self.ensure_built()
+        terms = query_terms(text)
+        with self._lock:
+            count = len(self._docs)
+            known = [
+                (math.log(1 + (count - len(self._postings[term]) + 0.5) / (len(self._postings[term]) + 0.5)), term)
+                for term in terms if term in self._postings
+            ]
+        return {term for _, term in heapq.nlargest(limit, known)}
+
+    def has_tag(self, doc_id: str, tag: str) -> bool:
+        with self._lock:
+            return doc_id in self._tags.get(normalize(tag), ())
+
+    def contains_phrase(self, doc_id: str, phrase: str) -> bool:
+        """条目的标题、标签或内容中是否原样包含该短语"""
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            return doc is not None and normalize(phrase).strip() in doc["normalized"]
+
+    def search(self, query: str, limit: int = 3, tag: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        BM25检索
+
+        Args:
+            query: 查询文本
+            limit: 返回的最大条目数
+            tag: 只返回带有该标签的条目
+
+        Returns:
+            [{"id", "title", "content"(包含查询词的片段), "score"}]，按得分降序
+        """
+        self.ensure_built()
+        terms = query_terms(query)
+        with self._lock:
+            count = len(self._docs)
+            if not terms or count == 0 or limit <= 0:
+                return []
+            allowed = self._tags.get(normalize(tag), set()) if tag else None
+            norms = self._get_norms()
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                weight = (BM25_K1 + 1) * math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight * frequency / (frequency + norms[doc_id])
+
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [
+                {
+                    "id": doc_id,
+                    "title": self._docs[doc_id]["title"],
+                    "content": self._snippet(self._docs[doc_id]["content"], query, terms),
+                    "score": round(score, 4)
+                }
+                for doc_id, score in top
+            ]
+
+    def _get_norms(self) -> Dict[str, float]:
+        """BM25中 k1 * (1 - b + b * 文档长度 / 平均长度)；调用方需持有锁"""
+        if self._norms is None:
+            scale = BM25_B / (self._total_length / len(self._docs))
+            self._norms = {
+                doc_id: BM25_K1 * (1 - BM25_B + scale * length)
+                for doc_id, length in self._doc_lengths.items()
+            }
+        return self._norms
+
+    @staticmethod
+    def _snippet(content: str, query: str, terms: List[str]) -> str:
+        """截取内容中第一次出现查询（或查询词项）附近的片段"""
+        if len(content) <= SNIPPET_LENGTH:
+            return content
+        normalized = normalize(content)
+        position = normalized.find(normalize(query).strip())
+        if position < 0:
+            positions = [p for p in (normalized.find(term) for term in terms) if p >= 0]
+            position = min(positions) if positions else 0
+        start = max(0, min(position - SNIPPET_LENGTH // 4, len(content) - SNIPPET_LENGTH))
+        return content[start:start + SNIPPET_LENGTH]
+
+    def __len__(self) -> int:
+        return len(self._docs)
@@ -0,0 +1,632 @@
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.ml.chunking import chunk_text
+from app.ml.embedding_cache import EmbeddingCache
+from app.ml.vector_store import VectorStore, create_vector_store
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 知识检索指标
+knowledge_search_duration_seconds = registry.histogram(
+    "knowledge_search_duration_seconds", "知识库检索各阶段耗时（秒），stage为embed、search或keyword", ("stage",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+knowledge_index_documents = registry.gauge(
+    "knowledge_index_documents", "知识库向量索引中的文档数"
+)
+knowledge_index_chunks = registry.gauge(
+    "knowledge_index_chunks", "知识库向量索引中的文本块数"
+)
+knowledge_ingest_chunks_total = registry.counter(
+    "knowledge_ingest_chunks_total", "写入索引时处理的文本块数，result为embedded、reused或unchanged", ("result",)
+)
+knowledge_ingest_chunks_per_second = registry.gauge(
+    "knowledge_ingest_chunks_per_second", "最近一次写入索引的吞吐（文本块/秒）", ("operation",)
+)
+
+# 索引状态
+STATE_UNINITIALIZED = "uninitialized"
+STATE_BUILDING = "building"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+META_FILE = "knowledge_meta.json"
+# 持久化格式版本，格式变化时旧文件会被忽略并重建
+INDEX_FORMAT_VERSION = 3
+
+# 初始化失败后重试间隔的上限（秒）
+MAX_RETRY_SECONDS = 3600
+
+# 每次送入嵌入模型的文本块数
+INGEST_BATCH_SIZE = 256
+# 同一文档的多个块可能同时命中，检索时先多取若干块再按文档去重
+CANDIDATE_FACTOR = 4
+
+EmbedFunction = Callable[[List[str]], np.ndarray]
+
+
+def load_sentence_transformer(model_name: str) -> EmbedFunction:
+    """加载本地CPU嵌入模型，返回输出L2归一化向量的函数"""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(texts: List[str]) -> np.ndarray:
+        return model.encode(
+            texts,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+
+    return embed
+
+
+def _ingest_stats(chunks: int, embedded: int, unchanged: int, seconds: float) -> Dict[str, Any]:
+    return {
+        "chunks": chunks,
+        "embedded": embedded,
+        "reused": chunks - embedded - unchanged,
+        "unchanged": unchanged,
+        "seconds": round(seconds, 3),
+        "chunks_per_sec": round(chunks / seconds, 1) if seconds > 0 else float(chunks),
+    }
+
+
+class KnowledgeIndex:
+    """
+    知识库向量索引
+
+    每个知识库条目按句子切分为相互重叠的文本块（见 app.ml.chunking），每块单独向量化，
+    检索时按块匹配、按条目去重，返回条目标题和最相关的文本块。
+
+    向量（已L2归一化）保存在进程内的VectorStore中，按余弦相似度取top-k，不需要额外的向量数据库进程。
+    检索后端由backend选择（见 app.ml.vector_store.BACKENDS）：默认ivf在块数较少时全量精确检索，
+    达到ivf_min_size后只扫描与查询最接近的nprobe个倒排列表；*_sq8后端以int8保存向量，内存约为1/4，
+    适合百万块以上的知识库；mmap为True时持久化文件以内存映射方式加载。
+
+    索引在首次使用时于后台线程初始化：优先加载向量目录中的持久化文件，
+    文件缺失、嵌入模型或分块参数变化、与数据库中的知识库条目不一致时，从数据库重建。
+    更新条目时只对内容哈希变化的块重新向量化。
+    """
+
+    def __init__(
+        self,
+        index_dir: str = None,
+        model_name: str = None,
+        embed_fn: Optional[EmbedFunction] = None,
+        session_factory: Optional[Callable] = None,
+        ivf_min_size: int = None,
+        nprobe: int = None,
+        chunk_size: int = None,
+        chunk_overlap: int = None,
+        cache: Optional[EmbeddingCache] = None,
+        backend: str = None,
+        mmap: bool = None,
+        retry_seconds: float = None
+    ):
+        self.index_dir = index_dir or settings.VECTOR_STORE_DIR
+        self.model_name = model_name or settings.EMBEDDING_MODEL
+        self._embed_fn = embed_fn
+        self._session_factory = session_factory
+        self.backend = backend or settings.KNOWLEDGE_INDEX_BACKEND
+        self._store_options = {
+            "ivf_min_size": settings.KNOWLEDGE_INDEX_IVF_MIN_SIZE if ivf_min_size is None else ivf_min_size,
+            "nprobe": nprobe or settings.KNOWLEDGE_INDEX_NPROBE,
+            "mmap": settings.KNOWLEDGE_INDEX_MMAP if mmap is None else mmap,
+        }
+        self.chunk_size = chunk_size or settings.KNOWLEDGE_CHUNK_SIZE
+        self.chunk_overlap = settings.KNOWLEDGE_CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+        # 嵌入缓存：重建索引、重复提问和重启后都不必重新推理已见过的文本。
+        # 首次向量化时才打开，导入模块（创建全局llm_service）时不创建目录、不占用写锁
+        self._cache = cache
+        self._cache_pending = cache is None and settings.EMBEDDING_CACHE_ENABLED
+        self._cache_lock = threading.Lock()
+
+        self.state = STATE_UNINITIALIZED
+        self.error: Optional[str] = None
+        # 初始化失败（如未安装sentence_transformers）后等待一段时间再重试，间隔逐次加倍，
+        # 避免每个请求都重新尝试并记录错误日志
+        self.retry_seconds = settings.KNOWLEDGE_INDEX_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # 初始化期间收到的增删操作，初始化完成后按顺序补上
+        self._pending: List[tuple] = []
+
+        # 每行一个文本块：_ids[row]为块ID（"<条目ID>#<块序号>"），_chunks[row]为块的元数据，
+        # 向量保存在_store的同一行
+        self._store = self._new_store()
+        self._size = 0
+        self._ids: List[str] = []
+        self._chunks: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}
+        # 条目ID -> {"title": 标题, "chunks": 块数}
+        self._parents: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def cache(self) -> Optional[EmbeddingCache]:
+        """嵌入缓存，首次访问时打开"""
+        if self._cache_pending:
+            with self._cache_lock:
+                if self._cache_pending:
+                    self._cache = EmbeddingCache(
+                        os.path.join(self.index_dir, "embedding_cache"), self.model_name,
+                        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES
+                    )
+                    self._cache_pending = False
+        return self._cache
+
+    def _new_store(self) -> VectorStore:
+        return create_vector_store(self.backend, **self._store_options)
+
+    # ---------- 初始化 ----------
+
+    def ensure_ready(self, timeout: float = 0) -> bool:
+        """
+        确保索引已初始化；首次调用时启动后台初始化线程
+
+        Args:
+            timeout: 等待初始化完成的最长秒数，0表示不等待
+
+        Returns:
+            索引是否可用
+        """
+        if self._ready.is_set():
+            return True
+        with self._lock:
+            if self.state == STATE_FAILED and time.monotonic() < self._retry_at:
+                return False
+            if self.state in (STATE_UNINITIALIZED, STATE_FAILED) and not (self._thread and self._thread.is_alive()):
+                self.state = STATE_BUILDING
+                self.error = None
+                self._thread = threading.Thread(target=self._initialize, name="knowledge-index-init", daemon=True)
+                self._thread.start()
+        if timeout:
+            self._ready.wait(timeout)
+        return self._ready.is_set()
+
+    def _initialize(self):
+        start = time.perf_counter()
+        try:
+            if self._embed_fn is None:
+                logger.info(f"正在加载嵌入模型: {self.model_name}")
+                self._embed_fn = load_sentence_transformer(self.model_name)
+
+            if not self._load():
+                self.rebuild()
+
+            with self._lock:
+                pending, self._pending = self._pending, []
+                for op, args in pending:
+                    getattr(self, f"_apply_{op}")(*args)
+                self.state = STATE_READY
+                self._failures = 0
+                self._ready.set()
+            if pending:
+                self._save()
+            logger.info(
+                f"知识库向量索引已就绪，共 {len(self._parents)} 条 {self._size} 块，"
+                f"耗时 {time.perf_counter() - start:.2f}s"
+            )
+        except Exception as e:
+            with self._lock:
+                self.state = STATE_FAILED
+                self.error = str(e)
+                delay = min(self.retry_seconds * 2 ** self._failures, MAX_RETRY_SECONDS)
+                self._failures += 1
+                self._retry_at = time.monotonic() + delay
+            logger.error(f"初始化知识库向量索引失败: {str(e)}，{delay:.0f}秒后重试")
+
+    def _get_session(self):
+        if self._session_factory is None:
+            from app.db.session import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def db_fingerprint(self) -> Dict[str, Any]:
+        """数据库中知识库条目的数量和最后更新时间，用于判断持久化索引和缓存的回答是否过期"""
+        from sqlalchemy import func
+        from app.db.models import KnowledgeBase
+
+        db = self._get_session()
+        try:
+            count, last_updated = db.query(
+                func.count(KnowledgeBase.id), func.max(KnowledgeBase.updated_at)
+            ).one()
+        finally:
+            db.close()
+        return {"count": count, "last_updated": last_updated.isoformat() if last_updated else None}
+
+    def _settings_signature(self) -> Dict[str, Any]:
+        """影响向量内容的参数，任一变化都需要重建索引"""
+        return {
+            "version": INDEX_FORMAT_VERSION,
+            "model": self.model_name,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "quantization": self._store.quantization,
+        }
+
+    def _load(self) -> bool:
+        """加载持久化的索引文件，不可用时返回False"""
+        vectors_path = VectorStore.data_path(self.index_dir)
+        meta_path = os.path.join(self.index_dir, META_FILE)
+        if not (os.path.exists(vectors_path) and os.path.exists(meta_path)):
+            logger.info("未找到持久化的知识库向量索引，将从数据库重建")
+            return False
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("signature") != self._settings_signature():
+                logger.info(f"嵌入模型或分块参数已变更（{meta.get('signature')}），将从数据库重建")
+                return False
+            if meta.get("fingerprint") != self.db_fingerprint():
+                logger.info("知识库条目与持久化索引不一致，将从数据库重建")
+                return False
+
+            store = self._new_store()
+            if not store.load(self.index_dir, len(meta["ids"])):
+                return False
+        except Exception as e:
+            logger.warning(f"加载知识库向量索引失败，将从数据库重建: {str(e)}")
+            return False
+
+        with self._lock:
+            self._set_rows(meta["ids"], meta["chunks"], meta["parents"], store)
+        return True
+
+    def rebuild(self) -> Dict[str, Any]:
+        """从数据库中的知识库条目重建索引，返回写入统计（块数、耗时、块/秒等）"""
+        from app.db.models import KnowledgeBase
+
+        start = time.perf_counter()
+        db = self._get_session()
+        try:
+            entries = db.query(KnowledgeBase.id, KnowledgeBase.title, KnowledgeBase.content).all()
+        finally:
+            db.close()
+
+        ids, chunks, texts = [], [], []
+        parents = {}
+        for entry in entries:
+            entry_chunks = self._split(entry.title, entry.content)
+            parents[entry.id] = {"title": entry.title, "chunks": len(entry_chunks)}
+            for i, (text, chunk_hash) in enumerate(entry_chunks):
+                ids.append(f"{entry.id}#{i}")
+                chunks.append({"parent_id": entry.id, "chunk_index": i, "text": text, "hash": chunk_hash})
+                texts.append(self._embedding_text(entry.title, text))
+
+        vectors = self._embed_batched(texts)
+        with self._lock:
+            self._replace(ids, chunks, parents, vectors)
+        self._save()
+        if self.cache is not None:
+            self.cache.flush()
+            logger.info(f"嵌入缓存统计: {self.cache.stats()}")
+
+        stats = _ingest_stats(len(ids), len(ids), 0, time.perf_counter() - start)
+        knowledge_ingest_chunks_total.inc(len(ids), result="embedded")
+        knowledge_ingest_chunks_per_second.set(stats["chunks_per_sec"], operation="rebuild")
+        logger.info(
+            f"已重建知识库向量索引: {len(entries)} 条 {stats['chunks']} 块，"
+            f"耗时 {stats['seconds']}s，{stats['chunks_per_sec']} 块/秒"
+        )
+        return stats
+
+    # ---------- 分块与向量化 ----------
+
+    def _split(self, title: str, content: str) -> List[Tuple[str, str]]:
+        """切分条目内容，返回 [(块文本, 块哈希)]；哈希覆盖标题，标题变化时所有块都需重新向量化"""
+        chunks = chunk_text(content, self.chunk_size, self.chunk_overlap) or [title]
+        return [
+            (text, hashlib.sha256(self._embedding_text(title, text).encode("utf-8")).hexdigest())
+            for text in chunks
+        ]
+
+    @staticmethod
+    def _embedding_text(title: str, text: str) -> str:
+        # 每块都带上标题，保证脱离上下文的块仍能匹配到主题
+        return f"{title}\n{text}"
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """向量化并L2归一化；命中嵌入缓存的文本不经过模型推理"""
+        if not texts:
+            return np.zeros((0, self._store.dim), dtype=np.float32)
+        if self.cache is None:
+            return self._infer(texts)
+
+        cached = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if not missing:
+            return np.stack(cached)
+        inferred = self._infer([texts[i] for i in missing])
+        self.cache.put_many([texts[i] for i in missing], inferred)
+        vectors = np.zeros((len(texts), inferred.shape[1]), dtype=np.float32)
+        for i, vector in zip(missing, inferred):
+            vectors[i] = vector
+        for i, vector in enumerate(cached):
+            if vector is not None:
+                vectors[i] = vector
+        return vectors
+
+    def _infer(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self._embed_fn(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _embed_batched(self, texts: List[str]) -> np.ndarray:
+        """
+        分批向量化
+
+        按长度排序后分批送入模型，同一批内长度接近，减少填充带来的无效计算；结果按原顺序返回。
+        """
+        if not texts:
+            return self._embed([])
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = None
+        start = time.perf_counter()
+        for offset in range(0, len(order), INGEST_BATCH_SIZE):
+            batch = order[offset:offset + INGEST_BATCH_SIZE]
+            batch_vectors = self._embed([texts[i] for i in batch])
+            if vectors is None:
+                vectors = np.zeros((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+            vectors[batch] = batch_vectors
+            done = offset + len(batch)
+            if len(order) > INGEST_BATCH_SIZE:
+                elapsed = time.perf_counter() - start
+                logger.info(f"向量化进度 {done}/{len(texts)}，{done / elapsed:.1f} 块/秒")
+        return vectors
+
+    # ---------- 存储 ----------
+
+    def _replace(
+        self,
+        ids: List[str],
+        chunks: List[Dict[str, Any]],
+        parents: Dict[str, Dict[str, Any]],
+        vectors: np.ndarray
+    ):
+        store = self._new_store()
+        store.reset(vectors)
+        self._set_rows(ids, chunks, parents, store)
+
+    def _set_rows(
+        self,
+        ids: List[str],
+        chunks: List[Dict[str, Any]],
+        parents: Dict[str, Dict[str, Any]],
+        store: VectorStore
+    ):
+        self._store = store
+        self._size = len(ids)
+        self._ids = list(ids)
+        self._chunks = list(chunks)
+        self._parents = dict(parents)
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+        self._update_gauges()
+
+    def _update_gauges(self):
+        knowledge_index_documents.set(len(self._parents))
+        knowledge_index_chunks.set(self._size)
+
+    def _save(self):
+        """原子写入索引文件（先写临时文件再替换）；在锁内取快照，写文件时不阻塞检索"""
+        with self._lock:
+            arrays = self._store.snapshot()
+            meta = {
+                "signature": self._settings_signature(),
+                "ids": list(self._ids),
+                "chunks": list(self._chunks),
+                "parents": dict(self._parents),
+            }
+        try:
+            meta["fingerprint"] = self.db_fingerprint()
+            with self._save_lock:
+                os.makedirs(self.index_dir, exist_ok=True)
+                meta_path = os.path.join(self.index_dir, META_FILE)
+                with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(meta, f, ensure_ascii=False)
+                VectorStore.write_snapshot(self.index_dir, arrays)
+                os.replace(meta_path + ".tmp", meta_path)
+        except Exception as e:
+            # 持久化失败不影响内存中的索引，下次启动时会从数据库重建
+            logger.error(f"保存知识库向量索引失败: {str(e)}")
+
+    def _put_row(self, chunk_id: str, chunk: Dict[str, Any], vector: np.ndarray):
+        """写入一个块，已存在则原地覆盖，否则追加"""
+        position = self._positions.get(chunk_id)
+        if position is None:
+            position = self._size
+            self._size += 1
+            self._ids.append(chunk_id)
+            self._chunks.append(chunk)
+            self._positions[chunk_id] = position
+        else:
+            self._chunks[position] = chunk
+        self._store.put(position, vector)
+
+    def _remove_row(self, chunk_id: str) -> bool:
+        position = self._positions.pop(chunk_id, None)
+        if position is None:
+            return False
+        # 用最后一行覆盖被删除的行，避免移动整个矩阵
+        last = self._size - 1
+        if position != last:
+            self._store.move(last, position)
+            self._ids[position] = self._ids[last]
+            self._chunks[position] = self._chunks[last]
+            self._positions[self._ids[position]] = position
+        self._ids.pop()
+        self._chunks.pop()
+        self._size = last
+        self._store.truncate(last)
+        return True
+
+    def _parent_rows(self, doc_id: str) -> List[int]:
+        parent = self._parents.get(doc_id)
+        if not parent:
+            return []
+        return [self._positions[f"{doc_id}#{i}"] for i in range(parent["chunks"])]
+
+    # ---------- 增删改 ----------
+
+    def upsert(self, doc_id: str, title: str, content: str) -> Dict[str, Any]:
+        """
+        添加或更新一条知识库条目，返回写入统计
+
+        只对内容哈希变化的块重新向量化：位置和内容都不变的块保持原样，
+        内容未变但位置移动的块（如在文章开头插入段落）复用已有向量。
+        索引尚未就绪时记录下来，在初始化完成后补上。
+        """
+        with self._lock:
+            if not self._ready.is_set():
+                self._pending.append(("upsert", (doc_id, title, content)))
+                self.ensure_ready()
+                return _ingest_stats(0, 0, 0, 0)
+        stats = self._apply_upsert(doc_id, title, content)
+        self._save()
+        return stats
+
+    def delete(self, doc_id: str) -> bool:
+        """删除一条知识库条目及其所有块"""
+        with self._lock:
+            if not self._ready.is_set():
+                self._pending.append(("delete", (doc_id,)))
+                self.ensure_ready()
+                return True
+            deleted = self._apply_delete(doc_id)
+        if deleted:
+            self._save()
+        return deleted
+
+    def _apply_upsert(self, doc_id: str, title: str, content: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        chunks = self._split(title, content)
+
+        # 在锁内取出可复用的向量，向量化在锁外进行，不阻塞检索
+        with self._lock:
+            known = {self._chunks[row]["hash"]: row for row in self._parent_rows(doc_id)}
+            vectors = {
+                chunk_hash: self._store.vector(known[chunk_hash])
+                for _, chunk_hash in chunks if chunk_hash in known
+            }
+        missing = {chunk_hash: text for text, chunk_hash in chunks if chunk_hash not in vectors}
+        embedded = self._embed_batched([self._embedding_text(title, text) for text in missing.values()])
+        vectors.update(zip(missing.keys(), embedded))
+
+        unchanged = 0
+        with self._lock:
+            previous = self._parents.get(doc_id, {}).get("chunks", 0)
+            for i, (text, chunk_hash) in enumerate(chunks):
+                chunk_id = f"{doc_id}#{i}"
+                position = self._positions.get(chunk_id)
+                if position is not None and self._chunks[position]["hash"] == chunk_hash:
+                    unchanged += 1
+                    continue
+                chunk = {"parent_id": doc_id, "chunk_index": i, "text": text, "hash": chunk_hash}
+                self._put_row(chunk_id, chunk, vectors[chunk_hash])
+            for i in range(len(chunks), previous):
+                self._remove_row(f"{doc_id}#{i}")
+            self._parents[doc_id] = {"title": title, "chunks": len(chunks)}
+
+            self._store.maybe_retrain()
+            self._update_gauges()
+
+        stats = _ingest_stats(len(chunks), len(missing), unchanged, time.perf_counter() - start)
+        knowledge_ingest_chunks_total.inc(stats["embedded"], result="embedded")
+        knowledge_ingest_chunks_total.inc(stats["reused"], result="reused")
+        knowledge_ingest_chunks_total.inc(stats["unchanged"], result="unchanged")
+        knowledge_ingest_chunks_per_second.set(stats["chunks_per_sec"], operation="upsert")
+        return stats
+
+    def _apply_delete(self, doc_id: str) -> bool:
+        if doc_id not in self._parents:
+            return False
+        for i in range(self._parents[doc_id]["chunks"]):
+            self._remove_row(f"{doc_id}#{i}")
+        del self._parents[doc_id]
+        self._update_gauges()
+        return True
+
+    # ---------- 检索 ----------
+
+    def search(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        检索与查询最相关的知识库条目
+
+        索引未就绪时触发后台初始化并立即返回空列表，不阻塞请求。
+        """
+        if not self.ensure_ready():
+            if self.state == STATE_FAILED:
+                logger.debug(f"知识库向量索引不可用（{self.error}），本次跳过知识检索")
+            else:
+                logger.info("知识库向量索引初始化中，本次跳过知识检索")
+            return []
+
+        start = time.perf_counter()
+        query_vector = self._embed([query])[0]
+        embedded = time.perf_counter()
+        knowledge_search_duration_seconds.observe(embedded - start, stage="embed")
+
+        results = self.search_vector(query_vector, limit)
+        knowledge_search_duration_seconds.observe(time.perf_counter() - embedded, stage="search")
+        return results
+
+    def embed_query(self, text: str) -> Optional[np.ndarray]:
+        """向量化一段查询文本；嵌入模型尚未就绪时返回None，不阻塞请求"""
+        if not self.ensure_ready():
+            return None
+        return self._embed([text])[0]
+
+    def search_vector(self, query_vector: np.ndarray, limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        按已归一化的查询向量检索（余弦相似度）
+
+        返回的每个结果对应一个知识库条目：content为该条目中最相关的块，score为该块的相似度。
+        """
+        if limit <= 0:
+            return []
+        with self._lock:
+            rows, scores = self._search_rows(query_vector, limit * CANDIDATE_FACTOR)
+            results = []
+            seen = set()
+            for row, score in zip(rows, scores):
+                chunk = self._chunks[row]
+                if chunk["parent_id"] in seen:
+                    continue
+                seen.add(chunk["parent_id"])
+                results.append({
+                    "id": chunk["parent_id"],
+                    "title": self._parents[chunk["parent_id"]]["title"],
+                    "content": chunk["text"],
+                    "chunk_index": chunk["chunk_index"],
+                    "score": float(score)
+                })
+                if len(results) == limit:
+                    break
+            return results
+
+    def _search_rows(self, query_vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回相似度最高的k个块的行号和相似度，按相似度降序；调用方需持有锁"""
+        return self._store.search(query_vector, k)
+
+    def __len__(self) -> int:
+        return len(self._parents)
@@ -0,0 +1,262 @@
+from typing import List, Dict, Any, Optional, Callable
+import time
+import asyncio
+import threading
+import logging
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.ml.reasoning import strip_reasoning
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+llm_queue_wait_seconds = registry.histogram(
+    "llm_queue_wait_seconds", "大模型请求等待并发名额的时间（秒）", ("model",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+llm_queue_depth = registry.gauge(
+    "llm_queue_depth", "等待并发名额的大模型请求数", ("model",)
+)
+llm_inflight_requests = registry.gauge(
+    "llm_inflight_requests", "正在执行的大模型请求数", ("model",)
+)
+llm_route_requests_total = registry.counter(
+    "llm_route_requests_total",
+    "按任务路由的大模型请求数，result为ok、saturated（排队已满）、timeout（等待超时）或error", ("task", "model", "result")
+)
+
+# 任务类型：alert（血糖预警）、quick_suggestion（即时饮食建议）为短文本，走小模型；advice（血糖管理建议）为长文本，走大模型
+TASK_ROUTES = {
+    "alert": "LLM_ROUTE_ALERT",
+    "quick_suggestion": "LLM_ROUTE_QUICK_SUGGESTION",
+    "advice": "LLM_ROUTE_ADVICE",
+}
+# 短文本任务不需要推理模型的思考过程，跳过后生成的token数和延迟大幅减少
+TASK_REASONING = {
+    "alert": False,
+    "quick_suggestion": False,
+    "advice": True,
+}
+
+
+class LLMUnavailableError(RuntimeError):
+    """路由中的所有模型都已饱和、超时或失败"""
+
+
+class OllamaProvider:
+    """Ollama中的一个模型"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.name = f"ollama:{model}"
+
+    def generate(
+        self, prompt: str, system: Optional[str], temperature: float, max_tokens: int, reasoning: bool = True
+    ) -> Dict[str, Any]:
+        from app.ml.ollama_service import ollama_service
+        response = ollama_service.generate_text(
+            prompt, model=self.model, system=system, temperature=temperature, max_tokens=max_tokens,
+            reasoning=reasoning
+        )
+        if not response["response"]:
+            # 生成长度在思考过程中用完，没有可用的回答
+            raise RuntimeError("模型未输出回答")
+        return {
+            "text": response["response"],
+            "prompt_tokens": response.get("prompt_eval_count", 0),
+            "completion_tokens": response.get("eval_count", 0),
+        }
+
+
+class LocalProvider:
+    """LLMService的本地模型（本进程或模型服务），与助手对话共用动态批处理"""
+
+    name = "local"
+
+    def generate(
+        self, prompt: str, system: Optional[str], temperature: float, max_tokens: int, reasoning: bool = True
+    ) -> Dict[str, Any]:
+        from app.ml.llm_service import llm_service
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        result = llm_service._generate(messages, max_new_tokens=max_tokens, temperature=temperature)
+        return {
+            "text": strip_reasoning(result["text"]),
+            "prompt_tokens": result["prompt_tokens"],
+            "completion_tokens": result["completion_tokens"],
+        }
+
+
+def create_provider(spec: str):
+    """按"ollama:<模型名>"或"local"创建提供者"""
+    spec = spec.strip()
+    if spec == "local":
+        return LocalProvider()
+    if spec.startswith("ollama:"):
+        return OllamaProvider(spec[len("ollama:"):])
+    raise ValueError(f"未知的模型: {spec}")
+
+
+class ModelSlot:
+    """
+    单个模型的并发名额和等待队列
+
+    同时最多max_concurrency个请求调用该模型，其余请求排队等待；排队数达到max_queue时视为饱和，新请求直接回退到下一个模型。
+    使用线程信号量，调用方在工作线程中阻塞等待，不依赖特定的事件循环。
+    """
+
+    def __init__(self, provider, max_concurrency: int, max_queue: int):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.inflight = 0
+
+    def acquire(self, timeout: float) -> Optional[str]:
+        """
+        等待并发名额
+
+        Returns:
+            None表示已获得名额，否则为未获得的原因（saturated或timeout）
+        """
+        model = self.provider.name
+        if self._semaphore.acquire(blocking=False):
+            llm_queue_wait_seconds.observe(0.0, model=model)
+        else:
+            with self._lock:
+                if self.waiting >= self.max_queue:
+                    return "saturated"
+                self.waiting += 1
+                llm_queue_depth.set(self.waiting, model=model)
+            start = time.perf_counter()
+            try:
+                acquired = self._semaphore.acquire(timeout=max(0.0, timeout))
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+                    llm_queue_depth.set(self.waiting, model=model)
+            llm_queue_wait_seconds.observe(time.perf_counter() - start, model=model)
+            if not acquired:
+                return "timeout"
+        with self._lock:
+            self.inflight += 1
+            llm_inflight_requests.set(self.inflight, model=model)
+        return None
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+            llm_inflight_requests.set(self.inflight, model=self.provider.name)
+        self._semaphore.release()
+
+
+class LLMRouter:
+    """
+    大模型请求的统一入口
+
+    按任务类型选择模型列表（LLM_ROUTE_*，逗号分隔，如"ollama:deepseek-r1:1.5b,local"），依次尝试：
+    模型排队已满、在截止时间前未获得并发名额或调用失败时回退到下一个模型，全部不可用时抛出LLMUnavailableError。
+    每个模型的并发数、排队上限和等待时间由LLM_MODEL_CONCURRENCY、LLM_MODEL_MAX_QUEUE和LLM_QUEUE_TIMEOUT_SECONDS控制，
+    等待时间、排队数、执行中请求数按模型记录到/metrics。
+    """
+
+    def __init__(
+        self,
+        routes: Optional[Dict[str, List[str]]] = None,
+        max_concurrency: int = None,
+        max_queue: int = None,
+        queue_timeout: float = None,
+        provider_factory: Callable[[str], Any] = create_provider
+    ):
+        if routes is None:
+            routes = {
+                task: [spec.strip() for spec in getattr(settings, name).split(",") if spec.strip()]
+                for task, name in TASK_ROUTES.items()
+            }
+        self.routes = routes
+        self.max_concurrency = max_concurrency or settings.LLM_MODEL_CONCURRENCY
+        self.max_queue = max_queue if max_queue is not None else settings.LLM_MODEL_MAX_QUEUE
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.LLM_QUEUE_TIMEOUT_SECONDS
+        self._provider_factory = provider_factory
+        self._slots: Dict[str, ModelSlot] = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, spec: str) -> ModelSlot:
+        with self._lock:
+            slot = self._slots.get(spec)
+            if slot is None:
+                slot = self._slots[spec] = ModelSlot(self._provider_factory(spec), self.max_concurrency, self.max_queue)
+            return slot
+
+    def complete_sync(
+        self,
+        task: str,
+        prompt: str,
+        system: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+        timeout: float = None,
+        reasoning: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        按任务路由生成文本（阻塞调用）
+
+        Args:
+            timeout: 排队等待的总截止时间（秒），默认queue_timeout；生成本身不受此限制
+            reasoning: 是否保留推理模型的思考过程，默认按TASK_REASONING；返回的文本总是去掉思考过程
+
+        Returns:
+            {"text", "model", "prompt_tokens", "completion_tokens", "fallback"(是否使用了非首选模型)}
+
+        Raises:
+            LLMUnavailableError: 所有模型都不可用
+        """
+        specs = self.routes.get(task)
+        if not specs:
+            raise ValueError(f"未配置任务 {task} 的模型路由")
+        if reasoning is None:
+            reasoning = TASK_REASONING.get(task, True)
+        deadline = time.perf_counter() + (timeout if timeout is not None else self.queue_timeout)
+        errors = []
+        for position, spec in enumerate(specs):
+            slot = self._slot(spec)
+            # 后面还有备选模型时不等到截止时间，留出回退的余地
+            remaining = deadline - time.perf_counter()
+            wait = remaining if position == len(specs) - 1 else remaining / 2
+            reason = slot.acquire(wait)
+            if reason is not None:
+                llm_route_requests_total.inc(task=task, model=spec, result=reason)
+                errors.append(f"{spec}: {reason}")
+                continue
+            try:
+                result = slot.provider.generate(prompt, system, temperature, max_tokens, reasoning)
+            except Exception as e:
+                llm_route_requests_total.inc(task=task, model=spec, result="error")
+                logger.warning(f"模型 {spec} 处理 {task} 失败，尝试下一个模型: {str(e)}")
+                errors.append(f"{spec}: {str(e)}")
+                continue
+            finally:
+                slot.release()
+            llm_route_requests_total.inc(task=task, model=spec, result="ok")
+            return dict(result, model=spec, fallback=position > 0)
+        raise LLMUnavailableError(f"任务 {task} 没有可用的模型（{'; '.join(errors)}）")
+
+    async def complete(self, task: str, prompt: str, **options: Any) -> Dict[str, Any]:
+        """complete_sync的异步版本，在线程池中排队和调用模型，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.complete_sync(task, prompt, **options))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各模型的执行中请求数和排队数"""
+        with self._lock:
+            return {
+                spec: {"inflight": slot.inflight, "waiting": slot.waiting, "max_concurrency": slot.max_concurrency}
+                for spec, slot in self._slots.items()
+            }
+
+
+# 全局路由实例
+llm_router = LLMRouter()
@@ -1,13 +1,20 @@
 from typing import List, Dict, Any, Tuple, Optional
 import os
+import re
 import json
+import math
+import time
 from datetime import datetime
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
 from app.core.config import settings
+from app.core.metrics import observe_llm_call
+from app.ml.knowledge_index import KnowledgeIndex
+from app.ml.keyword_index import KeywordIndex
+from app.ml.hybrid_search import HybridKnowledgeSearch
+from app.ml.response_cache import SemanticResponseCache
+from app.ml.local_model import create_model_runner
+from app.ml.model_server import ModelServerClient
+from app.ml.batching import create_batch_scheduler
+from app.ml.reasoning import strip_reasoning
 import logging
 
 # 配置日志
@@ -15,137 +22,82 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# 中日韩统一表意文字、兼容表意文字、中文标点和全角字符
+_CJK = re.compile(r"[\u3400-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """未加载分词器时估算token数：中文字符和全角标点各计1个，其余字符每4个计1个"""
+    text = text or ""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
 class LLMService:
     """大模型服务类，负责模型加载、推理和知识库管理"""
     
     def __init__(self):
         """初始化大模型服务"""
-        self.model = None
-        self.tokenizer = None
-        self.embedding_model = None
-        self.vector_db = None
-        self.knowledge_collection = None
+        # 配置了模型服务地址时通过本机socket请求独立的模型服务进程，否则在本进程内懒加载模型
+        self.model_client = ModelServerClient() if settings.MODEL_SERVER_ADDRESS else None
+        self.runner = None if self.model_client else create_model_runner()
+        # 本进程内推理时，并发请求同样经动态批处理合并后生成
+        self.scheduler = create_batch_scheduler(self.runner) if self.runner else None
+        # 知识库向量索引，首次检索时在后台初始化
+        self.knowledge_index = KnowledgeIndex()
+        # 知识库关键词索引（BM25），首次使用时从数据库构建
+        self.keyword_index = KeywordIndex()
+        self.knowledge_search = HybridKnowledgeSearch(self.knowledge_index, self.keyword_index)
+        # 相同或语义相近问题的回答缓存，与知识库共用嵌入模型
+        self.response_cache = SemanticResponseCache(
+            self.knowledge_index.embed_query,
+            threshold=settings.RESPONSE_CACHE_THRESHOLD,
+            ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            key_terms_fn=self.keyword_index.key_terms,
+            min_term_overlap=settings.RESPONSE_CACHE_MIN_TERM_OVERLAP,
+            version_fn=self.knowledge_index.db_fingerprint
+        ) if settings.RESPONSE_CACHE_ENABLED else None
         
-        # 不再初始化向量数据库，将在需要时初始化
-        # self._init_vector_db()
-        
-        # 懒加载模型，首次使用时才加载
-        logger.info("LLM服务初始化完成，模型将在首次使用时加载")
+        if self.model_client:
+            logger.info(f"LLM服务初始化完成，使用模型服务 {settings.MODEL_SERVER_ADDRESS}")
+        else:
+            # 懒加载模型，首次使用时才加载
+            logger.info("LLM服务初始化完成，模型将在首次使用时加载")
     
-    def _init_vector_db(self):
-        """初始化向量数据库"""
-        try:
-            # 确保向量数据库目录存在
-            os.makedirs(settings.VECTOR_STORE_DIR, exist_ok=True)
-            
-            # 初始化ChromaDB客户端
-            self.vector_db = chromadb.PersistentClient(path=settings.VECTOR_STORE_DIR)
-            
-            # 尝试加载embedding模型 - 使用更短的超时
-            try:
-                # 设置更短的超时时间
-                import urllib.request
-                import socket
-                socket.setdefaulttimeout(5)  # 减少到5秒超时
-                
-                # 创建一个简单的嵌入函数，暂不加载模型
-                # 仅在实际需要时再加载SentenceTransformer模型
-                self.embedding_model = None
-                
-                # 获取知识库集合，但不立即设置embedding_function
-                try:
-                    self.knowledge_collection = self.vector_db.get_collection(name="diabetes_knowledge")
-                    logger.info(f"已加载知识库集合，包含 {self.knowledge_collection.count()} 条记录")
-                except Exception:
-                    try:
-                        # 创建集合但暂不设置embedding_function
-                        self.knowledge_collection = self.vector_db.create_collection(name="diabetes_knowledge")
-                        logger.info("已创建新的知识库集合")
-                    except Exception as e:
-                        logger.error(f"创建知识库集合失败: {str(e)}")
-                        self.knowledge_collection = None
-            
-            except Exception as e:
-                logger.error(f"初始化知识库失败: {str(e)}")
-                self.embedding_model = None
-                self.knowledge_collection = None
-        
-        except Exception as e:
-            logger.error(f"初始化向量数据库失败: {str(e)}")
-            self.vector_db = None
-            self.knowledge_collection = None
+    def _generate(self, messages: List[Dict[str, str]], **options: Any) -> Dict[str, Any]:
+        """生成回复，返回 {"text", "prompt_tokens", "completion_tokens", ...}"""
+        if self.model_client is not None:
+            return self.model_client.generate(messages, **options)
+        return self.scheduler.submit(messages, **options)
     
-    def _load_model(self):
-        """加载大模型"""
-        if self.model is not None:
-            return
-        
-        try:
-            logger.info(f"正在加载模型: {settings.MODEL_PATH}")
-            
-            # 加载分词器
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                settings.MODEL_PATH, 
-                trust_remote_code=True
-            )
-            
-            # 根据量化设置加载模型
-            if settings.MODEL_QUANTIZATION == "int4":
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    settings.MODEL_PATH,
-                    torch_dtype=torch.float16,
-                    device_map=settings.MODEL_DEVICE,
-                    trust_remote_code=True,
-                    load_in_4bit=True
-                )
-            elif settings.MODEL_QUANTIZATION == "int8":
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    settings.MODEL_PATH,
-                    torch_dtype=torch.float16,
-                    device_map=settings.MODEL_DEVICE,
-                    trust_remote_code=True,
-                    load_in_8bit=True
-                )
-            else:
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    settings.MODEL_PATH,
-                    torch_dtype=torch.float16,
-                    device_map=settings.MODEL_DEVICE,
-                    trust_remote_code=True
-                )
-            
-            logger.info("模型加载完成")
-        
-        except Exception as e:
-            logger.error(f"加载模型失败: {str(e)}")
-            raise RuntimeError(f"加载模型失败: {str(e)}")
+    def model_status(self) -> Dict[str, Any]:
+        """模型状态：使用模型服务时为服务的health，否则为本进程内模型是否已加载"""
+        if self.model_client is not None:
+            return self.model_client.health()
+        return {"state": "ready" if self.runner.loaded else "not_loaded", "model": self.runner.model_path}
     
     def generate_response(
         self, 
         user_message: str, 
         user_context: Dict[str, Any] = None,
         knowledge_sources: List[Dict[str, Any]] = None,
-        history: List[Dict[str, str]] = None
+        history: List[Dict[str, str]] = None,
+        conversation_summary: Optional[str] = None
     ) -> Tuple[str, Optional[List[Dict[str, Any]]]]:
         """生成回复"""
         try:
-            # 检查是否可以加载模型
-            can_use_model = True
-            try:
-                # 懒加载模型
-                if self.model is None:
-                    self._load_model()
-            except Exception as e:
-                logger.error(f"加载模型失败: {str(e)}")
-                can_use_model = False
-            
-            # 如果无法加载模型，返回默认回复
-            if not can_use_model:
-                default_response = "很抱歉，智能助手目前无法使用。请稍后再试或联系管理员。"
-                return default_response, None
+            # 本进程内推理时先加载模型，无法加载时返回默认回复
+            if self.runner is not None:
+                try:
+                    self.runner.load()
+                except Exception as e:
+                    logger.error(f"加载模型失败: {str(e)}")
+                    default_response = "很抱歉，智能助手目前无法使用。请稍后再试或联系管理员。"
+                    return default_response, None
             
-            # 构建系统提示词
-            system_prompt = self._build_system_prompt(user_context, knowledge_sources)
+            # 构建系统提示词（固定说明+用户信息，同一用户的各轮对话相同）
+            system_prompt = self._build_system_prompt(user_context, conversation_summary)
             
             # 构建对话历史
             messages = [{"role": "system", "content": system_prompt}]
@@ -154,29 +106,24 @@ class LLMService:
             if history:
                 messages.extend(history)
             
-            # 添加当前用户消息
-            messages.append({"role": "user", "content": user_message})
-            
-            # 转换为模型输入格式
-            prompt = self.tokenizer.apply_chat_template(
-                messages, 
-                tokenize=False, 
-                add_generation_prompt=True
-            )
+            # 添加当前用户消息；每轮检索的知识放在最后，前面的系统提示词和历史可复用前缀KV缓存
+            messages.append({"role": "user", "content": self._build_user_message(user_message, knowledge_sources)})
             
             # 生成回复
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(settings.MODEL_DEVICE)
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=1024,
-                temperature=0.7,
-                top_p=0.9,
-                repetition_penalty=1.1,
-                do_sample=True
-            )
+            start_time = time.perf_counter()
+            try:
+                result = self._generate(messages)
+            except Exception:
+                observe_llm_call("local", settings.MODEL_NAME, "generate", time.perf_counter() - start_time, success=False)
+                raise
             
-            # 解码回复
-            response = self.tokenizer.decode(outputs[0][inputs.input_ids.shape[1]:], skip_special_tokens=True)
+            observe_llm_call(
+                "local", settings.MODEL_NAME, "generate", time.perf_counter() - start_time,
+                prompt_tokens=result["prompt_tokens"],
+                completion_tokens=result["completion_tokens"]
+            )
+            # 推理模型的思考过程不展示给用户
+            response = strip_reasoning(result["text"])
             
             # 返回回复和知识源
             return response.strip(), knowledge_sources
@@ -186,11 +133,7 @@ class LLMService:
             default_response = "很抱歉，我在处理您的问题时遇到了一些技术问题。请稍后再试或以不同方式提问。"
             return default_response, None
     
-    def _build_system_prompt(
-        self, 
-        user_context: Dict[str, Any] = None,
-        knowledge_sources: List[Dict[str, Any]] = None
-    ) -> str:
+    def _build_system_prompt(self, user_context: Dict[str, Any] = None, conversation_summary: Optional[str] = None) -> str:
         """构建系统提示词"""
         # 基础系统提示词
         system_prompt = """你是一个专业的糖尿病健康助理，名为"糖管家"。你的任务是帮助用户管理糖尿病，提供健康建议，解答相关问题。
@@ -202,7 +145,7 @@ class LLMService:
 5. 回答要简洁明了，突出重点
 """
         
-        # 添加用户上下文
+        # 添加用户上下文；此处使用的资料字段需与response_cache.PROFILE_FIELDS一致，否则不同资料的用户会共享缓存的回答
         if user_context:
             user_info = []
             if user_context.get("name"):
@@ -222,100 +165,137 @@ class LLMService:
             
             if user_info:
                 system_prompt += "\n\n用户信息：\n" + "\n".join(user_info)
+            
+            health_info = self._build_health_context(user_context)
+            if health_info:
+                system_prompt += "\n\n用户近期健康数据：\n" + "\n".join(health_info)
         
-        # 添加知识库内容
-        if knowledge_sources and len(knowledge_sources) > 0:
-            system_prompt += "\n\n相关知识：\n"
-            for i, source in enumerate(knowledge_sources, 1):
-                system_prompt += f"{i}. {source['title']}\n{source['content']}\n\n"
+        # 较早的对话并入的摘要
+        if conversation_summary:
+            system_prompt += "\n\n此前对话摘要：\n" + conversation_summary
         
         return system_prompt
     
-    def search_knowledge_base(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
-        """搜索知识库"""
-        try:
-            # 检查是否已初始化向量数据库，未初始化则先返回空结果
-            # 避免在每次搜索时都尝试初始化，减少不必要的延迟
-            if not self.knowledge_collection:
-                logger.warning("知识库未初始化，暂不支持知识检索")
-                return []
-            
-            # 搜索知识库
-            results = self.knowledge_collection.query(
-                query_texts=[query],
-                n_results=limit
+    def _build_health_context(self, user_context: Dict[str, Any]) -> List[str]:
+        """用户上下文快照中的近期血糖、饮食和用药，每项一行"""
+        lines = []
+        glucose = user_context.get("glucose")
+        if glucose:
+            latest = glucose["latest"]
+            lines.append(
+                f"近{glucose['days']}天血糖: 测量{glucose['count']}次，平均{glucose['average']} mmol/L，"
+                f"范围{glucose['min']}-{glucose['max']} mmol/L，达标率{glucose['in_range_percentage']}%，"
+                f"偏高{glucose['high_count']}次，偏低{glucose['low_count']}次；"
+                f"最近一次{latest['value']} mmol/L（{latest['measured_at'][:16].replace('T', ' ')}）"
             )
-            
-            # 处理结果
-            sources = []
-            if results and len(results["ids"]) > 0 and len(results["ids"][0]) > 0:
-                for i in range(len(results["ids"][0])):
-                    source = {
-                        "id": results["ids"][0][i],
-                        "title": results["metadatas"][0][i].get("title", "未知标题"),
-                        "content": results["documents"][0][i],
-                        "score": float(results["distances"][0][i]) if "distances" in results else 0.0
-                    }
-                    sources.append(source)
-            
-            return sources
+        meals = []
+        for meal in user_context.get("recent_meals") or []:
+            when = (meal.get("meal_time") or "")[:16].replace("T", " ")
+            foods = "、".join(meal.get("foods") or []) or "未记录食物"
+            meals.append(f"{when} {foods}（碳水{meal['total_carbs']:.0f}g）")
+        if meals:
+            lines.append("近期饮食: " + "；".join(meals))
+        medications = [f"{m['name']} {m['dosage']}" for m in user_context.get("medications") or []]
+        if medications:
+            lines.append("近期用药: " + "、".join(medications))
+        return lines
+    
+    def _build_user_message(self, user_message: str, knowledge_sources: List[Dict[str, Any]] = None) -> str:
+        """构建当前轮的用户消息，附上为本轮问题检索到的知识库内容"""
+        if not knowledge_sources:
+            return user_message
+        content = "相关知识：\n"
+        for i, source in enumerate(knowledge_sources, 1):
+            content += f"{i}. {source['title']}\n{source['content']}\n\n"
+        return content + f"用户问题：{user_message}"
+    
+    def count_tokens(self, text: str) -> int:
+        """统计文本的token数；本进程已加载transformers模型时用其分词器，否则按字符估算"""
+        tokenizer = getattr(self.runner, "tokenizer", None)
+        if tokenizer is None:
+            return estimate_tokens(text)
+        return len(tokenizer.encode(text or "", add_special_tokens=False))
+    
+    def summarize_conversation(self, previous_summary: Optional[str], turns: List[Dict[str, str]]) -> str:
+        """
+        把若干轮对话与已有摘要合并为新摘要
         
+        Raises:
+            生成失败时的异常，由调用方保留原摘要
+        """
+        dialogue = "\n".join(
+            f"{'用户' if turn['role'] == 'user' else '助手'}：{turn['content']}" for turn in turns
+        )
+        prompt = "请把以下糖尿病健康咨询对话整理为简洁的摘要，保留用户提到的身体状况、血糖数据、用药、饮食和运动情况以及助手给出的关键建议，不超过200字。\n\n"
+        if previous_summary:
+            prompt += f"已有摘要：\n{previous_summary}\n\n"
+        prompt += f"新的对话：\n{dialogue}\n\n只输出更新后的摘要。"
+        
+        start_time = time.perf_counter()
+        try:
+            result = self._generate(
+                [{"role": "user", "content": prompt}],
+                max_new_tokens=settings.ASSISTANT_SUMMARY_MAX_TOKENS,
+                do_sample=False
+            )
+        except Exception:
+            observe_llm_call("local", settings.MODEL_NAME, "summarize", time.perf_counter() - start_time, success=False)
+            raise
+        observe_llm_call(
+            "local", settings.MODEL_NAME, "summarize", time.perf_counter() - start_time,
+            prompt_tokens=result["prompt_tokens"],
+            completion_tokens=result["completion_tokens"]
+        )
+        return strip_reasoning(result["text"])
+    
+    def _invalidate_response_cache(self):
+        """知识库变化后缓存的回答可能已过时；其他进程中的缓存按知识库版本判断"""
+        if self.response_cache is not None:
+            self.response_cache.invalidate()
+    
+    def search_knowledge_base(self, query: str, limit: int = 3, tag: Optional[str] = None) -> List[Dict[str, Any]]:
+        """搜索知识库（关键词+向量混合检索）；向量索引尚在初始化时只返回关键词检索结果，不阻塞回复生成"""
+        try:
+            return self.knowledge_search.search(query, limit, tag=tag)
         except Exception as e:
             logger.error(f"搜索知识库失败: {str(e)}")
             return []
     
-    def add_to_knowledge_base(self, doc_id: str, title: str, content: str) -> bool:
+    def add_to_knowledge_base(self, doc_id: str, title: str, content: str, tags: Optional[List[str]] = None) -> bool:
         """添加文档到知识库"""
-        if not self.knowledge_collection:
-            logger.warning("知识库未初始化，无法添加文档")
-            return False
-        
         try:
-            # 添加文档
-            self.knowledge_collection.add(
-                ids=[doc_id],
-                documents=[content],
-                metadatas=[{"title": title, "updated_at": datetime.now().isoformat()}]
-            )
-            logger.info(f"已添加文档到知识库: {title}")
+            self.keyword_index.upsert(doc_id, title, content, tags)
+            self._invalidate_response_cache()
+            stats = self.knowledge_index.upsert(doc_id, title, content)
+            logger.info(f"已添加文档到知识库: {title}，{stats['chunks']} 块，{stats['chunks_per_sec']} 块/秒")
             return True
-        
         except Exception as e:
             logger.error(f"添加文档到知识库失败: {str(e)}")
             return False
     
-    def update_knowledge_base(self, doc_id: str, title: str, content: str) -> bool:
+    def update_knowledge_base(self, doc_id: str, title: str, content: str, tags: Optional[List[str]] = None) -> bool:
         """更新知识库中的文档"""
-        if not self.knowledge_collection:
-            logger.warning("知识库未初始化，无法更新文档")
-            return False
-        
         try:
-            # 更新文档
-            self.knowledge_collection.update(
-                ids=[doc_id],
-                documents=[content],
-                metadatas=[{"title": title, "updated_at": datetime.now().isoformat()}]
+            self.keyword_index.upsert(doc_id, title, content, tags)
+            self._invalidate_response_cache()
+            stats = self.knowledge_index.upsert(doc_id, title, content)
+            logger.info(
+                f"已更新知识库文档: {title}，{stats['chunks']} 块中重新向量化 {stats['embedded']} 块，"
+                f"复用 {stats['reused']} 块，未变 {stats['unchanged']} 块"
             )
-            logger.info(f"已更新知识库文档: {title}")
             return True
-        
         except Exception as e:
             logger.error(f"更新知识库文档失败: {str(e)}")
             return False
     
     def delete_from_knowledge_base(self, doc_id: str) -> bool:
         """从知识库中删除文档"""
-        if not self.knowledge_collection:
-            logger.warning("知识库未初始化，无法删除文档")
-            return False
-        
         try:
-            # 删除文档
-            self.knowledge_collection.delete(ids=[doc_id])
+            self.keyword_index.delete(doc_id)
+            self._invalidate_response_cache()
+            deleted = self.knowledge_index.delete(doc_id)
             logger.info(f"已从知识库删除文档: {doc_id}")
-            return True
-        
+            return deleted
         except Exception as e:
             logger.error(f"从知识库删除文档失败: {str(e)}")
             return False
@@ -0,0 +1,241 @@
+from typing import List, Dict, Any, Optional, Tuple
+import time
+import threading
+import logging
+
+from app.core.config import settings
+from app.ml.prefix_cache import PrefixCache, cache_nbytes, cache_length, crop_cache
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认生成参数
+GENERATION_DEFAULTS: Dict[str, Any] = {
+    "max_new_tokens": 1024,
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "repetition_penalty": 1.1,
+    "do_sample": True,
+}
+# 预热时生成的token数：只需走通一次前向计算，触发权重分页读入和算子初始化
+WARMUP_TOKENS = 4
+
+
+class LocalModelRunner:
+    """
+    本地transformers模型的加载和推理
+
+    torch和transformers在首次加载模型时才导入，不使用本地模型的进程（如连接模型服务的API进程）不占用这部分内存。
+    同一时刻只运行一个generate，多线程调用时按顺序执行；并发请求由BatchScheduler合并后通过generate_batch批量生成。
+    单条生成时复用前缀KV缓存（PrefixCache），系统提示词和对话历史中已计算过的部分不再重复编码；
+    左填充的批次中各行位置不同，不使用前缀缓存。
+    """
+
+    def __init__(
+        self,
+        model_path: str = None,
+        device: str = None,
+        quantization: str = None,
+        prefix_cache_mb: int = None
+    ):
+        self.model_path = model_path or settings.MODEL_PATH
+        self.device = device or settings.MODEL_DEVICE
+        self.quantization = quantization or settings.MODEL_QUANTIZATION
+        if prefix_cache_mb is None:
+            prefix_cache_mb = settings.MODEL_PREFIX_CACHE_MB
+        self.prefix_cache = PrefixCache(prefix_cache_mb * 2 ** 20) if prefix_cache_mb > 0 else None
+        self.model = None
+        self.tokenizer = None
+        self._load_lock = threading.Lock()
+        self._generate_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self):
+        """加载分词器和模型；已加载时直接返回"""
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            try:
+                import torch
+                from transformers import AutoTokenizer, AutoModelForCausalLM
+
+                logger.info(f"正在加载模型: {self.model_path}")
+                start = time.perf_counter()
+
+                # 加载分词器
+                tokenizer = AutoTokenizer.from_pretrained(self.model_path, trust_remote_code=True)
+
+                if self.device == "cpu":
+                    self.model = self._load_cpu_model(torch, AutoModelForCausalLM)
+                else:
+                    # 根据量化设置加载模型（bitsandbytes量化仅支持GPU）
+                    options = {
+                        "torch_dtype": torch.float16,
+                        "device_map": self.device,
+                        "trust_remote_code": True,
+                    }
+                    if self.quantization == "int4":
+                        options["load_in_4bit"] = True
+                    elif self.quantization == "int8":
+                        options["load_in_8bit"] = True
+                    self.model = AutoModelForCausalLM.from_pretrained(self.model_path, **options)
+                self.tokenizer = tokenizer
+
+                logger.info(f"模型加载完成，耗时 {time.perf_counter() - start:.1f}s")
+            except Exception as e:
+                logger.error(f"加载模型失败: {str(e)}")
+                raise RuntimeError(f"加载模型失败: {str(e)}")
+
+    def _load_cpu_model(self, torch, model_class):
+        """
+        CPU上加载模型
+
+        CPU没有高效的float16矩阵运算，按float32加载；bitsandbytes的int4/int8量化在CPU上不可用，
+        改为对线性层做PyTorch动态int8量化。MODEL_THREADS大于0时设置推理线程数。
+        需要更快的CPU推理时使用 MODEL_PROVIDER=gguf（llama.cpp）。
+        """
+        if settings.MODEL_THREADS > 0:
+            torch.set_num_threads(settings.MODEL_THREADS)
+        model = model_class.from_pretrained(self.model_path, torch_dtype=torch.float32, trust_remote_code=True)
+        model.eval()
+        if self.quantization in ("int4", "int8"):
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info("CPU推理：已对线性层做动态int8量化")
+        return model
+
+    def warm_up(self):
+        """加载模型并生成几个token，使首个真实请求不再承担初始化开销"""
+        self.load()
+        start = time.perf_counter()
+        self.generate([{"role": "user", "content": "你好"}], max_new_tokens=WARMUP_TOKENS, do_sample=False)
+        logger.info(f"模型预热完成，耗时 {time.perf_counter() - start:.2f}s")
+
+    def generate(self, messages: List[Dict[str, str]], **options: Any) -> Dict[str, Any]:
+        """
+        按对话消息生成回复
+
+        Args:
+            messages: [{"role", "content"}]，按模型的对话模板拼接
+            options: 覆盖GENERATION_DEFAULTS中的生成参数
+
+        Returns:
+            {"text", "prompt_tokens", "completion_tokens", "seconds"}
+        """
+        return self.generate_batch([messages], **options)[0]
+
+    def generate_batch(self, conversations: List[List[Dict[str, str]]], **options: Any) -> List[Dict[str, Any]]:
+        """
+        一次前向批量生成多段对话的回复
+
+        各对话的提示词左填充到相同长度后一起送入model.generate，生成参数对整批相同。
+        已生成结束符的行后续只补填充token，统计completion_tokens时不计入。
+
+        Returns:
+            与conversations一一对应的 [{"text", "prompt_tokens", "completion_tokens", "seconds"}]，seconds为整批耗时
+        """
+        self.load()
+        params = dict(GENERATION_DEFAULTS, **options)
+        if not params.get("do_sample"):
+            params.pop("temperature", None)
+            params.pop("top_p", None)
+
+        tokenizer = self.tokenizer
+        # 生成式模型需左填充，使各行的最后一个token对齐到同一位置
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token_id is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        prompts = [
+            tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            for messages in conversations
+        ]
+        if len(prompts) == 1 and self.prefix_cache is not None:
+            return [self._generate_with_prefix_cache(prompts[0], params)]
+
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+        with self._generate_lock:
+            start = time.perf_counter()
+            outputs = self.model.generate(**inputs, pad_token_id=tokenizer.pad_token_id, **params)
+            seconds = time.perf_counter() - start
+
+        padded_length = inputs.input_ids.shape[1]
+        results = []
+        for row, output in enumerate(outputs):
+            text, completion_tokens = self._decode_completion(output[padded_length:].tolist())
+            results.append({
+                "text": text,
+                "prompt_tokens": int(inputs.attention_mask[row].sum()),
+                "completion_tokens": completion_tokens,
+                "seconds": seconds,
+            })
+        return results
+
+    def _generate_with_prefix_cache(self, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """单条生成：从前缀缓存中取最长公共前缀的KV缓存，只计算其余的token，生成后缓存提示词和回复的KV"""
+        import torch
+
+        tokenizer = self.tokenizer
+        input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(self.device)
+        prompt_ids = input_ids[0].tolist()
+        with self._generate_lock:
+            start = time.perf_counter()
+            reused, cached = self.prefix_cache.lookup(prompt_ids)
+            options = {}
+            if cached is not None:
+                # 至少留一个token做前向计算以得到下一个token的分布
+                reused = min(reused, len(prompt_ids) - 1)
+                options["past_key_values"] = crop_cache(cached, reused)
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                pad_token_id=tokenizer.pad_token_id,
+                return_dict_in_generate=True,
+                **options,
+                **params
+            )
+            seconds = time.perf_counter() - start
+
+            # 缓存对象和旧式元组缓存都可以按前缀复用；模型不返回缓存时不保存
+            past_key_values = outputs.past_key_values
+            cached_length = cache_length(past_key_values) if past_key_values is not None else None
+            if cached_length:
+                self.prefix_cache.store(
+                    outputs.sequences[0][:cached_length].tolist(), past_key_values, cache_nbytes(past_key_values)
+                )
+        self.prefix_cache.record(len(prompt_ids), reused if cached is not None else 0)
+
+        text, completion_tokens = self._decode_completion(outputs.sequences[0][len(prompt_ids):].tolist())
+        return {
+            "text": text,
+            "prompt_tokens": len(prompt_ids),
+            "completion_tokens": completion_tokens,
+            "seconds": seconds,
+        }
+
+    def _decode_completion(self, generated: List[int]) -> Tuple[str, int]:
+        """解码生成的token，返回(文本, 截至结束符的token数)；结束符之后的填充token不计入"""
+        stop_ids = {self.tokenizer.eos_token_id, self.tokenizer.pad_token_id}
+        completion_tokens = len(generated)
+        for position, token in enumerate(generated):
+            if token in stop_ids:
+                completion_tokens = position + 1
+                break
+        text = self.tokenizer.decode(generated[:completion_tokens], skip_special_tokens=True)
+        return text.strip(), completion_tokens
+
+
+def create_model_runner(provider: str = None):
+    """
+    按MODEL_PROVIDER创建本地推理器
+
+    gguf为llama.cpp（GGUFModelRunner），其余为transformers（LocalModelRunner）
+    """
+    provider = provider or settings.MODEL_PROVIDER
+    if provider == "gguf":
+        from app.ml.gguf_model import GGUFModelRunner
+        return GGUFModelRunner()
+    return LocalModelRunner()
@@ -0,0 +1,278 @@
+from typing import List, Dict, Any, Optional, Tuple
+import os
+import hmac
+import json
+import time
+import socket
+import struct
+import hashlib
+import threading
+import logging
+
+from app.core.config import settings
+from app.ml.local_model import LocalModelRunner, create_model_runner
+from app.ml.batching import create_batch_scheduler
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 等待accept的连接数上限，并发请求时多余的连接会挂起
+LISTEN_BACKLOG = 128
+
+# 消息格式：4字节大端长度 + UTF-8 JSON；单条消息的长度上限
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+# 认证：服务端发送随机挑战，客户端返回 HMAC-SHA256(密钥, 挑战)
+CHALLENGE_BYTES = 32
+AUTH_TIMEOUT = 10.0
+
+# 早期版本的默认密钥是公开的，不能用于认证
+INSECURE_AUTHKEYS = {"", "diabetes-assistant-model-server"}
+
+# 模型服务状态
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """把"host:port"解析为(host, port)"""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def server_authkey() -> bytes:
+    """
+    连接认证密钥，API进程和模型服务使用同一个MODEL_SERVER_AUTHKEY
+
+    Raises:
+        RuntimeError: 未设置密钥或使用了公开的默认密钥
+    """
+    if settings.MODEL_SERVER_AUTHKEY in INSECURE_AUTHKEYS:
+        raise RuntimeError("未设置MODEL_SERVER_AUTHKEY，请在部署时生成随机密钥（如 openssl rand -hex 32）")
+    return hashlib.sha256(settings.MODEL_SERVER_AUTHKEY.encode("utf-8")).digest()
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("连接已关闭")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]):
+    """发送一条JSON消息"""
+    body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(FRAME_HEADER.pack(len(body)) + body)
+
+
+def recv_message(sock: socket.socket) -> Dict[str, Any]:
+    """
+    接收一条JSON消息；只解析JSON，不会像pickle那样执行任意代码
+
+    Raises:
+        EOFError: 对端关闭连接
+        ValueError: 消息过长或不是JSON对象
+    """
+    (size,) = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"消息过长: {size} 字节")
+    message = json.loads(_recv_exact(sock, size).decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("消息格式错误")
+    return message
+
+
+def _auth_digest(authkey: bytes, challenge: str) -> str:
+    return hmac.new(authkey, bytes.fromhex(challenge), hashlib.sha256).hexdigest()
+
+
+class ModelServer:
+    """
+    本地模型推理服务
+
+    独立进程中只加载一份模型，所有API工作进程通过本机socket发送请求：消息为带长度前缀的JSON，
+    每个连接先用共享密钥做HMAC挑战应答认证。
+    每个连接一个线程负责收发，生成请求进入BatchScheduler，并发的请求合并为批次由唯一的调度线程送入模型，
+    API进程不再加载模型，启动即可用，内存占用与工作进程数无关。
+    启动后在后台加载模型并预热，加载期间health请求返回loading状态。
+    """
+
+    def __init__(self, address: str = None, runner: LocalModelRunner = None, authkey: bytes = None):
+        self.authkey = authkey or server_authkey()
+        self.address = parse_address(address or settings.MODEL_SERVER_ADDRESS)
+        self.runner = runner or create_model_runner()
+        self.state = STATE_LOADING
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.served = 0
+        self.scheduler = create_batch_scheduler(self.runner)
+        self._listener: Optional[socket.socket] = None
+        self._stopped = threading.Event()
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        """开始监听并在后台加载模型；返回后即可接受连接"""
+        # 认证在各连接的线程中进行，慢速或异常的客户端不会阻塞accept
+        self._listener = socket.create_server(self.address, backlog=LISTEN_BACKLOG)
+        self.address = self._listener.getsockname()[:2]
+        threading.Thread(target=self._load, name="model-server-load", daemon=True).start()
+        threading.Thread(target=self._accept_loop, name="model-server-accept", daemon=True).start()
+        logger.info(f"模型服务已监听 {self.address[0]}:{self.address[1]}")
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self._stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopped.set()
+        self.scheduler.stop()
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except OSError:
+                pass
+
+    def _load(self):
+        try:
+            self.runner.warm_up()
+            self.state = STATE_READY
+        except Exception as e:
+            logger.error(f"模型服务加载模型失败: {str(e)}")
+            self.state = STATE_FAILED
+            self.error = str(e)
+
+    # ---------- 请求处理 ----------
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._listener.accept()
+            except Exception as e:
+                if self._stopped.is_set():
+                    return
+                logger.warning(f"模型服务接受连接失败: {str(e)}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _authenticate(self, conn: socket.socket) -> bool:
+        challenge = os.urandom(CHALLENGE_BYTES).hex()
+        conn.settimeout(AUTH_TIMEOUT)
+        send_message(conn, {"challenge": challenge})
+        answer = recv_message(conn).get("digest")
+        ok = isinstance(answer, str) and hmac.compare_digest(answer, _auth_digest(self.authkey, challenge))
+        send_message(conn, {"ok": ok})
+        conn.settimeout(None)
+        return ok
+
+    def _handle(self, conn: socket.socket):
+        try:
+            if not self._authenticate(conn):
+                raise ValueError("密钥不匹配")
+        except Exception as e:
+            # 认证失败只影响该连接
+            logger.warning(f"模型服务连接认证失败: {str(e)}")
+            conn.close()
+            return
+        try:
+            while True:
+                try:
+                    request = recv_message(conn)
+                except EOFError:
+                    return
+                send_message(conn, self._dispatch(request))
+        except Exception as e:
+            logger.warning(f"模型服务连接异常: {str(e)}")
+        finally:
+            conn.close()
+
+    def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "health":
+            return {"ok": True, "health": self.health()}
+        if op != "generate":
+            return {"ok": False, "error": f"未知操作: {op}"}
+        if self.state != STATE_READY:
+            return {"ok": False, "error": f"模型未就绪（{self.state}）{self.error or ''}"}
+
+        try:
+            result = self.scheduler.submit(request.get("messages") or [], **(request.get("options") or {}))
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        finally:
+            self.served += 1
+        return {"ok": True, "result": result}
+
+    def health(self) -> Dict[str, Any]:
+        """状态、模型、排队数、已处理请求数和前缀KV缓存的复用情况"""
+        prefix_cache = getattr(self.runner, "prefix_cache", None)
+        return {
+            "state": self.state,
+            "error": self.error,
+            "model": self.runner.model_path,
+            "queue_depth": self.scheduler.pending(),
+            "served": self.served,
+            "prefix_cache": prefix_cache.stats() if prefix_cache is not None else None,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+        }
+
+
+class ModelServerClient:
+    """API进程中连接模型服务的客户端，每次请求建立一个本机连接"""
+
+    def __init__(self, address: str = None, timeout: float = None, authkey: bytes = None):
+        self.address = parse_address(address or settings.MODEL_SERVER_ADDRESS)
+        self.timeout = timeout or settings.MODEL_SERVER_TIMEOUT
+        self.authkey = authkey or server_authkey()
+
+    def _request(self, request: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        conn = socket.create_connection(self.address, timeout=AUTH_TIMEOUT)
+        try:
+            challenge = recv_message(conn).get("challenge")
+            if not isinstance(challenge, str):
+                raise ValueError("模型服务认证消息格式错误")
+            send_message(conn, {"digest": _auth_digest(self.authkey, challenge)})
+            if not recv_message(conn).get("ok"):
+                raise ConnectionRefusedError("模型服务认证失败，请检查MODEL_SERVER_AUTHKEY")
+            conn.settimeout(timeout)
+            send_message(conn, request)
+            try:
+                return recv_message(conn)
+            except socket.timeout:
+                raise TimeoutError(f"模型服务在{timeout}秒内未响应")
+        finally:
+            conn.close()
+
+    def generate(self, messages: List[Dict[str, str]], **options: Any) -> Dict[str, Any]:
+        """
+        请求模型服务生成回复
+
+        Returns:
+            {"text", "prompt_tokens", "completion_tokens", "seconds", "batch_size", "queue_seconds"}
+
+        Raises:
+            RuntimeError: 模型服务不可用或生成失败
+        """
+        try:
+            response = self._request({"op": "generate", "messages": messages, "options": options}, self.timeout)
+        except (OSError, EOFError, ValueError) as e:
+            raise RuntimeError(f"无法连接模型服务: {str(e)}")
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error") or "模型服务生成失败")
+        return response["result"]
+
+    def health(self, timeout: float = 2.0) -> Dict[str, Any]:
+        """查询模型服务状态；无法连接时返回state为unavailable"""
+        try:
+            return self._request({"op": "health"}, timeout)["health"]
+        except Exception as e:
+            return {"state": "unavailable", "error": str(e)}
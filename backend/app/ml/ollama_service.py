@@ -1,15 +1,26 @@
 import httpx
 import json
 import logging
+import time
 from typing import Dict, List, Optional, Union, Any, Generator
 import ollama
 
+from app.core.config import settings
+from app.core.metrics import observe_llm_call
+from app.ml.reasoning import strip_reasoning, no_reasoning_prompt, is_reasoning_model
+from app.ml.single_flight import SingleFlight, normalize_prompt, request_key
+
 logger = logging.getLogger(__name__)
 
 class OllamaService:
-    """Ollama服务接口，用于与本地运行的Ollama服务进行交互"""
+    """
+    Ollama服务接口，用于与本地运行的Ollama服务进行交互
+    
+    generate_text和chat合并进行中的相同请求（模型、规范化后的提示词和生成参数都相同），
+    例如定时任务和用户页面同时生成同一条预警时只调用一次模型，节省的生成次数见/metrics的llm_singleflight_total
+    """
     
-    def __init__(self, base_url: str = "http://localhost:11434", default_model: str = "deepseek-r1:7b", lazy_connect: bool = True):
+    def __init__(self, base_url: str = None, default_model: str = "deepseek-r1:7b", lazy_connect: bool = True):
         """
         初始化Ollama服务
         
@@ -18,17 +29,18 @@ class OllamaService:
             default_model: 默认使用的模型名称
             lazy_connect: 是否延迟连接（仅在首次调用时连接）
         """
-        self.base_url = base_url
+        self.base_url = base_url or settings.OLLAMA_BASE_URL
         self.default_model = default_model
         self.client = None
         self.available = False
         self.initialized = False
+        self.single_flight = SingleFlight()
         
         # 如果不是延迟连接，则立即初始化
         if not lazy_connect:
             self._initialize_client()
         else:
-            logger.info(f"OllamaService配置完成，将在首次使用时尝试连接: {base_url}")
+            logger.info(f"OllamaService配置完成，将在首次使用时尝试连接: {self.base_url}")
     
     def _initialize_client(self):
         """初始化客户端连接"""
@@ -50,11 +62,20 @@ class OllamaService:
             logger.error(f"OllamaService初始化失败: {str(e)}")
             
     
-    async def generate(self, prompt: str, model: Optional[str] = None, 
+    @staticmethod
+    def _options(temperature: float, max_tokens: int, stop: Optional[List[str]] = None) -> Dict[str, Any]:
+        """生成参数，通过Ollama的options传递（num_predict即最大生成token数）"""
+        options = {"temperature": temperature, "num_predict": max_tokens}
+        if stop:
+            options["stop"] = list(stop)
+        return options
+    
+    def generate_text(self, prompt: str, model: Optional[str] = None,
                       system: Optional[str] = None, temperature: float = 0.7,
-                      max_tokens: int = 2000) -> Dict[str, Any]:
+                      max_tokens: int = 2000, stop: Optional[List[str]] = None,
+                      reasoning: bool = True) -> Dict[str, Any]:
         """
-        生成文本响应
+        同步生成文本响应，失败时抛出异常（供模型路由在工作线程中调用并据此回退）
         
         Args:
             prompt: 用户输入的提示词
@@ -62,9 +83,14 @@ class OllamaService:
             system: 系统提示词
             temperature: 温度参数，控制生成的随机性
             max_tokens: 最大生成的token数量
+            stop: 停止序列
+            reasoning: 为False时推理模型跳过思考过程直接回答（短文本任务）；返回的文本总是去掉思考过程
             
         Returns:
             包含生成文本的字典
+            
+        Raises:
+            RuntimeError: Ollama服务不可用或生成失败
         """
         # 延迟初始化
         if not self.initialized:
@@ -72,38 +98,77 @@ class OllamaService:
             
         # 检查服务是否可用
         if not self.available or self.client is None:
-            return self._create_error_response("Ollama服务不可用，请确保Ollama已启动")
+            raise RuntimeError("Ollama服务不可用，请确保Ollama已启动")
         
-        try:
-            model_name = model or self.default_model
-            logger.info(f"使用模型 {model_name} 生成回复，提示词: {prompt[:50]}...")
-            
-            # 构建请求参数
-            params = {
-                "model": model_name,
-                "prompt": prompt,
-                # 注意: ollama Python客户端不支持temperature参数
-                # "temperature": temperature,
-                # "max_tokens": max_tokens,
-            }
+        model_name = model or self.default_model
+        logger.info(f"使用模型 {model_name} 生成回复，提示词: {prompt[:50]}...")
+        
+        # 构建请求参数
+        params = {
+            "model": model_name,
+            "prompt": prompt,
+            "options": self._options(temperature, max_tokens, stop),
+        }
+        
+        if not reasoning and is_reasoning_model(model_name):
+            # raw模式不套用模型模板，由我们拼接并预填空的思考块
+            params["prompt"] = no_reasoning_prompt(prompt, system)
+            params["raw"] = True
+        elif system:
+            params["system"] = system
             
-            if system:
-                params["system"] = system
-                
+        def call():
             # 调用Ollama API
-            response = self.client.generate(**params)
+            start_time = time.perf_counter()
+            try:
+                response = self.client.generate(**params)
+            except Exception as e:
+                observe_llm_call("ollama", model_name, "generate", time.perf_counter() - start_time, success=False)
+                raise RuntimeError(f"Ollama生成失败: {str(e)}")
+            observe_llm_call(
+                "ollama", model_name, "generate", time.perf_counter() - start_time,
+                prompt_tokens=response.get("prompt_eval_count", 0),
+                completion_tokens=response.get("eval_count", 0)
+            )
             
             return {
-                "response": response["response"],
+                "response": strip_reasoning(response["response"]),
                 "model": model_name,
                 "total_duration": response.get("total_duration", 0),
                 "prompt_eval_count": response.get("prompt_eval_count", 0),
                 "eval_count": response.get("eval_count", 0)
             }
+        
+        key = request_key(
+            op="generate", model=model_name, prompt=normalize_prompt(params["prompt"]),
+            system=normalize_prompt(params.get("system")), options=params["options"], raw=params.get("raw", False)
+        )
+        return dict(self.single_flight.do(key, call, op="generate", model=model_name))
+    
+    async def generate(self, prompt: str, model: Optional[str] = None, 
+                      system: Optional[str] = None, temperature: float = 0.7,
+                      max_tokens: int = 2000, stop: Optional[List[str]] = None,
+                      reasoning: bool = True) -> Dict[str, Any]:
+        """
+        生成文本响应
+        
+        Args:
+            prompt: 用户输入的提示词
+            model: 使用的模型名称，如果为None则使用默认模型
+            system: 系统提示词
+            temperature: 温度参数，控制生成的随机性
+            max_tokens: 最大生成的token数量
+            stop: 停止序列
+            reasoning: 为False时推理模型跳过思考过程直接回答
             
+        Returns:
+            包含生成文本的字典；失败时为带error标记的字典
+        """
+        try:
+            return self.generate_text(prompt, model, system, temperature, max_tokens, stop, reasoning)
         except Exception as e:
-            logger.error(f"Ollama生成失败: {str(e)}")
-            return self._create_error_response(f"Ollama生成失败: {str(e)}")
+            logger.error(str(e))
+            return self._create_error_response(str(e))
     
     async def chat(self, messages: List[Dict[str, str]], model: Optional[str] = None,
                   system: Optional[str] = None, temperature: float = 0.7,
@@ -145,16 +210,34 @@ class OllamaService:
             params = {
                 "model": model_name,
                 "messages": chat_messages,
-                # 注意: ollama Python客户端不支持temperature参数
-                # "temperature": temperature,
-                # "max_tokens": max_tokens,
+                "options": self._options(temperature, max_tokens),
             }
             
-            # 调用Ollama API
-            response = self.client.chat(**params)
+            def call():
+                # 调用Ollama API
+                start_time = time.perf_counter()
+                try:
+                    response = self.client.chat(**params)
+                except Exception:
+                    observe_llm_call("ollama", model_name, "chat", time.perf_counter() - start_time, success=False)
+                    raise
+                observe_llm_call(
+                    "ollama", model_name, "chat", time.perf_counter() - start_time,
+                    prompt_tokens=response.get("prompt_eval_count", 0),
+                    completion_tokens=response.get("eval_count", 0)
+                )
+                return response
+            
+            key = request_key(
+                op="chat", model=model_name, options=params["options"],
+                messages=[(m.get("role"), normalize_prompt(m.get("content"))) for m in chat_messages]
+            )
+            response = self.single_flight.do(key, call, op="chat", model=model_name)
             
+            message = dict(response["message"])
+            message["content"] = strip_reasoning(message.get("content", ""))
             return {
-                "message": response["message"],
+                "message": message,
                 "model": model_name,
                 "total_duration": response.get("total_duration", 0),
                 "prompt_eval_count": response.get("prompt_eval_count", 0),
@@ -198,9 +281,7 @@ class OllamaService:
             params = {
                 "model": model_name,
                 "prompt": prompt,
-                # 注意: ollama Python客户端不支持temperature参数
-                # "temperature": temperature,
-                # "max_tokens": max_tokens,
+                "options": self._options(temperature, max_tokens),
                 "stream": True
             }
             
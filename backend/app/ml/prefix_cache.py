@@ -0,0 +1,162 @@
+from typing import Sequence, Tuple, Any, Optional, Dict
+import copy
+import threading
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.metrics import registry
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+llm_prompt_tokens_total = registry.counter(
+    "llm_prompt_tokens_total", "本地模型处理的提示词token数，source为cached（复用前缀KV缓存）或computed", ("source",)
+)
+llm_prefix_cache_bytes = registry.gauge(
+    "llm_prefix_cache_bytes", "前缀KV缓存占用的内存（字节）"
+)
+
+# 公共前缀短于该token数时不复用：拷贝缓存的开销接近重新计算
+PREFIX_MIN_TOKENS = 16
+
+
+def common_prefix_length(a: np.ndarray, b: np.ndarray) -> int:
+    """两个token序列的最长公共前缀长度"""
+    n = min(len(a), len(b))
+    if n == 0:
+        return 0
+    diff = np.flatnonzero(a[:n] != b[:n])
+    return int(diff[0]) if len(diff) else n
+
+
+def cache_nbytes(past_key_values) -> int:
+    """transformers KV缓存（逐层的(key, value)）占用的字节数"""
+    total = 0
+    for layer in past_key_values:
+        for tensor in layer:
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def cache_length(past_key_values) -> Optional[int]:
+    """
+    KV缓存覆盖的token数
+
+    支持transformers的Cache对象（DynamicCache，get_seq_length）和旧式元组缓存
+    （逐层的(key, value)，形状为[batch, heads, seq, dim]）；不认识的格式返回None
+    """
+    if hasattr(past_key_values, "get_seq_length"):
+        return int(past_key_values.get_seq_length())
+    if isinstance(past_key_values, (tuple, list)) and past_key_values and len(past_key_values[0]) == 2:
+        return int(past_key_values[0][0].shape[-2])
+    return None
+
+
+def crop_cache(past_key_values, length: int):
+    """
+    返回截断到前length个token的KV缓存，不修改传入的缓存
+
+    Cache对象在generate中会被原地追加，需拷贝后crop；旧式元组缓存在generate中不会被修改，切片即可，不拷贝张量
+    """
+    if hasattr(past_key_values, "crop"):
+        cropped = copy.deepcopy(past_key_values)
+        cropped.crop(length)
+        return cropped
+    return tuple(
+        (key[..., :length, :], value[..., :length, :])
+        for key, value in past_key_values
+    )
+
+
+class PrefixCache:
+    """
+    提示词前缀的KV缓存
+
+    以token序列为键保存模型计算过的KV缓存（提示词及生成的回复）。新请求在所有条目中找最长公共前缀，
+    调用方拷贝该条目并截断到公共前缀长度后传给generate，只需对其余token做前向计算：
+    - 各对话共享同一段系统提示词，任一条目都能复用这部分
+    - 同一对话的下一轮以上一轮的提示词和回复开头，只需计算新增的消息
+    按最近使用淘汰，总占用不超过max_bytes；新条目以某个旧条目为前缀时替换该旧条目。
+    """
+
+    def __init__(self, max_bytes: int, min_tokens: int = PREFIX_MIN_TOKENS):
+        self.max_bytes = max_bytes
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+        # 序列字节 -> (token数组, KV缓存, 字节数)，按最近使用排列
+        self._entries: "OrderedDict[bytes, Tuple[np.ndarray, Any, int]]" = OrderedDict()
+        self.nbytes = 0
+        self.reused_tokens = 0
+        self.computed_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, ids: Sequence[int]) -> Tuple[int, Optional[Any]]:
+        """
+        查找与ids公共前缀最长的缓存
+
+        Returns:
+            (公共前缀长度, KV缓存)；没有达到min_tokens的公共前缀时为(0, None)。
+            返回的KV缓存可能长于公共前缀，且由缓存持有，调用方需拷贝后再截断使用
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        best_key, best_length = None, 0
+        with self._lock:
+            for key, (entry_ids, _, _) in self._entries.items():
+                length = common_prefix_length(entry_ids, ids)
+                if length > best_length:
+                    best_key, best_length = key, length
+            if best_key is None or best_length < self.min_tokens:
+                return 0, None
+            self._entries.move_to_end(best_key)
+            return best_length, self._entries[best_key][1]
+
+    def record(self, total_tokens: int, reused_tokens: int):
+        """统计一次生成中复用和重新计算的提示词token数"""
+        computed = total_tokens - reused_tokens
+        with self._lock:
+            self.reused_tokens += reused_tokens
+            self.computed_tokens += computed
+        llm_prompt_tokens_total.inc(reused_tokens, source="cached")
+        llm_prompt_tokens_total.inc(computed, source="computed")
+
+    def store(self, ids: Sequence[int], past_key_values: Any, nbytes: int) -> bool:
+        """保存ids对应的KV缓存；单条超过max_bytes或短于min_tokens时不保存"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if nbytes > self.max_bytes or len(ids) < self.min_tokens:
+            return False
+        with self._lock:
+            # 已被新条目完整包含的旧条目不再有用
+            for key in [
+                key for key, (entry_ids, _, _) in self._entries.items()
+                if len(entry_ids) <= len(ids) and common_prefix_length(entry_ids, ids) == len(entry_ids)
+            ]:
+                self.nbytes -= self._entries.pop(key)[2]
+            self._entries[ids.tobytes()] = (ids, past_key_values, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+            llm_prefix_cache_bytes.set(self.nbytes)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            llm_prefix_cache_bytes.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """条目数、占用内存和提示词token的复用比例"""
+        with self._lock:
+            total = self.reused_tokens + self.computed_tokens
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "reused_tokens": self.reused_tokens,
+                "computed_tokens": self.computed_tokens,
+                "reuse_rate": round(self.reused_tokens / total, 4) if total else 0.0,
+            }
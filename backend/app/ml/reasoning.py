@@ -0,0 +1,42 @@
+import re
+
+# deepseek-r1等推理模型在回答前输出的思考过程
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.S)
+_THINK_CLOSE = "</think>"
+_THINK_OPEN = "<think>"
+
+# deepseek-r1的对话模板标记；在助手回复开头预先填入空的思考块，模型直接输出回答
+_R1_USER = "<｜User｜>"
+_R1_ASSISTANT = "<｜Assistant｜>"
+_EMPTY_THINK = "<think>\n\n</think>\n\n"
+
+
+def is_reasoning_model(model: str) -> bool:
+    """是否为会输出<think>思考过程的推理模型"""
+    return "deepseek-r1" in (model or "").lower()
+
+
+def strip_reasoning(text: str) -> str:
+    """
+    去掉回复中的思考过程，只保留最终回答
+
+    - 完整的<think>...</think>块直接删除
+    - 只有</think>（模板已在提示词中写入<think>）时取其后的内容
+    - 只有<think>（生成长度用完时思考尚未结束）时没有可用的回答，返回空字符串
+    """
+    text = _THINK_BLOCK.sub("", text or "")
+    if _THINK_CLOSE in text:
+        text = text.rsplit(_THINK_CLOSE, 1)[1]
+    if _THINK_OPEN in text:
+        text = text.split(_THINK_OPEN, 1)[0]
+    return text.strip()
+
+
+def no_reasoning_prompt(prompt: str, system: str = None) -> str:
+    """
+    构造跳过思考过程的原始提示词（用于Ollama的raw模式）
+
+    按deepseek-r1的对话模板拼接，并在助手回复开头填入空的<think></think>，
+    模型认为思考已结束，直接生成回答；适合预警、即时建议等短文本任务。
+    """
+    return f"{system or ''}{_R1_USER}{prompt}{_R1_ASSISTANT}{_EMPTY_THINK}"
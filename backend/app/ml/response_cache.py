@@ -0,0 +1,311 @@
+from typing import List, Dict, Any, Optional, Callable, Set
+import re
+import time
+import threading
+import unicodedata
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.metrics import registry
+from app.ml.keyword_index import query_terms
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+response_cache_requests_total = registry.counter(
+    "assistant_response_cache_requests_total",
+    "助手回复语义缓存查询次数，result为hit、miss或skip（嵌入模型未就绪）", ("result",)
+)
+response_cache_saved_seconds_total = registry.counter(
+    "assistant_response_cache_saved_seconds_total", "语义缓存命中节省的回复生成耗时（秒）"
+)
+response_cache_entries = registry.gauge(
+    "assistant_response_cache_entries", "助手回复语义缓存中的回答数"
+)
+
+# 问题末尾可忽略的标点和语气词
+_TRAILING = re.compile(r"[\s?？!！。.,，~～吗呢呀啊吧]+$")
+# LLMService._build_system_prompt写入系统提示词的用户资料字段；其中任一字段不同的用户都可能得到不同的回答
+PROFILE_FIELDS = (
+    "name", "gender", "age", "diabetes_type", "height", "weight", "target_glucose_min", "target_glucose_max"
+)
+
+
+def normalize_question(question: str) -> str:
+    """NFKC规范化、转小写、去掉空白和句末标点/语气词，用于精确匹配"""
+    text = unicodedata.normalize("NFKC", question or "").lower()
+    text = re.sub(r"\s+", "", text)
+    return _TRAILING.sub("", text)
+
+
+def context_class(user_context: Optional[Dict[str, Any]]) -> str:
+    """
+    用户上下文分类：系统提示词中的全部用户资料字段
+
+    只有这些字段完全相同（提示词相同）的用户才共享缓存的回答，
+    不会把按某个用户的体重、目标血糖范围等生成的回答返回给其他用户。
+    提示词省略空字段，因此空值统一视为未填写。
+    """
+    user_context = user_context or {}
+    return "|".join(str(user_context.get(field) or "") for field in PROFILE_FIELDS)
+
+
+class SemanticResponseCache:
+    """
+    助手回复的语义缓存
+
+    对规范化后的问题向量化，在同一用户上下文分类（资料相同）的近期回答中查找余弦相似度不低于threshold的问题，
+    命中时直接返回缓存的回答和知识来源，不再检索知识库和运行大模型。
+    嵌入向量对"X能吃吗"和"Y能吃吗"这类只差一个对象的问题相似度也很高，因此语义命中还要求：
+    两个问题的词项（二字组合）Jaccard重合度不低于min_term_overlap，且key_terms_fn给出的关键词项
+    （知识库中最有区分度的词项，如食物名、药名）相同。
+    回答在ttl_seconds后过期。为避免返回基于旧知识的回答，每条回答记录写入时的知识库版本（version_fn，
+    如数据库中条目数和最后更新时间），查询时版本不同即视为过期，其他进程修改知识库后同样生效；
+    本进程修改知识库时还会立即整体清空（invalidate）。
+    所有分类合计最多保留max_entries条，超出时淘汰最早写入的。
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], Optional[np.ndarray]],
+        threshold: float = 0.92,
+        ttl_seconds: float = 86400,
+        max_entries: int = 2000,
+        key_terms_fn: Optional[Callable[[str], Set[str]]] = None,
+        min_term_overlap: float = 0.6,
+        version_fn: Optional[Callable[[], Any]] = None
+    ):
+        self._embed_fn = embed_fn
+        self._key_terms_fn = key_terms_fn
+        self._version_fn = version_fn
+        self.threshold = threshold
+        self.min_term_overlap = min_term_overlap
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # 分类 -> {规范化问题: 条目}，按写入顺序排列
+        self._entries: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        # 分类 -> (问题列表, 向量矩阵)，条目变化后置为None，下次查询时重新堆叠
+        self._matrices: Dict[str, Optional[tuple]] = {}
+        # 所有分类的 (分类, 规范化问题)，按写入顺序排列，用于容量淘汰
+        self._order: "OrderedDict[tuple, None]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.skips = 0
+        self.saved_seconds = 0.0
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            return self._embed_fn(text)
+        except Exception as e:
+            logger.warning(f"语义缓存向量化失败: {str(e)}")
+            return None
+
+    def _key_terms(self, text: str) -> Optional[Set[str]]:
+        if self._key_terms_fn is None:
+            return None
+        try:
+            return set(self._key_terms_fn(text))
+        except Exception as e:
+            logger.warning(f"语义缓存提取关键词项失败: {str(e)}")
+            return None
+
+    def version(self) -> Any:
+        """当前知识库版本；未配置version_fn时为0，查询失败时为None（本次不使用缓存）"""
+        if self._version_fn is None:
+            return 0
+        try:
+            return self._version_fn()
+        except Exception as e:
+            logger.warning(f"语义缓存查询知识库版本失败: {str(e)}")
+            return None
+
+    def _same_subject(self, terms: Set[str], key_terms: Optional[Set[str]], entry: Dict[str, Any]) -> bool:
+        """语义相近的两个问题是否问的是同一对象：词项重合度足够且关键词项相同"""
+        union = terms | entry["terms"]
+        if union and len(terms & entry["terms"]) / len(union) < self.min_term_overlap:
+            return False
+        if key_terms is not None and entry["key_terms"] is not None and key_terms != entry["key_terms"]:
+            return False
+        return True
+
+    def _matrix(self, cls: str):
+        cached = self._matrices.get(cls)
+        if cached is None:
+            entries = self._entries.get(cls)
+            if not entries:
+                return [], None
+            keys = list(entries.keys())
+            vectors = np.stack([entries[key]["vector"] for key in keys])
+            cached = self._matrices[cls] = (keys, vectors)
+        return cached
+
+    def lookup(
+        self,
+        question: str,
+        user_context: Optional[Dict[str, Any]] = None,
+        version: Any = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查找语义相近的已缓存回答
+
+        Args:
+            version: 当前知识库版本（version()），为None时在此查询；知识库版本不同的回答视为过期
+
+        Returns:
+            命中时返回 {"answer", "sources", "question"(命中的原问题), "similarity", "saved_seconds"}，否则None
+        """
+        start = time.perf_counter()
+        cls = context_class(user_context)
+        key = normalize_question(question)
+        if not key:
+            return None
+        if version is None:
+            version = self.version()
+            if version is None:
+                self._skip()
+                return None
+
+        with self._lock:
+            entry = self._fresh(cls, key, version)
+            similarity = 1.0
+        if entry is None:
+            vector = self._embed(key)
+            if vector is None:
+                self._skip()
+                return None
+            terms, key_terms = set(query_terms(key)), self._key_terms(key)
+            with self._lock:
+                keys, vectors = self._matrix(cls)
+                if vectors is not None:
+                    scores = vectors @ vector
+                    for row in np.argsort(-scores)[:8]:
+                        if scores[row] < self.threshold:
+                            break
+                        candidate = self._fresh(cls, keys[row], version)
+                        if candidate is not None and self._same_subject(terms, key_terms, candidate):
+                            entry, similarity = candidate, float(scores[row])
+                            break
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                response_cache_requests_total.inc(result="miss")
+                return None
+            saved = max(0.0, entry["seconds"] - (time.perf_counter() - start))
+            self.hits += 1
+            self.saved_seconds += saved
+        response_cache_requests_total.inc(result="hit")
+        response_cache_saved_seconds_total.inc(saved)
+        return {
+            "answer": entry["answer"],
+            "sources": entry["sources"],
+            "question": entry["question"],
+            "similarity": round(similarity, 4),
+            "saved_seconds": round(saved, 3),
+        }
+
+    def _skip(self):
+        with self._lock:
+            self.skips += 1
+        response_cache_requests_total.inc(result="skip")
+
+    def _fresh(self, cls: str, key: str, version: Any) -> Optional[Dict[str, Any]]:
+        """取出未过期且知识库版本相同的条目；调用方需持有锁"""
+        entry = (self._entries.get(cls) or {}).get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created_at"] > self.ttl_seconds or entry["version"] != version:
+            self._remove(cls, key)
+            self._update_gauge()
+            return None
+        return entry
+
+    def _remove(self, cls: str, key: str):
+        """删除一个条目；调用方需持有锁"""
+        entries = self._entries[cls]
+        del entries[key]
+        self._order.pop((cls, key), None)
+        if entries:
+            self._matrices[cls] = None
+        else:
+            del self._entries[cls]
+            self._matrices.pop(cls, None)
+
+    def store(
+        self,
+        question: str,
+        answer: str,
+        sources: Optional[List[Dict[str, Any]]],
+        seconds: float,
+        user_context: Optional[Dict[str, Any]] = None,
+        version: Any = None
+    ) -> bool:
+        """
+        缓存一条回答
+
+        Args:
+            seconds: 生成该回答的耗时（知识检索+模型推理），命中时据此统计节省的时间
+            version: 生成回答前取得的知识库版本，生成期间知识库变化时该回答随即过期；为None时在此查询
+        """
+        key = normalize_question(question)
+        if not key or not answer:
+            return False
+        if version is None:
+            version = self.version()
+            if version is None:
+                return False
+        vector = self._embed(key)
+        if vector is None:
+            return False
+        key_terms = self._key_terms(key)
+
+        cls = context_class(user_context)
+        with self._lock:
+            entries = self._entries.setdefault(cls, OrderedDict())
+            entries.pop(key, None)
+            self._order.pop((cls, key), None)
+            entries[key] = {
+                "question": question,
+                "answer": answer,
+                "sources": sources,
+                "vector": np.asarray(vector, dtype=np.float32),
+                "terms": set(query_terms(key)),
+                "key_terms": key_terms,
+                "seconds": seconds,
+                "version": version,
+                "created_at": time.time(),
+            }
+            self._order[(cls, key)] = None
+            self._matrices[cls] = None
+            while len(self._order) > self.max_entries:
+                self._remove(*next(iter(self._order)))
+            self._update_gauge()
+        return True
+
+    def invalidate(self):
+        """清空缓存（知识库变化后调用）"""
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self._order.clear()
+            self._update_gauge()
+
+    def _update_gauge(self):
+        response_cache_entries.set(len(self._order))
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率和节省的时间"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._order),
+                "hits": self.hits,
+                "misses": self.misses,
+                "skips": self.skips,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
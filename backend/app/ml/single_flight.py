@@ -0,0 +1,79 @@
+from typing import Any, Callable, Dict, Hashable
+import re
+import json
+import hashlib
+import threading
+
+from app.core.metrics import registry
+
+llm_singleflight_total = registry.counter(
+    "llm_singleflight_total",
+    "相同请求合并的大模型调用数，result为generated（实际生成）或coalesced（等待进行中的相同请求，节省一次生成）", ("op", "model", "result")
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """合并连续空白并去掉首尾空白，缩进或换行不同的相同提示词视为同一请求"""
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def request_key(**parts: Any) -> str:
+    """按模型、提示词和生成参数计算请求的键"""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    合并进行中的相同请求
+
+    同一个键的请求正在执行时，后到的请求不再调用模型，而是等待并共享第一个请求的结果（或异常）；
+    请求结束后立即移除，之后的相同请求重新生成，不作为缓存使用。调用方在线程中阻塞等待，与模型路由和后台任务的工作线程一致。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], op: str = "generate", model: str = "") -> Any:
+        """执行fn，或等待进行中的相同请求；返回值对所有等待方共享，不要原地修改"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            llm_singleflight_total.inc(op=op, model=model, result="coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        llm_singleflight_total.inc(op=op, model=model, result="generated")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def inflight(self) -> int:
+        """正在执行的不同请求数"""
+        with self._lock:
+            return len(self._calls)
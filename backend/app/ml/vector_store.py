@@ -0,0 +1,338 @@
+from typing import Dict, Any, Optional, Tuple
+import os
+import time
+import logging
+
+import numpy as np
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 条目数达到该值后使用倒排列表（IVF）检索，之前全量精确检索
+IVF_MIN_SIZE = 20000
+# IVF检索时扫描的倒排列表数
+IVF_NPROBE = 16
+# k-means训练样本数 = 列表数 * 该值
+IVF_SAMPLES_PER_LIST = 32
+IVF_TRAIN_ITERATIONS = 10
+# 量化和分配列表时每批处理的行数，限制临时数组的大小
+BLOCK_ROWS = 65536
+# 打分时每批处理的行数：int8转float32的临时数组留在CPU缓存中，比大块快数倍
+SCORE_BLOCK_ROWS = 1024
+
+QUANTIZATION_NONE = "none"
+QUANTIZATION_SQ8 = "sq8"
+
+# 可选的检索后端：是否使用IVF倒排列表 × 向量的存储精度
+BACKENDS: Dict[str, Dict[str, Any]] = {
+    "flat": {"ivf": False, "quantization": QUANTIZATION_NONE},
+    "ivf": {"ivf": True, "quantization": QUANTIZATION_NONE},
+    "flat_sq8": {"ivf": False, "quantization": QUANTIZATION_SQ8},
+    "ivf_sq8": {"ivf": True, "quantization": QUANTIZATION_SQ8},
+}
+
+DATA_FILE = "knowledge_vectors.npy"
+SCALES_FILE = "knowledge_scales.npy"
+CENTROIDS_FILE = "knowledge_centroids.npy"
+ASSIGNMENTS_FILE = "knowledge_assignments.npy"
+
+
+def create_vector_store(
+    backend: str,
+    ivf_min_size: int = IVF_MIN_SIZE,
+    nprobe: int = IVF_NPROBE,
+    mmap: bool = False
+) -> "VectorStore":
+    """按后端名称创建向量存储，名称见BACKENDS"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的知识库检索后端: {backend}，可选 {', '.join(BACKENDS)}")
+    options = BACKENDS[backend]
+    return VectorStore(
+        quantization=options["quantization"],
+        ivf_min_size=ivf_min_size if options["ivf"] else None,
+        nprobe=nprobe,
+        mmap=mmap
+    )
+
+
+class VectorStore:
+    """
+    知识库向量的存储与近邻检索
+
+    行号与KnowledgeIndex中的文本块一一对应，向量均已L2归一化，按内积（余弦相似度）取top-k。
+
+    - 存储精度：none为float32；sq8为逐行int8标量量化（每行一个缩放系数），内存约为float32的1/4
+    - 倒排列表：块数达到ivf_min_size后用球面k-means把向量划分为约sqrt(n)个列表，
+      检索只扫描与查询最接近的nprobe个列表；ivf_min_size为None时始终全量精确检索
+    - 持久化：向量、缩放系数、列表中心和列表分配各保存为一个.npy文件，
+      mmap为True时以写时复制方式映射加载，多个进程可共享操作系统的页缓存，只有被修改的页占用私有内存
+    """
+
+    def __init__(
+        self,
+        quantization: str = QUANTIZATION_NONE,
+        ivf_min_size: Optional[int] = IVF_MIN_SIZE,
+        nprobe: int = IVF_NPROBE,
+        mmap: bool = False
+    ):
+        if quantization not in (QUANTIZATION_NONE, QUANTIZATION_SQ8):
+            raise ValueError(f"未知的向量量化方式: {quantization}")
+        self.quantization = quantization
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.mmap = mmap
+
+        self.size = 0
+        self._dtype = np.int8 if quantization == QUANTIZATION_SQ8 else np.float32
+        self._data = np.zeros((0, 0), dtype=self._dtype)
+        # sq8每行的缩放系数：原向量 ≈ int8向量 * 缩放系数
+        self._scales = np.zeros(0, dtype=np.float32)
+        # IVF倒排列表：列表中心和每行所属的列表；未启用时为None
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+
+    @property
+    def dim(self) -> int:
+        return self._data.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """向量和列表占用的字节数（mmap加载时大部分在页缓存中）"""
+        total = self._data[:self.size].nbytes + self._scales[:self.size].nbytes + self._assignments[:self.size].nbytes
+        return total + (self.centroids.nbytes if self.centroids is not None else 0)
+
+    # ---------- 编码 ----------
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.quantization == QUANTIZATION_NONE:
+            return vectors, None
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def vector(self, row: int) -> np.ndarray:
+        """取出一行的float32向量（sq8为反量化后的近似值）"""
+        if self.quantization == QUANTIZATION_NONE:
+            return np.array(self._data[row], dtype=np.float32)
+        return self._data[row].astype(np.float32) * self._scales[row]
+
+    # ---------- 写入 ----------
+
+    def reset(self, vectors: np.ndarray):
+        """用给定向量替换全部内容，并按需训练倒排列表"""
+        count, dim = vectors.shape if vectors.ndim == 2 else (0, 0)
+        self._data = np.zeros((count, dim), dtype=self._dtype)
+        self._scales = np.zeros(count, dtype=np.float32)
+        for offset in range(0, count, BLOCK_ROWS):
+            codes, scales = self._encode(vectors[offset:offset + BLOCK_ROWS])
+            self._data[offset:offset + len(codes)] = codes
+            if scales is not None:
+                self._scales[offset:offset + len(codes)] = scales
+        self.size = count
+        self._assignments = np.zeros(count, dtype=np.int32)
+        self.train()
+
+    def put(self, row: int, vector: np.ndarray):
+        """写入一行；row等于当前行数时追加"""
+        if row == self.size:
+            if self.size == self._data.shape[0]:
+                self._grow(len(vector))
+            self.size += 1
+        codes, scales = self._encode(vector[None, :])
+        self._data[row] = codes[0]
+        if scales is not None:
+            self._scales[row] = scales[0]
+        if self.centroids is not None:
+            self._assignments[row] = int(np.argmax(self.centroids @ vector))
+
+    def _grow(self, dim: int):
+        # 容量翻倍，摊销追加时的拷贝开销；mmap加载的数组在此时复制到内存
+        capacity = max(16, self._data.shape[0] * 2)
+        data = np.zeros((capacity, dim), dtype=self._dtype)
+        scales = np.zeros(capacity, dtype=np.float32)
+        assignments = np.zeros(capacity, dtype=np.int32)
+        if self.size:
+            data[:self.size] = self._data[:self.size]
+            scales[:self.size] = self._scales[:self.size]
+            assignments[:self.size] = self._assignments[:self.size]
+        self._data, self._scales, self._assignments = data, scales, assignments
+
+    def move(self, source: int, target: int):
+        """把source行复制到target行（删除时用最后一行覆盖被删除的行）"""
+        self._data[target] = self._data[source]
+        self._scales[target] = self._scales[source]
+        self._assignments[target] = self._assignments[source]
+
+    def truncate(self, size: int):
+        self.size = size
+
+    # ---------- 倒排列表 ----------
+
+    def train(self):
+        """用球面k-means训练IVF倒排列表，并把所有向量分配到最近的列表"""
+        if self.ivf_min_size is None or self.size < self.ivf_min_size:
+            self.centroids = None
+            self._trained_size = 0
+            return
+
+        start = time.perf_counter()
+        nlist = int(np.sqrt(self.size))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(self.size, min(self.size, nlist * IVF_SAMPLES_PER_LIST), replace=False))
+        sample = self._decode(sample_rows)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # 空列表保留原中心
+            nonempty = norms[:, 0] > 0
+            centroids[nonempty] = sums[nonempty] / norms[nonempty]
+
+        assignments = np.zeros(self._data.shape[0], dtype=np.int32)
+        for offset in range(0, self.size, BLOCK_ROWS):
+            rows = np.arange(offset, min(offset + BLOCK_ROWS, self.size))
+            assignments[rows] = np.argmax(self._decode(rows) @ centroids.T, axis=1)
+
+        self.centroids = centroids
+        self._assignments = assignments
+        self._trained_size = self.size
+        logger.info(f"已训练知识库倒排列表: {nlist} 个列表，耗时 {time.perf_counter() - start:.2f}s")
+
+    def maybe_retrain(self):
+        """跨过IVF阈值或行数较上次训练翻倍时重新训练，保持列表均衡"""
+        if self.ivf_min_size is None:
+            return
+        if (self.centroids is None and self.size >= self.ivf_min_size) or \
+                (self.centroids is not None and self.size >= self._trained_size * 2):
+            self.train()
+
+    # ---------- 检索 ----------
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        if self.quantization == QUANTIZATION_NONE:
+            return np.asarray(self._data[rows], dtype=np.float32)
+        return self._data[rows].astype(np.float32) * self._scales[rows, None]
+
+    def _score(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """计算查询与指定行（None为全部行）的内积，分批进行以限制临时数组大小"""
+        if self.quantization == QUANTIZATION_NONE and rows is None:
+            return self._data[:self.size] @ query
+        count = self.size if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for offset in range(0, count, SCORE_BLOCK_ROWS):
+            block = slice(offset, min(offset + SCORE_BLOCK_ROWS, count))
+            block_rows = block if rows is None else rows[block]
+            if self.quantization == QUANTIZATION_NONE:
+                scores[block] = self._data[block_rows] @ query
+            else:
+                # int8转float32后内积，再乘以每行的缩放系数
+                scores[block] = (self._data[block_rows].astype(np.float32) @ query) * self._scales[block_rows]
+        return scores
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        返回内积最高的k行的行号和内积，按内积降序
+
+        Args:
+            query: 已L2归一化的查询向量
+            k: 返回的行数
+            nprobe: 本次扫描的倒排列表数，默认使用self.nprobe；越大召回率越高、延迟越大
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if self.size == 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        rows = None
+        if self.centroids is not None:
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            selected = np.zeros(len(self.centroids), dtype=bool)
+            selected[probes] = True
+            rows = np.flatnonzero(selected[self._assignments[:self.size]])
+            if len(rows) < k:
+                rows = None
+
+        scores = self._score(query, rows)
+        if rows is None:
+            rows = np.arange(self.size)
+
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    # ---------- 持久化 ----------
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """复制当前内容，供在锁外写文件"""
+        arrays = {DATA_FILE: np.array(self._data[:self.size])}
+        if self.quantization == QUANTIZATION_SQ8:
+            arrays[SCALES_FILE] = np.array(self._scales[:self.size])
+        if self.centroids is not None:
+            arrays[CENTROIDS_FILE] = self.centroids.copy()
+            arrays[ASSIGNMENTS_FILE] = np.array(self._assignments[:self.size])
+        return arrays
+
+    @staticmethod
+    def write_snapshot(directory: str, arrays: Dict[str, np.ndarray]):
+        """原子写入快照中的各个文件（先写临时文件再替换），并删除快照中不再包含的列表文件"""
+        for name, array in arrays.items():
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+        for name in (CENTROIDS_FILE, ASSIGNMENTS_FILE):
+            path = os.path.join(directory, name)
+            if name not in arrays and os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def data_path(directory: str) -> str:
+        return os.path.join(directory, DATA_FILE)
+
+    def load(self, directory: str, count: int) -> bool:
+        """加载持久化文件，行数与count不一致或文件缺失时返回False"""
+        mmap_mode = "c" if self.mmap else None
+        data = np.load(os.path.join(directory, DATA_FILE), mmap_mode=mmap_mode)
+        if data.ndim != 2 or data.shape[0] != count or data.dtype != self._dtype:
+            return False
+        if self.quantization == QUANTIZATION_SQ8:
+            scales_path = os.path.join(directory, SCALES_FILE)
+            if not os.path.exists(scales_path):
+                return False
+            scales = np.load(scales_path, mmap_mode=mmap_mode)
+            if scales.shape != (count,):
+                return False
+        else:
+            scales = np.zeros(count, dtype=np.float32)
+
+        self._data, self._scales, self.size = data, scales, count
+        self._assignments = np.zeros(count, dtype=np.int32)
+        self.centroids = None
+
+        # 已保存的倒排列表可直接使用，省去训练和分配（百万行时分配需要数十秒）
+        centroids_path = os.path.join(directory, CENTROIDS_FILE)
+        assignments_path = os.path.join(directory, ASSIGNMENTS_FILE)
+        if self.ivf_min_size is not None and count >= self.ivf_min_size and \
+                os.path.exists(centroids_path) and os.path.exists(assignments_path):
+            centroids = np.load(centroids_path)
+            assignments = np.load(assignments_path, mmap_mode=mmap_mode)
+            if assignments.shape == (count,) and centroids.shape[1:] == (data.shape[1],):
+                self.centroids, self._assignments, self._trained_size = centroids, assignments, count
+        if self.centroids is None:
+            self.train()
+        return True
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "quantization": self.quantization,
+            "ivf_lists": len(self.centroids) if self.centroids is not None else 0,
+            "nprobe": self.nprobe,
+            "rows": self.size,
+            "bytes": self.nbytes,
+        }
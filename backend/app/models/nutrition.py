@@ -27,7 +27,7 @@ class FoodNutritionBase(BaseModel):
     category: str = Field(..., description="食物分类")
     diabetes_index: Optional[float] = Field(None, description="糖尿病指数")
     diabetes_friendly: Optional[int] = Field(None, description="是否适合糖尿病患者(1是，0否)")
-    image_url: Optional[str] = Field(None, description="食物图片URL或SVG数据")
+    image_url: Optional[str] = Field(None, description="食物图片URL；内联的SVG数据URI保存为图标文件后存储其URL")
 
 
 class FoodNutritionCreate(FoodNutritionBase):
@@ -65,6 +65,16 @@ class FoodNutritionPage(BaseModel):
     pages: int
 
 
+class FoodSuggestion(BaseModel):
+    id: int
+    name_cn: str
+    category: str
+    gi: Optional[int] = None
+    calories: int
+    carbs: float
+    diabetes_friendly: Optional[int] = None
+
+
 class FoodNutritionImport(BaseModel):
     items: List[FoodNutritionCreate]
 
@@ -1,5 +1,6 @@
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+import time
 import uuid
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
@@ -12,11 +13,14 @@ from app.models.assistant import (
     MessageCreate, Message as MessageSchema, MessageRoleEnum,
     AssistantResponse, KnowledgeBaseCreate, KnowledgeBaseUpdate
 )
-from app.ml.llm_service import LLMService
+# 与main.py共用同一个LLM服务实例，避免重复加载模型和知识库索引
+from app.ml.llm_service import llm_service
+from app.services.conversation_history import ConversationHistory
+from app.services.user_context import user_context_store, profile_only, has_health_data
+from app.core.config import settings
 
-
-# 创建LLM服务实例
-llm_service = LLMService()
+# 对话历史窗口和摘要，token数按模型的分词器统计，摘要由同一个模型生成
+conversation_history = ConversationHistory(llm_service.count_tokens, llm_service.summarize_conversation)
 
 
 def create_conversation(db: Session, conv_in: ConversationCreate) -> Conversation:
@@ -77,6 +81,8 @@ def create_conversation(db: Session, conv_in: ConversationCreate) -> Conversatio
             )
             db.add(error_message)
         
+    # 会话未开启autoflush，先写入再刷新，提交由调用方负责
+    db.flush()
     db.refresh(db_conversation)
     return db_conversation
 
@@ -156,6 +162,7 @@ def create_message(db: Session, message_in: MessageCreate) -> Message:
     
     # 保存到数据库
     db.add(db_message)
+    db.flush()
     db.refresh(db_message)
     
     # 如果是用户消息，生成助手回复
@@ -164,8 +171,10 @@ def create_message(db: Session, message_in: MessageCreate) -> Message:
             # 获取用户ID
             user_id = conversation.user_id
             
-            # 生成助手回复
-            assistant_response = generate_assistant_response(db, message_in.content, user_id)
+            # 生成助手回复，带入对话摘要和近期消息
+            assistant_response = generate_assistant_response(
+                db, message_in.content, user_id, conversation=conversation, exclude_message_id=db_message.id
+            )
             
             # 创建助手消息
             assistant_message = Message(
@@ -179,6 +188,7 @@ def create_message(db: Session, message_in: MessageCreate) -> Message:
             
             # 保存到数据库
             db.add(assistant_message)
+            db.flush()
             db.refresh(assistant_message)
             
             # 更新对话的更新时间
@@ -197,6 +207,7 @@ def create_message(db: Session, message_in: MessageCreate) -> Message:
                 message_metadata={"error": str(e)}
             )
             db.add(error_message)
+            db.flush()
             db.refresh(error_message)
             
             # 更新对话的更新时间
@@ -211,34 +222,56 @@ def create_message(db: Session, message_in: MessageCreate) -> Message:
 def get_conversation_messages(db: Session, conversation_id: str, skip: int = 0, limit: int = 100) -> List[Message]:
     """获取对话的所有消息"""
     return db.query(Message).filter(Message.conversation_id == conversation_id).order_by(
-        Message.timestamp
+        Message.timestamp, Message.id
     ).offset(skip).limit(limit).all()
 
 
-def generate_assistant_response(db: Session, user_message: str, user_id: str) -> AssistantResponse:
-    """生成助手回复"""
+def generate_assistant_response(
+    db: Session,
+    user_message: str,
+    user_id: str,
+    conversation: Optional[Conversation] = None,
+    exclude_message_id: Optional[str] = None
+) -> AssistantResponse:
+    """
+    生成助手回复
+    
+    传入conversation时带入其摘要和token预算内的近期消息（exclude_message_id为当前轮已入库的用户消息）。
+    """
     try:
-        # 获取用户信息
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
+        # 用户上下文快照（资料、近期血糖、饮食和用药），写入相关记录时已重建，通常不需要查询数据库
+        user_context = user_context_store.get(db, user_id)
+        if user_context is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="用户不存在"
             )
+        if not settings.ASSISTANT_HEALTH_CONTEXT:
+            user_context = profile_only(user_context)
+        
+        summary, history = None, []
+        if conversation is not None:
+            summary, history = conversation_history.build(db, conversation, exclude_message_id)
         
-        # 构建用户上下文
-        user_context = {
-            "name": user.name,
-            "gender": user.gender.value if user.gender else None,
-            "age": (datetime.now() - user.birth_date).days // 365 if user.birth_date else None,
-            "diabetes_type": user.diabetes_type.value if user.diabetes_type else None,
-            "diagnosis_date": user.diagnosis_date.isoformat() if user.diagnosis_date else None,
-            "height": user.height,
-            "weight": user.weight,
-            "target_glucose_min": user.target_glucose_min,
-            "target_glucose_max": user.target_glucose_max
-        }
+        # 相同用户分类下问过相同或相近问题时直接返回缓存的回答；
+        # 有对话上下文或带入了该用户的健康数据（ASSISTANT_HEALTH_CONTEXT开启）时回答是个人化的，不使用跨用户的缓存
+        personal = bool(summary or history) or has_health_data(user_context)
+        response_cache = llm_service.response_cache if not personal else None
+        if response_cache is not None:
+            # 在生成前取得知识库版本，生成期间知识库变化时写入的回答随即过期
+            kb_version = response_cache.version()
+            cached = response_cache.lookup(user_message, user_context, kb_version)
+            if cached:
+                return AssistantResponse(
+                    message=cached["answer"],
+                    sources=cached["sources"],
+                    message_metadata={
+                        "user_context": profile_only(user_context),
+                        "cache": {"question": cached["question"], "similarity": cached["similarity"]}
+                    }
+                )
         
+        start_time = time.perf_counter()
         # 查询相关知识库
         knowledge_results = llm_service.search_knowledge_base(user_message)
         
@@ -246,13 +279,21 @@ def generate_assistant_response(db: Session, user_message: str, user_id: str) ->
         response_text, sources = llm_service.generate_response(
             user_message, 
             user_context=user_context,
-            knowledge_sources=knowledge_results
+            knowledge_sources=knowledge_results,
+            history=history,
+            conversation_summary=summary
         )
         
+        # 生成失败时sources为None，失败的回复不缓存
+        if response_cache is not None and sources is not None:
+            response_cache.store(
+                user_message, response_text, sources, time.perf_counter() - start_time, user_context, kb_version
+            )
+        
         return AssistantResponse(
             message=response_text,
             sources=sources,
-            message_metadata={"user_context": user_context}
+            message_metadata={"user_context": profile_only(user_context)}
         )
     except Exception as e:
         # 记录错误并返回通用错误消息
@@ -281,7 +322,7 @@ def create_knowledge_base_entry(db: Session, entry_in: KnowledgeBaseCreate) -> K
     
     # 更新向量索引
     try:
-        llm_service.add_to_knowledge_base(db_entry.id, db_entry.title, db_entry.content)
+        llm_service.add_to_knowledge_base(db_entry.id, db_entry.title, db_entry.content, db_entry.tags)
     except Exception as e:
         # 如果向量索引更新失败，记录错误但不回滚事务
         print(f"Error updating vector index: {str(e)}")
@@ -298,14 +339,21 @@ def get_knowledge_base_entries(db: Session, skip: int = 0, limit: int = 100, tag
     """获取知识库条目"""
     query = db.query(KnowledgeBase)
     
-    # 如果指定了标签，过滤结果
+    # 如果指定了标签，通过关键词索引中的 标签 -> 条目 映射取得条目ID，避免逐行扫描JSON字段
     if tag:
-        # 注意：这种方式在PostgreSQL中有效，但在其他数据库中可能需要不同的实现
-        query = query.filter(KnowledgeBase.tags.contains([tag]))
+        entry_ids = llm_service.keyword_index.ids_with_tag(tag)
+        if not entry_ids:
+            return []
+        query = query.filter(KnowledgeBase.id.in_(entry_ids))
     
     return query.order_by(desc(KnowledgeBase.updated_at)).offset(skip).limit(limit).all()
 
 
+def search_knowledge_base_entries(query: str, limit: int = 3, tag: Optional[str] = None) -> List[Dict[str, Any]]:
+    """搜索知识库条目（关键词+向量混合检索）"""
+    return llm_service.search_knowledge_base(query, limit, tag=tag)
+
+
 def update_knowledge_base_entry(db: Session, entry_id: str, entry_in: KnowledgeBaseUpdate) -> KnowledgeBase:
     """更新知识库条目"""
     # 获取条目
@@ -318,7 +366,8 @@ def update_knowledge_base_entry(db: Session, entry_id: str, entry_in: KnowledgeB
     
     # 更新条目
     update_data = entry_in.dict(exclude_unset=True)
-    content_updated = "content" in update_data
+    # 标题和内容都参与向量化，标签参与关键词检索
+    content_updated = any(field in update_data for field in ("title", "content", "tags"))
     
     for field, value in update_data.items():
         if hasattr(db_entry, field) and value is not None:
@@ -331,7 +380,7 @@ def update_knowledge_base_entry(db: Session, entry_id: str, entry_in: KnowledgeB
     # 如果内容更新了，更新向量索引
     if content_updated:
         try:
-            llm_service.update_knowledge_base(db_entry.id, db_entry.title, db_entry.content)
+            llm_service.update_knowledge_base(db_entry.id, db_entry.title, db_entry.content, db_entry.tags)
         except Exception as e:
             # 如果向量索引更新失败，记录错误但不回滚事务
             print(f"Error updating vector index: {str(e)}")
@@ -348,15 +397,15 @@ def delete_knowledge_base_entry(db: Session, entry_id: str) -> bool:
             detail="知识库条目不存在"
         )
     
-    # 从向量索引中删除
+    # 删除数据库记录
+    db.delete(db_entry)
+    db.commit()
+    
+    # 从向量索引中删除（在数据库提交之后，索引持久化时记录的条目数才与数据库一致）
     try:
         llm_service.delete_from_knowledge_base(entry_id)
     except Exception as e:
-        # 如果向量索引删除失败，记录错误但继续删除数据库记录
+        # 如果向量索引删除失败，记录错误但不影响数据库删除
         print(f"Error deleting from vector index: {str(e)}")
     
-    # 删除数据库记录
-    db.delete(db_entry)
-    db.commit()
-    
     return True 
\ No newline at end of file
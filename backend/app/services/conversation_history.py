@@ -0,0 +1,173 @@
+from typing import List, Dict, Optional, Callable, Tuple, Set
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from sqlalchemy.orm import Session
+from sqlalchemy import desc
+
+from app.core.config import settings
+from app.db.models import Conversation, Message
+from app.models.assistant import MessageRoleEnum
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每条消息的角色标记等模板开销（token）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _as_turn(message: Message) -> Dict[str, str]:
+    return {"role": message.role.value, "content": message.content}
+
+
+def _is_failed_reply(message: Message) -> bool:
+    """生成失败时写入的兜底回复不作为上下文"""
+    return message.role == MessageRoleEnum.ASSISTANT and bool((message.message_metadata or {}).get("error"))
+
+
+class ConversationHistory:
+    """
+    对话历史窗口和滚动摘要
+
+    生成回复时只带入对话摘要和摘要之后的近期消息，且近期消息不超过token_budget，提示词长度与对话轮数无关。
+    近期消息超过预算后，在后台把最早的若干轮交给模型与旧摘要合并为新摘要，写入Conversation.summary，
+    并把这些消息标记为Message.summarized，使近期消息回落到预算的一半以下。
+    两次合并之间窗口的起点不变，各轮提示词以相同的系统提示词和历史开头，可复用本地模型的前缀KV缓存。
+    DATETIME只精确到秒，消息按(timestamp, id)排序；已合并的消息逐条标记而不是按排序后的前N条计算，
+    之后写入的同一秒的消息排在哪里都不会被重复合并或跳过。后台合并由单个工作线程依次执行。
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        summarize: Callable[[Optional[str], List[Dict[str, str]]], str],
+        token_budget: int = None,
+        max_messages: int = None,
+        session_factory: Optional[Callable] = None
+    ):
+        self._count_tokens = count_tokens
+        self._summarize = summarize
+        self.token_budget = token_budget or settings.ASSISTANT_HISTORY_TOKEN_BUDGET
+        self.max_messages = max_messages or settings.ASSISTANT_HISTORY_MAX_MESSAGES
+        self._session_factory = session_factory
+        self._folding: Set[str] = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _tokens(self, message: Message) -> int:
+        return self._count_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+
+    def _unsummarized(self, db: Session, conversation: Conversation, limit: Optional[int] = None) -> List[Message]:
+        """摘要之后的消息，按(时间, id)正序；指定limit时只取最近的limit条"""
+        query = db.query(Message).filter(
+            Message.conversation_id == conversation.id,
+            Message.summarized == False
+        ).order_by(desc(Message.timestamp), desc(Message.id))
+        if limit is not None:
+            query = query.limit(limit)
+        return list(reversed(query.all()))
+
+    def build(
+        self,
+        db: Session,
+        conversation: Conversation,
+        exclude_message_id: Optional[str] = None
+    ) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """
+        生成回复用的上下文
+
+        Args:
+            exclude_message_id: 不带入历史的消息（当前轮已入库的用户消息）
+
+        Returns:
+            (对话摘要, 近期消息[{"role", "content"}])；近期消息从用户消息开始，总token数不超过token_budget
+        """
+        messages = [
+            message for message in self._unsummarized(db, conversation, self.max_messages)
+            if message.id != exclude_message_id
+        ]
+        window, used = [], 0
+        for message in reversed(messages):
+            if _is_failed_reply(message):
+                continue
+            tokens = self._tokens(message)
+            if used + tokens > self.token_budget:
+                break
+            window.append(message)
+            used += tokens
+        window.reverse()
+        while window and window[0].role != MessageRoleEnum.USER:
+            window.pop(0)
+        return conversation.summary, [_as_turn(message) for message in window]
+
+    def fold(self, conversation_id: str) -> bool:
+        """
+        近期消息超过预算时把最早的消息并入摘要
+
+        Returns:
+            是否更新了摘要
+        """
+        if self._session_factory is None:
+            from app.db.session import SessionLocal
+            self._session_factory = SessionLocal
+        db = self._session_factory()
+        try:
+            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+            if conversation is None:
+                return False
+            messages = self._unsummarized(db, conversation)
+            tokens = [self._tokens(message) for message in messages]
+            remaining = sum(tokens)
+            if remaining <= self.token_budget:
+                return False
+
+            # 合并到剩余不超过预算的一半，且剩余部分从用户消息开始
+            count = 0
+            while count < len(messages) and (
+                remaining > self.token_budget // 2 or messages[count].role != MessageRoleEnum.USER
+            ):
+                remaining -= tokens[count]
+                count += 1
+
+            turns = [_as_turn(message) for message in messages[:count] if not _is_failed_reply(message)]
+            summary = self._summarize(conversation.summary, turns) if turns else conversation.summary
+            conversation.summary = summary
+            conversation.summarized_count = (conversation.summarized_count or 0) + count
+            for message in messages[:count]:
+                message.summarized = True
+            db.commit()
+            logger.info(f"对话 {conversation_id} 已将 {count} 条消息并入摘要")
+            return True
+        except Exception as e:
+            db.rollback()
+            logger.error(f"更新对话摘要失败: {str(e)}")
+            return False
+        finally:
+            db.close()
+
+    def schedule_fold(self, conversation_id: str) -> Optional[Future]:
+        """
+        在后台工作线程中合并摘要，不阻塞当前请求
+
+        同一对话已在排队或合并中时跳过，排队的任务数不超过对话数
+
+        Returns:
+            合并任务；已跳过时为None
+        """
+        with self._lock:
+            if conversation_id in self._folding:
+                return None
+            self._folding.add(conversation_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-summary")
+
+        def run():
+            try:
+                self.fold(conversation_id)
+            finally:
+                with self._lock:
+                    self._folding.discard(conversation_id)
+
+        return self._executor.submit(run)
+
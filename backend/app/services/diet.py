@@ -13,6 +13,8 @@ from app.models.diet import (
     DietRecordCreate, DietRecordUpdate, DietRecord as DietRecordSchema, 
     DietStatistics, DietRecordPage
 )
+from app.services.user_context import user_context_store
+from app.services.food_search import food_search_index
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +46,8 @@ def create_diet_record(db: Session, record_in: DietRecordCreate) -> DietRecord:
     db.add(db_record)
     db.commit()
     db.refresh(db_record)
+    user_context_store.refresh_health(db, db_record.user_id)
+    food_search_index.record_usage(food_items_json)
     
     return db_record
 
@@ -119,6 +123,7 @@ def update_diet_record(db: Session, record_id: str, record_in: DietRecordUpdate)
     # 保存到数据库
     db.commit()
     db.refresh(db_record)
+    user_context_store.refresh_health(db, db_record.user_id)
     
     return db_record
 
@@ -132,8 +137,10 @@ def delete_diet_record(db: Session, record_id: str) -> bool:
             detail="饮食记录不存在"
         )
     
+    user_id = db_record.user_id
     db.delete(db_record)
     db.commit()
+    user_context_store.refresh_health(db, user_id)
     
     return True
 
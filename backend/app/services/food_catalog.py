@@ -0,0 +1,184 @@
+from typing import List, Dict, Optional, Sequence
+import json
+import math
+import time
+import hashlib
+import threading
+import logging
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.models import FoodNutrition
+from app.models.nutrition import FoodNutrition as FoodNutritionSchema, FoodNutritionPage
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+food_catalog_reloads_total = registry.counter(
+    "food_catalog_reloads_total", "食物目录快照从数据库重新加载的次数，reason为expired（超过有效期）或write（本进程写入）", ("reason",)
+)
+
+# 可排序的数值字段；空值存为NaN
+NUMERIC_FIELDS = ("calories", "protein", "fat", "carbs", "gi", "diabetes_index", "diabetes_friendly")
+SORT_FIELDS = ("calories", "protein", "fat", "carbs", "gi")
+
+_EMPTY = np.empty(0, dtype=np.intp)
+
+
+class FoodCatalogSnapshot:
+    """
+    食物目录的不可变快照
+
+    行按ID升序排列，数值字段按列存为只读NumPy数组，另有 分类 -> 行号 的索引和按GI排序的行号，
+    列表、分类、GI范围等查询在内存中完成过滤、排序和分页，不查询数据库。
+    version为目录内容的摘要，内容相同的快照（包括其他工作进程加载的）版本相同，用作ETag。
+    """
+
+    def __init__(self, foods: Sequence[FoodNutritionSchema]):
+        self.items = tuple(sorted(foods, key=lambda food: food.id))
+        self.ids = self._readonly(np.array([food.id for food in self.items], dtype=np.int64))
+        self.columns: Dict[str, np.ndarray] = {
+            field: self._readonly(np.array(
+                [np.nan if getattr(food, field) is None else getattr(food, field) for food in self.items],
+                dtype=np.float64
+            ))
+            for field in NUMERIC_FIELDS
+        }
+        self._positions = {food.id: position for position, food in enumerate(self.items)}
+
+        # 分类 -> 行号（ID升序），分类按首次出现的顺序
+        self.categories: Dict[str, np.ndarray] = {}
+        for position, food in enumerate(self.items):
+            self.categories.setdefault(food.category, []).append(position)
+        self.categories = {
+            category: self._readonly(np.array(positions, dtype=np.intp))
+            for category, positions in self.categories.items()
+        }
+
+        # GI非空的行按 (GI, ID) 排序，GI范围查询用二分查找
+        gi = self.columns["gi"]
+        with_gi = np.flatnonzero(~np.isnan(gi))
+        self._gi_order = self._readonly(with_gi[np.argsort(gi[with_gi], kind="stable")])
+        self._gi_sorted = self._readonly(gi[self._gi_order])
+
+        digest = hashlib.sha1()
+        for food in self.items:
+            digest.update(json.dumps(food.model_dump(), ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        self.version = digest.hexdigest()[:16]
+
+    @staticmethod
+    def _readonly(array: np.ndarray) -> np.ndarray:
+        array.setflags(write=False)
+        return array
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    # ---------- 选择行 ----------
+
+    def rows(
+        self,
+        category: Optional[str] = None,
+        diabetes_friendly: Optional[int] = None,
+        ids: Optional[Sequence[int]] = None
+    ) -> np.ndarray:
+        """
+        符合条件的行号
+
+        ids为None时按ID升序；否则按ids的顺序（如搜索的相关度），不在快照中的ID忽略。
+        """
+        if ids is not None:
+            rows = np.array(
+                [self._positions[food_id] for food_id in ids if food_id in self._positions], dtype=np.intp
+            )
+            if category is not None:
+                rows = rows[np.isin(rows, self.categories.get(category, _EMPTY))]
+        elif category is not None:
+            rows = self.categories.get(category, _EMPTY)
+        else:
+            rows = np.arange(len(self.items))
+        if diabetes_friendly is not None:
+            rows = rows[self.columns["diabetes_friendly"][rows] == diabetes_friendly]
+        return rows
+
+    def gi_range(self, min_gi: float, max_gi: float) -> np.ndarray:
+        """GI在 [min_gi, max_gi] 内的行号，按ID升序"""
+        start = np.searchsorted(self._gi_sorted, min_gi, side="left")
+        end = np.searchsorted(self._gi_sorted, max_gi, side="right")
+        return np.sort(self._gi_order[start:end])
+
+    def sort(self, rows: np.ndarray, sort_by: Optional[str], sort_order: Optional[str] = "asc") -> np.ndarray:
+        """
+        按字段排序，值相同时按ID升序
+
+        空值升序时在前、降序时在后（与MySQL的NULL排序一致）；不支持的字段按ID排序。
+        """
+        if sort_by in SORT_FIELDS:
+            values = np.nan_to_num(self.columns[sort_by][rows], nan=-np.inf)
+        else:
+            values = self.ids[rows].astype(np.float64)
+        if sort_order == "desc":
+            values = -values
+        return rows[np.lexsort((self.ids[rows], values))]
+
+    def page(self, rows: np.ndarray, page: int, size: int) -> FoodNutritionPage:
+        total = len(rows)
+        return FoodNutritionPage(
+            items=[self.items[position] for position in rows[(page - 1) * size:page * size]],
+            total=total,
+            page=page,
+            size=size,
+            pages=math.ceil(total / size) if total > 0 else 0
+        )
+
+
+class FoodCatalog:
+    """
+    进程内的食物目录快照
+
+    本进程写入食物后调用reload重新加载并整体替换快照，读取方拿到的快照不会再变化；
+    其他进程的写入在快照超过max_age秒后由一个请求线程重新加载，加载期间其他线程继续使用旧快照。
+    """
+
+    def __init__(self, max_age: float = None):
+        self.max_age = max_age if max_age is not None else settings.FOOD_CATALOG_RELOAD_SECONDS
+        self._snapshot: Optional[FoodCatalogSnapshot] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> FoodCatalogSnapshot:
+        """当前快照；首次使用时加载，过期时重新加载"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._loaded_at <= self.max_age:
+            return snapshot
+        # 首次加载时等待；快照过期时只由一个线程重新加载，其他线程继续使用旧快照
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._snapshot is snapshot:
+                self._load(db, "expired")
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def reload(self, db: Session) -> FoodCatalogSnapshot:
+        """写入食物并提交后调用，重新加载快照"""
+        with self._lock:
+            return self._load(db, "write")
+
+    def _load(self, db: Session, reason: str) -> FoodCatalogSnapshot:
+        """调用方需持有锁；加载期间的读取和替换串行，后提交的写入不会被先读取的快照覆盖"""
+        foods = db.query(FoodNutrition).order_by(FoodNutrition.id).all()
+        snapshot = FoodCatalogSnapshot([FoodNutritionSchema.model_validate(food) for food in foods])
+        if self._snapshot is None or snapshot.version != self._snapshot.version:
+            logger.info(f"已加载食物目录快照: {len(snapshot)} 种食物，版本 {snapshot.version}")
+        self._snapshot, self._loaded_at = snapshot, time.monotonic()
+        food_catalog_reloads_total.inc(reason=reason)
+        return snapshot
+
+
+# 全局目录实例
+food_catalog = FoodCatalog()
@@ -0,0 +1,122 @@
+from typing import Optional
+import os
+import re
+import base64
+import hashlib
+import logging
+from urllib.parse import unquote
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from starlette.staticfiles import StaticFiles
+
+from app.core.config import settings
+from app.db.models import FoodNutrition
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 图标文件的URL前缀，对应 STATIC_DIR/icons/foods
+ICON_URL_PREFIX = "/icons/foods"
+SVG_DATA_URI_PREFIX = "data:image/svg+xml"
+
+# 文件名为内容摘要，内容变化即URL变化，可以让浏览器和CDN永久缓存
+ICON_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 直接打开同源的SVG文件时其中的脚本会执行（作为<img>的数据URI时不会），禁止脚本和外部资源，只允许内联样式
+ICON_CONTENT_SECURITY_POLICY = "default-src 'none'; style-src 'unsafe-inline'"
+
+
+def icon_dir() -> str:
+    """图标文件目录"""
+    return os.path.join(settings.STATIC_DIR, "icons", "foods")
+
+
+def minify_svg(svg: str) -> str:
+    """去掉标签之间的空白（缩进、换行），不改变渲染结果"""
+    return re.sub(r">\s+<", "><", svg.strip())
+
+
+def store_svg(svg: str) -> str:
+    """
+    把SVG保存为按内容寻址的静态文件，返回图标URL
+
+    文件名取压缩后内容的SHA-256前16位，相同的图标只保存一份；文件已存在时不再写入。
+    """
+    content = minify_svg(svg).encode("utf-8")
+    filename = f"{hashlib.sha256(content).hexdigest()[:16]}.svg"
+    directory = icon_dir()
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再改名，并发写入或读取时不会看到不完整的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return f"{ICON_URL_PREFIX}/{filename}"
+
+
+def decode_svg_data_uri(uri: str) -> str:
+    """
+    解析 data:image/svg+xml 的URI，支持 ;utf8 原文、百分号编码和 ;base64
+
+    Raises:
+        ValueError: base64或UTF-8编码错误，或内容不是SVG
+    """
+    header, _, data = uri.partition(",")
+    if ";base64" in header:
+        # binascii.Error和UnicodeDecodeError都是ValueError的子类
+        svg = base64.b64decode(data).decode("utf-8")
+    else:
+        # 原文直接以标签开头（其中的%不是编码，如width="100%"），否则按百分号编码解析
+        svg = data if data.lstrip().startswith("<") else unquote(data, errors="strict")
+    if "<svg" not in svg:
+        raise ValueError("内容不是SVG")
+    return svg
+
+
+def externalize_image_url(image_url: Optional[str]) -> Optional[str]:
+    """
+    内联的SVG数据URI转换为图标文件URL，其他URL原样返回
+
+    Raises:
+        HTTPException: 数据URI无法解析时返回422
+    """
+    if not image_url or not image_url.startswith(SVG_DATA_URI_PREFIX):
+        return image_url
+    try:
+        svg = decode_svg_data_uri(image_url)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"图标数据URI格式错误: {str(e)}"
+        )
+    return store_svg(svg)
+
+
+def migrate_inline_icons(db: Session) -> int:
+    """把数据库中内联的SVG图标转换为图标文件URL，返回转换的食物数"""
+    foods = db.query(FoodNutrition).filter(FoodNutrition.image_url.like(f"{SVG_DATA_URI_PREFIX}%")).all()
+    converted = 0
+    for food in foods:
+        try:
+            food.image_url = externalize_image_url(food.image_url)
+            converted += 1
+        except HTTPException as e:
+            # 无法解析的图标保持原样，不影响其他食物
+            logger.warning(f"食物 {food.id} 的内联图标无法转换: {e.detail}")
+    if converted:
+        db.commit()
+        logger.info(f"已将 {converted} 个食物的内联SVG图标转换为图标文件")
+    return converted
+
+
+class FoodIconFiles(StaticFiles):
+    """图标文件的静态文件服务，响应带长期缓存头，并禁止SVG中的脚本执行"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = ICON_CACHE_CONTROL
+        response.headers["Content-Security-Policy"] = ICON_CONTENT_SECURITY_POLICY
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        return response
@@ -0,0 +1,473 @@
+from typing import List, Dict, Any, Optional, Callable, Iterable, Set, Tuple
+import re
+import math
+import time
+import heapq
+import bisect
+import itertools
+import threading
+import unicodedata
+import logging
+from collections import Counter, OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 常见食物的同义词，食物名中含有其中一个词时，把它替换为同组其他词后的名称也加入索引
+SYNONYMS = [
+    ("西红柿", "番茄"),
+    ("圣女果", "小番茄", "樱桃番茄"),
+    ("土豆", "马铃薯", "洋芋"),
+    ("红薯", "地瓜", "番薯", "甘薯", "山芋"),
+    ("玉米", "苞米", "棒子"),
+    ("卷心菜", "圆白菜", "包菜", "洋白菜", "甘蓝"),
+    ("西兰花", "西蓝花", "绿菜花", "青花菜"),
+    ("菜花", "花菜", "花椰菜"),
+    ("黄瓜", "青瓜"),
+    ("青椒", "甜椒", "柿子椒"),
+    ("香菜", "芫荽"),
+    ("山药", "淮山"),
+    ("芋头", "芋艿"),
+    ("四季豆", "芸豆"),
+    ("豇豆", "长豆角"),
+    ("猕猴桃", "奇异果"),
+    ("菠萝", "凤梨"),
+    ("樱桃", "车厘子"),
+    ("鸡蛋", "鸡子儿"),
+    ("馒头", "馍"),
+    ("花生", "落花生"),
+    ("酸奶", "酸牛奶"),
+    ("燕麦", "莜麦"),
+    ("荞麦", "三角麦"),
+]
+
+# 匹配类型的基础相关度：名称（含同义词）> 全拼 > 首字母，完全匹配 > 前缀 > 包含
+NAME, PINYIN, INITIALS = 0, 1, 2
+RELEVANCE = {
+    NAME: {"exact": 100.0, "prefix": 80.0, "substring": 50.0},
+    PINYIN: {"exact": 90.0, "prefix": 70.0, "substring": 40.0},
+    INITIALS: {"exact": 85.0, "prefix": 65.0},
+}
+# 模糊匹配（字符n-gram的Dice相似度）的相关度为 FUZZY_WEIGHT * 相似度，低于最小相似度的不返回
+FUZZY_WEIGHT = 40.0
+FUZZY_MIN_SIMILARITY = 0.5
+# 同音字（查询的全拼与食物的全拼相同）视为相似度1的模糊匹配，全拼为食物全拼的前缀时的相似度
+HOMOPHONE_PREFIX_SIMILARITY = 0.9
+# 热度加分 POPULARITY_WEIGHT * ln(1 + 近期被记录的次数)，上限小于相邻匹配类型的差距，只在同类匹配中调整顺序
+POPULARITY_WEIGHT = 3.0
+POPULARITY_MAX_BONUS = 9.0
+# 名称比查询每多一个字扣的分数，同类匹配中较短（更接近查询）的名称在前
+LENGTH_PENALTY = 0.5
+MAX_LENGTH_PENALTY = 5.0
+# 输入联想结果的缓存条数，索引变化或重建时清空；热度变化不清空，缓存的联想结果在下次重建后按新热度排序
+SUGGEST_CACHE_SIZE = 1024
+# 以上分值保证任何前缀匹配的得分都高于包含和模糊匹配（见test_food_search.py），
+# 前缀匹配已够返回数量时不再查n-gram倒排表
+
+_KEY_PATTERN = re.compile(r"[^0-9a-z㐀-䶿一-鿿]+")
+
+PinyinFunction = Callable[[str], List[str]]
+
+# 索引使用的食物字段
+FoodRow = namedtuple("FoodRow", ["id", "name_cn", "category", "gi", "calories", "carbs", "diabetes_friendly"])
+
+
+def search_key(text: str) -> str:
+    """NFKC规范化（全角转半角）、转小写并去掉空白和标点，用于索引和查询"""
+    return _KEY_PATTERN.sub("", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def _grams(key: str) -> Set[str]:
+    """汉字单字和相邻二字组合；英文（拼音）只用二字组合"""
+    grams = {key[i:i + 2] for i in range(len(key) - 1)}
+    grams.update(char for char in key if char >= "㐀")
+    return grams
+
+
+def synonym_names(name: str) -> List[str]:
+    """按同义词表生成食物名的其他叫法，如 番茄炒蛋 -> 西红柿炒蛋"""
+    names = []
+    for group in SYNONYMS:
+        for word in group:
+            if word in name:
+                names.extend(name.replace(word, other) for other in group if other != word)
+                break
+    return names
+
+
+def load_pinyin() -> Optional[PinyinFunction]:
+    """pypinyin的逐字拼音函数；未安装时返回None，只支持汉字匹配"""
+    try:
+        from pypinyin import lazy_pinyin
+    except ImportError:
+        logger.warning("未安装pypinyin，食物搜索不支持拼音和首字母匹配")
+        return None
+    return lazy_pinyin
+
+
+class FoodSearchIndex:
+    """
+    食物名称搜索索引
+
+    常驻内存，索引每种食物的名称、同义词名称、全拼和拼音首字母：
+    - 前缀和完全匹配：所有名称键排序后二分查找
+    - 包含和模糊匹配：名称键的字符n-gram倒排表，查询的n-gram全部命中且原样包含时为包含匹配，
+      否则按Dice相似度模糊匹配（错字、漏字、多字）；汉字查询另按全拼匹配同音字（胡罗卜 -> 胡萝卜）
+    结果按匹配类型的相关度加热度（近期饮食记录中出现的次数）排序。
+    首次使用时从数据库构建，之后随食物的增删改增量更新；
+    超过max_age秒后由一个请求线程从数据库重建（同步其他工作进程的修改和热度），重建期间其他线程继续使用旧索引，
+    重建期间的增删改在新索引替换旧索引时重放。
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable] = None,
+        pinyin: Optional[PinyinFunction] = None,
+        max_age: float = None,
+        popularity_days: int = None
+    ):
+        self._session_factory = session_factory
+        self._pinyin = pinyin
+        self._pinyin_loaded = pinyin is not None
+        self.max_age = max_age if max_age is not None else settings.FOOD_SEARCH_REBUILD_SECONDS
+        self.popularity_days = popularity_days if popularity_days is not None else settings.FOOD_SEARCH_POPULARITY_DAYS
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self._built_at: Optional[float] = None
+        # 重建期间的增删改，重建完成后在新索引上重放
+        self._pending: Optional[List[Tuple[str, Any]]] = None
+
+        # 食物ID -> 食物信息（含该食物的名称键）
+        self._foods: Dict[int, Dict[str, Any]] = {}
+        # 键ID -> (食物ID, 键, 类型, n-gram数)
+        self._keys: Dict[int, Tuple[int, str, int, int]] = {}
+        self._key_ids = itertools.count()
+        # (键, 键ID) 按键排序，用于前缀查找
+        self._sorted: List[Tuple[str, int]] = []
+        # n-gram -> 键ID
+        self._grams: Dict[str, Set[int]] = {}
+        # 名称键 -> 近期被记录的次数
+        self._popularity: Counter = Counter()
+        # (查询键, 数量) -> 输入联想结果；索引每次变化（不含热度）时版本号加一并清空
+        self._suggestions: "OrderedDict[Tuple[str, int], List[Dict[str, Any]]]" = OrderedDict()
+        self._version = 0
+
+    # ---------- 构建 ----------
+
+    def ensure_built(self):
+        """首次使用时从数据库构建索引，超过max_age后重建"""
+        built_at = self._built_at
+        if built_at is not None and time.monotonic() - built_at <= self.max_age:
+            return
+        # 首次构建时等待；索引过期时只由一个线程重建，其他线程继续使用旧索引
+        if not self._rebuild_lock.acquire(blocking=built_at is None):
+            return
+        try:
+            if self._built_at is built_at:
+                self.rebuild()
+        finally:
+            self._rebuild_lock.release()
+
+    def _get_session(self):
+        if self._session_factory is None:
+            from app.db.session import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def _get_pinyin(self) -> Optional[PinyinFunction]:
+        if not self._pinyin_loaded:
+            self._pinyin = load_pinyin()
+            self._pinyin_loaded = True
+        return self._pinyin
+
+    def rebuild(self) -> int:
+        """从数据库重建索引和热度，返回食物数"""
+        from app.db.models import FoodNutrition, DietRecord
+
+        with self._lock:
+            self._pending = []
+        db = self._get_session()
+        try:
+            foods = db.query(*(getattr(FoodNutrition, field) for field in FoodRow._fields)).all()
+            since = datetime.now() - timedelta(days=self.popularity_days)
+            popularity = Counter()
+            for (food_items,) in db.query(DietRecord.food_items).filter(DietRecord.meal_time >= since):
+                popularity.update(self._item_keys(food_items))
+            # 在锁外构建新索引，期间查询继续使用旧索引
+            fresh = FoodSearchIndex(max_age=self.max_age)
+            fresh._pinyin, fresh._pinyin_loaded = self._get_pinyin(), True
+            for food in foods:
+                fresh._add(food)
+            fresh._sorted.sort()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            for action, value in self._pending:
+                if action == "upsert":
+                    fresh._remove(value.id)
+                    fresh._add(value, keep_sorted=True)
+                elif action == "delete":
+                    fresh._remove(value)
+                else:
+                    popularity.update(value)
+            self._foods, self._keys, self._sorted, self._grams = fresh._foods, fresh._keys, fresh._sorted, fresh._grams
+            self._key_ids = fresh._key_ids
+            self._popularity = popularity
+            self._pending = None
+            self._built_at = time.monotonic()
+            self._changed()
+        logger.info(f"已构建食物搜索索引: {len(foods)} 种食物，{len(self._keys)} 个名称键")
+        return len(foods)
+
+    @staticmethod
+    def _item_keys(food_items) -> List[str]:
+        return [
+            search_key(item["name"]) for item in food_items or []
+            if isinstance(item, dict) and item.get("name")
+        ]
+
+    def _add(self, food, keep_sorted: bool = False):
+        """添加一种食物；keep_sorted为False时由调用方在添加完后排序"""
+        variants = [food.name_cn] + synonym_names(food.name_cn)
+        names = []
+        for name in variants:
+            key = search_key(name)
+            if key and key not in names:
+                names.append(key)
+        entries = [(key, NAME) for key in names]
+
+        for name in variants:
+            pinyin_keys = self._pinyin_keys(name)
+            if pinyin_keys:
+                entries.append((pinyin_keys[0], PINYIN))
+                entries.append((pinyin_keys[1], INITIALS))
+
+        key_ids = []
+        for key, kind in dict.fromkeys(entries):
+            key_id = next(self._key_ids)
+            grams = _grams(key) if kind != INITIALS else set()
+            self._keys[key_id] = (food.id, key, kind, len(grams))
+            for gram in grams:
+                self._grams.setdefault(gram, set()).add(key_id)
+            if keep_sorted:
+                bisect.insort(self._sorted, (key, key_id))
+            else:
+                self._sorted.append((key, key_id))
+            key_ids.append(key_id)
+
+        self._foods[food.id] = {
+            "id": food.id,
+            "name_cn": food.name_cn,
+            "category": food.category,
+            "gi": food.gi,
+            "calories": food.calories,
+            "carbs": food.carbs,
+            "diabetes_friendly": food.diabetes_friendly,
+            "names": names,
+            "key_ids": key_ids,
+        }
+
+    def _pinyin_keys(self, text: str) -> Optional[Tuple[str, str]]:
+        """全拼和拼音首字母；未安装pypinyin时返回None"""
+        pinyin = self._get_pinyin()
+        if pinyin is None:
+            return None
+        syllables = [syllable for syllable in (search_key(s) for s in pinyin(text)) if syllable]
+        if not syllables:
+            return None
+        return "".join(syllables), "".join(syllable[0] for syllable in syllables)
+
+    def _changed(self):
+        """索引变化后清空输入联想缓存；调用方需持有锁"""
+        self._version += 1
+        self._suggestions.clear()
+
+    def _remove(self, food_id: int) -> bool:
+        food = self._foods.pop(food_id, None)
+        if food is None:
+            return False
+        for key_id in food["key_ids"]:
+            _, key, _, _ = self._keys.pop(key_id)
+            position = bisect.bisect_left(self._sorted, (key, key_id))
+            del self._sorted[position]
+            for gram in _grams(key):
+                postings = self._grams.get(gram)
+                if postings is not None:
+                    postings.discard(key_id)
+                    if not postings:
+                        del self._grams[gram]
+        return True
+
+    # ---------- 增删改 ----------
+
+    def upsert(self, food):
+        """添加或更新一种食物（FoodNutrition对象）"""
+        food = FoodRow(*(getattr(food, field) for field in FoodRow._fields))
+        self.ensure_built()
+        with self._lock:
+            self._remove(food.id)
+            self._add(food, keep_sorted=True)
+            self._changed()
+            if self._pending is not None:
+                self._pending.append(("upsert", food))
+
+    def delete(self, food_id: int) -> bool:
+        """删除一种食物"""
+        self.ensure_built()
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("delete", food_id))
+            self._changed()
+            return self._remove(food_id)
+
+    def record_usage(self, food_items: Iterable[Dict[str, Any]]):
+        """
+        饮食记录中的食物计入热度
+
+        搜索立即使用新的热度；每次记录饮食都清空输入联想缓存会使其几乎不命中，已缓存的联想结果在下次重建时更新。
+        """
+        keys = self._item_keys(food_items)
+        with self._lock:
+            self._popularity.update(keys)
+            if self._pending is not None:
+                self._pending.append(("usage", keys))
+
+    # ---------- 查询 ----------
+
+    def _match(self, query_key: str, limit: Optional[int], accept: Callable[[int], bool]) -> Dict[int, float]:
+        """通过过滤条件的食物ID -> 最好的匹配的相关度；调用方需持有锁"""
+        relevance: Dict[int, float] = {}
+        keys = self._keys
+
+        def hit(key_id: int, score: float):
+            food_id = keys[key_id][0]
+            if score > relevance.get(food_id, 0.0) and accept(food_id):
+                relevance[food_id] = score
+
+        # 前缀和完全匹配
+        position = bisect.bisect_left(self._sorted, (query_key,))
+        while position < len(self._sorted) and self._sorted[position][0].startswith(query_key):
+            key, key_id = self._sorted[position]
+            hit(key_id, RELEVANCE[keys[key_id][2]]["exact" if key == query_key else "prefix"])
+            position += 1
+        if limit is not None and len(relevance) >= limit:
+            return relevance
+
+        # 同音字：两个字以上的汉字查询转为全拼，与食物的全拼比较
+        if len(query_key) > 1 and any(char >= "㐀" for char in query_key):
+            pinyin_keys = self._pinyin_keys(query_key)
+            if pinyin_keys:
+                full = pinyin_keys[0]
+                position = bisect.bisect_left(self._sorted, (full,))
+                while position < len(self._sorted) and self._sorted[position][0].startswith(full):
+                    key, key_id = self._sorted[position]
+                    if keys[key_id][2] == PINYIN:
+                        hit(key_id, FUZZY_WEIGHT * (1.0 if key == full else HOMOPHONE_PREFIX_SIMILARITY))
+                    position += 1
+
+        # 包含和模糊匹配
+        grams = _grams(query_key)
+        if not grams:
+            return relevance
+        overlaps = Counter()
+        for gram in grams:
+            overlaps.update(self._grams.get(gram, ()))
+        # 名称键的n-gram数不少于重合数，Dice相似度达到阈值需要 重合数 >= 阈值 * 查询n-gram数 / (2 - 阈值)
+        min_overlap = FUZZY_MIN_SIMILARITY * len(grams) / (2 - FUZZY_MIN_SIMILARITY)
+        for key_id, overlap in overlaps.items():
+            if overlap < min_overlap:
+                continue
+            _, key, kind, size = keys[key_id]
+            if overlap == len(grams) and query_key in key:
+                hit(key_id, RELEVANCE[kind]["substring"])
+                continue
+            similarity = 2.0 * overlap / (len(grams) + size)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                hit(key_id, FUZZY_WEIGHT * similarity)
+        return relevance
+
+    def _score(self, food: Dict[str, Any], relevance: float, query_key: str) -> float:
+        popularity = sum(self._popularity.get(name, 0) for name in food["names"])
+        bonus = min(POPULARITY_WEIGHT * math.log1p(popularity), POPULARITY_MAX_BONUS)
+        penalty = min(LENGTH_PENALTY * max(len(food["names"][0]) - len(query_key), 0), MAX_LENGTH_PENALTY)
+        return relevance + bonus - penalty
+
+    def search(
+        self,
+        query: str,
+        limit: Optional[int] = None,
+        category: Optional[str] = None,
+        diabetes_friendly: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        搜索食物
+
+        Args:
+            query: 汉字（支持同义词、包含和模糊匹配）、全拼或拼音首字母
+            limit: 返回的最大数量，None表示全部匹配
+            category: 只返回该分类的食物
+            diabetes_friendly: 只返回该值的食物
+
+        Returns:
+            [(食物ID, 得分)]，按得分降序，得分相同时按ID升序
+        """
+        self.ensure_built()
+        query_key = search_key(query)
+        if not query_key or (limit is not None and limit <= 0):
+            return []
+
+        with self._lock:
+            foods = self._foods
+
+            def accept(food_id: int) -> bool:
+                food = foods[food_id]
+                return (category is None or food["category"] == category) and (
+                    diabetes_friendly is None or food["diabetes_friendly"] == diabetes_friendly
+                )
+
+            scored = [
+                (round(self._score(foods[food_id], relevance, query_key), 4), food_id)
+                for food_id, relevance in self._match(query_key, limit, accept).items()
+            ]
+        order = lambda item: (-item[0], item[1])
+        top = heapq.nsmallest(limit, scored, key=order) if limit is not None else sorted(scored, key=order)
+        return [(food_id, score) for score, food_id in top]
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """输入联想：返回得分最高的食物的基本信息，不查询数据库；相同的输入直接返回缓存的结果"""
+        self.ensure_built()
+        cache_key = (search_key(query), limit)
+        with self._lock:
+            results = self._suggestions.get(cache_key)
+            if results is not None:
+                self._suggestions.move_to_end(cache_key)
+                return [dict(item) for item in results]
+            version = self._version
+
+        hits = self.search(query, limit)
+        with self._lock:
+            results = [
+                {key: value for key, value in self._foods[food_id].items() if key not in ("names", "key_ids")}
+                for food_id, _ in hits if food_id in self._foods
+            ]
+            # 搜索期间索引有变化时不缓存
+            if self._version == version:
+                self._suggestions[cache_key] = results
+                while len(self._suggestions) > SUGGEST_CACHE_SIZE:
+                    self._suggestions.popitem(last=False)
+        return [dict(item) for item in results]
+
+    def __len__(self) -> int:
+        return len(self._foods)
+
+
+# 全局索引实例
+food_search_index = FoodSearchIndex()
@@ -8,6 +8,7 @@ import logging
 
 from app.db.models import GlucoseRecord, User
 from app.models.glucose import GlucoseCreate, GlucoseUpdate, Glucose, GlucoseStatistics
+from app.services.user_context import user_context_store
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -39,6 +40,7 @@ def create_glucose_record(db: Session, record_in: GlucoseCreate) -> GlucoseRecor
         db.commit()
         db.refresh(db_record)
         logger.info(f"血糖记录创建成功: {db_record.id}")
+        user_context_store.refresh_health(db, db_record.user_id)
         return db_record
     except Exception as e:
         db.rollback()
@@ -105,6 +107,7 @@ def update_glucose_record(db: Session, record_id: str, record_in: GlucoseUpdate)
     # 保存到数据库
     db.commit()
     db.refresh(db_record)
+    user_context_store.refresh_health(db, db_record.user_id)
     
     return db_record
 
@@ -118,8 +121,10 @@ def delete_glucose_record(db: Session, record_id: str) -> bool:
             detail="血糖记录不存在"
         )
     
+    user_id = db_record.user_id
     db.delete(db_record)
     db.commit()
+    user_context_store.refresh_health(db, user_id)
     
     return True
 
@@ -6,8 +6,9 @@ from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 
 from app.db.models import GlucoseRecord, User
-from app.ml.ollama_service import ollama_service
+from app.ml.llm_router import llm_router
 from app.services.glucose import get_user_glucose_records
+from app.services.user_context import user_context_store
 from app.core.config import settings
 
 # 配置日志
@@ -224,6 +225,8 @@ class GlucoseMonitorService:
                 db.rollback()
                 logger.error(f"保存血糖记录失败: {str(e)}")
         
+        if saved_records:
+            user_context_store.refresh_health(db, user_id)
         return saved_records
     
     async def analyze_glucose_data(self, db: Session, user_id: str, hours: int = 24) -> Dict[str, Any]:
@@ -393,16 +396,9 @@ class GlucoseMonitorService:
         """
         
         try:
-            # 调用Ollama生成预警消息
-            response = await ollama_service.generate(
-                prompt=prompt,
-                model="deepseek-r1:1.5b",  # 使用指定的模型
-                temperature=0.7,
-                max_tokens=512
-            )
-            
-            alert_message = response.get("response", "无法生成预警消息")
-            return alert_message
+            # 预警消息为短文本，按alert任务路由到小模型
+            result = await llm_router.complete("alert", prompt, temperature=0.7, max_tokens=512)
+            return result["text"]
         except Exception as e:
             logger.error(f"生成预警消息失败: {str(e)}")
             # 如果生成失败，返回一个基本的预警消息
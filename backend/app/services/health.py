@@ -1,11 +1,16 @@
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple, Sequence
+from datetime import datetime, timedelta, date
+from enum import Enum
 import uuid
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, desc
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, and_, desc, insert, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 import logging
 
+from app.services.user_context import user_context_store
 from app.db.models import (
     HealthRecord, WeightRecord, BloodPressureRecord, 
     ExerciseRecord, MedicationRecord, User
@@ -22,8 +27,113 @@ from app.models.health import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 健康记录的子记录加载策略：每种子记录一次IN查询，避免序列化时逐条懒加载(N+1)
+HEALTH_RECORD_LOAD_OPTIONS = (
+    selectinload(HealthRecord.weight_records),
+    selectinload(HealthRecord.blood_pressure_records),
+    selectinload(HealthRecord.exercise_records),
+    selectinload(HealthRecord.medication_records),
+)
+
+# 子记录集合：关系名 -> (ORM模型, 参与比较和写入的业务字段)
+HEALTH_CHILD_COLLECTIONS = {
+    "weight_records": (
+        WeightRecord,
+        ("weight", "bmi", "body_fat", "measured_at", "notes")
+    ),
+    "blood_pressure_records": (
+        BloodPressureRecord,
+        ("systolic", "diastolic", "pulse", "measured_at", "notes")
+    ),
+    "exercise_records": (
+        ExerciseRecord,
+        ("exercise_type", "duration", "intensity", "calories_burned", "start_time", "end_time", "notes")
+    ),
+    "medication_records": (
+        MedicationRecord,
+        ("name", "dosage", "taken_at", "scheduled_at", "is_taken", "notes")
+    ),
+}
+
+
+def _comparable(value: Any) -> Any:
+    """把字段值转换为可比较的形式，时间精确到秒以兼容MySQL DATETIME"""
+    if isinstance(value, datetime):
+        return value.replace(microsecond=0, tzinfo=None)
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _child_key(source: Any, fields: Sequence[str]) -> Tuple:
+    return tuple(_comparable(getattr(source, field, None)) for field in fields)
+
+
+def _child_row(data: Any, fields: Sequence[str], health_record_id: str, user_id: str) -> Dict[str, Any]:
+    row = {field: getattr(data, field, None) for field in fields}
+    row.update(id=str(uuid.uuid4()), health_record_id=health_record_id, user_id=user_id)
+    return row
+
+
+def _insert_children(db: Session, model, rows: List[Dict[str, Any]]) -> None:
+    """使用executemany批量插入子记录"""
+    if rows:
+        db.execute(insert(model), rows)
+
+
+def _sync_children(
+    db: Session,
+    model,
+    fields: Sequence[str],
+    existing: List[Any],
+    incoming: List[Any],
+    health_record_id: str,
+    user_id: str
+) -> Dict[str, int]:
+    """
+    对比现有子记录与提交的子记录，只写入发生变化的行
+
+    内容完全相同的行保持不动；剩余的旧行按顺序复用为UPDATE，
+    多出的新行批量INSERT，多出的旧行批量DELETE。
+    """
+    # 按内容匹配未变化的行（多重集合匹配）
+    unchanged: Dict[Tuple, List[Any]] = {}
+    for row in existing:
+        unchanged.setdefault(_child_key(row, fields), []).append(row)
+    
+    pending = []
+    for data in incoming:
+        matches = unchanged.get(_child_key(data, fields))
+        if matches:
+            matches.pop()
+        else:
+            pending.append(data)
+    stale = [row for rows in unchanged.values() for row in rows]
+    
+    # 旧行复用为更新，避免删除再插入
+    updates = []
+    for row, data in zip(stale, pending):
+        values = {field: getattr(data, field, None) for field in fields}
+        values["id"] = row.id
+        updates.append(values)
+    if updates:
+        db.execute(update(model), updates)
+    
+    inserts = [
+        _child_row(data, fields, health_record_id, user_id)
+        for data in pending[len(updates):]
+    ]
+    _insert_children(db, model, inserts)
+    
+    deletes = [row.id for row in stale[len(updates):]]
+    if deletes:
+        db.query(model).filter(model.id.in_(deletes)).delete(synchronize_session=False)
+    
+    return {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes)}
+
+
 def create_health_record(db: Session, record_in: HealthCreate) -> HealthRecord:
-    """创建新的健康记录"""
+    """创建新的健康记录，主记录与子记录在同一事务内写入"""
     # 记录请求数据
     logger.info(f"创建健康记录: {record_in.dict()}")
     
@@ -44,79 +154,18 @@ def create_health_record(db: Session, record_in: HealthCreate) -> HealthRecord:
             record_date=record_in.record_date,
             notes=record_in.notes
         )
-        
-        # 保存到数据库
         db.add(db_record)
-        db.commit()
-        db.refresh(db_record)
-        
-        # 添加体重记录
-        if record_in.weight_records:
-            for weight_data in record_in.weight_records:
-                weight_record = WeightRecord(
-                    id=str(uuid.uuid4()),
-                    health_record_id=db_record.id,
-                    user_id=record_in.user_id,
-                    weight=weight_data.weight,
-                    bmi=weight_data.bmi,
-                    body_fat=weight_data.body_fat,
-                    measured_at=weight_data.measured_at,
-                    notes=weight_data.notes
-                )
-                db.add(weight_record)
-        
-        # 添加血压记录
-        if record_in.blood_pressure_records:
-            for bp_data in record_in.blood_pressure_records:
-                bp_record = BloodPressureRecord(
-                    id=str(uuid.uuid4()),
-                    health_record_id=db_record.id,
-                    user_id=record_in.user_id,
-                    systolic=bp_data.systolic,
-                    diastolic=bp_data.diastolic,
-                    pulse=bp_data.pulse,
-                    measured_at=bp_data.measured_at,
-                    notes=bp_data.notes
-                )
-                db.add(bp_record)
+        db.flush()
         
-        # 添加运动记录
-        if record_in.exercise_records:
-            for exercise_data in record_in.exercise_records:
-                exercise_record = ExerciseRecord(
-                    id=str(uuid.uuid4()),
-                    health_record_id=db_record.id,
-                    user_id=record_in.user_id,
-                    exercise_type=exercise_data.exercise_type,
-                    duration=exercise_data.duration,
-                    intensity=exercise_data.intensity,
-                    calories_burned=exercise_data.calories_burned,
-                    start_time=exercise_data.start_time,
-                    end_time=exercise_data.end_time,
-                    notes=exercise_data.notes
-                )
-                db.add(exercise_record)
-        
-        # 添加药物记录
-        if record_in.medication_records:
-            for med_data in record_in.medication_records:
-                med_record = MedicationRecord(
-                    id=str(uuid.uuid4()),
-                    health_record_id=db_record.id,
-                    user_id=record_in.user_id,
-                    name=med_data.name,
-                    dosage=med_data.dosage,
-                    taken_at=med_data.taken_at,
-                    scheduled_at=med_data.scheduled_at,
-                    is_taken=med_data.is_taken,
-                    notes=med_data.notes
-                )
-                db.add(med_record)
+        # 批量添加体重、血压、运动和药物记录
+        for name, (model, fields) in HEALTH_CHILD_COLLECTIONS.items():
+            items = getattr(record_in, name) or []
+            rows = [_child_row(data, fields, db_record.id, record_in.user_id) for data in items]
+            _insert_children(db, model, rows)
         
-        # 提交所有记录
+        # 一次提交所有记录
         db.commit()
         logger.info(f"健康记录创建成功: {db_record.id}")
-        return db_record
     except Exception as e:
         db.rollback()
         logger.error(f"创建健康记录失败: {str(e)}")
@@ -124,12 +173,19 @@ def create_health_record(db: Session, record_in: HealthCreate) -> HealthRecord:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"创建健康记录失败: {str(e)}"
         )
+    
+    # 用药记录是助手上下文的一部分
+    if record_in.medication_records:
+        user_context_store.refresh_health(db, record_in.user_id)
+    return get_health_record(db, db_record.id)
 
 
 def get_health_record(db: Session, record_id: str) -> Optional[HealthRecord]:
     """通过ID获取健康记录"""
     logger.info(f"获取健康记录: {record_id}")
-    record = db.query(HealthRecord).filter(HealthRecord.id == record_id).first()
+    record = db.query(HealthRecord).options(*HEALTH_RECORD_LOAD_OPTIONS).filter(
+        HealthRecord.id == record_id
+    ).first()
     if record:
         logger.info(f"获取健康记录成功: {record_id}")
     else:
@@ -149,7 +205,9 @@ def get_user_health_records(
     logger.info(f"获取用户健康记录: user_id={user_id}, skip={skip}, limit={limit}, start_date={start_date}, end_date={end_date}")
     
     # 构建查询
-    query = db.query(HealthRecord).filter(HealthRecord.user_id == user_id)
+    query = db.query(HealthRecord).options(*HEALTH_RECORD_LOAD_OPTIONS).filter(
+        HealthRecord.user_id == user_id
+    )
     
     # 添加日期过滤
     if start_date:
@@ -164,8 +222,13 @@ def get_user_health_records(
 
 
 def update_health_record(db: Session, record_id: str, record_in: HealthUpdate) -> HealthRecord:
-    """更新健康记录"""
-    # 获取记录
+    """
+    更新健康记录
+    
+    提交了的子记录列表视为该类型子记录的完整集合，与现有记录对比后
+    只插入、更新或删除发生变化的行；未提交（None）的列表保持不变。
+    """
+    # 获取记录（子记录已预加载，用于对比）
     db_record = get_health_record(db, record_id)
     if not db_record:
         raise HTTPException(
@@ -173,94 +236,38 @@ def update_health_record(db: Session, record_id: str, record_in: HealthUpdate) -
             detail="健康记录不存在"
         )
     
-    # 更新记录
-    if record_in.notes is not None:
-        db_record.notes = record_in.notes
-    
-    # 更新体重记录
-    if record_in.weight_records is not None:
-        # 删除现有记录
-        db.query(WeightRecord).filter(WeightRecord.health_record_id == record_id).delete()
-        
-        # 添加新记录
-        for weight_data in record_in.weight_records:
-            weight_record = WeightRecord(
-                id=str(uuid.uuid4()),
-                health_record_id=db_record.id,
-                user_id=db_record.user_id,
-                weight=weight_data.weight,
-                bmi=weight_data.bmi,
-                body_fat=weight_data.body_fat,
-                measured_at=weight_data.measured_at,
-                notes=weight_data.notes
-            )
-            db.add(weight_record)
-    
-    # 更新血压记录
-    if record_in.blood_pressure_records is not None:
-        # 删除现有记录
-        db.query(BloodPressureRecord).filter(BloodPressureRecord.health_record_id == record_id).delete()
+    try:
+        # 更新记录
+        if record_in.notes is not None:
+            db_record.notes = record_in.notes
         
-        # 添加新记录
-        for bp_data in record_in.blood_pressure_records:
-            bp_record = BloodPressureRecord(
-                id=str(uuid.uuid4()),
+        # 对比并同步各类子记录
+        for name, (model, fields) in HEALTH_CHILD_COLLECTIONS.items():
+            incoming = getattr(record_in, name)
+            if incoming is None:
+                continue
+            changes = _sync_children(
+                db, model, fields,
+                existing=list(getattr(db_record, name)),
+                incoming=incoming,
                 health_record_id=db_record.id,
-                user_id=db_record.user_id,
-                systolic=bp_data.systolic,
-                diastolic=bp_data.diastolic,
-                pulse=bp_data.pulse,
-                measured_at=bp_data.measured_at,
-                notes=bp_data.notes
+                user_id=db_record.user_id
             )
-            db.add(bp_record)
-    
-    # 更新运动记录
-    if record_in.exercise_records is not None:
-        # 删除现有记录
-        db.query(ExerciseRecord).filter(ExerciseRecord.health_record_id == record_id).delete()
+            logger.info(f"同步{name}: {changes}")
         
-        # 添加新记录
-        for exercise_data in record_in.exercise_records:
-            exercise_record = ExerciseRecord(
-                id=str(uuid.uuid4()),
-                health_record_id=db_record.id,
-                user_id=db_record.user_id,
-                exercise_type=exercise_data.exercise_type,
-                duration=exercise_data.duration,
-                intensity=exercise_data.intensity,
-                calories_burned=exercise_data.calories_burned,
-                start_time=exercise_data.start_time,
-                end_time=exercise_data.end_time,
-                notes=exercise_data.notes
-            )
-            db.add(exercise_record)
+        # 保存到数据库
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"更新健康记录失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"更新健康记录失败: {str(e)}"
+        )
     
-    # 更新药物记录
     if record_in.medication_records is not None:
-        # 删除现有记录
-        db.query(MedicationRecord).filter(MedicationRecord.health_record_id == record_id).delete()
-        
-        # 添加新记录
-        for med_data in record_in.medication_records:
-            med_record = MedicationRecord(
-                id=str(uuid.uuid4()),
-                health_record_id=db_record.id,
-                user_id=db_record.user_id,
-                name=med_data.name,
-                dosage=med_data.dosage,
-                taken_at=med_data.taken_at,
-                scheduled_at=med_data.scheduled_at,
-                is_taken=med_data.is_taken,
-                notes=med_data.notes
-            )
-            db.add(med_record)
-    
-    # 保存到数据库
-    db.commit()
-    db.refresh(db_record)
-    
-    return db_record
+        user_context_store.refresh_health(db, db_record.user_id)
+    return get_health_record(db, record_id)
 
 
 def delete_health_record(db: Session, record_id: str) -> bool:
@@ -279,33 +286,87 @@ def delete_health_record(db: Session, record_id: str) -> bool:
     db.query(MedicationRecord).filter(MedicationRecord.health_record_id == record_id).delete()
     
     # 删除主记录
+    user_id = db_record.user_id
     db.delete(db_record)
     db.commit()
+    user_context_store.refresh_health(db, user_id)
     
     return True
 
 
 # 单独的记录服务
-def create_weight_record(db: Session, user_id: str, record_data: WeightRecordSchema) -> WeightRecord:
-    """创建体重记录"""
-    # 查找或创建今天的健康记录
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    health_record = db.query(HealthRecord).filter(
-        and_(
-            HealthRecord.user_id == user_id,
-            func.date(HealthRecord.record_date) == func.date(today)
-        )
-    ).first()
+def _find_daily_health_record(db: Session, user_id: str, day: date, locking: bool = False) -> Optional[HealthRecord]:
+    query = db.query(HealthRecord).filter(
+        HealthRecord.user_id == user_id,
+        HealthRecord.daily_date == day
+    )
+    if locking:
+        # 加锁读取最新已提交数据，避免可重复读隔离级别下看不到并发事务刚插入的行
+        query = query.with_for_update(read=True)
+    return query.first()
+
+
+def get_or_create_daily_health_record(db: Session, user_id: str, day: Optional[date] = None) -> HealthRecord:
+    """
+    获取或创建用户某天的健康记录
     
-    if not health_record:
-        health_record = HealthRecord(
-            id=str(uuid.uuid4()),
-            user_id=user_id,
-            record_date=today
+    通过 (user_id, daily_date) 唯一索引查找；不存在时插入，只忽略唯一键冲突
+    （MySQL ON DUPLICATE KEY UPDATE / SQLite ON CONFLICT DO NOTHING），
+    并发请求同时创建时也只会留下一条当日记录。
+    """
+    day = day or date.today()
+    health_record = _find_daily_health_record(db, user_id, day)
+    if health_record:
+        return health_record
+    
+    values = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "record_date": datetime.combine(day, datetime.min.time()),
+        "daily_date": day,
+    }
+    dialect = db.get_bind().dialect.name
+    try:
+        if dialect == "mysql":
+            # 不用INSERT IGNORE：它同时会忽略外键等其他错误
+            statement = mysql_insert(HealthRecord).values(**values)
+            db.execute(statement.on_duplicate_key_update(daily_date=statement.inserted.daily_date))
+        elif dialect == "sqlite":
+            db.execute(
+                sqlite_insert(HealthRecord).values(**values).on_conflict_do_nothing(
+                    index_elements=["user_id", "daily_date"]
+                )
+            )
+        else:
+            # 其他数据库使用保存点，唯一约束冲突时回滚到保存点后重新读取
+            try:
+                with db.begin_nested():
+                    db.execute(insert(HealthRecord).values(**values))
+            except IntegrityError:
+                logger.info(f"当日健康记录已被并发创建: user_id={user_id}, day={day}")
+        health_record = _find_daily_health_record(db, user_id, day, locking=True)
+    except IntegrityError as e:
+        db.rollback()
+        logger.error(f"创建当日健康记录失败: user_id={user_id}, day={day}, {str(e)}")
+    
+    if health_record is None:
+        # 插入因唯一键以外的原因失败（如用户不存在）
+        if not db.query(User.id).filter(User.id == user_id).first():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="创建当日健康记录失败"
         )
-        db.add(health_record)
-        db.commit()
-        db.refresh(health_record)
+    return health_record
+
+
+def create_weight_record(db: Session, user_id: str, record_data: WeightRecordSchema) -> WeightRecord:
+    """创建体重记录"""
+    # 获取或创建今天的健康记录
+    health_record = get_or_create_daily_health_record(db, user_id)
     
     # 创建体重记录
     weight_record = WeightRecord(
@@ -328,24 +389,8 @@ def create_weight_record(db: Session, user_id: str, record_data: WeightRecordSch
 
 def create_blood_pressure_record(db: Session, user_id: str, record_data: BloodPressureRecordSchema) -> BloodPressureRecord:
     """创建血压记录"""
-    # 查找或创建今天的健康记录
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    health_record = db.query(HealthRecord).filter(
-        and_(
-            HealthRecord.user_id == user_id,
-            func.date(HealthRecord.record_date) == func.date(today)
-        )
-    ).first()
-    
-    if not health_record:
-        health_record = HealthRecord(
-            id=str(uuid.uuid4()),
-            user_id=user_id,
-            record_date=today
-        )
-        db.add(health_record)
-        db.commit()
-        db.refresh(health_record)
+    # 获取或创建今天的健康记录
+    health_record = get_or_create_daily_health_record(db, user_id)
     
     # 创建血压记录
     bp_record = BloodPressureRecord(
@@ -368,24 +413,8 @@ def create_blood_pressure_record(db: Session, user_id: str, record_data: BloodPr
 
 def create_exercise_record(db: Session, user_id: str, record_data: ExerciseRecordSchema) -> ExerciseRecord:
     """创建运动记录"""
-    # 查找或创建今天的健康记录
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    health_record = db.query(HealthRecord).filter(
-        and_(
-            HealthRecord.user_id == user_id,
-            func.date(HealthRecord.record_date) == func.date(today)
-        )
-    ).first()
-    
-    if not health_record:
-        health_record = HealthRecord(
-            id=str(uuid.uuid4()),
-            user_id=user_id,
-            record_date=today
-        )
-        db.add(health_record)
-        db.commit()
-        db.refresh(health_record)
+    # 获取或创建今天的健康记录
+    health_record = get_or_create_daily_health_record(db, user_id)
     
     # 创建运动记录
     exercise_record = ExerciseRecord(
@@ -410,24 +439,8 @@ def create_exercise_record(db: Session, user_id: str, record_data: ExerciseRecor
 
 def create_medication_record(db: Session, user_id: str, record_data: MedicationRecordSchema) -> MedicationRecord:
     """创建药物记录"""
-    # 查找或创建今天的健康记录
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    health_record = db.query(HealthRecord).filter(
-        and_(
-            HealthRecord.user_id == user_id,
-            func.date(HealthRecord.record_date) == func.date(today)
-        )
-    ).first()
-    
-    if not health_record:
-        health_record = HealthRecord(
-            id=str(uuid.uuid4()),
-            user_id=user_id,
-            record_date=today
-        )
-        db.add(health_record)
-        db.commit()
-        db.refresh(health_record)
+    # 获取或创建今天的健康记录
+    health_record = get_or_create_daily_health_record(db, user_id)
     
     # 创建药物记录
     med_record = MedicationRecord(
@@ -445,5 +458,6 @@ def create_medication_record(db: Session, user_id: str, record_data: MedicationR
     db.add(med_record)
     db.commit()
     db.refresh(med_record)
+    user_context_store.refresh_health(db, user_id)
     
     return med_record 
\ No newline at end of file
@@ -13,12 +13,22 @@ import logging
 from app.db.models import FoodNutrition
 from app.models.nutrition import FoodNutritionCreate, FoodNutritionUpdate, FoodNutritionPage
 from app.core.config import settings
+from app.services.food_search import food_search_index
+from app.services.food_catalog import food_catalog
+from app.services.food_icons import externalize_image_url
 
 logger = logging.getLogger(__name__)
 
 
 def create_food_nutrition(db: Session, food_in: FoodNutritionCreate) -> FoodNutrition:
     """创建食物营养记录"""
+    db_food = _create_food(db, food_in)
+    food_catalog.reload(db)
+    return db_food
+
+
+def _create_food(db: Session, food_in: FoodNutritionCreate) -> FoodNutrition:
+    """保存食物（内联SVG图标转换为图标文件URL）并更新搜索索引，由调用方重新加载目录快照"""
     db_food = FoodNutrition(
         name_cn=food_in.name_cn,
         calories=food_in.calories,
@@ -29,11 +39,12 @@ def create_food_nutrition(db: Session, food_in: FoodNutritionCreate) -> FoodNutr
         category=food_in.category,
         diabetes_index=food_in.diabetes_index,
         diabetes_friendly=food_in.diabetes_friendly,
-        image_url=food_in.image_url
+        image_url=externalize_image_url(food_in.image_url)
     )
     db.add(db_food)
     db.commit()
     db.refresh(db_food)
+    food_search_index.upsert(db_food)
     return db_food
 
 
@@ -52,61 +63,21 @@ def get_food_nutrition_list(
     sort_by: Optional[str] = None,
     sort_order: Optional[str] = "asc"
 ) -> FoodNutritionPage:
-    """获取食物营养记录列表"""
-    query = db.query(FoodNutrition)
+    """获取食物营养记录列表（在目录快照中过滤、排序和分页）"""
+    catalog = food_catalog.get(db)
+    category = category or None
     
-    # 应用过滤条件
-    if category:
-        query = query.filter(FoodNutrition.category == category)
-        
-    if diabetes_friendly is not None:
-        query = query.filter(FoodNutrition.diabetes_friendly == diabetes_friendly)
-        
+    food_ids = None
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(FoodNutrition.name_cn.ilike(search_term))
+        # 名称搜索使用内存索引（拼音、同义词、模糊匹配），未指定排序时按相关度和热度排序
+        matches = food_search_index.search(search, category=category, diabetes_friendly=diabetes_friendly)
+        food_ids = [food_id for food_id, _ in matches]
     
-    # 应用排序
+    rows = catalog.rows(category=category, diabetes_friendly=diabetes_friendly, ids=food_ids)
     if sort_by:
-        if sort_by == "calories":
-            order_column = FoodNutrition.calories
-        elif sort_by == "protein":
-            order_column = FoodNutrition.protein
-        elif sort_by == "fat":
-            order_column = FoodNutrition.fat
-        elif sort_by == "carbs":
-            order_column = FoodNutrition.carbs
-        elif sort_by == "gi":
-            order_column = FoodNutrition.gi
-        else:
-            order_column = FoodNutrition.id
-            
-        if sort_order == "desc":
-            query = query.order_by(desc(order_column))
-        else:
-            query = query.order_by(asc(order_column))
-    else:
-        # 默认按ID排序
-        query = query.order_by(FoodNutrition.id)
-    
-    # 计算总记录数和总页数
-    total = query.count()
-    pages = math.ceil(total / size) if total > 0 else 0
-    
-    # 分页
-    skip = (page - 1) * size
-    query = query.offset(skip).limit(size)
+        rows = catalog.sort(rows, sort_by, sort_order)
     
-    items = query.all()
-    
-    # 由于移除了时间戳字段，这里直接返回items而不需要额外处理
-    return FoodNutritionPage(
-        items=items,
-        total=total,
-        page=page,
-        size=size,
-        pages=pages
-    )
+    return catalog.page(rows, page, size)
 
 
 def update_food_nutrition(
@@ -120,11 +91,16 @@ def update_food_nutrition(
         return None
     
     update_data = food_in.dict(exclude_unset=True)
+    if "image_url" in update_data:
+        # 内联的SVG图标保存为图标文件，列表响应中只返回URL
+        update_data["image_url"] = externalize_image_url(update_data["image_url"])
     for field, value in update_data.items():
         setattr(db_food, field, value)
     
     db.commit()
     db.refresh(db_food)
+    food_search_index.upsert(db_food)
+    food_catalog.reload(db)
     return db_food
 
 
@@ -136,6 +112,8 @@ def delete_food_nutrition(db: Session, food_id: int) -> bool:
     
     db.delete(db_food)
     db.commit()
+    food_search_index.delete(food_id)
+    food_catalog.reload(db)
     return True
 
 
@@ -149,12 +127,14 @@ def import_food_nutrition_data(
     
     for item in items:
         try:
-            create_food_nutrition(db, item)
+            _create_food(db, item)
             imported_count += 1
         except Exception as e:
             logger.error(f"导入食物数据失败: {e}", exc_info=True)
             failed_count += 1
     
+    if imported_count:
+        food_catalog.reload(db)
     return imported_count, failed_count
 
 
@@ -170,8 +150,7 @@ def get_food_by_category(
 
 def get_all_categories(db: Session) -> List[str]:
     """获取所有食物分类"""
-    result = db.query(FoodNutrition.category).distinct().all()
-    return [r[0] for r in result]
+    return list(food_catalog.get(db).categories)
 
 
 def get_diabetes_friendly_foods(
@@ -197,28 +176,8 @@ def get_low_gi_foods(
     threshold: int = 55
 ) -> FoodNutritionPage:
     """获取低GI食物"""
-    query = db.query(FoodNutrition).filter(
-        FoodNutrition.gi.isnot(None),
-        FoodNutrition.gi <= threshold
-    )
-    
-    # 计算总记录数和总页数
-    total = query.count()
-    pages = math.ceil(total / size) if total > 0 else 0
-    
-    # 分页
-    skip = (page - 1) * size
-    query = query.offset(skip).limit(size)
-    
-    items = query.all()
-    
-    return FoodNutritionPage(
-        items=items,
-        total=total,
-        page=page,
-        size=size,
-        pages=pages
-    )
+    catalog = food_catalog.get(db)
+    return catalog.page(catalog.gi_range(-math.inf, threshold), page, size)
 
 
 def get_foods_by_gi_range(
@@ -229,29 +188,8 @@ def get_foods_by_gi_range(
     size: int = 20
 ) -> FoodNutritionPage:
     """根据血糖指数范围查询食物"""
-    query = db.query(FoodNutrition).filter(
-        FoodNutrition.gi.isnot(None),
-        FoodNutrition.gi >= min_gi,
-        FoodNutrition.gi <= max_gi
-    )
-    
-    # 计算总记录数和总页数
-    total = query.count()
-    pages = math.ceil(total / size) if total > 0 else 0
-    
-    # 分页
-    skip = (page - 1) * size
-    query = query.offset(skip).limit(size)
-    
-    items = query.all()
-    
-    return FoodNutritionPage(
-        items=items,
-        total=total,
-        page=page,
-        size=size,
-        pages=pages
-    )
+    catalog = food_catalog.get(db)
+    return catalog.page(catalog.gi_range(min_gi, max_gi), page, size)
 
 
 def search_foods(
@@ -264,6 +202,11 @@ def search_foods(
     return get_food_nutrition_list(db, page, size, search=query)
 
 
+def suggest_foods(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """食物名称输入联想，只读内存索引"""
+    return food_search_index.suggest(query, limit)
+
+
 async def upload_food_image(file: UploadFile, food_id: int) -> Dict[str, Any]:
     """上传食物图片"""
     # 确保目录存在
@@ -10,6 +10,7 @@ from app.db.models import User
 from app.db.session import get_db
 from app.models.user import UserCreate, UserUpdate, User as UserSchema
 from app.core.config import settings
+from app.services.user_context import user_context_store
 
 # 密码哈希工具
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -137,6 +138,7 @@ def update_user(db: Session, user_id: str, user_in: UserUpdate) -> User:
     # 保存到数据库
     db.commit()
     db.refresh(db_user)
+    user_context_store.refresh(db, user_id)
     
     return db_user
 
@@ -150,6 +152,7 @@ def delete_user(db: Session, user_id: str) -> bool:
             detail="用户不存在",
         )
     
+    user_context_store.delete(db, user_id)
     db.delete(db_user)
     db.commit()
     
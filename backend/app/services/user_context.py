@@ -0,0 +1,247 @@
+from typing import Dict, Any, Optional, List
+import time
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.models import User, GlucoseRecord, DietRecord, MedicationRecord, UserContextSnapshot
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+user_context_lookups_total = registry.counter(
+    "user_context_lookups_total",
+    "助手读取用户上下文快照的次数，source为memory（进程内缓存）、db（快照表）或build（重新构建）", ("source",)
+)
+
+# 用户资料字段；其余为近期健康数据（glucose、recent_meals、medications）
+PROFILE_FIELDS = (
+    "name", "gender", "age", "diabetes_type", "diagnosis_date", "height", "weight", "bmi",
+    "target_glucose_min", "target_glucose_max"
+)
+
+# 血糖统计的时间窗口和未设置目标范围时的默认范围（mmol/L）
+GLUCOSE_WINDOW_DAYS = 7
+DEFAULT_TARGET_RANGE = (3.9, 10.0)
+# 带入提示词的近期饮食条数，及视为正在使用的药物的时间窗口
+RECENT_MEALS = 3
+MEDICATION_WINDOW_DAYS = 30
+MAX_MEDICATIONS = 5
+
+
+def _profile(user: User, now: datetime) -> Dict[str, Any]:
+    context = {
+        "name": user.name,
+        "gender": user.gender.value if user.gender else None,
+        "age": (now - user.birth_date).days // 365 if user.birth_date else None,
+        "diabetes_type": user.diabetes_type.value if user.diabetes_type else None,
+        "diagnosis_date": user.diagnosis_date.isoformat() if user.diagnosis_date else None,
+        "height": user.height,
+        "weight": user.weight,
+        "target_glucose_min": user.target_glucose_min,
+        "target_glucose_max": user.target_glucose_max
+    }
+    if user.height and user.weight:
+        context["bmi"] = round(user.weight / (user.height / 100) ** 2, 1)
+    return context
+
+
+def _glucose_stats(db: Session, user: User, now: datetime) -> Optional[Dict[str, Any]]:
+    """近7天的血糖统计和最近一次测量，在数据库中聚合"""
+    low = user.target_glucose_min or DEFAULT_TARGET_RANGE[0]
+    high = user.target_glucose_max or DEFAULT_TARGET_RANGE[1]
+    window = (GlucoseRecord.user_id == user.id, GlucoseRecord.measured_at >= now - timedelta(days=GLUCOSE_WINDOW_DAYS))
+    count, average, minimum, maximum, in_range, high_count, low_count = db.query(
+        func.count(GlucoseRecord.id),
+        func.avg(GlucoseRecord.value),
+        func.min(GlucoseRecord.value),
+        func.max(GlucoseRecord.value),
+        func.sum(case((GlucoseRecord.value.between(low, high), 1), else_=0)),
+        func.sum(case((GlucoseRecord.value > high, 1), else_=0)),
+        func.sum(case((GlucoseRecord.value < low, 1), else_=0)),
+    ).filter(*window).one()
+    if not count:
+        return None
+    latest = db.query(GlucoseRecord).filter(*window).order_by(GlucoseRecord.measured_at.desc()).first()
+    return {
+        "days": GLUCOSE_WINDOW_DAYS,
+        "count": count,
+        "average": round(float(average), 1),
+        "min": float(minimum),
+        "max": float(maximum),
+        "in_range_percentage": round(100.0 * in_range / count, 1),
+        "high_count": int(high_count),
+        "low_count": int(low_count),
+        "latest": {
+            "value": latest.value,
+            "measurement_time": latest.measurement_time.value,
+            "measured_at": latest.measured_at.isoformat(),
+        },
+    }
+
+
+def _recent_meals(db: Session, user_id: str) -> List[Dict[str, Any]]:
+    records = db.query(DietRecord).filter(DietRecord.user_id == user_id).order_by(
+        DietRecord.meal_time.desc()
+    ).limit(RECENT_MEALS).all()
+    return [{
+        "meal_type": record.meal_type.value,
+        "meal_time": record.meal_time.isoformat() if record.meal_time else None,
+        "foods": [item.get("name") for item in record.food_items or [] if isinstance(item, dict) and item.get("name")],
+        "total_carbs": record.total_carbs,
+        "total_calories": record.total_calories,
+    } for record in records]
+
+
+def _active_medications(db: Session, user_id: str, now: datetime) -> List[Dict[str, Any]]:
+    """近30天服用过的药物，每种取最近一次的剂量"""
+    records = db.query(MedicationRecord).filter(
+        MedicationRecord.user_id == user_id,
+        MedicationRecord.taken_at >= now - timedelta(days=MEDICATION_WINDOW_DAYS)
+    ).order_by(MedicationRecord.taken_at.desc()).limit(MAX_MEDICATIONS * 10).all()
+    medications = OrderedDict()
+    for record in records:
+        if record.name not in medications and len(medications) < MAX_MEDICATIONS:
+            medications[record.name] = {
+                "name": record.name,
+                "dosage": record.dosage,
+                "last_taken_at": record.taken_at.isoformat() if record.taken_at else None,
+            }
+    return list(medications.values())
+
+
+def profile_only(context: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留用户资料字段"""
+    return {key: context.get(key) for key in PROFILE_FIELDS if key in context}
+
+
+def has_health_data(context: Dict[str, Any]) -> bool:
+    """上下文中是否有该用户的近期血糖、饮食或用药数据"""
+    return bool(context.get("glucose") or context.get("recent_meals") or context.get("medications"))
+
+
+def build_user_context(db: Session, user_id: str, health: bool = None) -> Optional[Dict[str, Any]]:
+    """
+    从数据库构建用户上下文：资料字段（与原user_context相同）加 glucose、recent_meals、medications
+
+    Args:
+        health: 是否查询近期健康数据，默认取ASSISTANT_HEALTH_CONTEXT；否则只有资料字段（一次查询）
+
+    用户不存在时返回None
+    """
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        return None
+    now = datetime.now()
+    context = _profile(user, now)
+    if not (settings.ASSISTANT_HEALTH_CONTEXT if health is None else health):
+        return context
+    context["glucose"] = _glucose_stats(db, user, now)
+    context["recent_meals"] = _recent_meals(db, user_id)
+    context["medications"] = _active_medications(db, user_id, now)
+    return context
+
+
+class UserContextStore:
+    """
+    用户上下文快照
+
+    修改用户资料并提交后调用refresh、写入血糖、饮食、用药记录并提交后调用refresh_health，
+    重新构建快照并写入user_context_snapshots表和进程内缓存；未开启ASSISTANT_HEALTH_CONTEXT时快照只有资料字段，
+    写入健康记录不需要重建。
+    助手生成回复时调用get，命中进程内缓存时不查询数据库，否则读取一行快照。
+    进程内缓存的条目最多保留cache_ttl秒，多个工作进程之间通过快照表同步；
+    快照超过max_age秒（近7天统计的时间窗口已移动）或不存在时，读取时重新构建并只缓存在进程内。
+    """
+
+    def __init__(self, cache_ttl: float = None, max_age: float = None, max_entries: int = None):
+        self.cache_ttl = cache_ttl if cache_ttl is not None else settings.USER_CONTEXT_CACHE_TTL_SECONDS
+        self.max_age = max_age if max_age is not None else settings.USER_CONTEXT_MAX_AGE_SECONDS
+        self.max_entries = max_entries or settings.USER_CONTEXT_CACHE_MAX_ENTRIES
+        # 用户ID -> (缓存时间, 快照构建时间, 上下文)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: str) -> Optional[Dict[str, Any]]:
+        """读取用户上下文；用户不存在时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and now - entry[0] <= self.cache_ttl and not self._stale(entry[1], entry[2]):
+                self._cache.move_to_end(user_id)
+                user_context_lookups_total.inc(source="memory")
+                return entry[2]
+
+        snapshot = db.query(UserContextSnapshot).filter(UserContextSnapshot.user_id == user_id).first()
+        if snapshot is not None and not self._stale(snapshot.built_at, snapshot.data):
+            user_context_lookups_total.inc(source="db")
+            self._remember(user_id, snapshot.built_at, snapshot.data)
+            return snapshot.data
+
+        # 读取时调用方的会话中可能有未提交的写入（如本轮用户消息），只构建并缓存在进程内，快照表由写入路径更新
+        user_context_lookups_total.inc(source="build")
+        context = build_user_context(db, user_id)
+        if context is not None:
+            self._remember(user_id, datetime.now(), context)
+        return context
+
+    def refresh(self, db: Session, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        重新构建并保存用户的快照（在写入相关记录并提交之后调用）
+
+        快照保存失败不影响调用方的写入，只清除进程内缓存，下次读取时重新构建。
+        """
+        try:
+            context = build_user_context(db, user_id)
+            if context is None:
+                self.invalidate(user_id)
+                return None
+            built_at = datetime.now()
+            db.merge(UserContextSnapshot(user_id=user_id, data=context, built_at=built_at))
+            db.commit()
+            self._remember(user_id, built_at, context)
+            return context
+        except Exception as e:
+            db.rollback()
+            self.invalidate(user_id)
+            logger.error(f"更新用户上下文快照失败: {str(e)}")
+            return None
+
+    def refresh_health(self, db: Session, user_id: str) -> Optional[Dict[str, Any]]:
+        """写入血糖、饮食或用药记录并提交后调用；未开启ASSISTANT_HEALTH_CONTEXT时快照不含健康数据，不需要重建"""
+        if not settings.ASSISTANT_HEALTH_CONTEXT:
+            return None
+        return self.refresh(db, user_id)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def delete(self, db: Session, user_id: str):
+        """删除用户的快照（删除用户前调用，由调用方提交）"""
+        self.invalidate(user_id)
+        db.query(UserContextSnapshot).filter(UserContextSnapshot.user_id == user_id).delete()
+
+    def _expired(self, built_at: datetime) -> bool:
+        return (datetime.now() - built_at).total_seconds() > self.max_age
+
+    def _stale(self, built_at: datetime, context: Dict[str, Any]) -> bool:
+        """快照过期，或开启ASSISTANT_HEALTH_CONTEXT前构建、缺少健康数据"""
+        return self._expired(built_at) or (settings.ASSISTANT_HEALTH_CONTEXT and "glucose" not in context)
+
+    def _remember(self, user_id: str, built_at: datetime, context: Dict[str, Any]):
+        with self._lock:
+            self._cache[user_id] = (time.monotonic(), built_at, context)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+
+# 全局快照实例
+user_context_store = UserContextStore()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+本地推理后端生成速度基准测试
+
+对比transformers（MODEL_PROVIDER=local）和llama.cpp（MODEL_PROVIDER=gguf）在同一组问题上的单请求生成速度：
+首次加载耗时、每条回复的生成耗时分位数和解码速度（token/秒）。默认使用贪心解码，两种后端生成长度可比。
+
+使用方法:
+- python benchmark_llm_backends.py --local-model ./models/deepseek-lite --gguf-model ./models/deepseek-lite-q4_k_m.gguf
+- python benchmark_llm_backends.py --gguf-model ./models/deepseek-lite-q4_k_m.gguf --threads 4,8 --max-new-tokens 128
+- python benchmark_llm_backends.py --local-model ./models/deepseek-lite --quantization none
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.ml.local_model import LocalModelRunner
+from app.ml.gguf_model import GGUFModelRunner
+
+QUESTIONS = [
+    "空腹血糖7.2mmol/L需要注意什么？",
+    "糖尿病患者早餐可以吃什么？",
+    "餐后两小时血糖多少算正常？",
+    "运动后血糖偏低应该怎么处理？",
+    "二甲双胍有哪些常见的副作用？",
+]
+
+
+def run(name: str, runner, requests: int, max_new_tokens: int):
+    start = time.perf_counter()
+    runner.warm_up()
+    load_seconds = time.perf_counter() - start
+
+    timings, tokens = [], 0
+    for i in range(requests):
+        result = runner.generate(
+            [{"role": "user", "content": QUESTIONS[i % len(QUESTIONS)]}],
+            max_new_tokens=max_new_tokens, do_sample=False
+        )
+        timings.append(result["seconds"])
+        tokens += result["completion_tokens"]
+    timings = np.array(timings)
+    print(f"{name:<28}{load_seconds:>10.1f}{np.percentile(timings, 50):>9.2f}{np.percentile(timings, 95):>9.2f}"
+          f"{tokens / timings.sum():>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地推理后端生成速度基准测试")
+    parser.add_argument("--local-model", help="transformers模型目录，不指定则跳过")
+    parser.add_argument("--quantization", default=settings.MODEL_QUANTIZATION, help="transformers后端的量化方式：int8, none")
+    parser.add_argument("--gguf-model", help="GGUF模型文件，不指定则跳过")
+    parser.add_argument("--threads", default=str(settings.MODEL_THREADS), help="逗号分隔的gguf解码线程数，0为自动")
+    parser.add_argument("--requests", type=int, default=10, help="每种后端的请求数")
+    parser.add_argument("--max-new-tokens", type=int, default=128, help="每条回复最多生成的token数")
+    args = parser.parse_args()
+    if not args.local_model and not args.gguf_model:
+        parser.error("至少指定 --local-model 或 --gguf-model")
+
+    print(f"每种后端 {args.requests} 个请求，每条最多 {args.max_new_tokens} token，CPU逻辑核 {os.cpu_count()}\n")
+    print(f"{'后端':<28}{'加载(s)':>10}{'p50(s)':>9}{'p95(s)':>9}{'token/s':>10}")
+    if args.local_model:
+        runner = LocalModelRunner(args.local_model, "cpu", args.quantization, prefix_cache_mb=0)
+        run(f"transformers ({args.quantization})", runner, args.requests, args.max_new_tokens)
+    if args.gguf_model:
+        for threads in [int(n) for n in args.threads.split(",")]:
+            # 关闭前缀缓存，只比较模型本身的计算速度
+            runner = GGUFModelRunner(args.gguf_model, threads=threads, prefix_cache_mb=0)
+            run(f"llama.cpp (threads={threads or 'auto'})", runner, args.requests, args.max_new_tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+本地模型动态批处理基准测试
+
+用本地transformers模型模拟多个并发对话，对比逐条生成（批大小1）和动态批处理下的
+总吞吐（所有对话每秒生成的token数）以及单个请求的延迟分位数，用于选择 MODEL_BATCH_MAX_SIZE 和 MODEL_BATCH_MAX_WAIT_MS。
+各并发对话持续提问：上一条回复返回后立即发出下一条，每个对话共发 --rounds 条。
+为使不同配置生成的token数可比，默认使用贪心解码。
+
+使用方法:
+- python benchmark_llm_batching.py
+- python benchmark_llm_batching.py --concurrency 8,16,32 --batch-sizes 1,8,16,32 --max-new-tokens 64
+- python benchmark_llm_batching.py --model-path ./models/deepseek-lite --quantization none --max-wait-ms 10
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.ml.local_model import LocalModelRunner
+from app.ml.batching import BatchScheduler
+
+QUESTIONS = [
+    "空腹血糖7.2mmol/L需要注意什么？",
+    "糖尿病患者早餐可以吃什么？",
+    "餐后两小时血糖多少算正常？",
+    "运动后血糖偏低应该怎么处理？",
+    "二甲双胍有哪些常见的副作用？",
+    "糖化血红蛋白多久检测一次比较合适？",
+    "低血糖有哪些典型症状？",
+    "妊娠期糖尿病饮食上要注意哪些问题？",
+]
+
+
+def run(scheduler: BatchScheduler, concurrency: int, rounds: int, options: dict):
+    """返回 (总耗时秒, 生成token总数, 每个请求的延迟秒, 每个请求所在批次大小)"""
+    latencies, batch_sizes, tokens = [], [], []
+    lock = threading.Lock()
+
+    def chat(worker: int):
+        for turn in range(rounds):
+            question = QUESTIONS[(worker + turn) % len(QUESTIONS)]
+            start = time.perf_counter()
+            result = scheduler.submit([{"role": "user", "content": question}], **options)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                batch_sizes.append(result["batch_size"])
+                tokens.append(result["completion_tokens"])
+
+    threads = [threading.Thread(target=chat, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sum(tokens), np.array(latencies), np.array(batch_sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模型动态批处理基准测试")
+    parser.add_argument("--model-path", default=settings.MODEL_PATH, help="模型路径")
+    parser.add_argument("--device", default=settings.MODEL_DEVICE, help="推理设备")
+    parser.add_argument("--quantization", default=settings.MODEL_QUANTIZATION, help="量化方式：int4, int8, none")
+    parser.add_argument("--concurrency", default="1,8,16,32", help="逗号分隔的并发对话数")
+    parser.add_argument("--batch-sizes", default=f"1,{settings.MODEL_BATCH_MAX_SIZE}", help="逗号分隔的最大批大小，1为逐条生成")
+    parser.add_argument("--max-wait-ms", type=float, default=settings.MODEL_BATCH_MAX_WAIT_MS, help="凑批最多等待的毫秒数")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="每条回复最多生成的token数")
+    parser.add_argument("--rounds", type=int, default=2, help="每个对话连续提问的次数")
+    args = parser.parse_args()
+
+    runner = LocalModelRunner(args.model_path, args.device, args.quantization)
+    runner.warm_up()
+    options = {"max_new_tokens": args.max_new_tokens, "do_sample": False}
+
+    print(f"模型 {args.model_path}（{args.device}, {args.quantization}），每条最多 {args.max_new_tokens} token，"
+          f"每个对话 {args.rounds} 轮，凑批等待 {args.max_wait_ms}ms\n")
+    print(f"{'并发':>6}{'批大小上限':>10}{'平均批大小':>10}{'token/s':>10}{'p50(s)':>9}{'p95(s)':>9}{'耗时(s)':>9}")
+
+    for concurrency in [int(n) for n in args.concurrency.split(",")]:
+        for batch_size in [int(n) for n in args.batch_sizes.split(",")]:
+            scheduler = BatchScheduler(runner.generate_batch, max_batch_size=batch_size, max_wait_ms=args.max_wait_ms)
+            elapsed, tokens, latencies, batch_sizes = run(scheduler, concurrency, args.rounds, options)
+            scheduler.stop()
+            print(f"{concurrency:>6}{batch_size:>10}{batch_sizes.mean():>10.1f}{tokens / elapsed:>10.1f}"
+                  f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}{elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""
+大模型接口吞吐量和延迟基准测试（离线）
+
+启动模拟Ollama服务（mock_ollama.py）和使用模拟推理器的本地模型服务，在临时SQLite数据库上运行完整的API，
+按给定并发数请求以下接口，输出每个场景的延迟分位数（p50/p95/p99）、首token时间（TTFT，仅流式接口）和吞吐量：
+- assistant: POST /assistant/chat（本地模型服务，经动态批处理）
+- alert:     POST /glucose-monitor/analyze（有预警，后台任务经模型路由调用Ollama小模型，计到任务完成）
+- advice:    POST /glucose-monitor/analyze-trend（后台任务经模型路由调用Ollama大模型，计到任务完成）
+- stream:    POST /ollama/generate/stream（流式，TTFT为收到第一段内容的时间）
+
+不需要真实模型、GPU或网络，可在CI中运行；--max-p95 超出或有失败的请求时以非0状态退出，用于发现性能回退。
+
+使用方法:
+- python benchmark_llm_endpoints.py
+- python benchmark_llm_endpoints.py --concurrency 1,4,16 --requests 32 --scenarios alert,advice
+- python benchmark_llm_endpoints.py --tokens-per-second 10 --first-token-ms 500 --parallel 2
+- python benchmark_llm_endpoints.py --max-p95 alert=3 --max-p95 assistant=5 --json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_ollama import MockOllamaServer, TOKEN_TEXT, add_arguments, parse_model_speeds
+
+SCENARIOS = ["assistant", "alert", "advice", "stream"]
+QUESTIONS = [
+    "空腹血糖7.2mmol/L需要注意什么？",
+    "糖尿病患者早餐可以吃什么？",
+    "餐后两小时血糖多少算正常？",
+    "运动后血糖偏低应该怎么处理？",
+]
+# 含低血糖和高血糖的记录，/analyze 会生成预警
+GLUCOSE_VALUES = [3.2, 6.1, 11.5, 7.4, 8.9, 5.6]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class MockRunner:
+    """模拟本地模型：一批请求共享解码步，耗时 = 首token延迟 + 最长生成长度 / 解码速度"""
+
+    model_path = "mock-model"
+    loaded = True
+
+    def __init__(self, tokens_per_second: float, first_token_ms: float, completion_tokens: int):
+        self.tokens_per_second = tokens_per_second
+        self.first_token_ms = first_token_ms
+        self.completion_tokens = completion_tokens
+        self.generated_tokens = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        pass
+
+    def warm_up(self):
+        pass
+
+    def generate_batch(self, conversations, **options):
+        tokens = min(int(options.get("max_new_tokens") or self.completion_tokens), self.completion_tokens)
+        seconds = self.first_token_ms / 1000 + tokens / self.tokens_per_second
+        time.sleep(seconds)
+        with self._lock:
+            self.generated_tokens += tokens * len(conversations)
+        return [{
+            "text": TOKEN_TEXT * tokens,
+            "prompt_tokens": sum(len(m["content"]) for m in messages),
+            "completion_tokens": tokens,
+            "seconds": seconds,
+        } for messages in conversations]
+
+
+def seed_users(count: int):
+    """创建测试用户和血糖记录，返回每个用户的访问令牌"""
+    import uuid
+    from datetime import datetime, timedelta
+    from app.db.session import engine, SessionLocal
+    from app.db.base_class import Base
+    from app.db.models import User, GlucoseRecord
+    from app.core.security import create_access_token
+    from app.models.glucose import MeasurementTimeEnum, MeasurementMethodEnum
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    tokens = []
+    now = datetime.now()
+    times = list(MeasurementTimeEnum)
+    for i in range(count):
+        user = User(id=str(uuid.uuid4()), email=f"bench{i}@example.com", name=f"测试用户{i}", is_active=True)
+        db.add(user)
+        for j, value in enumerate(GLUCOSE_VALUES):
+            db.add(GlucoseRecord(
+                id=str(uuid.uuid4()), user_id=user.id, value=value,
+                measurement_time=times[j % len(times)], measurement_method=list(MeasurementMethodEnum)[0],
+                measured_at=now - timedelta(hours=2 * j + 1)
+            ))
+        tokens.append(create_access_token(user.id))
+    db.commit()
+    db.close()
+    return tokens
+
+
+def start_api(port: int):
+    """在后台线程中运行API服务"""
+    import uvicorn
+    from main import app
+
+    # 逐请求的INFO日志会影响计时
+    logging.getLogger().setLevel(logging.WARNING)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="api-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def run_job(client, path: str, body: dict):
+    """提交分析请求；返回202时轮询任务直到完成"""
+    response = client.post(path, json=body)
+    response.raise_for_status()
+    if response.status_code != 202:
+        return
+    status_url = response.json()["status_url"]
+    while True:
+        time.sleep(0.02)
+        job = client.get(status_url).json()
+        if job["status"] == "succeeded":
+            return
+        if job["status"] == "failed":
+            raise RuntimeError(job["error"])
+
+
+def make_request(scenario: str, client, i: int):
+    """
+    发送一个请求
+
+    Returns:
+        首token时间（秒），非流式接口为None
+    """
+    if scenario == "assistant":
+        response = client.post("/api/v1/assistant/chat", json={"message": QUESTIONS[i % len(QUESTIONS)]})
+        response.raise_for_status()
+    elif scenario == "alert":
+        run_job(client, "/api/v1/glucose-monitor/analyze", {"hours": 24})
+    elif scenario == "advice":
+        run_job(client, "/api/v1/glucose-monitor/analyze-trend", {"days": 3})
+    elif scenario == "stream":
+        start = time.perf_counter()
+        ttft = None
+        body = {"prompt": QUESTIONS[i % len(QUESTIONS)], "model": "deepseek-r1:1.5b", "max_tokens": 512}
+        with client.stream("POST", "/api/v1/ollama/generate/stream", json=body) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                if chunk and ttft is None:
+                    ttft = time.perf_counter() - start
+        return ttft
+    return None
+
+
+def run_scenario(scenario: str, base_url: str, tokens, concurrency: int, requests: int, token_counter):
+    """按并发数发送requests个请求，每个并发使用不同的用户"""
+    import httpx
+
+    clients = [
+        httpx.Client(base_url=base_url, headers={"Authorization": f"Bearer {token}"}, timeout=300)
+        for token in tokens[:concurrency]
+    ]
+    latencies, ttfts, errors = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(w: int):
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                ttft = make_request(scenario, clients[w], i)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+    tokens_before = token_counter()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        client.close()
+
+    result = {
+        "scenario": scenario, "concurrency": concurrency, "requests": requests,
+        "errors": len(errors), "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "tokens_per_second": (token_counter() - tokens_before) / elapsed,
+    }
+    if latencies:
+        result.update({f"p{q}": float(np.percentile(latencies, q)) for q in (50, 95, 99)})
+    if ttfts:
+        result.update({f"ttft_p{q}": float(np.percentile(ttfts, q)) for q in (50, 95)})
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def print_result(result: dict):
+    def fmt(key):
+        return f"{result[key]:.2f}" if key in result else "-"
+
+    print(f"{result['scenario']:<10}{result['concurrency']:>6}{result['requests']:>6}{result['errors']:>6}"
+          f"{fmt('p50'):>9}{fmt('p95'):>9}{fmt('p99'):>9}{fmt('ttft_p50'):>10}{fmt('ttft_p95'):>10}"
+          f"{result['requests_per_second']:>9.2f}{result['tokens_per_second']:>10.1f}")
+    if "first_error" in result:
+        print(f"  ⚠️ {result['first_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大模型接口吞吐量和延迟基准测试（离线）")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔的场景：{', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,4", help="逗号分隔的并发数")
+    parser.add_argument("--requests", type=int, default=16, help="每个场景、每个并发数的请求数")
+    parser.add_argument("--max-p95", action="append", metavar="SCENARIO=SECONDS", help="p95延迟上限，超出时以非0状态退出，可重复")
+    parser.add_argument("--json", help="结果另存为JSON文件")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知的场景: {', '.join(sorted(unknown))}")
+    concurrency_levels = [int(n) for n in args.concurrency.split(",")]
+    limits = {name: float(seconds) for name, seconds in (item.split("=") for item in args.max_p95 or [])}
+
+    ollama = MockOllamaServer(
+        tokens_per_second=args.tokens_per_second, first_token_ms=args.first_token_ms,
+        completion_tokens=args.completion_tokens, parallel=args.parallel,
+        model_speeds=parse_model_speeds(args.model_speed)
+    ).start()
+
+    # 配置在导入app之前通过环境变量设置：临时数据库、模拟服务地址，关闭依赖嵌入模型的回答缓存
+    workdir = tempfile.mkdtemp(prefix="llm-bench-")
+    model_server_address = f"127.0.0.1:{free_port()}"
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "OLLAMA_BASE_URL": ollama.url,
+        "MODEL_SERVER_ADDRESS": model_server_address,
+        "RESPONSE_CACHE_ENABLED": "false",
+        "DEBUG": "false",
+    })
+
+    from app.ml.model_server import ModelServer
+
+    runner = MockRunner(args.tokens_per_second, args.first_token_ms, args.completion_tokens)
+    ModelServer(model_server_address, runner=runner).start()
+    tokens = seed_users(max(concurrency_levels))
+    api_port = free_port()
+    start_api(api_port)
+    base_url = f"http://127.0.0.1:{api_port}"
+
+    print(f"模拟模型: {args.tokens_per_second} token/s，首token {args.first_token_ms}ms，"
+          f"最多 {args.completion_tokens} token，Ollama并行 {args.parallel}\n")
+    print(f"{'场景':<8}{'并发':>4}{'请求':>4}{'失败':>4}{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}"
+          f"{'TTFT50':>10}{'TTFT95':>10}{'req/s':>9}{'token/s':>10}")
+    results = []
+    for scenario in scenarios:
+        token_counter = (lambda: runner.generated_tokens) if scenario == "assistant" else (
+            lambda: ollama.stats()["generated_tokens"])
+        # 预热：建立连接、初始化客户端，不计入结果
+        run_scenario(scenario, base_url, tokens, 1, 1, token_counter)
+        for concurrency in concurrency_levels:
+            result = run_scenario(scenario, base_url, tokens, concurrency, args.requests, token_counter)
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.json}")
+
+    failed = [r for r in results if r["errors"]]
+    failed += [r for r in results if r["scenario"] in limits and r.get("p95", float("inf")) > limits[r["scenario"]]]
+    if failed:
+        for r in failed:
+            print(f"❌ {r['scenario']} 并发{r['concurrency']}: 失败 {r['errors']} 个，p95 {r.get('p95', float('nan')):.2f}s")
+        sys.exit(1)
+    print("\n✅ 基准测试完成")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+测试公共工具
+
+各测试文件也可以直接用 python test_xxx.py 运行，因此这里提供普通函数，由测试文件导入使用。
+"""
+
+import os
+import sys
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.base_class import Base
+
+
+def make_session_factory(path: str = None):
+    """
+    创建SQLite引擎并建表，返回 (engine, 会话工厂)
+
+    默认为内存数据库（所有会话共用一个连接）；多个线程同时写入时传入path使用文件数据库，每个会话独立连接
+    """
+    if path is not None:
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+        Base.metadata.create_all(bind=engine)
+        return engine, sessionmaker(bind=engine, autoflush=False)
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine, autoflush=False)
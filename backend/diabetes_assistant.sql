@@ -16,6 +16,24 @@
 SET NAMES utf8mb4;
 SET FOREIGN_KEY_CHECKS = 0;
 -- ----------------------------
+-- Table structure for background_jobs
+-- ----------------------------
+DROP TABLE IF EXISTS `background_jobs`;
+CREATE TABLE `background_jobs` (
+  `id` varchar(36) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+  `user_id` varchar(36) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+  `kind` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+  `params_key` varchar(40) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+  `status` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+  `result` json NULL,
+  `error` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL,
+  `created_at` datetime NOT NULL,
+  `finished_at` datetime NULL DEFAULT NULL,
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `ix_background_jobs_user_kind_key`(`user_id` ASC, `kind` ASC, `params_key` ASC) USING BTREE,
+  CONSTRAINT `background_jobs_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
+-- ----------------------------
 -- Table structure for blood_pressure_records
 -- ----------------------------
 DROP TABLE IF EXISTS `blood_pressure_records`;
@@ -33,6 +51,7 @@ CREATE TABLE `blood_pressure_records` (
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `health_record_id`(`health_record_id` ASC) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_blood_pressure_records_user_measured`(`user_id` ASC, `measured_at` ASC) USING BTREE,
   CONSTRAINT `blood_pressure_records_ibfk_1` FOREIGN KEY (`health_record_id`) REFERENCES `health_records` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT,
   CONSTRAINT `blood_pressure_records_ibfk_2` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
@@ -45,10 +64,13 @@ CREATE TABLE `conversations` (
   `user_id` varchar(36) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL,
   `title` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
   `is_active` tinyint(1) NULL DEFAULT NULL,
+  `summary` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL,
+  `summarized_count` int NOT NULL DEFAULT 0,
   `created_at` datetime NULL DEFAULT NULL,
   `updated_at` datetime NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_conversations_user_updated`(`user_id` ASC, `updated_at` ASC) USING BTREE,
   CONSTRAINT `conversations_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
 -- ----------------------------
@@ -69,6 +91,7 @@ CREATE TABLE `diet_records` (
   `updated_at` datetime NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_diet_records_user_meal_time`(`user_id` ASC, `meal_time` ASC) USING BTREE,
   CONSTRAINT `diet_records_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
 -- ----------------------------
@@ -100,6 +123,7 @@ CREATE TABLE `exercise_records` (
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `health_record_id`(`health_record_id` ASC) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_exercise_records_user_start_time`(`user_id` ASC, `start_time` ASC) USING BTREE,
   CONSTRAINT `exercise_records_ibfk_1` FOREIGN KEY (`health_record_id`) REFERENCES `health_records` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT,
   CONSTRAINT `exercise_records_ibfk_2` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
@@ -150,6 +174,7 @@ CREATE TABLE `glucose_records` (
   `updated_at` datetime NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_glucose_records_user_measured`(`user_id` ASC, `measured_at` ASC) USING BTREE,
   CONSTRAINT `glucose_records_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
 -- ----------------------------
@@ -160,11 +185,14 @@ CREATE TABLE `health_records` (
   `id` varchar(36) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
   `user_id` varchar(36) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL,
   `record_date` datetime NULL DEFAULT NULL,
+  `daily_date` date NULL DEFAULT NULL,
   `notes` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL,
   `created_at` datetime NULL DEFAULT NULL,
   `updated_at` datetime NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_health_records_user_record_date`(`user_id` ASC, `record_date` ASC) USING BTREE,
+  UNIQUE INDEX `uq_health_records_user_daily`(`user_id` ASC, `daily_date` ASC) USING BTREE,
   CONSTRAINT `health_records_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
 -- ----------------------------
@@ -179,7 +207,8 @@ CREATE TABLE `knowledge_base` (
   `tags` json NOT NULL,
   `created_at` datetime NULL DEFAULT NULL,
   `updated_at` datetime NULL DEFAULT NULL,
-  PRIMARY KEY (`id`) USING BTREE
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `ix_knowledge_base_updated_at`(`updated_at` ASC) USING BTREE
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
 -- ----------------------------
 -- Table structure for medication_records
@@ -200,6 +229,7 @@ CREATE TABLE `medication_records` (
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `health_record_id`(`health_record_id` ASC) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_medication_records_user_taken_at`(`user_id` ASC, `taken_at` ASC) USING BTREE,
   CONSTRAINT `medication_records_ibfk_1` FOREIGN KEY (`health_record_id`) REFERENCES `health_records` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT,
   CONSTRAINT `medication_records_ibfk_2` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
@@ -214,10 +244,12 @@ CREATE TABLE `messages` (
   `content` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
   `timestamp` datetime NULL DEFAULT NULL,
   `message_metadata` json NULL,
+  `summarized` tinyint(1) NOT NULL DEFAULT 0,
   `created_at` datetime NULL DEFAULT NULL,
   `updated_at` datetime NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `conversation_id`(`conversation_id` ASC) USING BTREE,
+  INDEX `ix_messages_conversation_timestamp`(`conversation_id` ASC, `timestamp` ASC) USING BTREE,
   CONSTRAINT `messages_ibfk_1` FOREIGN KEY (`conversation_id`) REFERENCES `conversations` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
 -- ----------------------------
@@ -284,6 +316,17 @@ CREATE TABLE `users` (
   UNIQUE INDEX `ix_users_email`(`email` ASC) USING BTREE
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
 -- ----------------------------
+-- Table structure for user_context_snapshots
+-- ----------------------------
+DROP TABLE IF EXISTS `user_context_snapshots`;
+CREATE TABLE `user_context_snapshots` (
+  `user_id` varchar(36) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+  `data` json NOT NULL,
+  `built_at` datetime NOT NULL,
+  PRIMARY KEY (`user_id`) USING BTREE,
+  CONSTRAINT `user_context_snapshots_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
+-- ----------------------------
 -- Table structure for weight_records
 -- ----------------------------
 DROP TABLE IF EXISTS `weight_records`;
@@ -301,6 +344,7 @@ CREATE TABLE `weight_records` (
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `health_record_id`(`health_record_id` ASC) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_weight_records_user_measured`(`user_id` ASC, `measured_at` ASC) USING BTREE,
   CONSTRAINT `weight_records_ibfk_1` FOREIGN KEY (`health_record_id`) REFERENCES `health_records` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT,
   CONSTRAINT `weight_records_ibfk_2` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci ROW_FORMAT = Dynamic;
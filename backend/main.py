@@ -1,6 +1,8 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import uvicorn
+import os
 import logging
 from typing import List
 
@@ -8,6 +10,9 @@ from app.api import router as api_router
 from app.core.config import settings
 from app.ml.llm_service import llm_service
 from app.core.scheduler import glucose_scheduler
+from app.core.metrics import PerformanceMiddleware, instrument_engine, render_metrics
+from app.db.session import engine
+from app.services.food_icons import FoodIconFiles, ICON_URL_PREFIX, icon_dir
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -47,9 +52,18 @@ app.add_middleware(
     max_age=3600,  # 预检请求的缓存时间
 )
 
+# 请求级性能统计：路由耗时直方图、并发数、每个请求的SQL次数与耗时
+if settings.METRICS_ENABLED:
+    app.add_middleware(PerformanceMiddleware)
+    instrument_engine(engine)
+
 # 注册路由
 app.include_router(api_router, prefix="/api/v1")
 
+# 食物图标：按内容寻址的SVG文件，带长期缓存头
+os.makedirs(icon_dir(), exist_ok=True)
+app.mount(ICON_URL_PREFIX, FoodIconFiles(directory=icon_dir()), name="food_icons")
+
 @app.get("/")
 async def root():
     return {
@@ -58,16 +72,36 @@ async def root():
         "status": "running"
     }
 
+@app.get("/health")
+def health():
+    """存活与就绪检查：status为ok表示API可用，ready表示大模型可以立即生成回复"""
+    model = llm_service.model_status()
+    return {
+        "status": "ok",
+        "ready": model.get("state") == "ready",
+        "model": model
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """以Prometheus文本格式导出性能指标，仅允许本机访问"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="指标未启用")
+    client_host = request.client.host if request.client else None
+    if client_host not in ("127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="仅允许本机访问指标")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时执行的操作"""
     logger.info("正在初始化应用...")
     
-    # 禁用向量数据库初始化
-    logger.info("向量数据库初始化已禁用，以提高启动速度")
-    
-    # 禁用模型预加载
-    logger.info("模型预加载已禁用，将在首次使用时按需加载")
+    # 模型在独立的模型服务进程中加载，或在本进程首次使用时按需加载
+    if settings.MODEL_SERVER_ADDRESS:
+        logger.info(f"使用模型服务 {settings.MODEL_SERVER_ADDRESS}，状态: {llm_service.model_status().get('state')}")
+    else:
+        logger.info("模型预加载已禁用，将在首次使用时按需加载")
     
     # 启动血糖监测调度器
     logger.info("正在启动血糖监测调度器...")
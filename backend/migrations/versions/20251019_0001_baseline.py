@@ -0,0 +1,29 @@
+"""基线版本
+
+对应 diabetes_assistant.sql / init_db() 创建的初始表结构。
+已有数据库直接执行 alembic upgrade head 即可，本版本不做任何修改。
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-10-19 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    pass
+
+
+def downgrade() -> None:
+    pass
@@ -0,0 +1,80 @@
+"""当日健康记录唯一键
+
+为 health_records 增加 daily_date 列及 (user_id, daily_date) 唯一索引，
+供快速记录接口按索引获取或创建当日健康记录。
+已有数据中每个用户每天最早的一条健康记录（原先按日期查找到的当日记录）回填daily_date，
+避免升级后为同一天再创建一条当日记录。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-10-19 10:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    columns = {column["name"] for column in inspector.get_columns("health_records")}
+    indexes = {index["name"] for index in inspector.get_indexes("health_records")}
+    indexes |= {constraint["name"] for constraint in inspector.get_unique_constraints("health_records")}
+
+    # 新建的数据库可能已由 init_db()/SQL文件 创建了该列和索引
+    with op.batch_alter_table("health_records") as batch_op:
+        if "daily_date" not in columns:
+            batch_op.add_column(sa.Column("daily_date", sa.Date(), nullable=True))
+        if "uq_health_records_user_daily" not in indexes:
+            batch_op.create_index("uq_health_records_user_daily", ["user_id", "daily_date"], unique=True)
+
+    _backfill_daily_date()
+
+
+def _backfill_daily_date() -> None:
+    """每个用户每天最早的一条健康记录设为当日记录；已有当日记录的日期跳过，可重复执行"""
+    health_records = sa.table(
+        "health_records",
+        sa.column("id", sa.String),
+        sa.column("user_id", sa.String),
+        sa.column("record_date", sa.DateTime),
+        sa.column("created_at", sa.DateTime),
+        sa.column("daily_date", sa.Date),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(
+            health_records.c.id, health_records.c.user_id, health_records.c.record_date, health_records.c.daily_date
+        ).where(health_records.c.record_date.isnot(None)).order_by(
+            health_records.c.record_date, health_records.c.created_at, health_records.c.id
+        )
+    ).fetchall()
+
+    taken = {(row.user_id, row.daily_date) for row in rows if row.daily_date is not None}
+    updates = []
+    for row in rows:
+        key = (row.user_id, row.record_date.date())
+        if row.daily_date is None and key not in taken:
+            taken.add(key)
+            updates.append({"record_id": row.id, "day": key[1]})
+    if updates:
+        bind.execute(
+            health_records.update().where(health_records.c.id == sa.bindparam("record_id")).values(
+                daily_date=sa.bindparam("day")
+            ),
+            updates
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("health_records") as batch_op:
+        batch_op.drop_index("uq_health_records_user_daily")
+        batch_op.drop_column("daily_date")
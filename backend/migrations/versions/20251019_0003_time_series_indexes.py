@@ -0,0 +1,61 @@
+"""按用户的时间序列表复合索引
+
+覆盖 app/services/* 中的高频查询：按用户（或对话、健康记录）过滤，
+再按时间范围过滤和排序。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-10-19 10:20:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (表名, 索引名, 索引列)
+INDEXES = [
+    ("glucose_records", "ix_glucose_records_user_measured", ["user_id", "measured_at"]),
+    ("diet_records", "ix_diet_records_user_meal_time", ["user_id", "meal_time"]),
+    ("health_records", "ix_health_records_user_record_date", ["user_id", "record_date"]),
+    ("weight_records", "ix_weight_records_health_record", ["health_record_id"]),
+    ("weight_records", "ix_weight_records_user_measured", ["user_id", "measured_at"]),
+    ("blood_pressure_records", "ix_blood_pressure_records_health_record", ["health_record_id"]),
+    ("blood_pressure_records", "ix_blood_pressure_records_user_measured", ["user_id", "measured_at"]),
+    ("exercise_records", "ix_exercise_records_health_record", ["health_record_id"]),
+    ("exercise_records", "ix_exercise_records_user_start_time", ["user_id", "start_time"]),
+    ("medication_records", "ix_medication_records_health_record", ["health_record_id"]),
+    ("medication_records", "ix_medication_records_user_taken_at", ["user_id", "taken_at"]),
+    ("conversations", "ix_conversations_user_updated", ["user_id", "updated_at"]),
+    ("messages", "ix_messages_conversation_timestamp", ["conversation_id", "timestamp"]),
+    ("knowledge_base", "ix_knowledge_base_updated_at", ["updated_at"]),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing = {}
+    for table, name, columns in INDEXES:
+        if table not in existing:
+            existing[table] = [
+                (index["name"], list(index["column_names"])) for index in inspector.get_indexes(table)
+            ]
+        # 同名或同列的索引已存在（如SQL文件中的 health_record_id 索引）则跳过
+        if any(index_name == name or index_columns == columns for index_name, index_columns in existing[table]):
+            continue
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table, name, columns in reversed(INDEXES):
+        if name in {index["name"] for index in inspector.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
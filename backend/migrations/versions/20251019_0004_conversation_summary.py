@@ -0,0 +1,41 @@
+"""对话滚动摘要
+
+为 conversations 增加 summary（较早消息的摘要）和 summarized_count（已并入摘要的消息数），
+生成回复时只带入摘要和之后的近期消息。
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-10-19 10:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    columns = {column["name"] for column in inspector.get_columns("conversations")}
+
+    # 新建的数据库可能已由 init_db()/SQL文件 创建了这两列
+    with op.batch_alter_table("conversations") as batch_op:
+        if "summary" not in columns:
+            batch_op.add_column(sa.Column("summary", sa.Text(), nullable=True))
+        if "summarized_count" not in columns:
+            batch_op.add_column(
+                sa.Column("summarized_count", sa.Integer(), nullable=False, server_default="0")
+            )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("conversations") as batch_op:
+        batch_op.drop_column("summarized_count")
+        batch_op.drop_column("summary")
@@ -0,0 +1,38 @@
+"""用户上下文快照
+
+新增 user_context_snapshots：每个用户一行，保存资料、近7天血糖统计、近期饮食和用药的快照（JSON），
+写入相关记录时重建，助手构建提示词时只需读取一行。
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-10-19 11:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # 新建的数据库可能已由 init_db()/SQL文件 创建了该表
+    if "user_context_snapshots" in inspector.get_table_names():
+        return
+    op.create_table(
+        "user_context_snapshots",
+        sa.Column("user_id", sa.String(36), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("data", sa.JSON(), nullable=False),
+        sa.Column("built_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_context_snapshots")
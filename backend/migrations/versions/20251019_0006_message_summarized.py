@@ -0,0 +1,60 @@
+"""逐条标记已并入摘要的消息
+
+为 messages 增加 summarized。此前按 conversations.summarized_count 取按时间排序的前N条消息视为已合并，
+DATETIME只精确到秒，同一秒的消息顺序不确定，会重复合并或跳过消息。升级时按(timestamp, id)回填已有对话。
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-10-19 11:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _backfill_summarized() -> None:
+    """把各对话按(timestamp, id)排序的前summarized_count条消息标记为已合并"""
+    bind = op.get_bind()
+    conversations = sa.table("conversations", sa.column("id"), sa.column("summarized_count"))
+    messages = sa.table(
+        "messages", sa.column("id"), sa.column("conversation_id"), sa.column("timestamp"), sa.column("summarized")
+    )
+    rows = bind.execute(
+        sa.select(conversations.c.id, conversations.c.summarized_count).where(conversations.c.summarized_count > 0)
+    ).fetchall()
+    for conversation_id, count in rows:
+        ids = [
+            row[0] for row in bind.execute(
+                sa.select(messages.c.id)
+                .where(messages.c.conversation_id == conversation_id)
+                .order_by(messages.c.timestamp, messages.c.id)
+                .limit(count)
+            )
+        ]
+        if ids:
+            bind.execute(messages.update().where(messages.c.id.in_(ids)).values(summarized=True))
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    columns = {column["name"] for column in inspector.get_columns("messages")}
+
+    # 新建的数据库可能已由 init_db()/SQL文件 创建了该列
+    if "summarized" not in columns:
+        with op.batch_alter_table("messages") as batch_op:
+            batch_op.add_column(sa.Column("summarized", sa.Boolean(), nullable=False, server_default=sa.false()))
+        _backfill_summarized()
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.drop_column("summarized")
@@ -0,0 +1,46 @@
+"""后台任务表
+
+新增 background_jobs：血糖分析后台任务的状态和结果。多个API工作进程时，
+查询任务的请求可能到达其他进程，任务状态保存在数据库中，任一进程都能查询。
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2025-10-19 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # 新建的数据库可能已由 init_db()/SQL文件 创建了该表
+    if "background_jobs" in inspector.get_table_names():
+        return
+    op.create_table(
+        "background_jobs",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("user_id", sa.String(36), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("params_key", sa.String(40), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_background_jobs_user_kind_key", "background_jobs", ["user_id", "kind", "params_key"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_background_jobs_user_kind_key", table_name="background_jobs")
+    op.drop_table("background_jobs")
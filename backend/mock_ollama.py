@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+模拟Ollama服务
+
+实现 /api/tags、/api/generate、/api/chat（含流式输出），按配置的首token延迟和解码速度返回固定文本，
+不需要真实模型和GPU，用于离线的性能基准测试（benchmark_llm_endpoints.py）和前端联调。
+同时生成的请求数由 --parallel 限制（对应Ollama的OLLAMA_NUM_PARALLEL），超出的请求排队，与真实服务的排队行为一致。
+
+使用方法:
+- python mock_ollama.py                                   # 监听 127.0.0.1:11434
+- python mock_ollama.py --port 11500 --tokens-per-second 20 --first-token-ms 300
+- python mock_ollama.py --model-speed deepseek-r1:7b=8 --model-speed deepseek-r1:1.5b=40
+- OLLAMA_BASE_URL=http://127.0.0.1:11500 uvicorn main:app
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 每个token对应的模拟文本
+TOKEN_TEXT = "糖"
+
+
+class MockOllamaServer:
+    """
+    在后台线程中运行的模拟Ollama服务
+
+    每个请求的耗时 = 排队时间 + first_token_ms + 生成token数 / tokens_per_second，
+    生成token数为请求的num_predict与completion_tokens中的较小值；model_speeds可按模型覆盖解码速度。
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        tokens_per_second: float = 30.0,
+        first_token_ms: float = 200.0,
+        completion_tokens: int = 120,
+        parallel: int = 1,
+        model_speeds: dict = None
+    ):
+        self.tokens_per_second = tokens_per_second
+        self.first_token_ms = first_token_ms
+        self.completion_tokens = completion_tokens
+        self.model_speeds = model_speeds or {}
+        self._slots = threading.BoundedSemaphore(parallel)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.generated_tokens = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "generated_tokens": self.generated_tokens}
+
+    def _tokens(self, body: dict) -> int:
+        num_predict = (body.get("options") or {}).get("num_predict")
+        if num_predict is None or num_predict < 0:
+            return self.completion_tokens
+        return max(1, min(int(num_predict), self.completion_tokens))
+
+    def _generate(self, body: dict, prompt_chars: int):
+        """按模拟速度逐个产出token；调用方持有并发名额"""
+        tokens = self._tokens(body)
+        speed = self.model_speeds.get(body.get("model"), self.tokens_per_second)
+        time.sleep(self.first_token_ms / 1000)
+        for i in range(tokens):
+            if i:
+                time.sleep(1.0 / speed)
+            yield TOKEN_TEXT
+        with self._lock:
+            self.requests += 1
+            self.generated_tokens += tokens
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    models = sorted(set(server.model_speeds) | {"deepseek-r1:1.5b", "deepseek-r1:7b"})
+                    self._send_json({"models": [{"name": name, "model": name, "size": 0} for name in models]})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                if self.path not in ("/api/generate", "/api/chat"):
+                    self._send_json({"error": "not found"}, 404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                chat = self.path == "/api/chat"
+                if chat:
+                    prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages") or [])
+                else:
+                    prompt_chars = len(body.get("prompt") or "") + len(body.get("system") or "")
+
+                start = time.perf_counter_ns()
+                with server._slots:
+                    if body.get("stream", True):
+                        self._stream(body, chat, prompt_chars, start)
+                    else:
+                        text = "".join(server._generate(body, prompt_chars))
+                        self._send_json(self._chunk(body, chat, text, True, prompt_chars, len(text), start))
+
+            def _chunk(self, body, chat, text, done, prompt_chars, tokens, start):
+                chunk = {"model": body.get("model"), "created_at": datetime.now().isoformat(), "done": done}
+                if chat:
+                    chunk["message"] = {"role": "assistant", "content": text}
+                else:
+                    chunk["response"] = text
+                if done:
+                    chunk.update({
+                        "total_duration": time.perf_counter_ns() - start,
+                        "prompt_eval_count": prompt_chars,
+                        "eval_count": tokens,
+                    })
+                return chunk
+
+            def _stream(self, body, chat, prompt_chars, start):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                tokens = 0
+                for text in server._generate(body, prompt_chars):
+                    tokens += 1
+                    self._write_chunk(self._chunk(body, chat, text, False, prompt_chars, tokens, start))
+                self._write_chunk(self._chunk(body, chat, "", True, prompt_chars, tokens, start))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, payload):
+                data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def parse_model_speeds(values) -> dict:
+    """解析"模型名=token/秒"列表"""
+    speeds = {}
+    for value in values or []:
+        name, _, speed = value.rpartition("=")
+        if not name:
+            raise ValueError(f"无效的模型速度: {value}，格式为 模型名=token/秒")
+        speeds[name] = float(speed)
+    return speeds
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """模拟服务的命令行参数，基准测试脚本共用"""
+    parser.add_argument("--tokens-per-second", type=float, default=30.0, help="模拟的解码速度（token/秒）")
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="模拟的首token延迟（毫秒，含提示词编码）")
+    parser.add_argument("--completion-tokens", type=int, default=120, help="每次最多生成的token数（不超过请求的num_predict）")
+    parser.add_argument("--parallel", type=int, default=1, help="同时生成的请求数，对应OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--model-speed", action="append", metavar="MODEL=TPS", help="按模型覆盖解码速度，可重复")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟Ollama服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockOllamaServer(
+        args.host, args.port, args.tokens_per_second, args.first_token_ms, args.completion_tokens,
+        args.parallel, parse_model_speeds(args.model_speed)
+    )
+    print(f"🚀 模拟Ollama服务已启动: {server.url}（{args.tokens_per_second} token/s，首token {args.first_token_ms}ms）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
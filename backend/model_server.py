@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+本地模型推理服务
+
+独立进程中加载一份本地transformers模型并预热，API工作进程通过 MODEL_SERVER_ADDRESS 连接，
+不再各自加载模型。加载和预热期间 /health 中的 model.state 为 loading，完成后为 ready。
+
+使用方法:
+- export MODEL_SERVER_AUTHKEY=$(openssl rand -hex 32)   # API进程和模型服务使用同一个密钥，必须设置
+- python model_server.py                         # 监听 MODEL_SERVER_ADDRESS，默认 127.0.0.1:8765
+- python model_server.py --address 127.0.0.1:9000
+- MODEL_SERVER_ADDRESS=127.0.0.1:8765 uvicorn main:app --workers 4
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.ml.model_server import ModelServer
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模型推理服务")
+    parser.add_argument("--address", default=settings.MODEL_SERVER_ADDRESS or "127.0.0.1:8765", help="监听地址 host:port")
+    args = parser.parse_args()
+
+    try:
+        server = ModelServer(args.address)
+    except RuntimeError as e:
+        print(f"❌ {str(e)}")
+        sys.exit(1)
+    print(f"🚀 模型服务启动中: {args.address}，模型 {settings.MODEL_PATH}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
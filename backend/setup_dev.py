@@ -13,6 +13,7 @@
 - 重置数据库（删除所有表并重新创建）: python setup_dev.py --reset
 - 创建示例数据: python setup_dev.py --sample-data
 - 导入食物营养数据: python setup_dev.py --import-food
+- 把已有的内联SVG图标转换为图标文件: python setup_dev.py --migrate-icons
 
 注意:
 - 默认使用diabetes_assistant.sql文件创建表结构，确保该文件位于backend目录下
@@ -40,6 +41,7 @@ from app.db.init_db import init_db, reset_db
 from app.db.session import SessionLocal, engine
 from app.models.user import UserCreate
 from app.services.user import create_superuser, get_user_by_email
+from app.services.food_icons import store_svg, migrate_inline_icons
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
@@ -310,9 +312,9 @@ def import_food_nutrition_data(db):
         # 批量插入数据
         with engine.begin() as conn:
             for food in food_data:
-                # 生成食物外形的SVG图标
+                # 生成食物外形的SVG图标，保存为图标文件，数据库中只存URL
                 svg_icon = get_food_svg(food['name_cn'], food['category'])
-                image_url = f"data:image/svg+xml;utf8,{svg_icon}"
+                image_url = store_svg(svg_icon)
                 
                 # 插入数据
                 conn.execute(
@@ -592,6 +594,7 @@ def main():
     parser.add_argument("--init-db", action="store_true", help="初始化数据库")
     parser.add_argument("--use-orm", action="store_true", help="使用ORM模型创建表结构（默认使用SQL文件）")
     parser.add_argument("--import-food", action="store_true", help="导入食物营养数据")
+    parser.add_argument("--migrate-icons", action="store_true", help="把数据库中内联的SVG图标转换为图标文件")
     args = parser.parse_args()
     
     try:
@@ -625,6 +628,11 @@ def main():
                 logger.info("正在导入食物营养数据...")
                 import_food_nutrition_data(db)
             
+            # 转换内联的SVG图标
+            if args.migrate_icons:
+                logger.info("正在转换内联的SVG图标...")
+                migrate_inline_icons(db)
+            
             logger.info("开发环境设置完成！")
             logger.info("\n开发账号信息:")
             logger.info(f"管理员: admin@example.com / admin123")
@@ -0,0 +1,135 @@
+"""
+生成请求动态批处理测试
+
+用记录批次的假批量生成函数验证：
+1. 并发请求在等待窗口内合并为一批，结果按请求各自返回
+2. 每批不超过max_batch_size，生成参数不同的请求不合并
+3. 单个请求最多等待max_wait_ms即被执行
+4. 批次失败时该批所有请求都收到异常，不影响后续批次
+"""
+
+import os
+import sys
+import time
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.ml.batching import BatchScheduler
+
+
+class _FakeBatchModel:
+    """记录每批请求和参数的假模型，回复为最后一条消息的倒序"""
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def generate_batch(self, conversations, **options):
+        with self._lock:
+            self.batches.append(([messages[-1]["content"] for messages in conversations], options))
+        time.sleep(self.seconds)
+        if any(messages[-1]["content"] == "fail" for messages in conversations):
+            raise RuntimeError("生成出错")
+        return [
+            {"text": messages[-1]["content"][::-1], "prompt_tokens": 1, "completion_tokens": 1, "seconds": self.seconds}
+            for messages in conversations
+        ]
+
+
+def _ask_concurrently(scheduler, contents, options=None):
+    results = [None] * len(contents)
+
+    def ask(i):
+        try:
+            results[i] = scheduler.submit([{"role": "user", "content": contents[i]}], **(options or {}))
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(contents))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_requests_form_batches():
+    model = _FakeBatchModel(seconds=0.02)
+    scheduler = BatchScheduler(model.generate_batch, max_batch_size=4, max_wait_ms=200)
+    results = _ask_concurrently(scheduler, [f"问题{i}" for i in range(10)])
+
+    assert [result["text"] for result in results] == [f"{i}题问" for i in range(10)]
+    sizes = [len(contents) for contents, _ in model.batches]
+    assert sum(sizes) == 10 and max(sizes) <= 4
+    assert len(sizes) == 3
+    assert all(result["batch_size"] in sizes for result in results)
+    assert scheduler.pending() == 0
+    scheduler.stop()
+
+
+def test_batches_grouped_by_options():
+    model = _FakeBatchModel()
+    scheduler = BatchScheduler(model.generate_batch, max_batch_size=8, max_wait_ms=100)
+    results = []
+
+    def run(options, contents):
+        results.extend(_ask_concurrently(scheduler, contents, options))
+
+    threads = [
+        threading.Thread(target=run, args=({"max_new_tokens": 16}, ["a", "b", "c"])),
+        threading.Thread(target=run, args=({"max_new_tokens": 64}, ["d", "e"])),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 5
+    for contents, options in model.batches:
+        expected = {"a", "b", "c"} if options["max_new_tokens"] == 16 else {"d", "e"}
+        assert set(contents) <= expected
+    scheduler.stop()
+
+
+def test_single_request_waits_at_most_max_wait():
+    model = _FakeBatchModel()
+    scheduler = BatchScheduler(model.generate_batch, max_batch_size=8, max_wait_ms=50)
+    start = time.perf_counter()
+    result = scheduler.submit([{"role": "user", "content": "你好"}])
+    elapsed = time.perf_counter() - start
+    assert result["text"] == "好你" and result["batch_size"] == 1
+    assert 0.04 <= elapsed < 1.0
+
+    # max_batch_size为1时不等待
+    sequential = BatchScheduler(model.generate_batch, max_batch_size=1, max_wait_ms=1000)
+    start = time.perf_counter()
+    sequential.submit([{"role": "user", "content": "你好"}])
+    assert time.perf_counter() - start < 0.5
+    scheduler.stop()
+    sequential.stop()
+
+
+def test_batch_failure_reported_to_each_request():
+    model = _FakeBatchModel()
+    scheduler = BatchScheduler(model.generate_batch, max_batch_size=4, max_wait_ms=100)
+    results = _ask_concurrently(scheduler, ["fail", "ok"])
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    assert scheduler.submit([{"role": "user", "content": "ok"}])["text"] == "ko"
+    scheduler.stop()
+    try:
+        scheduler.submit([{"role": "user", "content": "ok"}])
+        assert False, "停止后应拒绝请求"
+    except RuntimeError:
+        pass
+
+
+if __name__ == "__main__":
+    test_concurrent_requests_form_batches()
+    test_batches_grouped_by_options()
+    test_single_request_waits_at_most_max_wait()
+    test_batch_failure_reported_to_each_request()
+    print("✅ 动态批处理测试通过")
@@ -0,0 +1,247 @@
+"""
+对话历史窗口和滚动摘要测试
+
+用内存SQLite和假的token计数/摘要函数验证：
+1. 近期消息按token预算从最新往前截取，从用户消息开始，排除当前轮消息和生成失败的回复
+2. 超出预算时最早的消息并入摘要，summarized_count推进，剩余不超过预算的一半
+3. 摘要后构建的上下文只含摘要和之后的消息，长度与对话轮数无关
+4. 摘要生成失败时保留原状态
+5. 同一秒内写入的消息，多次合并后每条消息恰好并入摘要或留在窗口中一次
+6. 后台合并由单个工作线程执行，同一对话排队或合并中时跳过
+7. 迁移0006按summarized_count回填已有对话的已合并标记
+"""
+
+import os
+import sys
+import uuid
+import threading
+import importlib.util
+from datetime import datetime, timedelta
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.db.models import User, Conversation, Message
+from app.models.assistant import MessageRoleEnum
+from app.services.conversation_history import ConversationHistory, MESSAGE_OVERHEAD_TOKENS
+
+MIGRATION_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "migrations", "versions", "20251019_0006_message_summarized.py"
+)
+
+
+def _make_session_factory():
+    """创建内存SQLite会话工厂并建表"""
+    return make_session_factory()[1]
+
+
+def _seed(db, turns: int, content_length: int = 20) -> str:
+    """创建一个有turns轮问答的对话，每条消息content_length个字符"""
+    user_id, conversation_id = str(uuid.uuid4()), str(uuid.uuid4())
+    db.add(User(id=user_id, email=f"{user_id}@example.com", name="测试用户"))
+    db.add(Conversation(id=conversation_id, user_id=user_id, title="测试对话"))
+    start = datetime.now() - timedelta(hours=1)
+    for i in range(turns):
+        for offset, role in enumerate((MessageRoleEnum.USER, MessageRoleEnum.ASSISTANT)):
+            db.add(Message(
+                id=str(uuid.uuid4()), conversation_id=conversation_id, role=role,
+                content=f"{role.value}{i}".ljust(content_length, "。"),
+                timestamp=start + timedelta(seconds=2 * i + offset)
+            ))
+    db.commit()
+    return conversation_id
+
+
+class _FakeSummarizer:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, previous, turns):
+        if self.fail:
+            raise RuntimeError("模型不可用")
+        self.calls.append((previous, turns))
+        first, last = (turn["content"].rstrip("。") for turn in (turns[0], turns[-1]))
+        return f"{previous or ''}[{first}..{last}]"
+
+
+def test_window_within_budget():
+    factory = _make_session_factory()
+    db = factory()
+    conversation_id = _seed(db, turns=10)
+    conversation = db.get(Conversation, conversation_id)
+    per_message = 20 + MESSAGE_OVERHEAD_TOKENS
+    history = ConversationHistory(len, _FakeSummarizer(), token_budget=per_message * 5, session_factory=factory)
+
+    summary, window = history.build(db, conversation)
+    assert summary is None
+    # 预算容纳5条，但窗口需从用户消息开始，保留最近的4条（两轮）
+    assert [turn["content"].rstrip("。") for turn in window] == ["user8", "assistant8", "user9", "assistant9"]
+    assert all(turn["content"].startswith(turn["role"]) for turn in window)
+
+    # 当前轮的用户消息不带入历史；失败的回复被跳过
+    current = Message(
+        id=str(uuid.uuid4()), conversation_id=conversation_id, role=MessageRoleEnum.USER,
+        content="当前问题", timestamp=datetime.now()
+    )
+    failed = db.query(Message).filter(Message.content.like("assistant9%")).first()
+    failed.message_metadata = {"error": "超时"}
+    db.add(current)
+    db.commit()
+    _, window = history.build(db, conversation, exclude_message_id=current.id)
+    assert "当前问题" not in [turn["content"] for turn in window]
+    assert window[-1]["content"].startswith("user9")
+
+
+def test_fold_into_summary():
+    factory = _make_session_factory()
+    db = factory()
+    conversation_id = _seed(db, turns=10)
+    per_message = 20 + MESSAGE_OVERHEAD_TOKENS
+    summarizer = _FakeSummarizer()
+    history = ConversationHistory(len, summarizer, token_budget=per_message * 8, session_factory=factory)
+
+    assert history.fold(conversation_id)
+    db.expire_all()
+    conversation = db.get(Conversation, conversation_id)
+    # 20条消息合并到不超过预算一半（4条）
+    assert conversation.summarized_count == 16
+    assert conversation.summary == "[user0..assistant7]"
+    assert len(summarizer.calls[0][1]) == 16
+
+    summary, window = history.build(db, conversation)
+    assert summary == conversation.summary
+    assert [turn["content"].rstrip("。") for turn in window] == ["user8", "assistant8", "user9", "assistant9"]
+    # 未超出预算时不再合并
+    assert not history.fold(conversation_id)
+
+    # 继续对话：新摘要在旧摘要基础上合并
+    _seed_more(db, conversation_id, start_turn=10, turns=4)
+    assert history.fold(conversation_id)
+    db.expire_all()
+    conversation = db.get(Conversation, conversation_id)
+    assert summarizer.calls[1][0] == "[user0..assistant7]"
+    assert conversation.summary.startswith("[user0..assistant7][user8")
+    _, window = history.build(db, conversation)
+    assert sum(len(turn["content"]) + MESSAGE_OVERHEAD_TOKENS for turn in window) <= history.token_budget
+
+
+def _seed_more(db, conversation_id, start_turn, turns, content_length=20):
+    start = datetime.now()
+    for i in range(start_turn, start_turn + turns):
+        for offset, role in enumerate((MessageRoleEnum.USER, MessageRoleEnum.ASSISTANT)):
+            db.add(Message(
+                id=str(uuid.uuid4()), conversation_id=conversation_id, role=role,
+                content=f"{role.value}{i}".ljust(content_length, "。"),
+                timestamp=start + timedelta(seconds=2 * i + offset)
+            ))
+    db.commit()
+
+
+def test_fold_failure_keeps_state():
+    factory = _make_session_factory()
+    db = factory()
+    conversation_id = _seed(db, turns=10)
+    history = ConversationHistory(len, _FakeSummarizer(fail=True), token_budget=100, session_factory=factory)
+    assert not history.fold(conversation_id)
+    db.expire_all()
+    conversation = db.get(Conversation, conversation_id)
+    assert conversation.summary is None and conversation.summarized_count == 0
+
+
+def test_same_second_messages_folded_once():
+    factory = _make_session_factory()
+    db = factory()
+    user_id, conversation_id = str(uuid.uuid4()), str(uuid.uuid4())
+    db.add(User(id=user_id, email=f"{user_id}@example.com", name="测试用户"))
+    db.add(Conversation(id=conversation_id, user_id=user_id, title="测试对话"))
+    db.commit()
+    # DATETIME只精确到秒：每3轮（6条消息）共用一个时间戳
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    per_message = 20 + MESSAGE_OVERHEAD_TOKENS
+    summarizer = _FakeSummarizer()
+    history = ConversationHistory(len, summarizer, token_budget=per_message * 6, session_factory=factory)
+    for i in range(12):
+        for role in (MessageRoleEnum.USER, MessageRoleEnum.ASSISTANT):
+            db.add(Message(
+                id=str(uuid.uuid4()), conversation_id=conversation_id, role=role,
+                content=f"{role.value}{i}".ljust(20, "。"), timestamp=start + timedelta(seconds=i // 3)
+            ))
+        db.commit()
+        history.fold(conversation_id)
+
+    db.expire_all()
+    conversation = db.get(Conversation, conversation_id)
+    folded = [turn["content"] for _, turns in summarizer.calls for turn in turns]
+    pending = [message.content for message in history._unsummarized(db, conversation)]
+    contents = [message.content for message in db.query(Message).filter(Message.conversation_id == conversation_id)]
+    assert len(summarizer.calls) > 1
+    # 新消息按id可能排在已合并的同一秒消息之前，但每条消息只合并一次，其余的都未合并
+    assert sorted(folded + pending) == sorted(contents)
+    assert db.query(Message).filter(Message.summarized == True).count() == conversation.summarized_count
+
+
+def test_background_folds_on_one_worker():
+    factory = _make_session_factory()
+    db = factory()
+    conversation_ids = [_seed(db, turns=10) for _ in range(3)]
+    release = threading.Event()
+    active, threads = [], set()
+
+    def slow_summarizer(previous, turns):
+        active.append(1)
+        threads.add(threading.current_thread().name)
+        assert len(active) == 1, "同一时刻只运行一个合并"
+        release.wait(timeout=5)
+        active.pop()
+        return "摘要"
+
+    history = ConversationHistory(len, slow_summarizer, token_budget=100, session_factory=factory)
+    futures = [history.schedule_fold(conversation_id) for conversation_id in conversation_ids]
+    # 已排队的对话不再重复提交
+    assert history.schedule_fold(conversation_ids[0]) is None
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert len(threads) == 1
+    db.expire_all()
+    assert all(db.get(Conversation, conversation_id).summary == "摘要" for conversation_id in conversation_ids)
+    # 完成后可以再次提交
+    assert history.schedule_fold(conversation_ids[0]).result(timeout=5) is None
+
+
+def test_migration_backfills_summarized():
+    spec = importlib.util.spec_from_file_location("migration_0006", MIGRATION_PATH)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    engine, factory = make_session_factory()
+    db = factory()
+    conversation_id = _seed(db, turns=5)
+    conversation = db.get(Conversation, conversation_id)
+    conversation.summarized_count = 6
+    db.commit()
+
+    with engine.begin() as conn:
+        with Operations.context(MigrationContext.configure(conn)):
+            migration._backfill_summarized()
+
+    db.expire_all()
+    history = ConversationHistory(len, _FakeSummarizer(), token_budget=10 ** 6, session_factory=factory)
+    _, window = history.build(db, conversation)
+    assert [turn["content"].rstrip("。") for turn in window] == ["user3", "assistant3", "user4", "assistant4"]
+    assert db.query(Message).filter(Message.summarized == True).count() == 6
+
+
+if __name__ == "__main__":
+    test_window_within_budget()
+    test_fold_into_summary()
+    test_fold_failure_keeps_state()
+    test_same_second_messages_folded_once()
+    test_background_folds_on_one_worker()
+    test_migration_backfills_summarized()
+    print("✅ 对话历史窗口和摘要测试通过")
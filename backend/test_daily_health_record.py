@@ -0,0 +1,149 @@
+"""
+当日健康记录获取或创建测试
+
+在临时SQLite文件数据库中（每个会话独立连接）验证：
+1. 多个请求同时获取或创建同一天的健康记录时只留下一条，并且都返回这一条
+2. 插入因唯一键以外的原因失败（用户不存在、外键错误）时返回404，而不是AttributeError
+3. 迁移0002为已有数据回填daily_date后，不会为同一天再创建一条当日记录
+"""
+
+import os
+import sys
+import uuid
+import tempfile
+import threading
+import importlib.util
+from datetime import datetime, date, timedelta
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.base_class import Base
+from app.db.models import User, HealthRecord
+from app.services import health as health_service
+
+MIGRATION_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "migrations", "versions", "20251019_0002_health_daily_key.py"
+)
+
+
+def _make_file_db(directory):
+    """SQLite文件数据库，开启外键约束，写锁等待时间足够并发测试使用"""
+    engine = create_engine(
+        f"sqlite:///{os.path.join(directory, 'health.db')}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    event.listen(engine, "connect", lambda conn, record: conn.execute("PRAGMA foreign_keys=ON"))
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    db = session_factory()
+    user_id = str(uuid.uuid4())
+    db.add(User(id=user_id, email=f"{user_id}@example.com", name="测试用户"))
+    db.commit()
+    db.close()
+    return engine, session_factory, user_id
+
+
+def test_concurrent_get_or_create():
+    workers = 6
+    original = health_service._find_daily_health_record
+    barrier = threading.Barrier(workers)
+
+    def find_then_wait(db, user_id, day, locking=False):
+        # 所有请求都查找不到当日记录后再同时插入
+        record = original(db, user_id, day, locking)
+        if not locking:
+            barrier.wait(timeout=10)
+        return record
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_factory, user_id = _make_file_db(directory)
+        results, errors = [], []
+
+        def worker():
+            db = session_factory()
+            try:
+                record = health_service.get_or_create_daily_health_record(db, user_id, date.today())
+                db.commit()
+                results.append(record.id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+
+        health_service._find_daily_health_record = find_then_wait
+        try:
+            threads = [threading.Thread(target=worker) for _ in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            health_service._find_daily_health_record = original
+
+        assert errors == [], errors
+        db = session_factory()
+        assert db.query(HealthRecord).filter(HealthRecord.user_id == user_id).count() == 1
+        assert len(results) == workers and len(set(results)) == 1
+        db.close()
+        engine.dispose()
+
+
+def test_missing_user():
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_factory, _ = _make_file_db(directory)
+        db = session_factory()
+        try:
+            health_service.get_or_create_daily_health_record(db, "missing-user", date.today())
+            assert False, "用户不存在时应返回404"
+        except HTTPException as e:
+            assert e.status_code == 404
+        assert db.query(HealthRecord).count() == 0
+        db.close()
+        engine.dispose()
+
+
+def test_migration_backfills_daily_date():
+    spec = importlib.util.spec_from_file_location("migration_0002", MIGRATION_PATH)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_factory, user_id = _make_file_db(directory)
+        db = session_factory()
+        today = datetime.combine(date.today(), datetime.min.time())
+        yesterday = today - timedelta(days=1)
+        # 升级前的数据：当天由快速记录创建的记录和之后手动创建的记录，昨天一条
+        db.add_all([
+            HealthRecord(id="today-later", user_id=user_id, record_date=today + timedelta(hours=9)),
+            HealthRecord(id="today-daily", user_id=user_id, record_date=today),
+            HealthRecord(id="yesterday", user_id=user_id, record_date=yesterday + timedelta(hours=20)),
+        ])
+        db.commit()
+
+        with engine.begin() as conn:
+            with Operations.context(MigrationContext.configure(conn)):
+                migration._backfill_daily_date()
+                # 可重复执行
+                migration._backfill_daily_date()
+
+        db.expire_all()
+        daily = {record.id: record.daily_date for record in db.query(HealthRecord)}
+        assert daily == {"today-daily": date.today(), "today-later": None, "yesterday": yesterday.date()}
+        assert health_service.get_or_create_daily_health_record(db, user_id, date.today()).id == "today-daily"
+        assert db.query(HealthRecord).count() == 3
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_concurrent_get_or_create()
+    test_missing_user()
+    test_migration_backfills_daily_date()
+    print("✅ 当日健康记录测试通过")
@@ -0,0 +1,126 @@
+"""
+嵌入缓存测试
+
+验证命中/未命中统计、文本规范化、重启后从磁盘加载、达到容量上限时按最近最少使用淘汰，
+以及多个进程（实例）共用一个目录时只有一个写入磁盘，不会互相覆盖行号。
+"""
+
+import os
+import sys
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.ml.embedding_cache import EmbeddingCache
+
+
+def _vectors(count: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_hits_misses_and_normalized_keys():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(cache_dir, "model-a")
+        vectors = _vectors(2)
+        cache.put_many(["空腹血糖", "餐后血糖"], vectors)
+
+        # 首尾空白规范化后视为同一文本
+        cached = cache.get_many(["  空腹血糖 ", "餐后血糖", "糖化血红蛋白"])
+        assert np.allclose(cached[0], vectors[0], atol=1e-3)
+        assert np.allclose(cached[1], vectors[1], atol=1e-3)
+        assert cached[2] is None
+
+        stats = cache.stats()
+        assert stats["hits"] == 2 and stats["misses"] == 1
+        assert stats["hit_rate"] == round(2 / 3, 4)
+        assert stats["entries"] == 2
+
+
+def test_persisted_across_instances_and_models():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        vectors = _vectors(3)
+        first = EmbeddingCache(cache_dir, "BAAI/bge-small-zh-v1.5")
+        first.put_many(["a", "b", "c"], vectors)
+        # 模拟进程退出
+        first.close()
+
+        second = EmbeddingCache(cache_dir, "BAAI/bge-small-zh-v1.5")
+        assert len(second) == 3
+        assert np.allclose(second.get_many(["b"])[0], vectors[1], atol=1e-3)
+
+        # 不同模型的缓存互不影响
+        other = EmbeddingCache(cache_dir, "another-model")
+        assert other.get_many(["b"]) == [None]
+
+
+def test_size_bounded_lru_eviction():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(cache_dir, "model-a", max_entries=40)
+        texts = [f"文本{i}" for i in range(40)]
+        cache.put_many(texts, _vectors(40))
+        # 访问最早写入的条目，使其变为最近使用
+        assert cache.get_many(["文本0"])[0] is not None
+
+        cache.put_many(["新文本"], _vectors(1, seed=1))
+        stats = cache.stats()
+        assert stats["entries"] <= 40
+        assert stats["evictions"] >= 1
+        assert stats["capacity"] == 40
+        # 最久未使用的被淘汰，刚访问过的保留
+        assert cache.get_many(["文本1"])[0] is None
+        assert cache.get_many(["文本0"])[0] is not None
+        assert cache.get_many(["新文本"])[0] is not None
+
+        # 向量文件大小不超过上限
+        size = os.path.getsize(os.path.join(cache.dir, "vectors.f16"))
+        assert size == 40 * 8 * 2
+
+
+def _open_in_child(cache_dir, queue):
+    cache = EmbeddingCache(cache_dir, "model-a")
+    cache.put_many(["banana"], _vectors(1, seed=2))
+    queue.put((cache.persistent, cache.stats()["entries"]))
+
+
+def test_single_writer_per_directory():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        apple, banana = _vectors(1, seed=1), _vectors(1, seed=2)
+        a = EmbeddingCache(cache_dir, "model-a")
+        b = EmbeddingCache(cache_dir, "model-a")
+        assert a.persistent and not b.persistent
+
+        a.put_many(["apple"], apple)
+        b.put_many(["banana"], banana)
+        # b使用进程内缓存，不会占用a分配的行号
+        assert np.allclose(a.get_many(["apple"])[0], apple[0], atol=1e-3)
+        assert np.allclose(b.get_many(["banana"])[0], banana[0], atol=1e-3)
+        assert a.get_many(["banana"]) == [None] and b.get_many(["apple"]) == [None]
+
+        # 其他进程打开同一目录时同样使用进程内缓存
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        child = context.Process(target=_open_in_child, args=(cache_dir, queue))
+        child.start()
+        assert queue.get(timeout=60) == (False, 1)
+        child.join()
+
+        a.close()
+        b.close()
+        # 写入进程退出后磁盘上只有它写入的向量
+        c = EmbeddingCache(cache_dir, "model-a")
+        assert c.persistent and len(c) == 1
+        assert np.allclose(c.get_many(["apple"])[0], apple[0], atol=1e-3)
+        assert c.get_many(["banana"]) == [None]
+
+
+if __name__ == "__main__":
+    test_hits_misses_and_normalized_keys()
+    test_persisted_across_instances_and_models()
+    test_size_bounded_lru_eviction()
+    test_single_writer_per_directory()
+    print("✅ 嵌入缓存测试通过")
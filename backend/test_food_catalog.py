@@ -0,0 +1,182 @@
+"""
+食物目录快照测试
+
+用 data/static_food_data.csv 中的食物在内存SQLite中验证：
+1. 列表、分类、适合糖尿病患者、低GI和GI范围查询的结果（含排序和分页）与原SQL查询一致
+2. 快照加载后这些查询不执行SQL；快照只读，写入后整体替换并更新版本
+3. 接口返回ETag，客户端带If-None-Match且目录未变化时返回304
+"""
+
+import os
+import csv
+import sys
+import math
+import itertools
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, asc, desc
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.api.deps import get_db
+from app.api.endpoints import nutrition as nutrition_endpoints
+from app.db.models import FoodNutrition
+from app.models.nutrition import FoodNutritionCreate, FoodNutritionUpdate
+from app.services import nutrition as nutrition_service
+from app.services.food_catalog import FoodCatalog
+from app.services.food_search import FoodSearchIndex
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "static_food_data.csv")
+
+
+def _make_db():
+    engine, session_factory = make_session_factory()
+    db = session_factory()
+    with open(CSV_PATH, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            db.add(FoodNutrition(
+                name_cn=row["name_cn"], calories=int(float(row["calories"])), protein=float(row["protein"]),
+                fat=float(row["fat"]), carbs=float(row["carbs"]), gi=int(row["gi"]) if row["gi"] else None,
+                category=row["category"], diabetes_friendly=int(row["diabetes_friendly"] or 0)
+            ))
+    # 没有GI的食物，验证空值的排序和过滤
+    db.add(FoodNutrition(name_cn="魔芋", calories=7, protein=0.1, fat=0.1, carbs=3.3, gi=None, category="其他食物"))
+    db.commit()
+    return engine, session_factory, db
+
+
+class _Services:
+    """把营养服务和接口使用的全局目录、搜索索引替换为测试数据库上的实例"""
+
+    def __init__(self, session_factory):
+        self.catalog = FoodCatalog(max_age=3600)
+        self.index = FoodSearchIndex(session_factory, pinyin=lambda text: list(text), max_age=3600)
+
+    def __enter__(self):
+        self.original = (
+            nutrition_service.food_catalog, nutrition_service.food_search_index, nutrition_endpoints.food_catalog
+        )
+        nutrition_service.food_catalog = nutrition_endpoints.food_catalog = self.catalog
+        nutrition_service.food_search_index = self.index
+        return self
+
+    def __exit__(self, *args):
+        (nutrition_service.food_catalog, nutrition_service.food_search_index,
+         nutrition_endpoints.food_catalog) = self.original
+
+
+def _sql_page(db, page, size, category=None, diabetes_friendly=None, sort_by=None, sort_order="asc",
+              min_gi=None, max_gi=None):
+    """原实现的SQL查询；值相同时按ID排序"""
+    query = db.query(FoodNutrition)
+    if category:
+        query = query.filter(FoodNutrition.category == category)
+    if diabetes_friendly is not None:
+        query = query.filter(FoodNutrition.diabetes_friendly == diabetes_friendly)
+    if max_gi is not None:
+        query = query.filter(FoodNutrition.gi.isnot(None), FoodNutrition.gi >= min_gi, FoodNutrition.gi <= max_gi)
+    column = getattr(FoodNutrition, sort_by) if sort_by else FoodNutrition.id
+    query = query.order_by(desc(column) if sort_order == "desc" else asc(column), FoodNutrition.id)
+    return query.count(), [food.id for food in query.offset((page - 1) * size).limit(size)]
+
+
+def test_matches_sql():
+    engine, session_factory, db = _make_db()
+    with _Services(session_factory):
+        categories = [None, "蔬菜类", "肉蛋类", "不存在"]
+        for category, friendly, sort_by, sort_order, page in itertools.product(
+            categories, [None, 0, 1], [None, "calories", "gi", "carbs"], ["asc", "desc"], [1, 3]
+        ):
+            if sort_by is None and sort_order == "desc":
+                continue
+            result = nutrition_service.get_food_nutrition_list(
+                db, page=page, size=7, category=category, diabetes_friendly=friendly,
+                sort_by=sort_by, sort_order=sort_order
+            )
+            total, ids = _sql_page(db, page, 7, category, friendly, sort_by, sort_order)
+            assert (result.total, [item.id for item in result.items]) == (total, ids), (category, friendly, sort_by)
+            assert result.pages == math.ceil(total / 7)
+
+        for min_gi, max_gi in [(0, 100), (40, 55), (55, 55), (90, 100)]:
+            result = nutrition_service.get_foods_by_gi_range(db, min_gi, max_gi, page=1, size=100)
+            expected = _sql_page(db, 1, 100, min_gi=min_gi, max_gi=max_gi)
+            assert (result.total, [item.id for item in result.items]) == expected
+        result = nutrition_service.get_low_gi_foods(db, page=2, size=5, threshold=55)
+        assert (result.total, [item.id for item in result.items]) == _sql_page(db, 2, 5, min_gi=-1, max_gi=55)
+
+        expected = {row[0] for row in db.query(FoodNutrition.category).distinct()}
+        assert set(nutrition_service.get_all_categories(db)) == expected
+        result = nutrition_service.get_diabetes_friendly_foods(db, size=100, category="水果类")
+        assert (result.total, [item.id for item in result.items]) == _sql_page(db, 1, 100, "水果类", 1)
+
+
+def test_no_sql_after_load_and_swap_on_write():
+    engine, session_factory, db = _make_db()
+    with _Services(session_factory) as services:
+        snapshot = services.catalog.get(db)
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        nutrition_service.get_food_nutrition_list(db, page=2, size=10, category="蔬菜类", sort_by="gi")
+        nutrition_service.get_low_gi_foods(db)
+        nutrition_service.get_foods_by_gi_range(db, 30, 60)
+        nutrition_service.get_all_categories(db)
+        assert statements == [], statements
+
+        # 快照只读
+        assert not snapshot.columns["gi"].flags.writeable
+        version = snapshot.version
+
+        food = nutrition_service.create_food_nutrition(db, FoodNutritionCreate(
+            name_cn="荞麦面", calories=340, protein=10.0, fat=2.0, carbs=70.0, gi=59, category="谷物类"
+        ))
+        current = services.catalog.get(db)
+        assert current is not snapshot and current.version != version
+        assert len(current) == len(snapshot) + 1 and food.id not in snapshot._positions
+
+        nutrition_service.update_food_nutrition(db, food.id, FoodNutritionUpdate(gi=45))
+        assert food.id in [item.id for item in nutrition_service.get_foods_by_gi_range(db, 45, 45).items]
+        nutrition_service.delete_food_nutrition(db, food.id)
+        # 内容相同的快照版本相同（其他进程加载的快照ETag一致）
+        assert services.catalog.get(db).version == version == FoodCatalog().get(db).version
+
+        # 搜索结果按快照返回，并可按字段排序
+        page = nutrition_service.get_food_nutrition_list(db, search="鸡", sort_by="calories", sort_order="desc")
+        calories = [item.calories for item in page.items]
+        assert calories == sorted(calories, reverse=True) and all("鸡" in item.name_cn for item in page.items)
+
+
+def test_etag_revalidation():
+    engine, session_factory, db = _make_db()
+    app = FastAPI()
+    app.include_router(nutrition_endpoints.router, prefix="/nutrition")
+    app.dependency_overrides[get_db] = lambda: db
+    client = TestClient(app)
+
+    with _Services(session_factory):
+        response = client.get("/nutrition/low-gi", params={"threshold": 40})
+        assert response.status_code == 200 and response.json()["total"] > 0
+        etag = response.headers["etag"]
+        assert response.headers["x-catalog-version"] in etag
+
+        response = client.get("/nutrition/low-gi", params={"threshold": 40}, headers={"If-None-Match": etag})
+        assert response.status_code == 304 and response.content == b""
+        assert client.get("/nutrition/categories", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+        # 搜索结果不带ETag
+        assert "etag" not in client.get("/nutrition", params={"search": "鸡"}).headers
+
+        nutrition_service.create_food_nutrition(db, FoodNutritionCreate(
+            name_cn="魔芋丝", calories=6, protein=0.1, fat=0.0, carbs=3.0, gi=17, category="其他食物"
+        ))
+        response = client.get("/nutrition/low-gi", params={"threshold": 40, "size": 100}, headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["etag"] != etag
+        assert "魔芋丝" in [item["name_cn"] for item in response.json()["items"]]
+
+
+if __name__ == "__main__":
+    test_matches_sql()
+    test_no_sql_after_load_and_swap_on_write()
+    test_etag_revalidation()
+    print("✅ 食物目录快照测试通过")
@@ -0,0 +1,214 @@
+"""
+食物图标文件测试
+
+用 data/static_food_data.csv 中的食物和 setup_dev.get_food_svg 生成的图标在内存SQLite中验证：
+1. SVG按内容寻址保存为静态文件，相同图标只存一份，各种编码的数据URI转换为同一URL
+2. 通过营养服务创建、更新食物以及转换已有数据后，image_url只存短URL
+3. 列表响应的大小和序列化耗时明显下降
+4. 图标文件带长期缓存头返回，CSP禁止其中的脚本执行
+5. 无法解析的数据URI返回422，转换已有数据时跳过
+"""
+
+import os
+import csv
+import sys
+import time
+import base64
+import tempfile
+from urllib.parse import quote
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.core.config import settings
+from app.db.models import FoodNutrition
+from app.models.nutrition import FoodNutritionCreate, FoodNutritionUpdate
+from app.services import nutrition as nutrition_service
+from app.services.food_catalog import FoodCatalog
+from app.services.food_icons import (
+    FoodIconFiles, ICON_URL_PREFIX, ICON_CACHE_CONTROL, ICON_CONTENT_SECURITY_POLICY, icon_dir, store_svg,
+    externalize_image_url, migrate_inline_icons
+)
+from app.services.food_search import FoodSearchIndex
+from setup_dev import get_food_svg
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "static_food_data.csv")
+
+
+class _StaticDir:
+    """把静态文件目录替换为临时目录"""
+
+    def __enter__(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.original = settings.STATIC_DIR
+        settings.STATIC_DIR = self.tmp.name
+        return self.tmp.name
+
+    def __exit__(self, *args):
+        settings.STATIC_DIR = self.original
+        self.tmp.cleanup()
+
+
+def _make_db():
+    """导入目录中的食物，图标按原导入脚本内联为数据URI"""
+    engine, session_factory = make_session_factory()
+    db = session_factory()
+    with open(CSV_PATH, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            db.add(FoodNutrition(
+                name_cn=row["name_cn"], calories=int(float(row["calories"])), protein=float(row["protein"]),
+                fat=float(row["fat"]), carbs=float(row["carbs"]), gi=int(row["gi"]) if row["gi"] else None,
+                category=row["category"], diabetes_friendly=int(row["diabetes_friendly"] or 0),
+                image_url=f"data:image/svg+xml;utf8,{get_food_svg(row['name_cn'], row['category'])}"
+            ))
+    db.commit()
+    return session_factory, db
+
+
+def test_content_addressed_files():
+    with _StaticDir():
+        svg = get_food_svg("苹果", "水果类")
+        url = store_svg(svg)
+        assert url.startswith(f"{ICON_URL_PREFIX}/") and url.endswith(".svg") and len(url) < 40
+        with open(os.path.join(icon_dir(), os.path.basename(url)), encoding="utf-8") as f:
+            content = f.read()
+        # 去掉缩进和换行，内容不变
+        assert "\n" not in content and content.startswith("<svg") and "苹果" in content
+        assert len(content) < len(svg)
+
+        # 相同内容只存一份；不同编码的数据URI得到同一URL
+        assert store_svg("\n" + svg + "  ") == url
+        assert externalize_image_url(f"data:image/svg+xml;utf8,{svg}") == url
+        assert externalize_image_url(f"data:image/svg+xml,{quote(svg)}") == url
+        encoded = base64.b64encode(svg.encode("utf-8")).decode("ascii")
+        assert externalize_image_url(f"data:image/svg+xml;base64,{encoded}") == url
+        assert os.listdir(icon_dir()) == [os.path.basename(url)]
+
+        assert store_svg(get_food_svg("香蕉", "水果类")) != url
+        # 普通URL和空值原样返回
+        assert externalize_image_url("/uploads/foods/food_1.jpg") == "/uploads/foods/food_1.jpg"
+        assert externalize_image_url(None) is None
+
+
+def test_service_writes_and_migration():
+    session_factory, db = _make_db()
+    original = nutrition_service.food_search_index, nutrition_service.food_catalog
+    nutrition_service.food_search_index = FoodSearchIndex(session_factory, pinyin=lambda text: list(text), max_age=3600)
+    nutrition_service.food_catalog = FoodCatalog(max_age=3600)
+    try:
+        with _StaticDir():
+            svg = get_food_svg("荞麦面", "谷物类")
+            food = nutrition_service.create_food_nutrition(db, FoodNutritionCreate(
+                name_cn="荞麦面", calories=340, protein=10.0, fat=2.0, carbs=70.0, gi=59, category="谷物类",
+                image_url=f"data:image/svg+xml;utf8,{svg}"
+            ))
+            assert food.image_url == store_svg(svg)
+
+            food = nutrition_service.update_food_nutrition(db, food.id, FoodNutritionUpdate(
+                image_url=f"data:image/svg+xml;utf8,{get_food_svg('荞麦', '谷物类')}"
+            ))
+            assert food.image_url == store_svg(get_food_svg("荞麦", "谷物类"))
+            nutrition_service.update_food_nutrition(db, food.id, FoodNutritionUpdate(image_url="/uploads/foods/a.jpg"))
+            assert nutrition_service.get_food_nutrition(db, food.id).image_url == "/uploads/foods/a.jpg"
+
+            # 已有的内联图标转换为文件，名称前两个字相同的同类食物共用一个文件
+            total = db.query(FoodNutrition).filter(FoodNutrition.image_url.like("data:%")).count()
+            assert migrate_inline_icons(db) == total > 0
+            assert migrate_inline_icons(db) == 0
+            urls = {food.image_url for food in db.query(FoodNutrition)}
+            assert all(url.startswith(("/icons/", "/uploads/")) for url in urls)
+            assert len(os.listdir(icon_dir())) <= total + 2
+    finally:
+        nutrition_service.food_search_index, nutrition_service.food_catalog = original
+
+
+def test_list_payload_shrinks():
+    session_factory, db = _make_db()
+
+    def measure():
+        catalog = FoodCatalog(max_age=3600).get(db)
+        page = catalog.page(catalog.rows(), 1, 100)
+        samples = []
+        for _ in range(30):
+            start = time.perf_counter()
+            body = page.model_dump_json()
+            samples.append(time.perf_counter() - start)
+        return len(body.encode("utf-8")), sorted(samples)[len(samples) // 2]
+
+    with _StaticDir():
+        inline_size, inline_time = measure()
+        migrate_inline_icons(db)
+        size, seconds = measure()
+    print(f"列表响应: {inline_size} -> {size} 字节，序列化 {inline_time * 1e6:.0f} -> {seconds * 1e6:.0f} 微秒")
+    assert size * 3 < inline_size
+    assert seconds < inline_time
+
+
+def test_icon_cache_headers():
+    with _StaticDir():
+        url = store_svg(get_food_svg("苹果", "水果类"))
+        app = FastAPI()
+        app.mount(ICON_URL_PREFIX, FoodIconFiles(directory=icon_dir()), name="food_icons")
+        client = TestClient(app)
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("image/svg+xml")
+        assert response.headers["cache-control"] == ICON_CACHE_CONTROL
+        assert response.headers["content-security-policy"] == ICON_CONTENT_SECURITY_POLICY
+        assert response.headers["x-content-type-options"] == "nosniff"
+        assert "苹果" in response.text
+
+        # 重新验证时也带缓存头
+        response = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+        assert response.status_code == 304 and response.headers["cache-control"] == ICON_CACHE_CONTROL
+        assert client.get(f"{ICON_URL_PREFIX}/0000000000000000.svg").status_code == 404
+
+
+MALFORMED_URIS = (
+    "data:image/svg+xml;base64,PHN2Zz4",          # base64长度错误
+    "data:image/svg+xml;base64,//79/Q==",         # 不是UTF-8
+    "data:image/svg+xml,%E4%B8%3Csvg%3E",         # 百分号编码的UTF-8不完整
+    "data:image/svg+xml;utf8,<html></html>",      # 不是SVG
+)
+
+
+def test_malformed_data_uri_rejected():
+    session_factory, db = _make_db()
+    original = nutrition_service.food_search_index, nutrition_service.food_catalog
+    nutrition_service.food_search_index = FoodSearchIndex(session_factory, pinyin=lambda text: list(text), max_age=3600)
+    nutrition_service.food_catalog = FoodCatalog(max_age=3600)
+    try:
+        with _StaticDir():
+            for uri in MALFORMED_URIS:
+                try:
+                    nutrition_service.create_food_nutrition(db, FoodNutritionCreate(
+                        name_cn="坏图标", calories=1, protein=0.0, fat=0.0, carbs=0.0, category="其他", image_url=uri
+                    ))
+                    assert False, f"应拒绝: {uri}"
+                except HTTPException as e:
+                    assert e.status_code == 422
+            assert db.query(FoodNutrition).filter(FoodNutrition.name_cn == "坏图标").count() == 0
+
+            # 已有数据中无法解析的图标保持原样，其他照常转换
+            food = db.query(FoodNutrition).first()
+            food.image_url = MALFORMED_URIS[0]
+            db.commit()
+            total = db.query(FoodNutrition).filter(FoodNutrition.image_url.like("data:%")).count()
+            assert migrate_inline_icons(db) == total - 1
+            assert db.query(FoodNutrition).filter(FoodNutrition.image_url.like("data:%")).count() == 1
+    finally:
+        nutrition_service.food_search_index, nutrition_service.food_catalog = original
+
+
+if __name__ == "__main__":
+    test_content_addressed_files()
+    test_service_writes_and_migration()
+    test_list_payload_shrinks()
+    test_icon_cache_headers()
+    test_malformed_data_uri_rejected()
+    print("✅ 食物图标文件测试通过")
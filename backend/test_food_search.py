@@ -0,0 +1,210 @@
+"""
+食物名称搜索索引测试
+
+用 data/static_food_data.csv 中的食物在内存SQLite中验证：
+1. 完全匹配、前缀、包含、同义词（西红柿/番茄）、全拼、首字母、错字的模糊匹配和同音字
+2. 近期饮食记录的热度调整同类匹配的顺序，分类过滤
+3. 通过营养服务增删改食物后索引增量更新，分页结果按相关度排序
+4. 万条规模下搜索亚毫秒返回，重复的输入联想直接返回缓存结果，记录饮食不清空联想缓存
+5. 相关度常量保证前缀匹配总排在包含和模糊匹配之前（_match据此提前返回）
+"""
+
+import os
+import csv
+import sys
+import time
+import uuid
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.db.models import FoodNutrition, DietRecord, User
+from app.models.diet import MealTypeEnum
+from app.models.nutrition import FoodNutritionCreate, FoodNutritionUpdate
+from app.services import nutrition as nutrition_service
+from app.services import food_search
+from app.services.food_search import FoodSearchIndex, search_key, synonym_names
+from app.services.food_catalog import FoodCatalog
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "static_food_data.csv")
+
+# 测试用的逐字拼音（不依赖pypinyin）
+PINYIN = {
+    "西": "xi", "红": "hong", "柿": "shi", "番": "fan", "茄": "qie", "胡": "hu", "萝": "luo", "卜": "bo",
+    "黄": "huang", "瓜": "gua", "鸡": "ji", "蛋": "dan", "炒": "chao", "米": "mi", "饭": "fan", "罗": "luo",
+}
+
+
+def fake_pinyin(text):
+    return [PINYIN.get(char, char) for char in text]
+
+
+def _load_catalog():
+    with open(CSV_PATH, encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def _make_db(rows):
+    engine, session_factory = make_session_factory()
+    db = session_factory()
+    for row in rows:
+        db.add(FoodNutrition(
+            name_cn=row["name_cn"], calories=int(float(row["calories"])), protein=float(row["protein"]),
+            fat=float(row["fat"]), carbs=float(row["carbs"]), gi=int(row["gi"]) if row["gi"] else None,
+            category=row["category"], diabetes_friendly=int(row["diabetes_friendly"] or 0)
+        ))
+    db.commit()
+    return session_factory, db
+
+
+def _names(db, hits):
+    foods = {food.id: food.name_cn for food in db.query(FoodNutrition)}
+    return [foods[food_id] for food_id, _ in hits]
+
+
+def test_match_types():
+    session_factory, db = _make_db(_load_catalog())
+    index = FoodSearchIndex(session_factory, pinyin=fake_pinyin, max_age=3600)
+
+    assert _names(db, index.search("西红柿", 1)) == ["西红柿"]
+    # 同义词
+    assert _names(db, index.search("番茄", 1)) == ["西红柿"]
+    assert synonym_names("番茄炒蛋") == ["西红柿炒蛋"]
+    # 全拼前缀、首字母
+    assert _names(db, index.search("xihong", 1)) == ["西红柿"]
+    assert _names(db, index.search("fanqie", 1)) == ["西红柿"]
+    assert _names(db, index.search("hlb", 1)) == ["胡萝卜"]
+    # 包含匹配、全角和空白
+    assert "胡萝卜" in _names(db, index.search("萝卜"))
+    assert _names(db, index.search(" 黄 瓜 ", 1)) == ["黄瓜"]
+    assert search_key("猪肉（瘦）") == "猪肉瘦"
+    assert _names(db, index.search("猪肉瘦", 1)) == ["猪肉(瘦)"]
+    # 错字
+    assert _names(db, index.search("胡萝葡", 1)) == ["胡萝卜"]
+    assert _names(db, index.search("西红市", 1)) == ["西红柿"]
+    # 同音字
+    assert _names(db, index.search("胡罗卜", 1)) == ["胡萝卜"]
+    assert _names(db, index.search("胡罗", 1)) == ["胡萝卜"]
+    # 完全匹配排在包含匹配之前
+    assert _names(db, index.search("米饭"))[:2] == ["米饭", "糙米饭"]
+    assert index.search("不存在的食物") == []
+
+
+def test_popularity_and_filters():
+    session_factory, db = _make_db(_load_catalog())
+    user = User(id=str(uuid.uuid4()), email="food@example.com", name="李四")
+    db.add(user)
+    for _ in range(5):
+        db.add(DietRecord(
+            id=str(uuid.uuid4()), user_id=user.id, meal_type=MealTypeEnum.DINNER, meal_time=datetime.now(),
+            food_items=[{"name": "鸡肝"}], total_carbs=1.0, total_calories=120.0
+        ))
+    db.commit()
+    index = FoodSearchIndex(session_factory, pinyin=fake_pinyin, max_age=3600)
+
+    # 同为前缀匹配，近期记录过的鸡肝排在前面
+    assert _names(db, index.search("鸡"))[:2] == ["鸡肝", "鸡蛋"]
+    for _ in range(50):
+        index.record_usage([{"name": "鸡蛋"}])
+    assert _names(db, index.search("鸡"))[0] == "鸡蛋"
+    # 热度不会让前缀匹配超过完全匹配
+    index.record_usage([{"name": "鸡胸肉"}] * 1000)
+    assert _names(db, index.search("鸡胸肉", 1)) == ["鸡胸肉"]
+    assert _names(db, index.search("鸡蛋"))[0] == "鸡蛋"
+
+    names = _names(db, index.search("豆", category="豆制品"))
+    assert set(names) == {"豆腐", "豆浆", "豆干"}, names
+    assert all(
+        db.query(FoodNutrition).get(food_id).diabetes_friendly == 1
+        for food_id, _ in index.search("鱼", diabetes_friendly=1)
+    )
+
+
+def test_incremental_updates_through_service():
+    session_factory, db = _make_db(_load_catalog())
+    index = FoodSearchIndex(session_factory, pinyin=fake_pinyin, max_age=3600)
+    original = nutrition_service.food_search_index, nutrition_service.food_catalog
+    nutrition_service.food_search_index, nutrition_service.food_catalog = index, FoodCatalog(max_age=3600)
+    try:
+        food = nutrition_service.create_food_nutrition(db, FoodNutritionCreate(
+            name_cn="番茄炒蛋", calories=86, protein=5.2, fat=5.8, carbs=4.2, gi=None, category="其他食物"
+        ))
+        assert index.suggest("西红柿炒", 1)[0]["id"] == food.id
+        assert index.suggest("xhscd", 1)[0]["name_cn"] == "番茄炒蛋"
+
+        nutrition_service.update_food_nutrition(db, food.id, FoodNutritionUpdate(name_cn="黄瓜炒蛋"))
+        assert food.id not in [food_id for food_id, _ in index.search("番茄炒蛋")]
+        assert index.suggest("青瓜炒蛋", 1)[0]["name_cn"] == "黄瓜炒蛋"
+
+        # 列表接口：按相关度分页，只查询当前页
+        page = nutrition_service.get_food_nutrition_list(db, page=1, size=2, search="黄瓜")
+        assert [item.name_cn for item in page.items] == ["黄瓜", "黄瓜炒蛋"] and page.total == 2
+        page = nutrition_service.get_food_nutrition_list(db, page=1, size=10, search="黄瓜", sort_by="calories")
+        assert [item.name_cn for item in page.items] == ["黄瓜", "黄瓜炒蛋"]
+        page = nutrition_service.get_food_nutrition_list(
+            db, page=1, size=10, search="黄瓜", sort_by="calories", sort_order="desc"
+        )
+        assert [item.name_cn for item in page.items] == ["黄瓜炒蛋", "黄瓜"]
+
+        nutrition_service.delete_food_nutrition(db, food.id)
+        assert nutrition_service.search_foods(db, "黄瓜炒蛋").items[0].name_cn == "黄瓜"
+        assert all(hit["id"] != food.id for hit in index.suggest("黄瓜炒蛋"))
+    finally:
+        nutrition_service.food_search_index, nutrition_service.food_catalog = original
+
+
+def test_suggest_latency():
+    catalog = _load_catalog()
+    # 由目录中的食物名两两组合出约7000种食物
+    rows = [dict(a, name_cn=a["name_cn"] + b["name_cn"]) for a in catalog for b in catalog]
+    session_factory, db = _make_db(rows)
+    index = FoodSearchIndex(session_factory, pinyin=fake_pinyin, max_age=3600)
+    assert len(index.suggest("西红柿鸡蛋")) > 0 and len(index) == len(rows)
+
+    queries = ["西红", "xhs", "jidan", "鸡蛋", "胡萝葡", "胡罗卜", "番茄炒"]
+    samples = []
+    for _ in range(50):
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, 10)
+            samples.append(time.perf_counter() - start)
+    p50 = sorted(samples)[len(samples) // 2]
+    assert p50 < 0.001, f"搜索p50为{p50 * 1000:.3f}ms"
+
+    # 单字查询匹配的食物多，重复输入时使用缓存
+    first = index.suggest("菜", 10)
+    samples = []
+    for _ in range(20):
+        start = time.perf_counter()
+        assert index.suggest("菜", 10) == first
+        samples.append(time.perf_counter() - start)
+    assert sorted(samples)[len(samples) // 2] < 0.0001
+
+    # 记录饮食只影响搜索，不清空联想缓存；索引变化后缓存失效
+    popular = first[-1]
+    index.record_usage([{"name": popular["name_cn"]}] * 100)
+    assert index.search("菜", 10)[0][0] == popular["id"]
+    assert index.suggest("菜", 10) == first
+    index.delete(first[0]["id"])
+    assert index.suggest("菜", 10)[0]["name_cn"] == popular["name_cn"]
+
+
+def test_prefix_matches_outrank_substring_and_fuzzy():
+    best_prefix = min(food_search.RELEVANCE[kind]["prefix"] for kind in food_search.RELEVANCE)
+    best_other = max(
+        food_search.RELEVANCE[food_search.NAME]["substring"],
+        food_search.RELEVANCE[food_search.PINYIN]["substring"],
+        food_search.FUZZY_WEIGHT
+    )
+    assert best_prefix - food_search.MAX_LENGTH_PENALTY > best_other + food_search.POPULARITY_MAX_BONUS
+
+
+if __name__ == "__main__":
+    test_match_types()
+    test_popularity_and_filters()
+    test_incremental_updates_through_service()
+    test_suggest_latency()
+    test_prefix_matches_outrank_substring_and_fuzzy()
+    print("✅ 食物搜索索引测试通过")
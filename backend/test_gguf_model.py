@@ -0,0 +1,105 @@
+"""
+GGUF（llama.cpp）推理后端测试
+
+不加载真实模型，替换为记录参数的假Llama对象，验证：
+1. 生成参数映射到llama.cpp的create_chat_completion（贪心解码对应温度0）
+2. 返回结构与LocalModelRunner一致
+3. MODEL_PROVIDER选择推理后端
+4. 批处理调度器不为逐条生成的GGUF后端合并批次，每个请求生成完即返回
+"""
+
+import os
+import sys
+import time
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.ml.batching import create_batch_scheduler
+from app.ml.gguf_model import GGUFModelRunner
+from app.ml.local_model import LocalModelRunner, GENERATION_DEFAULTS, create_model_runner
+
+
+class _FakeLlama:
+    def __init__(self):
+        self.calls = []
+
+    def create_chat_completion(self, messages, **kwargs):
+        self.calls.append((messages, kwargs))
+        return {
+            "choices": [{"message": {"role": "assistant", "content": f" 回复:{messages[-1]['content']} "}}],
+            "usage": {"prompt_tokens": 12, "completion_tokens": 5, "total_tokens": 17},
+        }
+
+
+def test_generate_maps_options():
+    runner = GGUFModelRunner("fake.gguf", threads=2, prefix_cache_mb=0)
+    runner.model = _FakeLlama()
+    assert runner.loaded
+
+    result = runner.generate([{"role": "user", "content": "你好"}], max_new_tokens=32, do_sample=False)
+    assert result["text"] == "回复:你好"
+    assert result["prompt_tokens"] == 12 and result["completion_tokens"] == 5
+    assert result["seconds"] >= 0
+    _, kwargs = runner.model.calls[-1]
+    assert kwargs["max_tokens"] == 32 and kwargs["temperature"] == 0.0
+
+    runner.generate([{"role": "user", "content": "你好"}])
+    _, kwargs = runner.model.calls[-1]
+    assert kwargs["max_tokens"] == GENERATION_DEFAULTS["max_new_tokens"]
+    assert kwargs["temperature"] == GENERATION_DEFAULTS["temperature"]
+    assert kwargs["repeat_penalty"] == GENERATION_DEFAULTS["repetition_penalty"]
+
+
+def test_generate_batch_sequential():
+    runner = GGUFModelRunner("fake.gguf", prefix_cache_mb=0)
+    runner.model = _FakeLlama()
+    results = runner.generate_batch([[{"role": "user", "content": "a"}], [{"role": "user", "content": "b"}]])
+    assert [result["text"] for result in results] == ["回复:a", "回复:b"]
+
+
+def test_create_model_runner():
+    assert isinstance(create_model_runner("gguf"), GGUFModelRunner)
+    assert isinstance(create_model_runner("local"), LocalModelRunner)
+
+
+class _SlowLlama(_FakeLlama):
+    def create_chat_completion(self, messages, **kwargs):
+        time.sleep(0.1)
+        return super().create_chat_completion(messages, **kwargs)
+
+
+def test_scheduler_does_not_batch_gguf():
+    runner = GGUFModelRunner("fake.gguf", prefix_cache_mb=0)
+    runner.model = _SlowLlama()
+    scheduler = create_batch_scheduler(runner)
+    assert scheduler.max_batch_size == 1
+    assert create_batch_scheduler(LocalModelRunner("fake-model", prefix_cache_mb=0)).max_batch_size > 1
+
+    finished = {}
+
+    def ask(i):
+        result = scheduler.submit([{"role": "user", "content": str(i)}])
+        finished[i] = (time.perf_counter(), result["batch_size"])
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    scheduler.stop()
+    # 依次完成，最先提交的请求只等待自己的一次生成
+    times = sorted(elapsed for elapsed, _ in finished.values())
+    assert all(batch_size == 1 for _, batch_size in finished.values())
+    assert times[0] - start < 0.25 and times[-1] - start >= 0.35
+
+
+if __name__ == "__main__":
+    test_generate_maps_options()
+    test_generate_batch_sequential()
+    test_create_model_runner()
+    test_scheduler_does_not_batch_gguf()
+    print("✅ GGUF推理后端测试通过")
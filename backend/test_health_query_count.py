@@ -0,0 +1,112 @@
+"""
+健康记录读取路径的SQL语句数回归测试
+
+get_user_health_records / get_health_record 使用selectinload预加载子记录，
+序列化为Health响应时不应再触发逐条懒加载，语句数应与分页大小无关。
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.db.models import (
+    User, HealthRecord, WeightRecord, BloodPressureRecord, ExerciseRecord, MedicationRecord
+)
+from app.models.health import Health, ExerciseTypeEnum, ExerciseIntensityEnum
+from app.services.health import get_user_health_records, get_health_record
+
+
+def _make_session():
+    """创建内存SQLite会话并建表"""
+    engine, session_factory = make_session_factory()
+    return engine, session_factory()
+
+
+def _seed(db, user_id: str, num_records: int, children_per_type: int = 2):
+    """为用户生成带子记录的健康记录"""
+    db.add(User(id=user_id, email=f"{user_id}@example.com", name="测试用户"))
+    now = datetime.now()
+    for i in range(num_records):
+        record_id = str(uuid.uuid4())
+        db.add(HealthRecord(id=record_id, user_id=user_id, record_date=now - timedelta(days=i)))
+        for _ in range(children_per_type):
+            db.add(WeightRecord(health_record_id=record_id, user_id=user_id, weight=70.0))
+            db.add(BloodPressureRecord(health_record_id=record_id, user_id=user_id, systolic=120, diastolic=80))
+            db.add(ExerciseRecord(
+                health_record_id=record_id, user_id=user_id,
+                exercise_type=ExerciseTypeEnum.WALKING, duration=30,
+                intensity=ExerciseIntensityEnum.LOW
+            ))
+            db.add(MedicationRecord(health_record_id=record_id, user_id=user_id, name="二甲双胍", dosage="0.5g"))
+    db.commit()
+    db.expunge_all()
+
+
+class _StatementCounter:
+    """统计引擎上执行的SQL语句数"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def _count_page_statements(engine, db, user_id: str, limit: int) -> int:
+    db.expunge_all()
+    with _StatementCounter(engine) as counter:
+        records = get_user_health_records(db, user_id=user_id, limit=limit)
+        payload = [Health.model_validate(record, from_attributes=True) for record in records]
+    assert len(payload) == limit
+    assert all(len(item.weight_records) == 2 for item in payload)
+    return counter.count
+
+
+def test_health_page_statement_count_is_constant():
+    """分页读取健康记录的语句数不随记录数增长"""
+    engine, db = _make_session()
+    user_id = str(uuid.uuid4())
+    _seed(db, user_id, num_records=100)
+
+    small_page = _count_page_statements(engine, db, user_id, limit=10)
+    large_page = _count_page_statements(engine, db, user_id, limit=100)
+
+    # 1条主查询 + 4种子记录各1条IN查询
+    assert small_page == 5
+    assert large_page == small_page
+
+
+def test_single_health_record_statement_count():
+    """读取单条健康记录时子记录同样预加载"""
+    engine, db = _make_session()
+    user_id = str(uuid.uuid4())
+    _seed(db, user_id, num_records=1)
+    record_id = db.query(HealthRecord.id).scalar()
+
+    db.expunge_all()
+    with _StatementCounter(engine) as counter:
+        record = get_health_record(db, record_id)
+        Health.model_validate(record, from_attributes=True)
+
+    assert counter.count == 5
+
+
+if __name__ == "__main__":
+    test_health_page_statement_count_is_constant()
+    test_single_health_record_statement_count()
+    print("✅ 健康记录查询语句数测试通过")
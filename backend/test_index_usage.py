@@ -0,0 +1,136 @@
+"""
+时间序列表索引使用回归测试
+
+在SQLite上对服务层的高频查询执行 EXPLAIN QUERY PLAN，
+确认按用户（或对话、健康记录）过滤并按时间排序的查询命中复合索引，而不是全表扫描。
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, date
+
+from sqlalchemy import event, desc
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.db.models import User, Conversation, Message
+from app.services.glucose import get_user_glucose_records
+from app.services.diet import get_user_diet_records
+from app.services.health import get_user_health_records, get_health_record, get_or_create_daily_health_record
+
+
+def _make_session():
+    """创建内存SQLite会话并建表"""
+    engine, session_factory = make_session_factory()
+    db = session_factory()
+    user_id = str(uuid.uuid4())
+    db.add(User(id=user_id, email=f"{user_id}@example.com", name="测试用户"))
+    db.commit()
+    return engine, db, user_id
+
+
+class _PlanRecorder:
+    """记录执行的SELECT语句，并取出每条语句的查询计划"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+    def plans(self, db):
+        """返回每条语句的查询计划文本（使用会话自身的连接，避免影响会话事务）"""
+        conn = db.connection()
+        result = []
+        for statement, parameters in self.statements:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            result.append(" | ".join(row[-1] for row in rows))
+        return result
+
+
+def _assert_uses_index(plan: str, index_name: str):
+    assert index_name in plan, f"查询未使用索引 {index_name}: {plan}"
+    assert "USE TEMP B-TREE FOR ORDER BY" not in plan, f"排序未利用索引: {plan}"
+
+
+def test_glucose_range_query_uses_index():
+    engine, db, user_id = _make_session()
+    now = datetime.now()
+    with _PlanRecorder(engine) as recorder:
+        get_user_glucose_records(db, user_id, start_date=now - timedelta(days=7), end_date=now)
+    _assert_uses_index(recorder.plans(db)[0], "ix_glucose_records_user_measured")
+
+
+def test_diet_range_query_uses_index():
+    engine, db, user_id = _make_session()
+    now = datetime.now()
+    with _PlanRecorder(engine) as recorder:
+        get_user_diet_records(db, user_id, start_date=now - timedelta(days=7), end_date=now)
+    plans = recorder.plans(db)
+    assert plans and all("ix_diet_records_user_meal_time" in plan for plan in plans), plans
+
+
+def test_health_queries_use_indexes():
+    engine, db, user_id = _make_session()
+    record_id = get_or_create_daily_health_record(db, user_id, date.today()).id
+    db.expunge_all()
+
+    with _PlanRecorder(engine) as recorder:
+        get_user_health_records(db, user_id, limit=10)
+    plans = recorder.plans(db)
+    _assert_uses_index(plans[0], "ix_health_records_user_record_date")
+    # 子记录的selectinload IN查询按health_record_id索引查找
+    child_plans = " || ".join(plans[1:])
+    for child_index in (
+        "ix_weight_records_health_record",
+        "ix_blood_pressure_records_health_record",
+        "ix_exercise_records_health_record",
+        "ix_medication_records_health_record",
+    ):
+        assert child_index in child_plans, child_plans
+
+    db.expunge_all()
+    with _PlanRecorder(engine) as recorder:
+        get_or_create_daily_health_record(db, user_id, date.today())
+    # SQLite中唯一约束对应的索引名为 sqlite_autoindex_*，按索引列判断
+    assert "USING INDEX" in recorder.plans(db)[0] and "daily_date=?" in recorder.plans(db)[0]
+
+    db.expunge_all()
+    with _PlanRecorder(engine) as recorder:
+        get_health_record(db, record_id)
+    assert "ix_weight_records_health_record" in " || ".join(recorder.plans(db)[1:])
+
+
+def test_conversation_queries_use_indexes():
+    # 与 app.services.assistant 中的查询一致（该模块依赖大模型组件，这里直接构造查询）
+    engine, db, user_id = _make_session()
+    with _PlanRecorder(engine) as recorder:
+        db.query(Conversation).filter(Conversation.user_id == user_id).order_by(
+            desc(Conversation.updated_at)
+        ).offset(0).limit(20).all()
+        db.query(Message).filter(Message.conversation_id == str(uuid.uuid4())).order_by(
+            Message.timestamp
+        ).offset(0).limit(100).all()
+    conversation_plan, message_plan = recorder.plans(db)
+    _assert_uses_index(conversation_plan, "ix_conversations_user_updated")
+    _assert_uses_index(message_plan, "ix_messages_conversation_timestamp")
+
+
+if __name__ == "__main__":
+    test_glucose_range_query_uses_index()
+    test_diet_range_query_uses_index()
+    test_health_queries_use_indexes()
+    test_conversation_queries_use_indexes()
+    print("✅ 索引使用测试通过")
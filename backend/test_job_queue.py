@@ -0,0 +1,244 @@
+"""
+后台任务队列测试
+
+验证：
+1. 任务在工作线程中执行，结果和失败信息可查询
+2. 同时执行的任务数不超过workers
+3. 同一用户的相同任务进行中时合并为一个，不同用户或不同参数不合并，完成后可再次提交
+4. 排队已满时拒绝新任务，只能查询自己的任务，过期的结果被清理
+5. 任务状态保存在数据库中：另一个进程（另一个JobQueue）能查询到结果并复用进行中的任务，进程退出后遗留的任务视为失败
+6. 任务完成和清理过期结果同时发生时不会出错；数据库读写不持有锁，过期任务定期清理
+7. /analyze 的202响应写入OpenAPI文档
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.core.jobs import JobQueue, JobQueueFullError, STATUS_SUCCEEDED, STATUS_FAILED, STATUS_RUNNING
+from app.db.models import BackgroundJob
+
+_tmp = tempfile.TemporaryDirectory()
+_engine, _session_factory = make_session_factory(os.path.join(_tmp.name, "jobs.db"))
+
+
+def _queue(**kwargs):
+    return JobQueue(session_factory=_session_factory, **kwargs)
+
+
+def _wait(job, timeout=5):
+    assert job.done.wait(timeout), "任务未在规定时间内完成"
+
+
+def test_run_and_fail():
+    jobs = _queue(workers=1, max_pending=10, result_ttl=60)
+    job, created = jobs.submit("alert", "u1", {"hours": 24}, lambda: {"alert_message": "注意"})
+    assert created
+    _wait(job)
+    assert job.status == STATUS_SUCCEEDED and job.result == {"alert_message": "注意"}
+    assert job.to_dict()["finished_at"] is not None
+
+    def fail():
+        raise RuntimeError("模型不可用")
+
+    job, _ = jobs.submit("advice", "u1", {"days": 3}, fail)
+    _wait(job)
+    assert job.status == STATUS_FAILED and "模型不可用" in job.error
+
+
+def test_concurrency_limit():
+    jobs = _queue(workers=2, max_pending=10, result_ttl=60)
+    lock = threading.Lock()
+    state = {"active": 0, "max_active": 0}
+
+    def work():
+        with lock:
+            state["active"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+        time.sleep(0.05)
+        with lock:
+            state["active"] -= 1
+
+    submitted = [jobs.submit("advice", "u1", {"i": i}, work)[0] for i in range(6)]
+    for job in submitted:
+        _wait(job)
+    assert state["max_active"] == 2, state
+
+
+def test_deduplicate_inflight():
+    jobs = _queue(workers=2, max_pending=10, result_ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "建议"
+
+    first, created = jobs.submit("advice", "u1", {"days": 3}, work)
+    second, created_again = jobs.submit("advice", "u1", {"days": 3}, work)
+    assert created and not created_again and second is first
+
+    # 不同用户或不同参数是不同的任务
+    other_user, created = jobs.submit("advice", "u2", {"days": 3}, work)
+    assert created and other_user is not first
+    release.set()
+    _wait(first)
+    _wait(other_user)
+    assert len(calls) == 2
+
+    # 已完成的任务不再合并
+    third, created = jobs.submit("advice", "u1", {"days": 3}, work)
+    assert created and third is not first
+    _wait(third)
+
+
+def test_queue_full_ownership_and_ttl():
+    jobs = _queue(workers=1, max_pending=1, result_ttl=0)
+    release = threading.Event()
+    running, _ = jobs.submit("advice", "u1", {"i": 0}, lambda: release.wait(5))
+    # 等待第一个任务开始执行，队列中只剩排队的任务
+    while running.status != "running":
+        time.sleep(0.01)
+    queued, _ = jobs.submit("advice", "u1", {"i": 1}, lambda: None)
+    try:
+        jobs.submit("advice", "u1", {"i": 2}, lambda: None)
+        assert False, "排队已满时应拒绝新任务"
+    except JobQueueFullError:
+        pass
+
+    assert jobs.get(running.id, user_id="u1") is running
+    assert jobs.get(running.id, user_id="u2") is None
+
+    release.set()
+    _wait(running)
+    _wait(queued)
+    time.sleep(0.01)
+    # 过期的结果不再返回（本进程和数据库中的都是）
+    assert jobs.get(running.id) is None and jobs.get(queued.id) is None
+    assert _queue(result_ttl=0).get(running.id) is None
+
+
+def test_shared_across_processes():
+    submitter, other = _queue(workers=1, max_pending=10, result_ttl=60), _queue(workers=1, max_pending=10, result_ttl=60)
+    release = threading.Event()
+    job, _ = submitter.submit("advice", "u-shared", {"days": 3}, lambda: release.wait(5) and {"advice": "多运动"})
+    while job.status != STATUS_RUNNING:
+        time.sleep(0.01)
+
+    # 查询请求到达另一个工作进程
+    seen = other.get(job.id, user_id="u-shared")
+    assert seen is not None and seen.status == STATUS_RUNNING
+    assert other.get(job.id, user_id="u-other") is None
+    # 另一个进程提交相同的分析时复用进行中的任务
+    again, created = other.submit("advice", "u-shared", {"days": 3}, lambda: None)
+    assert not created and again.id == job.id
+
+    release.set()
+    _wait(job)
+    seen = other.get(job.id, user_id="u-shared")
+    assert seen.status == STATUS_SUCCEEDED and seen.result == {"advice": "多运动"}
+    assert seen.to_dict()["finished_at"] is not None
+
+
+def test_orphaned_job_reported_failed():
+    jobs = _queue(workers=1, max_pending=10, result_ttl=60)
+    db = _session_factory()
+    db.add(BackgroundJob(
+        id="orphan", user_id="u-orphan", kind="alert", params_key="k", status=STATUS_RUNNING,
+        created_at=datetime.now() - timedelta(seconds=90)
+    ))
+    db.commit()
+    db.close()
+
+    job = jobs.get("orphan", user_id="u-orphan")
+    assert job.status == STATUS_FAILED and job.error
+    # 遗留的任务不再被复用
+    fresh, created = jobs.submit("alert", "u-orphan", {"k": 1}, lambda: "ok")
+    assert created
+    _wait(fresh)
+
+
+def test_purge_while_jobs_finish():
+    jobs = _queue(workers=4, max_pending=1000, result_ttl=0)
+    submitted = [jobs.submit("alert", "u-purge", {"i": i}, lambda: None)[0] for i in range(300)]
+    for job in submitted:
+        _wait(job)
+    assert all(job.status == STATUS_SUCCEEDED for job in submitted)
+
+
+def test_database_io_outside_lock():
+    jobs = _queue(workers=1, max_pending=10, result_ttl=60)
+    finished, _ = jobs.submit("alert", "u-slow", {"i": 0}, lambda: "ok")
+    _wait(finished)
+
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_session():
+        entered.set()
+        release.wait(5)
+        return _session_factory()
+
+    jobs._session_factory = slow_session
+    submitter = threading.Thread(target=jobs.submit, args=("alert", "u-slow", {"i": 1}, lambda: "ok"))
+    submitter.start()
+    assert entered.wait(5)
+    # 提交请求等待数据库期间，查询本进程的任务不被阻塞
+    start = time.perf_counter()
+    assert jobs.get(finished.id) is finished
+    assert time.perf_counter() - start < 1
+    release.set()
+    submitter.join(5)
+
+
+def test_purge_runs_periodically():
+    purges = []
+
+    class CountingQueue(JobQueue):
+        def _purge(self):
+            purges.append(1)
+            super()._purge()
+
+    jobs = CountingQueue(workers=1, max_pending=100, result_ttl=60, session_factory=_session_factory, purge_interval=60)
+    for i in range(20):
+        jobs.submit("alert", "u-periodic", {"i": i}, lambda: None)
+    assert len(purges) == 1
+
+    jobs.purge_interval = 0
+    jobs._next_purge = 0
+    jobs.submit("alert", "u-periodic", {"i": 20}, lambda: None)
+    jobs.submit("alert", "u-periodic", {"i": 21}, lambda: None)
+    assert len(purges) == 3
+
+
+def test_analyze_documents_202():
+    from fastapi import FastAPI
+    from app.api.endpoints import glucose_monitor
+
+    app = FastAPI()
+    app.include_router(glucose_monitor.router, prefix="/glucose-monitor")
+    paths = app.openapi()["paths"]
+    for path in ("/glucose-monitor/analyze", "/glucose-monitor/analyze-trend"):
+        accepted = paths[path]["post"]["responses"]["202"]
+        assert accepted["content"]["application/json"]["schema"]["$ref"].endswith("/JobAcceptedResponse")
+
+
+if __name__ == "__main__":
+    test_run_and_fail()
+    test_concurrency_limit()
+    test_deduplicate_inflight()
+    test_queue_full_ownership_and_ttl()
+    test_shared_across_processes()
+    test_orphaned_job_reported_failed()
+    test_purge_while_jobs_finish()
+    test_database_io_outside_lock()
+    test_purge_runs_periodically()
+    test_analyze_documents_202()
+    print("✅ 后台任务队列测试通过")
@@ -0,0 +1,213 @@
+"""
+知识库关键词检索与混合检索测试
+
+验证：
+1. 中文按单字和二字组合切分，BM25按标题、标签、内容加权排序
+2. 标签索引和增删改后的增量更新
+3. RRF融合两路结果
+4. 关键词查询直接返回BM25结果，不做向量化，且在万条规模下亚毫秒返回
+"""
+
+import os
+import sys
+import time
+import uuid
+import tempfile
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.db.models import KnowledgeBase
+from app.ml.knowledge_index import KnowledgeIndex
+from app.ml.keyword_index import KeywordIndex, tokenize, query_terms
+from app.ml.hybrid_search import HybridKnowledgeSearch, reciprocal_rank_fusion, is_keyword_query
+
+DIM = 64
+
+
+class _CharEmbedder:
+    """按字符哈希到固定维度的词袋向量，记录被向量化的文本数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += len(texts)
+        vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for char in text:
+                vectors[row, hash(char) % DIM] += 1.0
+        return vectors
+
+
+def _make_session_factory(entries):
+    engine, factory = make_session_factory()
+    db = factory()
+    for entry_id, title, content, tags in entries:
+        db.add(KnowledgeBase(id=entry_id, title=title, content=content, tags=tags))
+    db.commit()
+    db.close()
+    return factory
+
+
+ENTRIES = [
+    ("hypo", "低血糖处理", "出现心慌出汗时立即补充15克葡萄糖，15分钟后复测血糖", ["急救", "低血糖"]),
+    ("metformin", "二甲双胍用法", "二甲双胍随餐服用可减轻胃肠道反应，肾功能不全者慎用", ["药物"]),
+    ("exercise", "运动建议", "每周至少150分钟中等强度有氧运动，如快走、游泳", ["运动"]),
+    ("diet", "饮食原则", "控制总热量，主食粗细搭配，少吃精制糖和油炸食品，可用燕麦代替白米", ["饮食"]),
+]
+
+
+def test_tokenize_chinese_ngrams():
+    assert tokenize("二甲双胍 HbA1c") == ["二", "甲", "双", "胍", "二甲", "甲双", "双胍", "hba1c"]
+    # 全角字符规范化后与半角一致
+    assert tokenize("ＨｂＡ１ｃ") == ["hba1c"]
+    # 有二字组合时查询不使用高频单字
+    assert sorted(query_terms("血糖")) == ["血糖"]
+    assert query_terms("糖") == ["糖"]
+
+
+def test_bm25_ranking_and_tag_filter():
+    index = KeywordIndex(_make_session_factory(ENTRIES))
+
+    results = index.search("二甲双胍", limit=3)
+    assert results[0]["id"] == "metformin"
+    assert all(result["id"] != "exercise" for result in results)
+
+    # 标题中的词权重高于只在内容中出现的词
+    assert index.search("血糖", limit=1)[0]["id"] == "hypo"
+
+    assert index.ids_with_tag("药物") == {"metformin"}
+    assert index.ids_with_tag("不存在") == set()
+    assert [r["id"] for r in index.search("血糖", limit=5, tag="饮食")] == []
+    assert [r["id"] for r in index.search("精制糖", limit=5, tag="饮食")] == ["diet"]
+
+
+def test_incremental_updates():
+    index = KeywordIndex(_make_session_factory(ENTRIES))
+    assert index.rebuild() == 4
+
+    index.upsert("insulin", "胰岛素保存", "未开封的胰岛素冷藏保存", ["药物"])
+    assert index.search("胰岛素", limit=1)[0]["id"] == "insulin"
+    assert index.ids_with_tag("药物") == {"metformin", "insulin"}
+
+    # 更新后旧内容和旧标签不再命中
+    index.upsert("insulin", "注射部位", "腹部吸收最快，注意轮换", ["注射"])
+    assert index.search("胰岛素", limit=5) == []
+    assert index.ids_with_tag("药物") == {"metformin"}
+
+    assert index.delete("insulin")
+    assert not index.delete("insulin")
+    assert index.search("注射部位", limit=5) == []
+    assert index.ids_with_tag("注射") == set()
+    assert len(index) == 4
+
+
+def test_rebuild_syncs_other_workers_and_replays_local_writes():
+    factory = _make_session_factory(ENTRIES)
+    index = KeywordIndex(factory, max_age=3600)
+    assert index.ids_with_tag("足部") == set()
+
+    # 其他工作进程新增的条目在索引过期重建后才可见
+    db = factory()
+    db.add(KnowledgeBase(id="foot", title="足部护理", content="每天检查双脚有无破损", tags=["足部"]))
+    db.commit()
+    db.close()
+    assert index.ids_with_tag("足部") == set()
+
+    def session_with_local_write():
+        # 重建读取数据库期间本进程写入的条目，在新索引替换旧索引时重放
+        index.upsert("pen", "胰岛素笔", "针头一次性使用", ["胰岛素"])
+        index.delete("exercise")
+        return factory()
+
+    index._session_factory = session_with_local_write
+    index.max_age = 0
+    assert index.ids_with_tag("足部") == {"foot"}
+    index._session_factory, index.max_age = factory, 3600
+    assert index.ids_with_tag("胰岛素") == {"pen"}
+    assert index.search("针头", limit=1)[0]["id"] == "pen"
+    assert index.ids_with_tag("运动") == set() and len(index) == len(ENTRIES) + 1
+
+
+def test_long_content_returns_snippet():
+    index = KeywordIndex(_make_session_factory([]))
+    content = "饮食控制很重要。" * 60 + "阿卡波糖需与第一口饭同时嚼服。" + "坚持运动。" * 60
+    index.upsert("long", "长文", content)
+    snippet = index.search("阿卡波糖", limit=1)[0]["content"]
+    assert "阿卡波糖" in snippet and len(snippet) == 256
+
+
+def test_reciprocal_rank_fusion():
+    vector = [{"id": "a", "content": "块a"}, {"id": "b", "content": "块b"}]
+    keyword = [{"id": "b", "content": "片段b"}, {"id": "c", "content": "片段c"}]
+    fused = reciprocal_rank_fusion([vector, keyword])
+    # b在两路中都出现，排在最前；保留最先出现那一路（向量）的content
+    assert [item["id"] for item in fused] == ["b", "a", "c"]
+    assert fused[0]["content"] == "块b"
+    assert abs(fused[0]["score"] - (1 / 62 + 1 / 61)) < 1e-6
+
+
+def test_keyword_query_skips_embedding():
+    assert is_keyword_query("二甲双胍")
+    assert not is_keyword_query("低血糖时应该怎么处理？")
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        factory = _make_session_factory(ENTRIES)
+        embedder = _CharEmbedder()
+        vector_index = KnowledgeIndex(index_dir, "char-hash", embedder, factory)
+        assert vector_index.ensure_ready(timeout=10)
+        search = HybridKnowledgeSearch(vector_index, KeywordIndex(factory))
+
+        calls = embedder.calls
+        results = search.search("二甲双胍", limit=2)
+        assert results[0]["id"] == "metformin"
+        assert embedder.calls == calls
+
+        # 自然语言问题走混合检索，需要向量化查询
+        results = search.search("出汗心慌时补充葡萄糖", limit=2)
+        assert results[0]["id"] == "hypo"
+        assert embedder.calls == calls + 1
+
+        # 按标签过滤同时作用于两路结果
+        assert [r["id"] for r in search.search("出汗心慌时补充葡萄糖", limit=3, tag="运动")] == ["exercise"]
+
+
+def test_keyword_query_latency():
+    factory = _make_session_factory([])
+    index = KeywordIndex(factory)
+    index.ensure_built()
+    for i in range(10000):
+        index.upsert(
+            str(uuid.uuid4()), f"第{i}条饮食建议",
+            "控制总热量，主食粗细搭配，多吃蔬菜，少吃精制糖和油炸食品，定时定量进餐。" * 3,
+            ["饮食"]
+        )
+    index.upsert("metformin", "二甲双胍用法", "二甲双胍随餐服用可减轻胃肠道反应", ["药物"])
+    search = HybridKnowledgeSearch(None, index)
+
+    for _ in range(10):
+        search.search("二甲双胍", limit=3)
+    samples = []
+    for _ in range(200):
+        start = time.perf_counter()
+        results = search.search("二甲双胍", limit=3)
+        samples.append(time.perf_counter() - start)
+    assert results[0]["id"] == "metformin"
+    p50 = sorted(samples)[len(samples) // 2]
+    assert p50 < 0.001, f"关键词查询p50为{p50 * 1000:.3f}ms"
+
+
+if __name__ == "__main__":
+    test_tokenize_chinese_ngrams()
+    test_bm25_ranking_and_tag_filter()
+    test_incremental_updates()
+    test_rebuild_syncs_other_workers_and_replays_local_writes()
+    test_long_content_returns_snippet()
+    test_reciprocal_rank_fusion()
+    test_keyword_query_skips_embedding()
+    test_keyword_query_latency()
+    print("✅ 知识库关键词检索测试通过")
@@ -0,0 +1,352 @@
+"""
+知识库向量索引测试
+
+使用确定性的字符哈希嵌入代替真实嵌入模型，验证：
+1. 首次检索触发后台初始化，并从数据库重建索引
+2. 增删改后检索结果随之变化
+3. 持久化文件与数据库一致时直接加载，不一致时重建
+4. 条目较多时使用IVF倒排列表检索，扫描全部列表时与精确检索结果一致
+5. 长文按句子切分为重叠的块，更新条目时只对变化的块重新向量化
+6. int8量化后端与float32检索结果接近；mmap加载时复用已保存的倒排列表，切换后端时重建
+"""
+
+import os
+import sys
+import uuid
+import time
+import random
+import tempfile
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.db.models import KnowledgeBase
+from app.ml.knowledge_index import KnowledgeIndex
+from app.ml.chunking import split_sentences, chunk_text
+from app.ml.vector_store import VectorStore, create_vector_store, CENTROIDS_FILE
+
+DIM = 64
+
+
+class _CharEmbedder:
+    """按字符哈希到固定维度的词袋向量，记录被向量化的文本数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += len(texts)
+        vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for char in text:
+                vectors[row, hash(char) % DIM] += 1.0
+        return vectors
+
+
+def _make_session_factory(entries):
+    engine, factory = make_session_factory()
+    db = factory()
+    for title, content in entries:
+        db.add(KnowledgeBase(id=str(uuid.uuid4()), title=title, content=content, tags=[]))
+    db.commit()
+    db.close()
+    return factory
+
+
+ENTRIES = [
+    ("低血糖处理", "出现心慌出汗时立即补充15克葡萄糖，15分钟后复测血糖"),
+    ("运动建议", "每周至少150分钟中等强度有氧运动，如快走、游泳"),
+    ("饮食原则", "控制总热量，主食粗细搭配，少吃精制糖和油炸食品"),
+]
+
+
+def test_search_builds_index_in_background():
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = KnowledgeIndex(index_dir, "char-hash", _CharEmbedder(), _make_session_factory(ENTRIES))
+
+        # 首次检索只触发初始化，不等待
+        index.search("低血糖")
+        assert index.ensure_ready(timeout=10)
+        assert len(index) == 3
+
+        results = index.search("低血糖心慌怎么办", limit=2)
+        assert len(results) == 2
+        assert results[0]["title"] == "低血糖处理"
+        assert results[0]["score"] >= results[1]["score"]
+        assert os.path.exists(os.path.join(index_dir, "knowledge_vectors.npy"))
+
+
+def test_failed_initialization_backs_off():
+    attempts = []
+
+    def broken_embedder(texts):
+        attempts.append(len(texts))
+        raise ImportError("No module named 'sentence_transformers'")
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = KnowledgeIndex(
+            index_dir, "char-hash", broken_embedder, _make_session_factory(ENTRIES), retry_seconds=60
+        )
+        assert not index.ensure_ready(timeout=10)
+        index._thread.join(timeout=10)
+        assert index.state == "failed" and "sentence_transformers" in index.error
+
+        # 等待重试期间的检索不再重新初始化
+        for _ in range(20):
+            assert index.search("低血糖") == []
+        assert len(attempts) == 1 and not index._thread.is_alive()
+
+        # 到期后重试，再次失败时间隔加倍
+        index._retry_at = 0
+        index.ensure_ready()
+        index._thread.join(timeout=10)
+        assert len(attempts) == 2 and index._retry_at - time.monotonic() > 100
+
+        # 恢复后正常初始化
+        index._embed_fn = _CharEmbedder()
+        index._retry_at = 0
+        assert index.ensure_ready(timeout=10) and len(index) == 3
+
+
+def test_embedding_cache_opened_on_first_embed():
+    with tempfile.TemporaryDirectory() as index_dir:
+        cache_dir = os.path.join(index_dir, "embedding_cache")
+        index = KnowledgeIndex(index_dir, "char-hash", _CharEmbedder(), _make_session_factory(ENTRIES))
+        # 构造索引（如导入时创建全局服务）不创建缓存目录、不占用写锁
+        assert not os.path.exists(cache_dir)
+        assert index.ensure_ready(timeout=10)
+        assert os.path.isdir(cache_dir) and index.cache.persistent
+        index.cache.close()
+
+
+def test_upsert_and_delete():
+    with tempfile.TemporaryDirectory() as index_dir:
+        factory = _make_session_factory(ENTRIES)
+        index = KnowledgeIndex(index_dir, "char-hash", _CharEmbedder(), factory)
+        assert index.ensure_ready(timeout=10)
+
+        index.upsert("new-doc", "胰岛素注射", "注射部位轮换，腹部吸收最快")
+        assert index.search("胰岛素注射部位", limit=1)[0]["id"] == "new-doc"
+
+        index.upsert("new-doc", "胰岛素保存", "未开封的胰岛素冷藏保存")
+        assert len(index) == 4
+        assert index.search("胰岛素保存", limit=1)[0]["title"] == "胰岛素保存"
+
+        first_id = index.search("运动", limit=1)[0]["id"]
+        assert index.delete(first_id)
+        assert len(index) == 3
+        assert all(result["id"] != first_id for result in index.search("运动", limit=10))
+        assert not index.delete("missing")
+
+
+def test_persisted_index_reused_until_database_changes():
+    with tempfile.TemporaryDirectory() as index_dir:
+        factory = _make_session_factory(ENTRIES)
+        first = KnowledgeIndex(index_dir, "char-hash", _CharEmbedder(), factory)
+        assert first.ensure_ready(timeout=10)
+
+        # 数据库未变化：直接加载文件，不重新向量化
+        embedder = _CharEmbedder()
+        second = KnowledgeIndex(index_dir, "char-hash", embedder, factory)
+        assert second.ensure_ready(timeout=10)
+        assert embedder.calls == 0
+        assert len(second) == 3
+        # 模拟进程重启：释放嵌入缓存目录
+        first.cache.close()
+        second.cache.close()
+
+        # 数据库新增条目：重建索引，已有条目命中嵌入缓存，只向量化新条目
+        db = factory()
+        db.add(KnowledgeBase(id=str(uuid.uuid4()), title="足部护理", content="每天检查双脚", tags=[]))
+        db.commit()
+        db.close()
+        embedder = _CharEmbedder()
+        third = KnowledgeIndex(index_dir, "char-hash", embedder, factory)
+        assert third.ensure_ready(timeout=10)
+        assert len(third) == 4
+        assert embedder.calls == 1
+
+        # 嵌入模型变化：重建索引
+        embedder = _CharEmbedder()
+        fourth = KnowledgeIndex(index_dir, "another-model", embedder, factory)
+        assert fourth.ensure_ready(timeout=10)
+        assert embedder.calls == 4
+
+
+def test_ivf_partitions_match_exact_search_when_probing_all_lists():
+    rng = random.Random(0)
+    chars = "血糖胰岛素饮食运动蛋白质脂肪碳水化合物维生素并发症视网膜足部肾脏心血管"
+    entries = [(f"条目{i}", "".join(rng.choice(chars) for _ in range(12))) for i in range(400)]
+    factory = _make_session_factory(entries)
+
+    with tempfile.TemporaryDirectory() as exact_dir, tempfile.TemporaryDirectory() as ivf_dir:
+        exact = KnowledgeIndex(exact_dir, "char-hash", _CharEmbedder(), factory, ivf_min_size=10000)
+        # 400条 -> 20个列表，nprobe=20即扫描全部列表
+        ivf = KnowledgeIndex(ivf_dir, "char-hash", _CharEmbedder(), factory, ivf_min_size=100, nprobe=20)
+        assert exact.ensure_ready(timeout=10) and ivf.ensure_ready(timeout=10)
+        assert ivf._store.centroids is not None and len(ivf._store.centroids) == 20
+
+        ivf.upsert("extra", "新增条目", "血糖监测频率")
+        exact.upsert("extra", "新增条目", "血糖监测频率")
+        ivf.delete("extra")
+        exact.delete("extra")
+
+        for _, content in entries[:20]:
+            expected = [result["id"] for result in exact.search(content, limit=5)]
+            assert [result["id"] for result in ivf.search(content, limit=5)] == expected
+
+
+def test_sq8_store_matches_float32_store():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = create_vector_store("flat")
+    quantized = create_vector_store("flat_sq8")
+    exact.reset(vectors)
+    quantized.reset(vectors)
+    assert quantized.nbytes < exact.nbytes / 3
+
+    overlap = []
+    for query in vectors[:50]:
+        rows, scores = quantized.search(query, 10)
+        expected, _ = exact.search(query, 10)
+        assert rows[0] == expected[0] and abs(scores[0] - 1.0) < 0.01
+        overlap.append(len(set(rows) & set(expected)) / 10)
+    assert np.mean(overlap) >= 0.95
+
+    # 反量化后再写回，量化结果不变（更新条目时复用未变化块的向量）
+    before = quantized.vector(5)
+    quantized.put(5, before)
+    assert np.array_equal(quantized.vector(5), before)
+
+    try:
+        create_vector_store("hnsw")
+        assert False, "未知后端应报错"
+    except ValueError:
+        pass
+
+
+def test_mmap_load_reuses_saved_partitions_and_backend_switch_rebuilds():
+    rng = random.Random(1)
+    chars = "血糖胰岛素饮食运动蛋白质脂肪碳水化合物维生素并发症视网膜足部肾脏心血管"
+    entries = [(f"条目{i}", "".join(rng.choice(chars) for _ in range(12))) for i in range(300)]
+    factory = _make_session_factory(entries)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        first = KnowledgeIndex(index_dir, "char-hash", _CharEmbedder(), factory, ivf_min_size=100, backend="ivf_sq8")
+        assert first.ensure_ready(timeout=10)
+        assert os.path.exists(os.path.join(index_dir, CENTROIDS_FILE))
+        expected = [result["id"] for result in first.search(entries[0][1], limit=5)]
+
+        embedder = _CharEmbedder()
+        second = KnowledgeIndex(
+            index_dir, "char-hash", embedder, factory, ivf_min_size=100, backend="ivf_sq8", mmap=True
+        )
+        assert second.ensure_ready(timeout=10)
+        assert embedder.calls == 0
+        assert isinstance(second._store._data, np.memmap)
+        assert np.array_equal(second._store.centroids, first._store.centroids)
+        assert [result["id"] for result in second.search(entries[0][1], limit=5)] == expected
+
+        # 写时复制：修改映射的向量不影响磁盘文件，追加时复制到内存
+        second.upsert("extra", "新增条目", "血糖监测频率")
+        assert second.search("新增条目\n血糖监测频率", limit=1)[0]["id"] == "extra"
+
+        # 切换为float32后端：持久化文件的量化方式不匹配，从数据库重建
+        third = KnowledgeIndex(index_dir, "char-hash", _CharEmbedder(), factory, ivf_min_size=100, backend="ivf")
+        assert third.ensure_ready(timeout=10)
+        assert third._store.quantization == "none" and len(third) == 300
+
+
+def test_split_sentences_and_overlapping_chunks():
+    sentences = split_sentences("空腹血糖应控制在4.4-7.0mmol/L。餐后两小时呢？\n“少食多餐”很重要！Eat less. 结尾没有标点")
+    assert sentences == [
+        "空腹血糖应控制在4.4-7.0mmol/L。", "餐后两小时呢？", "“少食多餐”很重要！", "Eat less.", "结尾没有标点"
+    ]
+
+    text = "".join(f"第{i}条建议是按时监测血糖。" for i in range(20))
+    chunks = chunk_text(text, chunk_size=60, overlap=20)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    # 相邻块以整句重叠，且所有句子都被覆盖
+    for previous, current in zip(chunks, chunks[1:]):
+        assert split_sentences(current)[0] in previous
+    assert all(any(sentence in chunk for chunk in chunks) for sentence in split_sentences(text))
+
+    # 超长句子按字符硬切分
+    assert [len(chunk) for chunk in chunk_text("糖" * 150, chunk_size=60, overlap=20)] == [60, 60, 60, 30]
+    assert chunk_text("", 60, 20) == []
+
+    # 英文和中英混排保留句子之间原有的空格和段落换行
+    text = "Check your feet daily. Wear comfortable shoes! 足部护理很重要。\nKeep skin moisturized."
+    assert chunk_text(text, chunk_size=256, overlap=0) == [text]
+    chunks = chunk_text(" ".join(f"Sentence number {i} is here." for i in range(12)), chunk_size=60, overlap=30)
+    assert len(chunks) > 1 and all(len(chunk) <= 60 for chunk in chunks)
+    assert all(".S" not in chunk and "  " not in chunk for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert split_sentences(current)[0] in previous
+
+
+def test_incremental_update_only_embeds_changed_chunks():
+    with tempfile.TemporaryDirectory() as index_dir:
+        embedder = _CharEmbedder()
+        index = KnowledgeIndex(index_dir, "char-hash", embedder, _make_session_factory([]), chunk_size=20, chunk_overlap=0)
+        assert index.ensure_ready(timeout=10)
+
+        paragraphs = [f"第{i}段介绍糖尿病管理中的第{i}个要点。" for i in range(6)]
+        stats = index.upsert("article", "糖尿病管理", "".join(paragraphs))
+        assert stats["chunks"] == 6 and stats["embedded"] == 6
+
+        # 修改最后一段：只重新向量化一块
+        embedder.calls = 0
+        changed = paragraphs[:5] + ["第5段改为介绍足部护理的注意事项。"]
+        stats = index.upsert("article", "糖尿病管理", "".join(changed))
+        assert stats["embedded"] == 1 and stats["unchanged"] == 5
+        assert embedder.calls == 1
+
+        # 在开头插入一段：原有块位置后移，向量复用
+        embedder.calls = 0
+        stats = index.upsert("article", "糖尿病管理", "新增的开头段落说明背景。" + "".join(changed))
+        assert stats["chunks"] == 7 and stats["embedded"] == 1 and stats["reused"] == 6
+        assert embedder.calls == 1
+
+        # 缩短文章：多余的块被删除
+        index.upsert("article", "糖尿病管理", paragraphs[0])
+        assert index._size == 1
+        result = index.search("足部护理", limit=3)
+        assert len(result) == 1 and result[0]["content"] == paragraphs[0]
+
+        # 标题参与向量化，修改标题时所有块重新向量化
+        stats = index.upsert("article", "控糖指南", paragraphs[0])
+        assert stats["embedded"] == 1 and stats["unchanged"] == 0
+
+
+def test_search_returns_best_chunk_per_entry():
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = KnowledgeIndex(index_dir, "char-hash", _CharEmbedder(), _make_session_factory([]), chunk_size=20, chunk_overlap=0)
+        assert index.ensure_ready(timeout=10)
+        index.upsert("a", "综合指南", "低血糖时立即补充葡萄糖。每天坚持快走运动。注意足部护理与检查。")
+        index.upsert("b", "运动", "游泳和快走都是适合的有氧运动。")
+
+        results = index.search("低血糖补充葡萄糖", limit=5)
+        assert [result["id"] for result in results].count("a") == 1
+        assert results[0]["id"] == "a"
+        assert results[0]["content"] == "低血糖时立即补充葡萄糖。"
+
+
+if __name__ == "__main__":
+    test_search_builds_index_in_background()
+    test_failed_initialization_backs_off()
+    test_embedding_cache_opened_on_first_embed()
+    test_upsert_and_delete()
+    test_persisted_index_reused_until_database_changes()
+    test_ivf_partitions_match_exact_search_when_probing_all_lists()
+    test_sq8_store_matches_float32_store()
+    test_mmap_load_reuses_saved_partitions_and_backend_switch_rebuilds()
+    test_split_sentences_and_overlapping_chunks()
+    test_incremental_update_only_embeds_changed_chunks()
+    test_search_returns_best_chunk_per_entry()
+    print("✅ 知识库向量索引测试通过")
@@ -0,0 +1,134 @@
+"""
+大模型路由测试
+
+用可控耗时和失败的假模型验证：
+1. 按任务选择首选模型，失败时回退到下一个模型
+2. 每个模型的并发数不超过上限，超出的请求排队
+3. 排队已满（饱和）或等待超时时回退；全部不可用时抛出LLMUnavailableError
+4. 异步接口在线程池中执行
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.ml.llm_router import LLMRouter, LLMUnavailableError, create_provider, OllamaProvider, LocalProvider
+
+
+class _FakeProvider:
+    def __init__(self, name, seconds=0.0, fail=False):
+        self.name = name
+        self.seconds = seconds
+        self.fail = fail
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, system, temperature, max_tokens, reasoning=True):
+        self.reasoning = reasoning
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.seconds)
+            if self.fail:
+                raise RuntimeError("模型出错")
+            return {"text": f"{self.name}:{prompt}", "prompt_tokens": 3, "completion_tokens": 5}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _router(providers, routes, **kwargs):
+    return LLMRouter(routes=routes, provider_factory=lambda spec: providers[spec], **kwargs)
+
+
+def test_route_and_fallback_on_error():
+    providers = {"small": _FakeProvider("small", fail=True), "large": _FakeProvider("large")}
+    router = _router(providers, {"alert": ["small", "large"], "advice": ["large"]})
+
+    result = router.complete_sync("advice", "建议")
+    assert result["text"] == "large:建议" and result["model"] == "large" and not result["fallback"]
+
+    result = router.complete_sync("alert", "预警")
+    assert result["model"] == "large" and result["fallback"]
+    assert providers["small"].calls == 1
+
+    try:
+        router.complete_sync("unknown", "x")
+        assert False, "未配置的任务应报错"
+    except ValueError:
+        pass
+
+
+def test_concurrency_limit_and_saturation_fallback():
+    providers = {"small": _FakeProvider("small", seconds=0.2), "large": _FakeProvider("large", seconds=0.01)}
+    router = _router(
+        providers, {"alert": ["small", "large"]}, max_concurrency=2, max_queue=1, queue_timeout=5
+    )
+    results = [None] * 6
+
+    def ask(i):
+        results[i] = router.complete_sync("alert", str(i))
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    # small最多同时2个、排队1个，其余请求因饱和回退到large
+    assert providers["small"].max_active == 2
+    assert providers["small"].calls == 3
+    assert sum(1 for result in results if result["model"] == "large") == 3
+    stats = router.stats()
+    assert stats["small"]["inflight"] == 0 and stats["small"]["waiting"] == 0
+
+
+def test_queue_timeout_and_unavailable():
+    providers = {"only": _FakeProvider("only", seconds=0.3)}
+    router = _router(providers, {"advice": ["only"]}, max_concurrency=1, max_queue=4, queue_timeout=0.05)
+    holder = threading.Thread(target=router.complete_sync, args=("advice", "占用"))
+    holder.start()
+    time.sleep(0.05)
+    try:
+        router.complete_sync("advice", "等待")
+        assert False, "等待超时应报错"
+    except LLMUnavailableError as e:
+        assert "timeout" in str(e)
+    holder.join()
+
+
+def test_async_complete():
+    providers = {"small": _FakeProvider("small")}
+    router = _router(providers, {"quick_suggestion": ["small"]})
+    result = asyncio.run(router.complete("quick_suggestion", "饮食", max_tokens=100))
+    assert result["text"] == "small:饮食"
+
+
+def test_create_provider():
+    provider = create_provider("ollama:deepseek-r1:1.5b")
+    assert isinstance(provider, OllamaProvider) and provider.model == "deepseek-r1:1.5b"
+    assert isinstance(create_provider("local"), LocalProvider)
+    try:
+        create_provider("openai:gpt")
+        assert False, "未知的模型应报错"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    test_route_and_fallback_on_error()
+    test_concurrency_limit_and_saturation_fallback()
+    test_queue_timeout_and_unavailable()
+    test_async_complete()
+    test_create_provider()
+    print("✅ 大模型路由测试通过")
@@ -0,0 +1,198 @@
+"""
+本地模型服务测试
+
+用不加载真实模型的假推理器启动模型服务，验证：
+1. 加载预热期间health为loading，完成后为ready，未就绪时拒绝生成请求
+2. 客户端通过本机socket请求生成，并发请求在服务端合并为批次，同一时刻只运行一个批次
+3. 生成失败、认证失败和服务不可达时客户端报错
+4. 未设置或使用公开的默认密钥时拒绝启动；非JSON消息（如pickle）直接断开连接，不会被反序列化
+"""
+
+import os
+import sys
+import time
+import pickle
+import socket
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.ml.model_server import ModelServer, ModelServerClient, send_message, recv_message, _auth_digest
+
+
+class _FakeRunner:
+    """记录并发数的假推理器，回复为最后一条消息的倒序"""
+
+    model_path = "fake-model"
+
+    def __init__(self, load_seconds=0.0, generate_seconds=0.0):
+        self.load_seconds = load_seconds
+        self.generate_seconds = generate_seconds
+        self.active = 0
+        self.max_active = 0
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        time.sleep(self.load_seconds)
+
+    def generate_batch(self, conversations, **options):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.batch_sizes.append(len(conversations))
+        time.sleep(self.generate_seconds)
+        with self._lock:
+            self.active -= 1
+        results = []
+        for messages in conversations:
+            content = messages[-1]["content"]
+            if content == "fail":
+                raise RuntimeError("生成出错")
+            results.append({
+                "text": content[::-1],
+                "prompt_tokens": len(content),
+                "completion_tokens": options.get("max_new_tokens", len(content)),
+                "seconds": self.generate_seconds,
+            })
+        return results
+
+
+def _start(runner):
+    server = ModelServer("127.0.0.1:0", runner=runner, authkey=b"test")
+    server.start()
+    address = f"{server.address[0]}:{server.address[1]}"
+    return server, ModelServerClient(address, timeout=10, authkey=b"test")
+
+
+def _wait_ready(client, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if client.health()["state"] == "ready":
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_health_and_generate():
+    server, client = _start(_FakeRunner(load_seconds=0.3))
+    try:
+        assert client.health()["state"] == "loading"
+        try:
+            client.generate([{"role": "user", "content": "你好"}])
+            assert False, "模型未就绪时应报错"
+        except RuntimeError as e:
+            assert "未就绪" in str(e)
+
+        assert _wait_ready(client)
+        result = client.generate([{"role": "user", "content": "空腹血糖"}], max_new_tokens=7)
+        assert result["text"] == "糖血腹空"
+        assert result["completion_tokens"] == 7
+        assert result["queue_seconds"] >= 0 and result["batch_size"] == 1
+
+        health = client.health()
+        assert health["served"] == 1 and health["model"] == "fake-model"
+    finally:
+        server.stop()
+
+
+def test_concurrent_requests_are_batched():
+    runner = _FakeRunner(generate_seconds=0.05)
+    server, client = _start(runner)
+    try:
+        assert _wait_ready(client)
+        results = [None] * 6
+
+        def ask(i):
+            results[i] = client.generate([{"role": "user", "content": f"问题{i}"}])["text"]
+
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [f"{i}题问" for i in range(6)]
+        # 只有一个调度线程，同一时刻只运行一个批次；首个批次生成期间到达的请求合并为后续批次
+        assert runner.max_active == 1
+        assert sum(runner.batch_sizes) == 6 and len(runner.batch_sizes) < 6
+    finally:
+        server.stop()
+
+
+def test_errors_reported_to_client():
+    server, client = _start(_FakeRunner())
+    try:
+        assert _wait_ready(client)
+        try:
+            client.generate([{"role": "user", "content": "fail"}])
+            assert False, "生成失败应报错"
+        except RuntimeError as e:
+            assert "生成出错" in str(e)
+
+        wrong_key = ModelServerClient(f"{server.address[0]}:{server.address[1]}", authkey=b"wrong")
+        assert wrong_key.health()["state"] == "unavailable"
+    finally:
+        server.stop()
+
+    unreachable = ModelServerClient("127.0.0.1:1", timeout=1, authkey=b"test")
+    assert unreachable.health()["state"] == "unavailable"
+    try:
+        unreachable.generate([{"role": "user", "content": "你好"}])
+        assert False, "服务不可达时应报错"
+    except RuntimeError as e:
+        assert "无法连接" in str(e)
+
+
+def test_insecure_authkey_refused():
+    original = settings.MODEL_SERVER_AUTHKEY
+    try:
+        for key in ("", "diabetes-assistant-model-server"):
+            settings.MODEL_SERVER_AUTHKEY = key
+            for create in (lambda: ModelServer("127.0.0.1:0", runner=_FakeRunner()), lambda: ModelServerClient("127.0.0.1:1")):
+                try:
+                    create()
+                    assert False, "未设置密钥时应拒绝启动"
+                except RuntimeError as e:
+                    assert "MODEL_SERVER_AUTHKEY" in str(e)
+        settings.MODEL_SERVER_AUTHKEY = "a-random-deploy-key"
+        assert ModelServerClient("127.0.0.1:1").authkey != ModelServerClient("127.0.0.1:1", authkey=b"test").authkey
+    finally:
+        settings.MODEL_SERVER_AUTHKEY = original
+
+
+class _Exploit:
+    def __reduce__(self):
+        return (setattr, (settings, "MODEL_SERVER_TIMEOUT", -1.0))
+
+
+def test_pickle_payload_not_loaded():
+    server, client = _start(_FakeRunner())
+    original = settings.MODEL_SERVER_TIMEOUT
+    try:
+        assert _wait_ready(client)
+        payload = pickle.dumps({"op": "health", "x": _Exploit()})
+        for authenticate in (False, True):
+            with socket.create_connection(server.address, timeout=5) as conn:
+                challenge = recv_message(conn)["challenge"]
+                if authenticate:
+                    send_message(conn, {"digest": _auth_digest(b"test", challenge)})
+                    assert recv_message(conn)["ok"] is True
+                conn.sendall(len(payload).to_bytes(4, "big") + payload)
+                # 非JSON消息导致连接关闭，不会执行其中的代码
+                assert conn.recv(1) == b""
+        assert settings.MODEL_SERVER_TIMEOUT == original
+        assert client.health()["state"] == "ready"
+    finally:
+        settings.MODEL_SERVER_TIMEOUT = original
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_health_and_generate()
+    test_concurrent_requests_are_batched()
+    test_errors_reported_to_client()
+    test_insecure_authkey_refused()
+    test_pickle_payload_not_loaded()
+    print("✅ 模型服务测试通过")
@@ -0,0 +1,138 @@
+"""
+前缀KV缓存测试
+
+用token列表代替模型的KV缓存，验证：
+1. 在所有条目中找最长公共前缀，短于min_tokens时不复用
+2. 新条目包含旧条目时替换旧条目（同一对话的下一轮）
+3. 按最近使用淘汰，总占用不超过max_bytes
+4. 复用比例统计
+5. 截断真实的KV缓存（torch张量的旧式元组缓存和transformers的DynamicCache），不修改缓存中的原条目
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.ml.prefix_cache import PrefixCache, common_prefix_length, cache_length, crop_cache, cache_nbytes
+
+SYSTEM = list(range(100, 140))
+
+
+def test_common_prefix_length():
+    assert common_prefix_length(np.array([1, 2, 3]), np.array([1, 2, 4])) == 2
+    assert common_prefix_length(np.array([1, 2]), np.array([1, 2, 3])) == 2
+    assert common_prefix_length(np.array([], dtype=np.int64), np.array([1])) == 0
+    assert common_prefix_length(np.array([5]), np.array([1])) == 0
+
+
+def test_longest_prefix_lookup():
+    cache = PrefixCache(max_bytes=10 ** 6, min_tokens=16)
+    conversation_a = SYSTEM + [1] * 30
+    conversation_b = SYSTEM + [2] * 30
+    assert cache.store(conversation_a, "kv-a", 100)
+    assert cache.store(conversation_b, "kv-b", 100)
+
+    # 同一对话的下一轮：整段历史都能复用
+    length, kv = cache.lookup(conversation_a + [3] * 10)
+    assert (length, kv) == (len(conversation_a), "kv-a")
+    # 新对话：只共享系统提示词
+    length, kv = cache.lookup(SYSTEM + [9] * 5)
+    assert length == len(SYSTEM) and kv in ("kv-a", "kv-b")
+    # 公共前缀太短
+    assert cache.lookup(SYSTEM[:10] + [7] * 40) == (0, None)
+    # 太短的序列不保存
+    assert not cache.store([1] * 10, "kv-short", 10)
+
+
+def test_superseded_entries_replaced():
+    cache = PrefixCache(max_bytes=10 ** 6, min_tokens=16)
+    turn1 = SYSTEM + [1] * 20
+    turn2 = turn1 + [2] * 20
+    cache.store(turn1, "kv-1", 100)
+    cache.store(turn2, "kv-2", 150)
+    assert len(cache) == 1 and cache.nbytes == 150
+    assert cache.lookup(turn2 + [3])[1] == "kv-2"
+
+
+def test_lru_eviction_by_bytes():
+    cache = PrefixCache(max_bytes=250, min_tokens=16)
+    cache.store(SYSTEM + [1] * 20, "kv-1", 100)
+    cache.store(SYSTEM + [2] * 20, "kv-2", 100)
+    # 访问kv-1，使kv-2成为最久未使用
+    assert cache.lookup(SYSTEM + [1] * 20)[1] == "kv-1"
+    cache.store(SYSTEM + [3] * 20, "kv-3", 100)
+    assert len(cache) == 2 and cache.nbytes == 200
+    assert cache.lookup(SYSTEM + [2] * 20)[0] == len(SYSTEM)
+    assert cache.lookup(SYSTEM + [1] * 20)[1] == "kv-1"
+    # 单条超过上限的不保存
+    assert not cache.store(SYSTEM + [4] * 20, "kv-big", 300)
+
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_reuse_stats():
+    cache = PrefixCache(max_bytes=10 ** 6)
+    cache.record(100, 0)
+    cache.record(120, 100)
+    stats = cache.stats()
+    assert stats["reused_tokens"] == 100 and stats["computed_tokens"] == 120
+    assert stats["reuse_rate"] == round(100 / 220, 4)
+
+
+def _legacy_cache(torch, layers=2, seq=40):
+    """旧式元组缓存：逐层的(key, value)，形状为[batch, heads, seq, dim]"""
+    return tuple(
+        (torch.randn(1, 2, seq, 8), torch.randn(1, 2, seq, 8))
+        for _ in range(layers)
+    )
+
+
+def test_crop_legacy_tuple_cache():
+    torch = pytest.importorskip("torch")
+    cache = _legacy_cache(torch)
+    assert cache_length(cache) == 40
+    assert cache_nbytes(cache) == 2 * 2 * (2 * 40 * 8) * 4
+
+    cropped = crop_cache(cache, 25)
+    assert cache_length(cropped) == 25
+    assert torch.equal(cropped[1][0], cache[1][0][:, :, :25, :])
+    # 原条目不变，仍可供其他请求截断到不同长度
+    assert cache_length(cache) == 40
+
+    prefix = PrefixCache(max_bytes=10 ** 6, min_tokens=16)
+    assert prefix.store(list(range(40)), cache, cache_nbytes(cache))
+    length, kv = prefix.lookup(list(range(30)) + [999])
+    assert length == 30 and cache_length(crop_cache(kv, length)) == 30
+
+
+def test_crop_dynamic_cache():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    legacy = _legacy_cache(torch)
+    cache = transformers.DynamicCache.from_legacy_cache(legacy)
+    assert cache_length(cache) == 40
+
+    cropped = crop_cache(cache, 25)
+    assert cache_length(cropped) == 25
+    assert cache_length(cache) == 40
+    # 在截断的副本上追加（generate中的原地更新）不影响原条目
+    cropped.update(torch.randn(1, 2, 3, 8), torch.randn(1, 2, 3, 8), 0)
+    assert cache_length(cropped) == 28 and cache_length(cache) == 40
+    assert cache_nbytes(cache) == cache_nbytes(legacy)
+
+
+if __name__ == "__main__":
+    test_common_prefix_length()
+    test_longest_prefix_lookup()
+    test_superseded_entries_replaced()
+    test_lru_eviction_by_bytes()
+    test_reuse_stats()
+    test_crop_legacy_tuple_cache()
+    test_crop_dynamic_cache()
+    print("✅ 前缀KV缓存测试通过")
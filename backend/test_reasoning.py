@@ -0,0 +1,106 @@
+"""
+推理模型输出控制测试
+
+验证：
+1. strip_reasoning去掉完整、只有结尾或被截断的<think>思考过程
+2. OllamaService把温度、最大token数和停止序列通过options传给Ollama
+3. 短文本任务使用raw模式并预填空的思考块，返回的文本不含思考过程
+4. 模型路由按任务类型决定是否跳过思考过程
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.ml.reasoning import strip_reasoning, no_reasoning_prompt, is_reasoning_model
+from app.ml.ollama_service import OllamaService
+from app.ml.llm_router import LLMRouter
+
+
+class _FakeOllamaClient:
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def generate(self, **params):
+        self.calls.append(params)
+        return {"response": self.response, "prompt_eval_count": 10, "eval_count": 20}
+
+    def chat(self, **params):
+        self.calls.append(params)
+        return {"message": {"role": "assistant", "content": self.response}, "eval_count": 20}
+
+
+def _service(response):
+    service = OllamaService()
+    service.initialized = True
+    service.available = True
+    service.client = _FakeOllamaClient(response)
+    return service
+
+
+def test_strip_reasoning():
+    assert strip_reasoning("<think>\n先分析血糖...\n</think>\n\n请及时补充糖分。") == "请及时补充糖分。"
+    assert strip_reasoning("分析过程</think>建议少量多餐") == "建议少量多餐"
+    assert strip_reasoning("<think>思考被截断") == ""
+    assert strip_reasoning("直接回答") == "直接回答"
+    assert strip_reasoning(None) == ""
+
+
+def test_no_reasoning_prompt():
+    prompt = no_reasoning_prompt("生成预警", system="你是助手")
+    assert prompt.startswith("你是助手") and prompt.endswith("<think>\n\n</think>\n\n")
+    assert is_reasoning_model("deepseek-r1:1.5b") and not is_reasoning_model("qwen2:7b")
+
+
+def test_options_passed_to_ollama():
+    service = _service("<think>思考</think>血糖偏高，请注意饮食。")
+    result = service.generate_text("生成预警", model="deepseek-r1:1.5b", temperature=0.3, max_tokens=200, stop=["\n\n"])
+    params = service.client.calls[-1]
+    assert params["options"] == {"temperature": 0.3, "num_predict": 200, "stop": ["\n\n"]}
+    assert "raw" not in params
+    assert result["response"] == "血糖偏高，请注意饮食。"
+
+    service.generate_text("生成预警", model="deepseek-r1:1.5b", system="系统", reasoning=False)
+    params = service.client.calls[-1]
+    assert params["raw"] is True and "system" not in params
+    assert params["prompt"] == no_reasoning_prompt("生成预警", "系统")
+
+    # 非推理模型不使用raw模式
+    service.generate_text("生成预警", model="qwen2:7b", reasoning=False)
+    assert "raw" not in service.client.calls[-1]
+
+
+def test_chat_strips_reasoning():
+    import asyncio
+    service = _service("<think>想一想</think>可以吃燕麦。")
+    result = asyncio.run(service.chat([{"role": "user", "content": "早餐吃什么"}], max_tokens=100))
+    assert result["message"]["content"] == "可以吃燕麦。"
+    assert service.client.calls[-1]["options"]["num_predict"] == 100
+
+
+def test_router_reasoning_by_task():
+    class _Provider:
+        name = "fake"
+
+        def generate(self, prompt, system, temperature, max_tokens, reasoning=True):
+            self.reasoning = reasoning
+            return {"text": "ok", "prompt_tokens": 1, "completion_tokens": 1}
+
+    provider = _Provider()
+    router = LLMRouter(routes={"alert": ["fake"], "advice": ["fake"]}, provider_factory=lambda spec: provider)
+    router.complete_sync("alert", "x")
+    assert provider.reasoning is False
+    router.complete_sync("advice", "x")
+    assert provider.reasoning is True
+
+
+if __name__ == "__main__":
+    test_strip_reasoning()
+    test_no_reasoning_prompt()
+    test_options_passed_to_ollama()
+    test_chat_strips_reasoning()
+    test_router_reasoning_by_task()
+    print("✅ 推理模型输出控制测试通过")
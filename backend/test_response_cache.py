@@ -0,0 +1,209 @@
+"""
+助手回复语义缓存测试
+
+使用确定性的字符哈希嵌入代替真实嵌入模型，验证：
+1. 问题规范化后精确命中（忽略空白、标点和语气词），语义相近的问题按阈值命中
+2. 只在系统提示词中的资料完全相同的用户之间共享回答
+3. 过期、知识库变化后失效（含其他进程修改知识库）、容量淘汰
+4. 命中率和节省时间的统计
+5. 向量相似但问的是不同对象（食物、药物）时不命中
+"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.db.models import KnowledgeBase
+from app.ml.keyword_index import KeywordIndex
+from app.ml.knowledge_index import KnowledgeIndex
+from app.ml.response_cache import SemanticResponseCache, normalize_question, context_class
+
+DIM = 64
+
+TYPE2_ADULT = {"id": "u1", "name": "张三", "diabetes_type": "type2", "age": 52}
+# 另一个用户，提示词中的资料与TYPE2_ADULT相同
+TYPE2_SAME_PROFILE = {"id": "u2", "name": "张三", "diabetes_type": "type2", "age": 52, "created_at": "2024-01-01"}
+TYPE1_CHILD = {"id": "u3", "name": "王五", "diabetes_type": "type1", "age": 12}
+
+
+class _CharEmbedder:
+    """按字符哈希到固定维度的归一化词袋向量，记录调用次数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.available = True
+
+    def __call__(self, text):
+        if not self.available:
+            return None
+        self.calls += 1
+        vector = np.zeros(DIM, dtype=np.float32)
+        for char in text:
+            vector[hash(char) % DIM] += 1.0
+        return vector / np.linalg.norm(vector)
+
+
+def test_normalize_and_context_class():
+    assert normalize_question(" 空腹血糖多少正常？ ") == normalize_question("空腹血糖多少正常")
+    assert normalize_question("糖尿病能吃西瓜吗?") == "糖尿病能吃西瓜"
+    assert context_class(TYPE2_ADULT) == context_class(TYPE2_SAME_PROFILE)
+    assert context_class(TYPE2_ADULT) != context_class(TYPE1_CHILD)
+    assert context_class(None) == context_class({"name": "", "age": None})
+
+
+def test_exact_and_semantic_hits():
+    embedder = _CharEmbedder()
+    cache = SemanticResponseCache(embedder, threshold=0.9)
+    assert cache.lookup("空腹血糖多少正常", TYPE2_ADULT) is None
+    assert cache.store("空腹血糖多少正常", "空腹血糖正常范围为3.9-6.1mmol/L", [], 2.5, TYPE2_ADULT)
+
+    # 规范化后完全相同：不需要向量化
+    calls = embedder.calls
+    hit = cache.lookup("空腹血糖多少正常？", TYPE2_SAME_PROFILE)
+    assert hit["answer"].startswith("空腹血糖正常范围") and hit["similarity"] == 1.0
+    assert embedder.calls == calls
+    assert 0 < hit["saved_seconds"] <= 2.5
+
+    # 语义相近（字符重合度高）的问题命中，差异较大的问题不命中
+    hit = cache.lookup("空腹血糖多少算正常", TYPE2_ADULT)
+    assert hit is not None and 0.9 <= hit["similarity"] < 1.0
+    assert cache.lookup("糖尿病能吃西瓜吗", TYPE2_ADULT) is None
+
+    # 不同用户分类不共享
+    assert cache.lookup("空腹血糖多少正常", TYPE1_CHILD) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 3 and stats["hit_rate"] == 0.4
+    assert stats["saved_seconds"] > 0
+
+
+def test_answers_not_shared_across_profiles():
+    # 糖尿病类型和年龄段相同，但体重、目标血糖范围等提示词中的资料不同
+    first = {"id": "u1", "name": "张三", "gender": "男", "age": 52, "diabetes_type": "type2",
+             "height": 170, "weight": 90, "target_glucose_min": 4.4, "target_glucose_max": 7.0}
+    cache = SemanticResponseCache(_CharEmbedder(), threshold=0.9)
+    cache.store("糖尿病能吃西瓜吗", "按您90kg的体重和4.4-7.0的目标范围，每次不超过200g", [], 2.0, first)
+    assert cache.lookup("糖尿病能吃西瓜吗", first) is not None
+
+    for field, value in [("weight", 60), ("height", 160), ("target_glucose_min", 3.9), ("target_glucose_max", 10.0),
+                         ("gender", "女"), ("age", 55), ("name", "李四")]:
+        second = dict(first, id="u2", **{field: value})
+        assert cache.lookup("糖尿病能吃西瓜吗", second) is None, field
+        assert cache.lookup("糖尿病能吃西瓜么", second) is None, field
+
+
+def test_ttl_invalidate_and_eviction():
+    cache = SemanticResponseCache(_CharEmbedder(), ttl_seconds=0.05, max_entries=3)
+    cache.store("空腹血糖多少正常", "回答1", [], 1.0, TYPE2_ADULT)
+    time.sleep(0.1)
+    assert cache.lookup("空腹血糖多少正常", TYPE2_ADULT) is None
+    assert cache.stats()["entries"] == 0
+
+    # 容量是所有分类合计的，淘汰最早写入的
+    cache.ttl_seconds = 3600
+    for i, question in enumerate(["问题一", "问题二", "问题三"]):
+        cache.store(question, f"回答{i}", [], 1.0, TYPE2_ADULT)
+    cache.store("问题四", "回答3", [], 1.0, TYPE1_CHILD)
+    assert cache.stats()["entries"] == 3
+    assert cache.lookup("问题一", TYPE2_ADULT) is None
+    assert cache.lookup("问题三", TYPE2_ADULT)["answer"] == "回答2"
+    assert cache.lookup("问题四", TYPE1_CHILD)["answer"] == "回答3"
+
+    cache.invalidate()
+    assert cache.lookup("问题三", TYPE2_ADULT) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_knowledge_base_change_in_another_process_expires_answers():
+    engine, factory = make_session_factory()
+    db = factory()
+    db.add(KnowledgeBase(id="glucose", title="血糖监测", content="空腹血糖正常范围为3.9-6.1mmol/L", tags=[]))
+    db.commit()
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        # 两个进程各自的缓存，知识库版本取自共享的数据库
+        fingerprint = KnowledgeIndex(index_dir, "char-hash", _CharEmbedder(), factory).db_fingerprint
+        cache = SemanticResponseCache(_CharEmbedder(), version_fn=fingerprint)
+        other = SemanticResponseCache(_CharEmbedder(), version_fn=fingerprint)
+        cache.store("空腹血糖多少正常", "3.9-6.1mmol/L", [], 1.0, TYPE2_ADULT)
+        assert cache.lookup("空腹血糖多少正常", TYPE2_ADULT)["answer"] == "3.9-6.1mmol/L"
+
+        # 另一个进程修改知识库：只有它自己的缓存调用了invalidate
+        entry = db.get(KnowledgeBase, "glucose")
+        entry.content = "空腹血糖正常范围为4.4-6.1mmol/L"
+        entry.updated_at = datetime.now() + timedelta(seconds=1)
+        db.commit()
+        other.invalidate()
+        assert cache.lookup("空腹血糖多少正常", TYPE2_ADULT) is None
+        assert cache.stats()["entries"] == 0
+
+        # 生成前取得的版本在生成期间过期：写入的回答不会被命中
+        version = cache.version()
+        db.add(KnowledgeBase(id="diet", title="饮食", content="少吃精制碳水", tags=[]))
+        db.commit()
+        cache.store("空腹血糖多少正常", "4.4-6.1mmol/L", [], 1.0, TYPE2_ADULT, version)
+        assert cache.lookup("空腹血糖多少正常", TYPE2_ADULT) is None
+        cache.store("空腹血糖多少正常", "4.4-6.1mmol/L", [], 1.0, TYPE2_ADULT)
+        assert cache.lookup("空腹血糖多少正常", TYPE2_ADULT)["answer"] == "4.4-6.1mmol/L"
+    db.close()
+
+
+def test_skipped_when_embedding_unavailable():
+    embedder = _CharEmbedder()
+    embedder.available = False
+    cache = SemanticResponseCache(embedder)
+    assert cache.lookup("空腹血糖多少正常", TYPE2_ADULT) is None
+    assert not cache.store("空腹血糖多少正常", "回答", [], 1.0, TYPE2_ADULT)
+    assert cache.stats()["skips"] == 1 and cache.stats()["misses"] == 0
+
+
+def test_different_subjects_are_not_shared():
+    engine, factory = make_session_factory()
+    db = factory()
+    for entry_id, title, content in [
+        ("apple", "水果选择", "苹果的升糖指数较低，可以在两餐之间适量食用"),
+        ("durian", "高糖水果", "榴莲含糖量高，糖尿病患者应少吃"),
+        ("metformin", "二甲双胍", "二甲双胍随餐服用可减轻胃肠道反应"),
+        ("acarbose", "阿卡波糖", "阿卡波糖需与第一口饭同时嚼服"),
+        ("glucose", "血糖监测", "空腹血糖正常范围为3.9-6.1mmol/L，餐后两小时血糖低于7.8"),
+    ]:
+        db.add(KnowledgeBase(id=entry_id, title=title, content=content, tags=[]))
+    db.commit()
+    db.close()
+    keyword_index = KeywordIndex(factory)
+    assert "苹果" in keyword_index.key_terms("糖尿病人能吃苹果吗")
+
+    # 较低的向量阈值模拟真实嵌入模型对只差一个对象的问题给出的高相似度
+    cache = SemanticResponseCache(_CharEmbedder(), threshold=0.6, key_terms_fn=keyword_index.key_terms)
+    cache.store("2型糖尿病患者晚餐后可以吃苹果吗", "苹果升糖指数较低，可以适量吃", [], 2.0, TYPE2_ADULT)
+    cache.store("二甲双胍饭前吃还是饭后吃", "二甲双胍建议随餐或餐后服用", [], 2.0, TYPE2_ADULT)
+    cache.store("糖尿病人能吃火龙果吗", "火龙果含糖量中等，少量食用", [], 2.0, TYPE2_ADULT)
+
+    # 词项重合度很高，但关键词项（食物名、药名）不同
+    assert cache.lookup("2型糖尿病患者晚餐后可以吃榴莲吗", TYPE2_ADULT) is None
+    assert cache.lookup("阿卡波糖饭前吃还是饭后吃", TYPE2_ADULT) is None
+    # 知识库中没有的对象由词项重合度把关
+    assert cache.lookup("糖尿病人能吃山竹吗", TYPE2_ADULT) is None
+    # 同一对象的不同问法仍然命中
+    hit = cache.lookup("2型糖尿病患者晚餐后能吃苹果吗", TYPE2_ADULT)
+    assert hit is not None and hit["answer"].startswith("苹果")
+    assert cache.lookup("二甲双胍是饭前吃还是饭后吃", TYPE2_ADULT)["answer"].startswith("二甲双胍")
+
+
+if __name__ == "__main__":
+    test_normalize_and_context_class()
+    test_exact_and_semantic_hits()
+    test_answers_not_shared_across_profiles()
+    test_ttl_invalidate_and_eviction()
+    test_knowledge_base_change_in_another_process_expires_answers()
+    test_skipped_when_embedding_unavailable()
+    test_different_subjects_are_not_shared()
+    print("✅ 助手回复语义缓存测试通过")
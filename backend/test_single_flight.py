@@ -0,0 +1,113 @@
+"""
+相同请求合并测试
+
+验证：
+1. 进行中的相同请求只执行一次，所有等待方得到同一结果；失败时所有等待方都收到异常
+2. 请求结束后不缓存，之后的相同请求重新执行
+3. OllamaService.generate_text按模型、规范化后的提示词和生成参数合并，参数不同时分别生成
+"""
+
+import os
+import sys
+import time
+import itertools
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.ml.single_flight import SingleFlight, normalize_prompt
+from app.ml.ollama_service import OllamaService
+
+
+def _run_concurrently(fn, n):
+    results, errors = [None] * n, [None] * n
+
+    def worker(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_coalesce_and_no_caching():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"text": "建议"}
+
+    results, errors = _run_concurrently(lambda: flight.do("k", slow), 5)
+    assert len(calls) == 1, calls
+    assert all(r == {"text": "建议"} for r in results) and not any(errors)
+    assert flight.inflight() == 0
+
+    flight.do("k", slow)
+    assert len(calls) == 2
+
+
+def test_error_shared():
+    flight = SingleFlight()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("模型不可用")
+
+    results, errors = _run_concurrently(lambda: flight.do("k", fail), 4)
+    assert len(calls) == 1
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+class _FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, **params):
+        self.calls.append(params)
+        time.sleep(0.2)
+        return {"response": "注意补充碳水", "prompt_eval_count": 10, "eval_count": 5}
+
+
+def test_ollama_generate_text_coalesces():
+    service = OllamaService()
+    service.initialized = service.available = True
+    service.client = _FakeClient()
+
+    # 缩进和换行不同的相同提示词视为同一请求
+    prompts = ["为患者生成预警。\n  严重程度: high", "为患者生成预警。 严重程度: high"]
+    counter = itertools.count()
+    results, errors = _run_concurrently(
+        lambda: service.generate_text(prompts[next(counter) % 2], model="qwen", max_tokens=200), 6
+    )
+    assert not any(errors), errors
+    assert len(service.client.calls) == 1
+    assert all(r["response"] == "注意补充碳水" for r in results)
+    # 每个调用方得到独立的字典
+    assert len({id(r) for r in results}) == 6
+    assert normalize_prompt(prompts[0]) == normalize_prompt(prompts[1])
+
+    # 生成参数不同时分别生成
+    service.client.calls.clear()
+    counter = itertools.count()
+    _run_concurrently(
+        lambda: service.generate_text(prompts[0], model="qwen", max_tokens=200 + next(counter) % 2), 4
+    )
+    assert len(service.client.calls) == 2
+
+
+if __name__ == "__main__":
+    test_coalesce_and_no_caching()
+    test_error_shared()
+    test_ollama_generate_text_coalesces()
+    print("✅ 相同请求合并测试通过")
@@ -0,0 +1,284 @@
+"""
+用户上下文快照测试
+
+在内存SQLite中验证：
+1. 快照包含资料、BMI、近7天血糖统计、近期饮食和近30天用药
+2. 写入血糖、饮食、用药记录或修改资料后快照立即更新并保存到快照表；未开启ASSISTANT_HEALTH_CONTEXT时
+   快照只有资料字段，写入健康记录不重建快照
+3. 读取快照命中进程内缓存时不执行SQL，缓存过期后只读取一行快照
+4. 系统提示词中带入近期健康数据
+5. 通过 /glucose-monitor 接口新增、修改、删除血糖记录后快照立即更新
+6. 默认不带入健康数据，有健康记录的用户也使用回答缓存；开启ASSISTANT_HEALTH_CONTEXT后不使用
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conftest import make_session_factory
+from app.core.config import settings
+from app.db.models import User, DietRecord, UserContextSnapshot
+from app.models.glucose import GlucoseCreate, MeasurementTimeEnum, MeasurementMethodEnum
+from app.models.diet import MealTypeEnum
+from app.models.health import MedicationRecord as MedicationRecordSchema
+from app.models.user import UserUpdate
+from app.services import user_context as user_context_module
+from app.services.user_context import UserContextStore, build_user_context, profile_only, has_health_data
+from app.services.glucose import create_glucose_record, delete_glucose_record
+from app.services.health import create_medication_record
+from app.services.user import update_user
+
+
+def _make_session():
+    engine, session_factory = make_session_factory()
+    return engine, session_factory()
+
+
+def _count_statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def _seed(db):
+    user = User(id=str(uuid.uuid4()), email="ctx@example.com", name="张三", height=170.0, weight=72.0,
+                birth_date=datetime.now() - timedelta(days=365 * 56 + 30))
+    db.add(user)
+    now = datetime.now()
+    db.add(DietRecord(
+        id=str(uuid.uuid4()), user_id=user.id, meal_type=MealTypeEnum.BREAKFAST, meal_time=now - timedelta(hours=3),
+        food_items=[{"name": "燕麦"}, {"name": "牛奶"}], total_carbs=45.0, total_calories=320.0
+    ))
+    db.commit()
+    return user
+
+
+def _glucose(user_id, value, hours_ago):
+    return GlucoseCreate(
+        user_id=user_id, value=value, measurement_time=MeasurementTimeEnum.BEFORE_BREAKFAST,
+        measurement_method=MeasurementMethodEnum.FINGER_STICK, measured_at=datetime.now() - timedelta(hours=hours_ago)
+    )
+
+
+def test_build_user_context():
+    engine, db = _make_session()
+    user = _seed(db)
+    context = build_user_context(db, user.id, health=True)
+    assert context["name"] == "张三" and context["age"] == 56 and context["bmi"] == 24.9
+    assert context["glucose"] is None
+    assert context["recent_meals"][0]["foods"] == ["燕麦", "牛奶"]
+    assert context["medications"] == []
+    assert not has_health_data(profile_only(context))
+    assert build_user_context(db, "missing") is None
+
+    # 默认不带入健康数据：只查询用户资料
+    assert not settings.ASSISTANT_HEALTH_CONTEXT
+    statements = _count_statements(engine)
+    assert build_user_context(db, user.id) == profile_only(context)
+    assert len(statements) == 1
+
+
+def test_health_writes_skip_snapshot_when_disabled():
+    engine, db = _make_session()
+    user = _seed(db)
+    store = UserContextStore(cache_ttl=300, max_age=3600, max_entries=100)
+    original = user_context_module.user_context_store
+    for module in ("app.services.glucose", "app.services.health", "app.services.user"):
+        sys.modules[module].user_context_store = store
+    try:
+        assert not settings.ASSISTANT_HEALTH_CONTEXT
+        statements = _count_statements(engine)
+        create_glucose_record(db, _glucose(user.id, 3.2, 2))
+        create_medication_record(db, user.id, MedicationRecordSchema(user_id=user.id, name="二甲双胍", dosage="500mg"))
+        assert not any("user_context_snapshots" in s or "diet_records" in s for s in statements), statements
+
+        # 修改资料仍然更新快照
+        update_user(db, user.id, UserUpdate(weight=68.0))
+        snapshot = db.query(UserContextSnapshot).filter(UserContextSnapshot.user_id == user.id).one()
+        assert snapshot.data["weight"] == 68.0 and "glucose" not in snapshot.data
+
+        # 开启后读取到缺少健康数据的快照时重新构建
+        settings.ASSISTANT_HEALTH_CONTEXT = True
+        assert store.get(db, user.id)["glucose"]["count"] == 1
+    finally:
+        settings.ASSISTANT_HEALTH_CONTEXT = False
+        for module in ("app.services.glucose", "app.services.health", "app.services.user"):
+            sys.modules[module].user_context_store = original
+
+
+def test_refresh_on_write():
+    engine, db = _make_session()
+    user = _seed(db)
+    store = UserContextStore(cache_ttl=300, max_age=3600, max_entries=100)
+    original = user_context_module.user_context_store
+    # 写入路径使用全局实例，替换为本测试的实例
+    for module in ("app.services.glucose", "app.services.health", "app.services.user"):
+        sys.modules[module].user_context_store = store
+    settings.ASSISTANT_HEALTH_CONTEXT = True
+    try:
+        record = create_glucose_record(db, _glucose(user.id, 3.2, 2))
+        create_glucose_record(db, _glucose(user.id, 11.0, 30))
+        create_glucose_record(db, _glucose(user.id, 6.0, 24 * 10))  # 超出7天窗口
+        glucose = store.get(db, user.id)["glucose"]
+        assert glucose["count"] == 2 and glucose["min"] == 3.2 and glucose["max"] == 11.0
+        assert glucose["low_count"] == 1 and glucose["high_count"] == 1 and glucose["in_range_percentage"] == 0.0
+        assert glucose["latest"]["value"] == 3.2
+
+        create_medication_record(db, user.id, MedicationRecordSchema(user_id=user.id, name="二甲双胍", dosage="500mg"))
+        assert store.get(db, user.id)["medications"][0]["name"] == "二甲双胍"
+
+        update_user(db, user.id, UserUpdate(weight=68.0))
+        assert store.get(db, user.id)["weight"] == 68.0
+
+        delete_glucose_record(db, record.id)
+        assert store.get(db, user.id)["glucose"]["count"] == 1
+
+        # 快照表中保存了最新的快照
+        snapshot = db.query(UserContextSnapshot).filter(UserContextSnapshot.user_id == user.id).one()
+        assert snapshot.data["glucose"]["count"] == 1 and snapshot.data["weight"] == 68.0
+    finally:
+        settings.ASSISTANT_HEALTH_CONTEXT = False
+        for module in ("app.services.glucose", "app.services.health", "app.services.user"):
+            sys.modules[module].user_context_store = original
+
+
+def test_lookup_cost():
+    engine, db = _make_session()
+    user = _seed(db)
+    store = UserContextStore(cache_ttl=300, max_age=3600, max_entries=100)
+    user_id = user.id
+    store.refresh(db, user_id)
+
+    statements = _count_statements(engine)
+    context = store.get(db, user_id)
+    assert context["name"] == "张三"
+    assert statements == [], statements
+
+    # 进程内缓存过期（如其他工作进程写入后）时只读取一行快照
+    store.cache_ttl = -1
+    store.get(db, user_id)
+    assert len(statements) == 1 and "user_context_snapshots" in statements[0]
+
+    # 快照过期时重新构建，但不在读取路径写入快照表
+    store.max_age = -1
+    statements.clear()
+    store.get(db, user_id)
+    assert not any(s.lstrip().upper().startswith(("INSERT", "UPDATE")) for s in statements)
+
+
+def test_system_prompt_includes_health_data():
+    from app.ml.llm_service import LLMService
+
+    context = {
+        "name": "张三", "age": 56,
+        "glucose": {
+            "days": 7, "count": 12, "average": 7.8, "min": 4.6, "max": 12.1, "in_range_percentage": 75.0,
+            "high_count": 3, "low_count": 0,
+            "latest": {"value": 8.4, "measurement_time": "AFTER_LUNCH", "measured_at": "2025-10-19T13:05:00"}
+        },
+        "recent_meals": [{"meal_type": "lunch", "meal_time": "2025-10-19T12:10:00", "foods": ["米饭", "清蒸鱼"],
+                          "total_carbs": 62.0, "total_calories": 540.0}],
+        "medications": [{"name": "二甲双胍", "dosage": "500mg", "last_taken_at": None}],
+    }
+    prompt = LLMService._build_system_prompt(LLMService.__new__(LLMService), context)
+    assert "近7天血糖: 测量12次，平均7.8 mmol/L" in prompt
+    assert "最近一次8.4 mmol/L（2025-10-19 13:05）" in prompt
+    assert "近期饮食: 2025-10-19 12:10 米饭、清蒸鱼（碳水62g）" in prompt
+    assert "近期用药: 二甲双胍 500mg" in prompt
+
+
+def test_glucose_endpoints_refresh_snapshot():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api.deps import get_current_user, get_db
+    from app.api.endpoints import glucose_monitor
+
+    engine, db = _make_session()
+    user = _seed(db)
+    store = UserContextStore(cache_ttl=300, max_age=3600, max_entries=100)
+    app = FastAPI()
+    app.include_router(glucose_monitor.router, prefix="/glucose-monitor")
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_db] = lambda: db
+    client = TestClient(app)
+    original = glucose_monitor.user_context_store
+    glucose_monitor.user_context_store = store
+    settings.ASSISTANT_HEALTH_CONTEXT = True
+    try:
+        assert store.get(db, user.id)["glucose"] is None
+        response = client.post("/glucose-monitor", json={
+            "value": 9.6, "measurement_time": MeasurementTimeEnum.AFTER_LUNCH.value,
+            "measurement_method": MeasurementMethodEnum.FINGER_STICK.value
+        })
+        assert response.status_code == 200, response.text
+        record_id = response.json()["id"]
+        assert store.get(db, user.id)["glucose"]["latest"]["value"] == 9.6
+
+        assert client.put(f"/glucose-monitor/{record_id}", json={"value": 6.1}).status_code == 200
+        assert store.get(db, user.id)["glucose"]["latest"]["value"] == 6.1
+
+        assert client.delete(f"/glucose-monitor/{record_id}").status_code == 204
+        assert store.get(db, user.id)["glucose"] is None
+    finally:
+        settings.ASSISTANT_HEALTH_CONTEXT = False
+        glucose_monitor.user_context_store = original
+
+
+class _FakeResponseCache:
+    def __init__(self):
+        self.lookups = []
+
+    def version(self):
+        return 0
+
+    def lookup(self, question, user_context=None, version=None):
+        self.lookups.append(user_context)
+        return {"answer": "缓存的回答", "sources": [], "question": question, "similarity": 1.0}
+
+
+def test_response_cache_with_health_data():
+    from app.services import assistant
+
+    engine, db = _make_session()
+    user = _seed(db)
+    store = UserContextStore(cache_ttl=300, max_age=3600, max_entries=100)
+    cache = _FakeResponseCache()
+    original = assistant.user_context_store, assistant.llm_service.response_cache, settings.ASSISTANT_HEALTH_CONTEXT
+    assistant.user_context_store, assistant.llm_service.response_cache = store, cache
+    service = assistant.llm_service
+    # 不调用真实模型
+    service.search_knowledge_base = lambda question: []
+    service.generate_response = lambda question, user_context=None, **kwargs: ("模型的回答", [])
+    try:
+        # 默认不带入健康数据（快照中也没有），回答可在资料相同的用户之间共享
+        assert not settings.ASSISTANT_HEALTH_CONTEXT
+        assert not has_health_data(store.get(db, user.id))
+        response = assistant.generate_assistant_response(db, "糖尿病人能吃火龙果吗", user.id)
+        assert response.message == "缓存的回答"
+        assert not has_health_data(cache.lookups[-1])
+
+        # 开启后该用户的回答是个人化的，不查缓存
+        settings.ASSISTANT_HEALTH_CONTEXT = True
+        lookups = len(cache.lookups)
+        response = assistant.generate_assistant_response(db, "糖尿病人能吃火龙果吗", user.id)
+        assert response.message == "模型的回答" and len(cache.lookups) == lookups
+    finally:
+        del service.search_knowledge_base, service.generate_response
+        assistant.user_context_store, assistant.llm_service.response_cache, settings.ASSISTANT_HEALTH_CONTEXT = original
+
+
+if __name__ == "__main__":
+    test_build_user_context()
+    test_health_writes_skip_snapshot_when_disabled()
+    test_refresh_on_write()
+    test_lookup_cost()
+    test_system_prompt_includes_health_data()
+    test_glucose_endpoints_refresh_snapshot()
+    test_response_cache_with_health_data()
+    print("✅ 用户上下文快照测试通过")
@@ -49,6 +49,28 @@ apiClient.interceptors.response.use(
 // 导出apiClient (改为命名导出)
 export { apiClient }
 
+// 提交血糖分析请求；需要大模型生成内容时后端返回202和任务ID，轮询任务直到完成，返回与同步接口相同结构的响应
+const runAnalysisJob = async (url: string, data: any, timeout: number = 60000) => {
+  const deadline = Date.now() + timeout
+  const response = await apiClient.post(url, data, { timeout })
+  if (response.status !== 202) {
+    return response
+  }
+  const statusUrl = response.data.status_url
+  while (Date.now() < deadline) {
+    await new Promise(resolve => setTimeout(resolve, 1000))
+    const jobResponse = await apiClient.get(statusUrl)
+    const job = jobResponse.data
+    if (job.status === 'succeeded') {
+      return { ...jobResponse, data: job.result }
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || '分析任务失败')
+    }
+  }
+  throw new Error('分析任务超时，请稍后再试')
+}
+
 // 用户相关API
 export const userApi = {
   login: (email: string, password: string) => {
@@ -131,6 +153,16 @@ export const glucoseApi = {
   
   getRecentGlucoseRecords: (days: number = 7) => {
     return apiClient.get(`/api/v1/glucose/recent`, { params: { days } })
+  },
+  
+  // 血糖异常分析（含大模型预警消息），timeout为等待分析完成的总时间
+  analyzeGlucose: (hours: number = 24, timeout?: number) => {
+    return runAnalysisJob('/api/v1/glucose-monitor/analyze', { hours }, timeout)
+  },
+  
+  // 血糖趋势分析和管理建议，timeout为等待分析完成的总时间
+  analyzeGlucoseTrend: (days: number = 3, timeout?: number) => {
+    return runAnalysisJob('/api/v1/glucose-monitor/analyze-trend', { days }, timeout)
   }
 }
 